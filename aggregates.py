@@ -0,0 +1,182 @@
+"""
+Running spending totals per (user, category), (user, day) and (user, month).
+
+Totals are folded in as each expense is saved (the store notifies us), so
+"how much did I spend on food" is a dictionary lookup rather than a pass over
+the ledger. Totals are integer LEDGER_CURRENCY minor units (row["amount_minor"]),
+so they never drift however many rows are folded in. An edited or deleted row is
+folded out again (change()). Changes the store's listeners never hear of (another
+worker process, add_many() during a migration) move store.outside_changes(), which
+counts the times the store found its generation moved without its own writes; when
+that differs from the count at the last rebuild, the totals are rebuilt.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+from dates import normalize_date, split_period
+from storage import get_store
+
+logger = logging.getLogger(__name__)
+
+AGGREGATES_CHECK_INTERVAL = float(os.getenv("AGGREGATES_CHECK_INTERVAL", "30"))
+
+_MONTH_RE = re.compile(r"^(\d{4})-(\d{1,2})\b")
+
+
+def category_key(category):
+    return (category or "").strip().lower()
+
+
+def month_key(date):
+    match = _MONTH_RE.match((date or "").strip())
+    return f"{match.group(1)}-{int(match.group(2)):02d}" if match else None
+
+
+class SpendingAggregates:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # key -> [total in minor units, count]
+        self.by_category = defaultdict(lambda: [0, 0])
+        self.by_day = defaultdict(lambda: [0, 0])
+        self.by_month = defaultdict(lambda: [0, 0])
+        self.rows = 0
+
+    # Add a row to the totals, or take it out again with sign=-1
+    def _fold(self, row, sign=1):
+        user_id, amount = row["user_id"], row["amount_minor"]
+        for table, key in (
+            (self.by_category, (user_id, category_key(row["category"]))),
+            (self.by_day, (user_id, (row["date"] or "").strip())),
+            (self.by_month, (user_id, month_key(row["date"]))),
+        ):
+            if key[1]:
+                entry = table[key]
+                entry[0] += sign * amount
+                entry[1] += sign
+                if not entry[1]:
+                    del table[key]
+        self.rows += sign
+
+    # Store listener: fold one new row into the totals
+    def record(self, row):
+        with self._lock:
+            self._fold(row)
+
+    # Store change listener: swap an edited row's old values for the new ones, or drop a deleted row
+    def change(self, old, new):
+        with self._lock:
+            self._fold(old, -1)
+            if new is not None:
+                self._fold(new)
+
+    def rebuild(self, rows):
+        with self._lock:
+            self._reset()
+            for row in rows:
+                self._fold(row)
+
+    def _lookup(self, table, key):
+        with self._lock:
+            entry = table.get(key)
+            return (entry[0], entry[1]) if entry else None
+
+    def category_total(self, user_id, category):
+        """(total in minor units, count) for one user's category, or None if they have none."""
+        return self._lookup(self.by_category, (user_id, category_key(category)))
+
+    def day_total(self, user_id, date):
+        return self._lookup(self.by_day, (user_id, normalize_date(date)))
+
+    def month_total(self, user_id, month):
+        return self._lookup(self.by_month, (user_id, month))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "by_category": {key: tuple(value) for key, value in self.by_category.items()},
+                "by_day": {key: tuple(value) for key, value in self.by_day.items()},
+                "by_month": {key: tuple(value) for key, value in self.by_month.items()},
+                "rows": self.rows,
+            }
+
+
+# Compare the running totals against a full recompute from the ledger.
+# Returns a list of (table, key, running, recomputed) for every mismatch.
+def check_consistency(aggregates, rows):
+    expected = SpendingAggregates()
+    expected.rebuild(rows)
+    actual, wanted = aggregates.snapshot(), expected.snapshot()
+
+    mismatches = []
+    if actual["rows"] != wanted["rows"]:
+        mismatches.append(("rows", None, actual["rows"], wanted["rows"]))
+    for table in ("by_category", "by_day", "by_month"):
+        for key in set(actual[table]) | set(wanted[table]):
+            have, want = actual[table].get(key), wanted[table].get(key)
+            if have != want:
+                mismatches.append((table, key, have, want))
+    return mismatches
+
+
+_aggregates = None
+_aggregates_lock = threading.Lock()
+_last_check = 0.0
+_outside_changes = 0  # store.outside_changes() as of the last rebuild
+
+
+# Process-wide aggregates over get_store(), built on first use and then kept current.
+# Every AGGREGATES_CHECK_INTERVAL seconds the totals are rebuilt if the ledger has been
+# changed by anything but this process's store (see ExpenseStore.outside_changes()).
+def get_aggregates():
+    global _aggregates, _last_check, _outside_changes
+    with _aggregates_lock:
+        store = get_store()
+        if _aggregates is None:
+            _aggregates = SpendingAggregates()
+            _outside_changes = store.outside_changes()
+            _aggregates.rebuild(store.iter_rows())
+            store.subscribe(_aggregates.record, _aggregates.change)
+            _last_check = time.monotonic()
+        elif time.monotonic() - _last_check >= AGGREGATES_CHECK_INTERVAL:
+            _last_check = time.monotonic()
+            if store.outside_changes() != _outside_changes:
+                logger.warning("Spending aggregates out of date, rebuilding from the ledger")
+                _outside_changes = store.outside_changes()
+                _aggregates.rebuild(store.iter_rows())
+        return _aggregates
+
+
+_DAY_RE = re.compile(r"^\d{4}-\d{1,2}-\d{1,2}$")
+_MONTH_ONLY_RE = re.compile(r"^\d{4}-\d{1,2}$")
+
+
+# O(1) (total in minor units, count) for a query term whose rows are known without looking
+# them up, so the total is the one storage.query_expenses() would add up: a day, a month, or
+# one of the user's categories when `index` (a SearchIndex) matches exactly that category's
+# rows for the term, i.e. no description or other category shares its words. None when
+# the rows have to be looked up.
+def spending_total(user_id, term, index):
+    aggregates = get_aggregates()
+    term = term.strip()
+    period, rest = split_period(term)
+    if period is not None:
+        if rest:
+            return None
+        if _DAY_RE.match(term):
+            return aggregates.day_total(user_id, term)
+        if _MONTH_ONLY_RE.match(term):
+            return aggregates.month_total(user_id, month_key(term))
+        return None
+    total = aggregates.category_total(user_id, term)
+    if total is None:
+        return None
+    # Every row of the category matches the term, so equal counts mean the same rows
+    ids = index.matches(user_id, term)
+    return total if ids is not None and len(ids) == total[1] else None
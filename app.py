@@ -1,308 +1,267 @@
-from flask import Flask, request, jsonify
+from engine import handle_message, interpret_message  # first: loads .env before the other modules read it
+from flask import Flask, request, jsonify, g, Response
 from flask_cors import CORS
-import csv
 import os
-import requests
-import json
-import re
-from datetime import datetime, timedelta
-from dotenv import load_dotenv
-from twilio.rest import Client
+import atexit
+import logging
+import threading
+import time
+from searchindex import save_search_index
+from reports import TWILIO_MESSAGE_LIMIT
+from workqueue import ThreadWorkQueue
+from dedup import MessageDeduplicator
+from llmcache import llm_cache
+from sessions import sessions
+from budgets import get_budgets
+from dispatcher import ThreadDispatcher, RetryableSendError, SendError
+from tenants import get_tenant, tenant_for_twilio_number
+from recording import record_webhook
+from logs import configure_logging, get_level, set_level
+from metrics import (CONTENT_TYPE, HTTP_REQUESTS, HTTP_REQUEST_SECONDS, MESSAGES, record_upstream,
+                     render as render_metrics, timed, watch_work_queue)
+from profiler import install_signal_toggle, profiler
 
 app = Flask(__name__)
 CORS(app)
 
-load_dotenv() 
+configure_logging()
+logger = logging.getLogger(__name__)
+install_signal_toggle()
+
+# Bearer token for /debug (profiler, log level); disabled while unset
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")
+# Override of https://api.twilio.com, e.g. a local stub for the benchmarks
+TWILIO_API_URL = os.getenv("TWILIO_API_URL")
+
+
+# One Twilio client and one dispatcher per tenant, created on first use; the twilio
+# package is only imported then, which keeps worker start-up short. Each dispatcher
+# is rate limited, retried and ordered per recipient (see dispatcher.py), so one
+# tenant's account hitting its limits does not hold up the others.
+_clients = {}
+_dispatchers = {}
+_tenant_lock = threading.Lock()
+
+def twilio_client(tenant):
+    with _tenant_lock:
+        client = _clients.get(tenant.id)
+        if client is None:
+            from twilio.rest import Client
+            client = Client(tenant.account_sid, tenant.auth_token)
+            if TWILIO_API_URL:
+                client.api.base_url = TWILIO_API_URL
+            _clients[tenant.id] = client
+        return client
+
+# One attempt at Twilio; 429, 5xx and connection errors are retried by the dispatcher
+def post_whatsapp_message(to, message, tenant):
+    from requests import RequestException
+    from twilio.base.exceptions import TwilioRestException
+
+    started = time.perf_counter()
+    try:
+        response = twilio_client(tenant).messages.create(
+            body=message,
+            from_=f"whatsapp:{tenant.twilio_number}",
+            to=f"whatsapp:{to}"  # Pass recipient dynamically
+        )
+    except TwilioRestException as e:
+        record_upstream("twilio", e.status, time.perf_counter() - started)
+        if e.status == 429 or e.status >= 500:
+            raise RetryableSendError(f"Twilio error {e.status}: {e.msg}")
+        raise SendError(f"Twilio error {e.status}: {e.msg}")
+    except RequestException as e:
+        record_upstream("twilio", "error")
+        raise RetryableSendError(f"Failed to connect to Twilio: {e}")
+    record_upstream("twilio", 201, time.perf_counter() - started)
+    return response.sid
 
-# Groq API Configuration
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
-account_sid =  os.getenv("account_sid")
-auth_token =  os.getenv("auth_token")
+def outbound_for(tenant):
+    with _tenant_lock:
+        dispatcher = _dispatchers.get(tenant.id)
+        if dispatcher is None:
+            dispatcher = ThreadDispatcher(post_whatsapp_message, name=f"twilio:{tenant.id}")
+            _dispatchers[tenant.id] = dispatcher
+        return dispatcher
+
+# Reply to `to` (a bare number or a Twilio "whatsapp:" address) from the tenant's number
+def send_whatsapp_message(to, message, tenant=None):
+    tenant = tenant or get_tenant()
+    to = to.removeprefix("whatsapp:")
+    return outbound_for(tenant).send(to, message, tenant)
+
+# Process one message: interpret it, save or query, and reply. Runs on the work queue.
+@timed("process")
+def process_message(tenant_id, sender, message_text):
+    logger.debug("Received Message: %s from %s", message_text, sender)
+    tenant = get_tenant(tenant_id)
+
+    # Stored under the bare number, like the FastAPI app's users, so the key splits back cleanly
+    user_key = tenant.user_key(sender.removeprefix("whatsapp:"))
+    request_type, details = interpret_message(message_text, user_key)
+    MESSAGES.inc(app="flask", intent=request_type or "none")
+    logger.info("Message from %s classified as %s", sender, request_type)
+
+    replies, result = handle_message(user_key, request_type, details, limit=TWILIO_MESSAGE_LIMIT)
+    try:
+        for reply in replies:
+            send_whatsapp_message(sender, reply, tenant)
+    except Exception as e:
+        logger.error("Error sending WhatsApp message: %s", e)
+        return {"error": "Failed to send WhatsApp message"}
+    return result
 
-# CSV File Path
-CSV_FILE = "expenses.csv"
-recipient = os.getenv("recipient") 
 
+# Keyed on the tenant and sender so each user's messages are applied in order
+work_queue = ThreadWorkQueue(process_message, name="webhook",
+                             key=lambda tenant_id, sender, message_text: (tenant_id, sender))
+watch_work_queue("webhook", work_queue)
+atexit.register(work_queue.stop)
+atexit.register(save_search_index)
+deduplicator = MessageDeduplicator()
 
-# Initialize Twilio client (Make sure to set your credentials)
-client = Client(account_sid, auth_token) 
+# Webhook to receive WhatsApp messages: validate, enqueue and acknowledge straight away
+@app.route("/webhook", methods=["POST"])
+def webhook():
+    try:
+        logger.debug("Headers: %s", request.headers)
+        logger.debug("Raw Data: %s", request.data)
 
-# Ensure CSV file exists with headers
-if not os.path.exists(CSV_FILE):
-    with open(CSV_FILE, mode="w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["user_id", "amount", "category", "description", "date"])
+        # Handle Twilio's form-urlencoded data
+        if request.content_type == "application/x-www-form-urlencoded":
+            data = request.form.to_dict()
+        else:
+            data = request.get_json(silent=True)
 
-def send_whatsapp_message(to, message):
-    response = client.messages.create(
-        body=message,
-        from_="whatsapp:+14155238886",  # Twilio sandbox number
-        to=f"whatsapp:{to}"  # Pass recipient dynamically
-    )
-    return response.sid
+        logger.debug("Parsed Data: %s", data)
+        record_webhook("twilio", data)
 
-# Function to resolve relative dates
-def resolve_relative_date(date_str):
-    today = datetime.today()
-
-    # Predefined mappings for relative dates
-    relative_dates = {
-        "today": today,
-        "yesterday": today - timedelta(days=1),
-        "day before yesterday": today - timedelta(days=2),
-        "tomorrow": today + timedelta(days=1),
-        "day after tomorrow": today + timedelta(days=2),
-    }
-
-    # Directly mapped relative date
-    if date_str.lower() in relative_dates:
-        return relative_dates[date_str.lower()].strftime("%Y-%m-%d")
-
-    # Handling "X days back" or "X days ago"
-    match = re.search(r"(\d+)\s*days?\s*(back|ago)", date_str.lower())
-    if match:
-        days_ago = int(match.group(1))
-        resolved_date = today - timedelta(days=days_ago)
-        return resolved_date.strftime("%Y-%m-%d")
-
-    # If format is unknown, return original string
-    return date_str
-
-
-# Classify request as Add or Query
-def classify_request_with_llama(message):
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": "llama3-8b-8192",
-        "messages": [
-            {"role": "system", "content": """You are an assistant that determines if the user wants to *add* an expense or *query* past expenses.  
-
-            - If the user is reporting a new expense (e.g., "I spent 100 on lunch", "Bought groceries for 500"), classify it as *'add'*.  
-            - If the user is asking about past expenses (e.g., "How much did I spend on food?", "Show my transactions"), classify it as *'query'*.
-            - if the user is not asking query and not reporting a new expense , classify it as *'none'*.
-            - Respond with ONLY one word: *'add'* or *'query'* or *'none'*. Do not explain.  
-            """},
-            {"role": "user", "content": message}
-        ]
-    }
-    response = requests.post(GROQ_URL, json=payload, headers=headers)
-
-    if response.status_code == 200:
-        try:
-            parsed_response = response.json()
-            classification = parsed_response["choices"][0]["message"]["content"].strip().lower()
-            return classification if classification in ["add", "query"] else None
-        except KeyError:
-            return None
-    return None
-
-# Extract search term (category OR item) from user query using Llama-3
-def extract_query_term_with_llama(message):
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": "llama3-8b-8192",
-        "messages": [
-            {
-                "role": "system",
-                "content": """Extract the *expense category or item name* from the user's query.  
-                
-                - If the user asks *"How much did I spend on food?"*, return "food".  
-                - If they ask *"How much for a dustbin?"*, return "dustbin".  
-                - If no category/item is found, return "unknown".  
-                
-                Respond with *ONLY the extracted term* (no explanations)."""
-            },
-            {"role": "user", "content": message}
-        ]
-    }
-    response = requests.post(GROQ_URL, json=payload, headers=headers)
-
-    if response.status_code == 200:
-        try:
-            extracted_term = response.json()["choices"][0]["message"]["content"].strip().lower()
-            return extracted_term if extracted_term != "unknown" else None
-        except KeyError:
-            return None
-    return None
-
-#  Fetch filtered expenses (Checks Category + Description)
-def fetch_filtered_expenses(user_id, search_term):
-    expenses = []
-    transactions = []
-    search_term = search_term.replace('"', '').strip().lower()  
-
-    print(f"🔍 Searching for: '{search_term}'")  # Debugging log
-
-    with open(CSV_FILE, mode="r") as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            if row["user_id"] == user_id:
-                category = row["category"].strip().lower()
-                description = row["description"].strip().lower()
-                date = row["date"].strip().lower()
-                print(f"📂 Checking row - Category: '{category}', Description: '{description}', Date: '{date}'")  # Debugging log
-
-                # Match in either Category OR Description
-                if search_term in category or search_term in description or search_term in date:
-                    amount = float(row["amount"])
-                    expenses.append(amount)
-                    transactions.append({
-                        "amount": amount,
-                        "category": row["category"],
-                        "description": row["description"],
-                        "date": row["date"]
-                    })
-                    print(f"✅ Match found! Amount: {amount}")  # Debugging log
-
-    total_spent = sum(expenses)
-
-    if total_spent > 0:
-        response = f"You have spent a total of {total_spent} Rs on {search_term}.\nHere are your transactions:\n"
-        for txn in transactions:
-            response += f"- {txn['date']}: {txn['amount']} Rs ({txn['description']})\n"
-    else:
-        response = f"No expenses found for {search_term}."
-
-    print(f"📢 Response: {response}")  # Debugging log
-    return response
+        if not isinstance(data, dict):
+            return jsonify({"error": "Invalid payload"}), 400
 
+        message_text = data.get("Body", "")
+        user_id = data.get("From", "")
 
+        if not message_text or not user_id:
+            return jsonify({"error": "Missing Body or From"}), 400
 
-# Extract expense details
-def parse_expense_with_llama(message):
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": "llama3-8b-8192",
-        "messages": [
-            {"role": "system", "content": "Extract expense details from user input and return in JSON format with keys: amount, category, description, date."},
-            {"role": "user", "content": message}
-        ]
-    }
-    response = requests.post(GROQ_URL, json=payload, headers=headers)
+        # Twilio retries webhooks it thinks failed; skip MessageSids already accepted
+        message_sid = data.get("MessageSid")
+        if not deduplicator.first_delivery(message_sid):
+            return jsonify({"message": "Duplicate"}), 200
 
-    if response.status_code == 200:
-        try:
-            parsed_response = response.json()
-            extracted_text = parsed_response["choices"][0]["message"]["content"].strip()
+        # "To" is the tenant's number the message was sent to; a full queue answers 503 so Twilio retries later
+        tenant = tenant_for_twilio_number(data.get("To"))
+        if not work_queue.submit(tenant.id, user_id, message_text):
+            deduplicator.forget(message_sid)
+            return jsonify({"error": "Message queue is full"}), 503
+
+        return jsonify({"message": "Queued"}), 200
 
-            # Extract JSON using regex
-            json_match = re.search(r"{[\s\S]*}", extracted_text)
-            if json_match:
-                extracted_data = json.loads(json_match.group(0))
+    except Exception as e:
+        logger.exception("Unexpected Error: %s", e)
+        return jsonify({"error": str(e)}), 500
 
-                # Resolve relative dates
-                if "date" in extracted_data and extracted_data["date"]:
-                    extracted_data["date"] = resolve_relative_date(extracted_data["date"])
-                else:
-                    extracted_data["date"] = datetime.today().strftime("%Y-%m-%d")
 
-                return extracted_data
-        except (KeyError, json.JSONDecodeError):
-            return None
-        return None
+# Request count and latency per route, for request rates on /metrics
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
 
 
+@app.after_request
+def count_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    HTTP_REQUESTS.inc(app="flask", route=route, status=response.status_code)
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.get("started", time.perf_counter()), app="flask", route=route)
+    return response
 
-# Save expense to CSV
-def save_expense_to_csv(user_id, amount, category, description, date):
-    with open(CSV_FILE, mode="a", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow([user_id, amount, category, description, date])
 
-# Webhook to process WhatsApp messages
-from flask import request, jsonify
+# Prometheus scrape endpoint
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
 
-@app.route("/webhook", methods=["POST"])
-def webhook():
-    try:
-        print(f"Headers: {request.headers}")
-        print(f"Raw Data: {request.data}")
 
-        # Handle Twilio's form-urlencoded data
-        if request.content_type == "application/x-www-form-urlencoded":
-            data = request.form.to_dict()
-        else:
-            data = request.get_json()
+def debug_allowed():
+    return bool(PROFILER_TOKEN) and request.headers.get("Authorization") == f"Bearer {PROFILER_TOKEN}"
 
-        print(f"Parsed Data: {data}")
 
-        message_text = data.get("Body", "")
-        user_id = data.get("From", "")
+# Start the sampling profiler for up to `seconds` without restarting the app
+@app.route("/debug/profile/start", methods=["POST"])
+def start_profiler():
+    if not debug_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    if not profiler.start(request.args.get("seconds", type=float), request.args.get("interval_ms", type=float)):
+        return jsonify({"error": "Profiler is already running"}), 409
+    return jsonify(profiler.stats()), 200
 
-        print(f"Received Message: {message_text} from {user_id}")
 
-        request_type = classify_request_with_llama(message_text)
-        print(f"Request Type: {request_type}")
+@app.route("/debug/profile/stop", methods=["POST"])
+def stop_profiler():
+    if not debug_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    profiler.stop()
+    return jsonify(profiler.stats()), 200
 
-        if request_type == "add":
-            parsed_expense = parse_expense_with_llama(message_text)
-            print(f"Parsed Expense: {parsed_expense}")
 
-            if parsed_expense:
-                amount = parsed_expense.get("amount", 0)
-                category = parsed_expense.get("category", "Unknown")
-                description = parsed_expense.get("description", "")
-                date = parsed_expense.get("date", str(datetime.now().date()))
+# Collapsed stacks of the last profile, for flamegraph.pl or speedscope
+@app.route("/debug/profile", methods=["GET"])
+def profile():
+    if not debug_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    return Response(profiler.folded(), content_type="text/plain; charset=utf-8")
 
-                print(f"Amount: {amount}, Category: {category}, Description: {description}, Date: {date}")
 
-                try:
-                    save_expense_to_csv(user_id, amount, category, description, date)
-                    print("Expense saved successfully")
-                except Exception as e:
-                    print(f"Error saving expense: {e}")
-                    return jsonify({"error": "Failed to save expense"}), 500
+# Read or change the log level (e.g. DEBUG for a while to see payloads) without a redeploy
+@app.route("/debug/log-level", methods=["GET", "POST"])
+def log_level():
+    if not debug_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    if request.method == "POST":
+        try:
+            set_level(request.args.get("level", ""))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    return jsonify({"level": get_level()}), 200
 
-                try:
-                    send_whatsapp_message(recipient,"Expense added successfully ✅")
-                    print("WhatsApp message sent")
-                except Exception as e:
-                    print(f"Error sending WhatsApp message: {e}")
-                    return jsonify({"error": "Failed to send WhatsApp message"}), 500
 
-                return jsonify({"message": "Expense added"}), 200
+# Queue depth, in-flight count and queue lag
+@app.route("/stats/queue", methods=["GET"])
+def queue_stats():
+    return jsonify(work_queue.snapshot()), 200
 
-            else:
-                print("Failed to parse expense")
-                return jsonify({"message": "Could not extract expense details"}), 400
 
-        elif request_type == "query":
-            query_term = extract_query_term_with_llama(message_text)
-            print(f"Extracted Query Term: {query_term}")
-            
-            if query_term:
-                response_message = fetch_filtered_expenses(user_id, query_term)
+# Redelivered messages suppressed by the dedup cache
+@app.route("/stats/dedup", methods=["GET"])
+def dedup_stats():
+    return jsonify(deduplicator.stats()), 200
 
-                try:
-                    send_whatsapp_message(recipient,response_message)
-                    print("Query response sent")
-                except Exception as e:
-                    print(f"Error sending WhatsApp message: {e}")
-                    return jsonify({"error": "Failed to send WhatsApp message"}), 500
 
-                return jsonify({"message": response_message}), 200
+# Hit/miss counts of the Groq response cache
+@app.route("/stats/llm-cache", methods=["GET"])
+def llm_cache_stats():
+    return jsonify(llm_cache.stats()), 200
 
-            else:
-                return jsonify({"message": "Could not identify query term"}), 400
 
-        else:
-            send_whatsapp_message(recipient,"I am here to help you manage your expenses!\nPlease enter or query valid expense😊")
-            print("Could not classify request")
-            return jsonify({"message": "Could not classify request"}), 400
+# Conversation sessions held and how often follow-ups found one
+@app.route("/stats/sessions", methods=["GET"])
+def session_stats():
+    return jsonify(sessions.stats()), 200
 
-    except Exception as e:
-        print(f"Unexpected Error: {e}")
-        return jsonify({"error": str(e)}), 500
+
+# Budgets set and alerts sent
+@app.route("/stats/budgets", methods=["GET"])
+def budget_stats():
+    return jsonify({"budgets": get_budgets().stats()}), 200
+
+
+# Outbound sends, retries, drops, latency and circuit state per tenant
+@app.route("/stats/outbound", methods=["GET"])
+def outbound_stats():
+    with _tenant_lock:
+        dispatchers = dict(_dispatchers)
+    return jsonify({tenant_id: dispatcher.snapshot() for tenant_id, dispatcher in dispatchers.items()}), 200
 
 
 
@@ -0,0 +1,90 @@
+"""
+Compares answering "how much did I spend on X" by scanning the user's rows
+against the running per-user aggregates, then checks that the running totals
+still match a full recompute after a burst of individual adds.
+
+    python benchmarks/aggregates_totals.py --rows 200000 --users 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregates import SpendingAggregates, check_consistency  # noqa: E402
+from storage import SqliteExpenseStore  # noqa: E402
+
+CATEGORIES = ["food", "groceries", "transport", "books", "clothing", "entertainment", "bills", "health"]
+ITEMS = ["lunch", "dinner", "taxi", "tshirt", "novel", "movie", "electricity", "medicine", "coffee", "milk"]
+
+
+def synthetic_rows(count, users, seed=7):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield (
+            str(9000000000 + rng.randrange(users)),
+            rng.randrange(10, 5000),
+            rng.choice(CATEGORIES),
+            rng.choice(ITEMS),
+            f"2025-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+        )
+
+
+def scan_total(store, user_id, category):
+    return sum(row["amount_minor"] for row in store.search(user_id, category) if row["category"].lower() == category)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--adds", type=int, default=5_000, help="rows added one by one after the bulk load")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteExpenseStore(os.path.join(tmp, "expenses.db"))
+        store.add_many(synthetic_rows(args.rows, args.users))
+
+        aggregates = SpendingAggregates()
+        start = time.perf_counter()
+        aggregates.rebuild(store.iter_rows())
+        print(f"built aggregates over {args.rows} rows in {time.perf_counter() - start:.2f}s")
+        store.subscribe(aggregates.record)
+
+        start = time.perf_counter()
+        for user_id, amount, category, description, date in synthetic_rows(args.adds, args.users, seed=13):
+            store.add(user_id, amount, category, description, date)
+        print(f"added {args.adds} rows one by one in {time.perf_counter() - start:.2f}s")
+
+        rng = random.Random(11)
+        queries = [(str(9000000000 + rng.randrange(args.users)), rng.choice(CATEGORIES)) for _ in range(args.queries)]
+
+        start = time.perf_counter()
+        scanned = [scan_total(store, user_id, category) for user_id, category in queries]
+        scan_latency = (time.perf_counter() - start) / len(queries)
+
+        start = time.perf_counter()
+        looked_up = [(aggregates.category_total(user_id, category) or (0, 0))[0] for user_id, category in queries]
+        lookup_latency = (time.perf_counter() - start) / len(queries)
+
+        wrong = sum(1 for a, b in zip(scanned, looked_up) if a != b)
+        print(f"scan total    {scan_latency * 1000:>10.3f} ms/query")
+        print(f"aggregate     {lookup_latency * 1000:>10.4f} ms/query")
+        print(f"speedup       {scan_latency / lookup_latency:>10.0f}x")
+        print(f"answers that differ: {wrong}")
+
+        mismatches = check_consistency(aggregates, store.iter_rows())
+        print(f"consistency check: {len(mismatches)} mismatches")
+        for mismatch in mismatches[:10]:
+            print(f"  {mismatch}")
+        store.close()
+        if wrong or mismatches:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
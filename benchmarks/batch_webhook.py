@@ -0,0 +1,81 @@
+"""
+Throughput of batched Meta webhook deliveries against one message per webhook,
+through the FastAPI app with Groq and the Graph API replaced by local stubs.
+tests/test_batch_webhook.py checks that every message of a batch is processed
+in per-user order.
+
+    python benchmarks/batch_webhook.py --messages 400 --batch 20 --groq-latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("CSV_FILE", os.path.join(_tmp, "expenses.csv"))
+os.environ.setdefault("EXPENSE_DB", os.path.join(_tmp, "expenses.db"))
+os.environ.setdefault("SEARCH_INDEX_FILE", os.path.join(_tmp, "search_index.json"))
+
+import httpx  # noqa: E402
+
+import extractor  # noqa: E402
+import main  # noqa: E402
+import sendMessage  # noqa: E402
+from stubs import GraphStub, GroqStub, meta_payload  # noqa: E402
+
+MESSAGES = ["spent 200 on food yesterday", "how much on food", "paid 90 for breakfast", "spent 40 on chai"]
+
+
+def batched_payload(messages):
+    payload = meta_payload("0", "")
+    payload["entry"][0]["changes"][0]["value"]["messages"] = messages
+    return payload
+
+
+async def throughput(client, label, payloads, count):
+    start = time.perf_counter()
+    await asyncio.gather(*(client.post("/webhook", json=payload) for payload in payloads))
+    await main.work_queue.join()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {count / elapsed:>8.1f} msg/s  ({len(payloads)} webhooks)")
+
+
+async def run(args):
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app), httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+        rng = random.Random(5)
+        messages = [
+            meta_payload(str(9200000000 + rng.randrange(args.users)), rng.choice(MESSAGES), f"wamid.tp.{i}")
+            ["entry"][0]["changes"][0]["value"]["messages"][0]
+            for i in range(args.messages)
+        ]
+        single = [batched_payload([message]) for message in messages]
+        await throughput(client, "one/webhook", single, len(messages))
+
+        for message in messages:
+            message["id"] += ".b"
+        batches = [batched_payload(messages[i:i + args.batch]) for i in range(0, len(messages), args.batch)]
+        await throughput(client, f"{args.batch}/webhook", batches, len(messages))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--batch", type=int, default=20)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--groq-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with GroqStub(latency=args.groq_latency) as groq, GraphStub() as graph:
+        extractor.GROQ_URL = groq.completions_url
+        sendMessage.GRAPH_API_URL = graph.url
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,162 @@
+"""
+Cold start of a worker: how long a fresh interpreter takes to import each app,
+run its startup, and answer the first webhook, against local Groq, Graph API and
+Twilio stubs. Each run is a new process, so nothing is cached between them.
+
+Reported per app (median of --runs):
+
+  boot_ms         process spawn until the app module is imported
+  import_ms       the import of app.py / main.py alone
+  startup_ms      the FastAPI lifespan startup (Flask has none)
+  first_reply_ms  first webhook posted until its reply reached the stub
+  rss_mb          resident memory once the app is imported
+
+and which heavy optional libraries the import pulled in.
+
+    python benchmarks/cold_start.py --runs 7
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+
+# Libraries a worker should only load once it needs them
+HEAVY_MODULES = ("twilio.rest", "httpx", "requests", "pyarrow", "numpy", "dotenv")
+MESSAGE = "spent 200 on food"
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+# One POST through the ASGI app without an HTTP client library, so the harness
+# does not import httpx on the app's behalf
+async def asgi_post(app, path, body):
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    status = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+             "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+             "client": ("127.0.0.1", 1), "server": ("bot", 80)}
+    await app(scope, receive, send)
+    return status[0]
+
+
+def first_reply_fastapi(main):
+    async def run():
+        started = time.perf_counter()
+        async with main.lifespan(main.app):
+            ready = time.perf_counter()
+            payload = {"entry": [{"changes": [{"value": {"messages": [
+                {"id": "wamid.cold.1", "from": "919800000000", "type": "text", "text": {"body": MESSAGE}}]}}]}]}
+            status = await asgi_post(main.app, "/webhook", json.dumps(payload).encode())
+            await main.work_queue.join()
+            replied = time.perf_counter()
+        return status, ready - started, replied - ready
+
+    return asyncio.run(run())
+
+
+def first_reply_flask(app):
+    started = time.perf_counter()
+    form = {"From": "whatsapp:+919800000000", "To": "whatsapp:+14155238886", "Body": MESSAGE,
+            "MessageSid": "SMcold1"}
+    status = app.app.test_client().post("/webhook", data=form).status_code
+    app.work_queue.join()
+    return status, 0.0, time.perf_counter() - started
+
+
+# Runs in the child process
+def run_child(app_name, spawned_at):
+    imported_before = set(sys.modules)
+    started = time.perf_counter()
+    if app_name == "fastapi":
+        import main as module
+    else:
+        import app as module
+    import_seconds = time.perf_counter() - started
+    boot_seconds = time.time() - spawned_at
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules and name not in imported_before]
+    rss = rss_mb()
+
+    runner = first_reply_fastapi if app_name == "fastapi" else first_reply_flask
+    status, startup_seconds, reply_seconds = runner(module)
+    return {
+        "status": status,
+        "boot_ms": boot_seconds * 1000,
+        "import_ms": import_seconds * 1000,
+        "startup_ms": startup_seconds * 1000,
+        "first_reply_ms": reply_seconds * 1000,
+        "rss_mb": rss,
+        "heavy_modules": heavy,
+    }
+
+
+def run_once(app_name, env):
+    command = [sys.executable, os.path.abspath(__file__), "--child", app_name, "--spawned-at", repr(time.time())]
+    output = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    if output.returncode != 0:
+        sys.exit(f"{app_name} child failed:\n{output.stderr}")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", choices=["flask", "fastapi", "both"], default="both")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", choices=["flask", "fastapi"], help=argparse.SUPPRESS)
+    parser.add_argument("--spawned-at", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.spawned_at)))
+        return
+
+    from stubs import GraphStub, GroqStub, TwilioStub
+
+    tmp = tempfile.mkdtemp()
+    with GroqStub() as groq, GraphStub() as graph, TwilioStub() as twilio:
+        env = dict(os.environ, CSV_FILE=os.path.join(tmp, "expenses.csv"), EXPENSE_DB=os.path.join(tmp, "expenses.db"),
+                   SEARCH_INDEX_FILE=os.path.join(tmp, "search_index.json"), GROQ_URL=groq.completions_url,
+                   GRAPH_API_URL=graph.url, TWILIO_API_URL=twilio.url, LOG_LEVEL="WARNING",
+                   account_sid="AC" + "0" * 32, auth_token="stub-token")
+        apps = ["flask", "fastapi"] if args.app == "both" else [args.app]
+        for app_name in apps:
+            runs = [run_once(app_name, env) for _ in range(args.runs)]
+            sends = graph.requests + twilio.requests
+            graph.reset()
+            twilio.reset()
+            print(f"\n{app_name}: {args.runs} cold starts, {sends} replies sent")
+            for metric in ("boot_ms", "import_ms", "startup_ms", "first_reply_ms", "rss_mb"):
+                print(f"  {metric:<16}{median([run[metric] for run in runs]):>10.1f}")
+            print(f"  heavy imports   {', '.join(runs[0]['heavy_modules']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,155 @@
+"""
+Memory per row and latency of the analytical questions (top categories,
+monthly trend, average per day) on the columnar ledger (ledger.py) against the
+DictReader approach: a pass over expenses.csv with a dict per row for every
+question. Every columnar answer is checked against the pass, and a ledger built
+row by row through record() against one rebuilt in bulk.
+
+    python benchmarks/columnar_ledger.py --rows 500000 --users 1000
+"""
+import argparse
+import csv
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("FX_RATES_FILE", os.path.join(ROOT, "fx_rates.json"))
+
+from dates import resolve_period  # noqa: E402
+from ledger import ColumnarLedger  # noqa: E402
+from storage import EXPENSE_FIELDS, CsvExpenseStore  # noqa: E402
+
+CATEGORIES = ["food", "groceries", "transport", "books", "clothing", "entertainment", "bills", "health"]
+TODAY = date(2026, 10, 17)
+
+
+def write_ledger(path, rows, users, seed=7):
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(EXPENSE_FIELDS)
+        for _ in range(rows):
+            day = TODAY - timedelta(days=rng.randrange(400))
+            amount = f"{rng.randrange(100, 50000) / 100:.2f} USD" if rng.random() < 0.1 else str(rng.randrange(10, 5000))
+            writer.writerow([str(9000000000 + rng.randrange(users)), amount, rng.choice(CATEGORIES), "item",
+                             day.isoformat()])
+
+
+# The DictReader approach: one pass over the file per question
+def scan_categories(store, user_id, start, end):
+    totals = defaultdict(lambda: [0, 0])
+    for row in store.iter_rows():
+        if row["user_id"] == user_id and start <= row["date"] <= end:
+            entry = totals[row["category"].strip().lower()]
+            entry[0] += row["amount_minor"]
+            entry[1] += 1
+    return sorted(((category, total, count) for category, (total, count) in totals.items()),
+                  key=lambda item: (-item[1], item[0]))
+
+
+def scan_months(store, user_id, start, end):
+    totals = defaultdict(lambda: [0, 0])
+    for row in store.iter_rows():
+        if row["user_id"] == user_id and start <= row["date"] <= end:
+            entry = totals[row["date"][:7]]
+            entry[0] += row["amount_minor"]
+            entry[1] += 1
+    return {month: tuple(entry) for month, entry in totals.items()}
+
+
+def scan_total(store, user_id, start, end):
+    rows = [row["amount_minor"] for row in store.iter_rows() if row["user_id"] == user_id and start <= row["date"] <= end]
+    return sum(rows), len(rows)
+
+
+def timed(func, *args):
+    began = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - began
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--queries", type=int, default=200, help="questions of each kind on the columnar ledger")
+    parser.add_argument("--scan-queries", type=int, default=3, help="questions of each kind answered by a pass")
+    args = parser.parse_args()
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "expenses.csv")
+        write_ledger(path, args.rows, args.users)
+        store = CsvExpenseStore(path)
+
+        gc.collect()
+        tracemalloc.start()
+        began = time.perf_counter()
+        rows = list(store.iter_rows())
+        load_seconds = time.perf_counter() - began
+        dict_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        gc.collect()
+        tracemalloc.start()
+        ledger = ColumnarLedger()
+        began = time.perf_counter()
+        ledger.rebuild(rows)
+        build_seconds = time.perf_counter() - began
+        column_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        print(f"{args.rows:,} rows for {args.users:,} users")
+        print(f"dicts         {dict_bytes / args.rows:>8.0f} bytes/row  (read in {load_seconds:.1f}s)")
+        print(f"columnar      {column_bytes / args.rows:>8.1f} bytes/row  (built in {build_seconds:.2f}s from those rows; "
+              f"columns {ledger.nbytes() / args.rows:.1f} bytes/row at capacity)")
+
+        incremental = ColumnarLedger(capacity=1)
+        for row in rows:
+            incremental.record(row)
+        same = all((getattr(incremental, name)[:len(rows)] == getattr(ledger, name)[:len(rows)]).all()
+                   for name in ("users", "categories", "amounts", "days"))
+        failures += not same
+        print(f"{'ok  ' if same else 'FAIL'} appending row by row gives the same columns as a rebuild")
+        del rows
+
+        rng = random.Random(5)
+        users = [str(9000000000 + rng.randrange(args.users)) for _ in range(args.queries)]
+        month = resolve_period("last month", today=TODAY)
+        half_year = resolve_period("last 6 months", today=TODAY)
+        questions = [
+            ("top categories last month", lambda user: ledger.category_totals(user, *month),
+             lambda user: scan_categories(store, user, *month)),
+            ("monthly trend, 6 months", lambda user: {first[:7]: (total, count) for first, total, count
+                                                     in ledger.bucket_totals(user, "month", *half_year) if count},
+             lambda user: scan_months(store, user, *half_year)),
+            ("average per day last month", lambda user: ledger.total(user, *month),
+             lambda user: scan_total(store, user, *month)),
+        ]
+        print(f"\n{'question':<28} {'DictReader':>12} {'columnar':>10} {'speedup':>8}")
+        for name, columnar, scan in questions:
+            began = time.perf_counter()
+            answers = [columnar(user) for user in users]
+            columnar_ms = (time.perf_counter() - began) / len(users) * 1000
+            scanned = [timed(scan, user) for user in users[:args.scan_queries]]
+            scan_ms = sum(seconds for _, seconds in scanned) / len(scanned) * 1000
+            wrong = sum(1 for (result, _), answer in zip(scanned, answers) if result != answer)
+            failures += wrong
+            print(f"{name:<28} {scan_ms:>9.1f} ms {columnar_ms:>7.3f} ms {scan_ms / columnar_ms:>7.0f}x"
+                  f"{f'  {wrong} answers differ' if wrong else ''}")
+        store.close()
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
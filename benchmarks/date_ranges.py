@@ -0,0 +1,95 @@
+"""
+Range-query latency ("last month", "between X and Y") as one user's history
+grows: a filter over every row against the per-user DateIndex and the SQLite
+(user_id, date) index. Every answer is checked against the filter.
+
+    python benchmarks/date_ranges.py --sizes 1000 10000 100000 --users 100
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dateindex import DateIndex  # noqa: E402
+from dates import resolve_period  # noqa: E402
+from storage import SqliteExpenseStore, make_row  # noqa: E402
+
+CATEGORIES = ["food", "groceries", "transport", "books", "clothing", "entertainment", "bills", "health"]
+TODAY = date(2025, 3, 12)
+PERIODS = ["last week", "this month", "last month", "last 7 days", "between 1 jan and 15 jan", "yesterday"]
+
+
+# Rows for `users` users over the `days` days up to TODAY, deliberately unsorted by date
+def synthetic_rows(count, users, days, seed=7):
+    rng = random.Random(seed)
+    for _ in range(count):
+        day = TODAY - timedelta(days=rng.randrange(days))
+        yield (
+            str(9000000000 + rng.randrange(users)),
+            rng.randrange(10, 5000),
+            rng.choice(CATEGORIES),
+            "",
+            f"{day.year}-{day.month}-{day.day}",
+        )
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--days", type=int, default=730, help="history length in days")
+    args = parser.parse_args()
+
+    periods = [resolve_period(period, TODAY) for period in PERIODS]
+    user_id = "9000000000"
+    wrong = 0
+    print(f"{'rows':>10} {'per user':>9} {'scan ms':>10} {'index ms':>10} {'sqlite ms':>10}")
+
+    for size in args.sizes:
+        raw = list(synthetic_rows(size, args.users, args.days))
+        rows = [make_row(i, *values) for i, values in enumerate(raw, start=1)]
+        index = DateIndex(rows)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = SqliteExpenseStore(os.path.join(tmp, "expenses.db"))
+            store.add_many(raw)
+
+            scan = index_time = sqlite_time = 0.0
+            for start, end in periods:
+                elapsed, expected = timed(
+                    lambda: [row for row in rows if row["user_id"] == user_id and start <= row["date"] <= end], 3)
+                scan += elapsed
+                elapsed, found = timed(lambda: index.range(user_id, start, end), 200)
+                index_time += elapsed
+                elapsed, stored = timed(lambda: store.date_range(user_id, start, end), 50)
+                sqlite_time += elapsed
+
+                expected_ids = sorted(row["id"] for row in expected)
+                if sorted(row["id"] for row in found) != expected_ids or sorted(row["id"] for row in stored) != expected_ids:
+                    wrong += 1
+            store.close()
+
+        per_user = len(index.range(user_id, "0000-00-00", "9999-99-99"))
+        count = len(periods)
+        print(f"{size:>10} {per_user:>9} {scan / count * 1000:>10.3f} "
+              f"{index_time / count * 1000:>10.4f} {sqlite_time / count * 1000:>10.4f}")
+
+    print(f"ranges that disagree with the full filter: {wrong}")
+    if wrong:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Times building the weekly digests for every user in one pass over the ledger
+(digests.build_digests), against looking each user up on their own, and what
+the incremental budget checks add to each saved expense.
+
+The ledger is a SQLite store with --users users and --rows-per-user expenses
+each over the last five weeks; --budget-share of the users have a budget. The
+per-user path is timed on a sample of users, extrapolated, and its digests
+checked against the one-pass ones. Finally DigestScheduler.run_once() builds
+and "sends" every digest to a counting stub of send_message.
+
+    python benchmarks/digest_build.py --users 100000 --rows-per-user 8
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("EXPENSE_STORE", "sqlite")
+os.environ.setdefault("EXPENSE_DB", os.path.join(_tmp, "expenses.db"))
+os.environ.setdefault("CSV_FILE", os.path.join(_tmp, "expenses.csv"))
+os.environ.setdefault("BUDGETS_FILE", os.path.join(_tmp, "budgets.json"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("PHONE_NUMBER_ID", "bench-phone")  # digests only go to users of a Meta number
+
+from aggregates import category_key  # noqa: E402
+from budgets import get_budgets, status_line  # noqa: E402
+from digests import DigestScheduler, build_digests, digest_text, digest_window  # noqa: E402
+from storage import get_store  # noqa: E402
+
+CATEGORIES = ["food", "groceries", "transport", "books", "clothing", "entertainment", "bills", "health"]
+
+
+def user_id(number):
+    return str(9000000000 + number)
+
+
+def synthetic_rows(users, per_user, today, seed=3):
+    rng = random.Random(seed)
+    for number in range(users):
+        for _ in range(per_user):
+            day = today - timedelta(days=rng.randrange(35))
+            yield user_id(number), rng.randrange(10, 2000), rng.choice(CATEGORIES), "item", day.isoformat()
+
+
+# The digest of one user from their own date-range queries
+def per_user_digest(store, user, period, start, end, budgets, today):
+    rows = store.date_range(user, start, end)
+    if not rows:
+        return None
+    categories = {}
+    for row in rows:
+        key = category_key(row["category"])
+        categories[key] = categories.get(key, 0) + row["amount_minor"]
+    budget_lines = []
+    for category in sorted(budgets.for_user(user)):
+        budget_lines.append(status_line(category, *budgets.spent(user, category, today)))
+    return digest_text(period, start, end, sum(row["amount_minor"] for row in rows), len(rows), categories, budget_lines)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--rows-per-user", type=int, default=8)
+    parser.add_argument("--budget-share", type=float, default=0.1, help="fraction of users with a food budget")
+    parser.add_argument("--sample", type=int, default=2_000, help="users timed on the per-user path")
+    parser.add_argument("--adds", type=int, default=2_000, help="expenses saved to time the budget checks")
+    args = parser.parse_args()
+
+    today = date.today()
+    start, end, _ = digest_window("weekly", today)
+    store = get_store()
+    began = time.perf_counter()
+    store.add_many(synthetic_rows(args.users, args.rows_per_user, today))
+    total_rows = store.count()
+    print(f"ledger: {total_rows} rows for {args.users} users, loaded in {time.perf_counter() - began:.1f}s")
+
+    budgets = get_budgets()
+    rng = random.Random(5)
+    with_budget = rng.sample(range(args.users), int(args.users * args.budget_share))
+    budgets.path = None  # saved once below rather than on every set
+    began = time.perf_counter()
+    for number in with_budget:
+        budgets.set(user_id(number), "food", rng.choice([2000, 5000, 8000]), rng.choice(["week", "month"]))
+    print(f"budgets: {len(with_budget)} set in {time.perf_counter() - began:.1f}s")
+
+    began = time.perf_counter()
+    scanned = sum(1 for _ in store.iter_rows())
+    scan_seconds = time.perf_counter() - began
+
+    began = time.perf_counter()
+    whole = build_digests(store.iter_rows(), "weekly", start, end, budgets, today)
+    whole_ledger = time.perf_counter() - began
+
+    began = time.perf_counter()
+    digests = build_digests(store.iter_date_range(start, end), "weekly", start, end, budgets, today)
+    one_pass = time.perf_counter() - began
+    print(f"\none pass      {one_pass:>8.2f}s for {len(digests)} digests, reading {start}..{end} "
+          f"through the date index")
+    print(f"whole ledger  {whole_ledger:>8.2f}s the same pass over all {scanned} rows "
+          f"(reading them alone takes {scan_seconds:.2f}s)")
+
+    sample = [user_id(number) for number in rng.sample(range(args.users), min(args.sample, args.users))]
+    began = time.perf_counter()
+    per_user = {user: per_user_digest(store, user, "weekly", start, end, budgets, today) for user in sample}
+    per_user_seconds = (time.perf_counter() - began) / len(sample) * args.users
+    different = sum(1 for user in sample if per_user[user] != digests.get(user))
+    print(f"per user      {per_user_seconds:>8.2f}s extrapolated from {len(sample)} users "
+          f"({per_user_seconds / one_pass:.1f}x the one pass); {different} sampled digests differ")
+
+    # Budget checks on save: a dictionary miss for most users, a date-range read for the rest
+    adds = [(user_id(rng.randrange(args.users)), rng.randrange(10, 500), rng.choice(CATEGORIES), "item",
+             today.isoformat()) for _ in range(args.adds)]
+    row = {"id": 0, "user_id": None, "amount": 0.0, "currency": "INR", "amount_minor": 0, "category": "food",
+           "description": "", "date": today.isoformat()}
+    began = time.perf_counter()
+    for user, amount, category, description, day in adds:
+        budgets.record(dict(row, user_id=user, amount=float(amount), amount_minor=amount * 100, category=category))
+    check_us = (time.perf_counter() - began) / len(adds) * 1e6
+    print(f"\nbudget check  {check_us:>8.1f} us per saved expense "
+          f"(rescanning the ledger instead: {scan_seconds * 1000:,.0f} ms); {budgets.stats()['alerts_sent']} alerts")
+
+    sent = []
+
+    async def send(text, to=None, tenant=None):
+        sent.append(to)
+
+    scheduler = DigestScheduler(send, period="weekly", state_file=os.path.join(_tmp, "digests.json"))
+    began = time.perf_counter()
+    count = asyncio.run(scheduler.run_once(today))
+    print(f"run_once      {time.perf_counter() - began:>8.2f}s to build and hand over {count} digests "
+          f"(build {scheduler.last_build_seconds:.2f}s)")
+    again = asyncio.run(scheduler.run_once(today))
+    print(f"second run    {'skipped, period already claimed' if again is None else f'sent {again} again'}")
+
+    if different or whole != digests or again is not None or count != len(digests):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,81 @@
+"""
+Peak memory and throughput of the streaming exports for one user with a long
+history, and the cost of building a chat reply with `response +=` against
+summary_pages().
+
+    python benchmarks/export_stream.py --rows 500000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reports import EXPORTERS, PARQUET_AVAILABLE, summary_pages, transaction_line  # noqa: E402
+from storage import SqliteExpenseStore  # noqa: E402
+
+CATEGORIES = ["food", "groceries", "transport", "books", "clothing", "entertainment", "bills", "health"]
+ITEMS = ["lunch", "dinner", "taxi", "tshirt", "novel", "movie", "electricity", "medicine", "coffee", "milk"]
+USER_ID = "9000000000"
+
+
+def synthetic_rows(count, seed=7):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield (USER_ID, rng.randrange(10, 5000), rng.choice(CATEGORIES), rng.choice(ITEMS),
+               f"{rng.randrange(2015, 2026)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}")
+
+
+def concatenated_reply(transactions):
+    response = "Here are your transactions:\n"
+    for txn in transactions:
+        response += transaction_line(txn) + "\n"
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=500_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteExpenseStore(os.path.join(tmp, "expenses.db"))
+        store.add_many(synthetic_rows(args.rows))
+
+        print(f"{'format':>8} {'seconds':>8} {'rows/s':>10} {'MiB out':>8} {'peak MiB':>9}")
+        for name, (exporter, _) in EXPORTERS.items():
+            if name == "parquet" and not PARQUET_AVAILABLE:
+                print(f"{name:>8}  skipped (pyarrow not installed)")
+                continue
+            start = time.perf_counter()
+            size = sum(len(chunk) for chunk in exporter(store.iter_user_rows(USER_ID)))
+            elapsed = time.perf_counter() - start
+            # Second pass for memory: tracing slows the export down too much to time it
+            tracemalloc.start()
+            for _ in exporter(store.iter_user_rows(USER_ID)):
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:>8} {elapsed:>8.2f} {args.rows / elapsed:>10.0f} {size / 2**20:>8.1f} {peak / 2**20:>9.1f}")
+
+        transactions = list(store.iter_user_rows(USER_ID))
+        store.close()
+
+    for count in (1_000, 10_000, len(transactions)):
+        subset = transactions[:count]
+        start = time.perf_counter()
+        reply = concatenated_reply(subset)
+        concatenated = time.perf_counter() - start
+        start = time.perf_counter()
+        pages = summary_pages("Here are your transactions:", (transaction_line(txn) for txn in subset), count)
+        paged = time.perf_counter() - start
+        print(f"{count:>8} transactions: += reply {concatenated * 1000:8.1f} ms ({len(reply)} chars), "
+              f"summary_pages {paged * 1000:6.2f} ms ({len(pages)} pages, max {max(map(len, pages))} chars)")
+
+
+if __name__ == "__main__":
+    main()
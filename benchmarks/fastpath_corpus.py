@@ -0,0 +1,60 @@
+"""
+Per-message latency over a corpus of sample messages with the rule-based fast
+path on and off, against a local Groq stub. Also reports the fast-path hit rate.
+
+    python benchmarks/fastpath_corpus.py --latency 0.05
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine  # noqa: E402
+import extractor  # noqa: E402
+import fastpath  # noqa: E402
+from stubs import GroqStub  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "messages.txt")
+
+
+def run(label, messages, stub, rounds):
+    stub.reset()
+    timings = []
+    for _ in range(rounds):
+        for message in messages:
+            start = time.perf_counter()
+            engine.interpret_message(message)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(
+        f"{label:<14} mean {statistics.mean(timings) * 1000:>8.2f} ms  "
+        f"p95 {p95 * 1000:>8.2f} ms  {stub.requests / len(timings):.2f} LLM calls/msg"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub latency per call in seconds")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(CORPUS) as file:
+        messages = [line.strip() for line in file if line.strip()]
+
+    with GroqStub(latency=args.latency) as stub:
+        extractor.GROQ_URL = stub.completions_url
+
+        fastpath.FASTPATH_ENABLED = False
+        run("fast path off", messages, stub, args.rounds)
+
+        fastpath.FASTPATH_ENABLED = True
+        run("fast path on", messages, stub, args.rounds)
+        print(f"fast-path hit rate: {fastpath.fastpath_hit_rate():.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Plays short conversations with follow-ups ("make that 300", "and last week?",
+"delete that") through engine.interpret_message and handle_message, against a
+local Groq stub, and counts the Groq calls the follow-ups cost with sessions
+and without (every message interpreted on its own), then times an edit of the
+latest expense on a store of --rows rows. tests/test_follow_ups.py checks that
+the edits and deletes reach the ledger and every structure derived from it.
+
+    python benchmarks/follow_ups.py --store csv --users 50 --rows 200000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+TMP = tempfile.mkdtemp(prefix="follow-ups-")
+os.environ.setdefault("FX_RATES_FILE", os.path.join(ROOT, "fx_rates.json"))
+os.environ["CSV_FILE"] = os.path.join(TMP, "expenses.csv")
+os.environ["EXPENSE_DB"] = os.path.join(TMP, "expenses.db")
+os.environ["BUDGETS_FILE"] = os.path.join(TMP, "budgets.json")
+os.environ["SEARCH_INDEX_FILE"] = ""
+os.environ["LLM_CACHE_ENABLED"] = "0"
+if "--store" in sys.argv:
+    os.environ["EXPENSE_STORE"] = sys.argv[sys.argv.index("--store") + 1]
+
+import engine  # noqa: E402
+import extractor  # noqa: E402
+from aggregates import get_aggregates  # noqa: E402
+from ledger import get_ledger  # noqa: E402
+from searchindex import get_search_index  # noqa: E402
+from sessions import SessionStore, sessions  # noqa: E402
+from groupcommit import encode_rows  # noqa: E402
+from storage import EXPENSE_FIELDS, CsvExpenseStore, SqliteExpenseStore  # noqa: E402
+from stubs import GroqStub  # noqa: E402
+
+# (message, is a follow-up)
+CONVERSATION = [
+    ("set groceries budget to 250", False),
+    ("spent 200 on food yesterday", False),
+    ("make that 300", True),
+    ("it was for groceries", True),
+    ("how much did I spend on groceries?", False),
+    ("and last week?", True),
+    ("what about food?", True),
+    ("paid 120 for taxi today", False),
+    ("delete that", True),
+    ("top categories this month", False),
+    ("how about last month?", True),
+]
+
+
+# Groq calls made while interpreting the follow-ups, with each user's session or without
+def converse(users, stub, with_sessions):
+    calls = 0
+    for user in users:
+        for message, follow_up in CONVERSATION:
+            before = stub.requests
+            request_type, details = engine.interpret_message(message, user if with_sessions else None)
+            if follow_up:
+                calls += stub.requests - before
+            if with_sessions:
+                engine.handle_message(user, request_type, details)
+    return calls
+
+
+# A store of `rows` rows over 500 users, loaded in bulk
+def loaded_store(backend, directory, rows):
+    values = [(str(8000000000 + number % 500), str(number % 900 + 1), "food", f"item {number}", "2026-10-01")
+              for number in range(rows)]
+    if backend == "csv":
+        path = os.path.join(directory, "edits.csv")
+        with open(path, "wb") as file:
+            file.write(encode_rows([EXPENSE_FIELDS] + values))
+        return CsvExpenseStore(path)
+    store = SqliteExpenseStore(os.path.join(directory, "edits.db"))
+    store.add_many(values)
+    return store
+
+
+# Seconds per (find the user's latest expense, edit it) and per edit of a known row id, as a session has it
+def time_edits(store, rows, edits):
+    user = str(8000000000 + (rows - 1) % 500)
+    store.count()
+    began = time.perf_counter()
+    for number in range(edits):
+        store.update(user, store.last_row(user)["id"], amount=str(number + 1))
+    latest = (time.perf_counter() - began) / edits
+    row_id = store.last_row(user)["id"]
+    began = time.perf_counter()
+    for number in range(edits):
+        store.update(user, row_id, amount=str(number + 1))
+    return latest, (time.perf_counter() - began) / edits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=200_000, help="rows in the store the edit is timed on")
+    parser.add_argument("--edits", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub latency per Groq call in seconds")
+    args = parser.parse_args()
+    users = [str(9000000000 + number) for number in range(args.users)]
+
+    # Built before the conversations so the timings include keeping them current
+    get_aggregates(), get_search_index(), get_ledger()
+    with GroqStub(latency=args.latency) as stub:
+        extractor.GROQ_URL = stub.completions_url
+        follow_ups = sum(follow_up for _, follow_up in CONVERSATION) * len(users)
+        began = time.perf_counter()
+        stateless_calls = converse(users, stub, with_sessions=False)
+        stateless_seconds = time.perf_counter() - began
+        began = time.perf_counter()
+        session_calls = converse(users, stub, with_sessions=True)
+        session_seconds = time.perf_counter() - began
+
+    print(f"{follow_ups} follow-ups over {len(users)} users, {args.store} store")
+    print(f"stateless     {stateless_calls / follow_ups:>5.2f} Groq calls per follow-up "
+          f"({stateless_seconds / len(users) * 1000:.1f} ms per conversation, interpret only)")
+    print(f"sessions      {session_calls / follow_ups:>5.2f} Groq calls per follow-up "
+          f"({session_seconds / len(users) * 1000:.1f} ms per conversation, interpret + handle)")
+
+    session_store = SessionStore(maxsize=1000, ttl=60)
+    began = time.perf_counter()
+    for number in range(100_000):
+        session_store.update(str(number % 5000), intent="query", filter="food")
+        session_store.get(str(number % 5000))
+    print(f"\nsession get + update   {(time.perf_counter() - began) / 100_000 * 1e6:.2f} us "
+          f"(LRU of 1000 for 5000 users: {session_store.stats()['evictions']} evictions)")
+    print(f"sessions held          {sessions.stats()['sessions']}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        timing_store = loaded_store(args.store, tmp, args.rows)
+        latest, known = time_edits(timing_store, args.rows, args.edits)
+        timing_store.close()
+    print(f"edit latest expense    {latest * 1000:.2f} ms on {args.rows:,} rows (looked up, no session)")
+    print(f"edit session expense   {known * 1000:.2f} ms (row id from the session)")
+
+
+if __name__ == "__main__":
+    main()
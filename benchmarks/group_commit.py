@@ -0,0 +1,72 @@
+"""
+Adds per second for the CSV ledger at 1, 8 and 32 concurrent writers: one
+open/append/fsync/close per row (the old path, made durable) against the
+group-commit writer. Crash recovery (several processes, a killed writer, a
+torn last row) is covered by tests/test_group_commit.py.
+
+    python benchmarks/group_commit.py --rows 2000
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import EXPENSE_FIELDS, CsvExpenseStore  # noqa: E402
+
+
+def per_row_add(path, values, lock):
+    with lock:
+        with open(path, mode="a", newline="") as file:
+            csv.writer(file).writerow(values)
+            file.flush()
+            os.fsync(file.fileno())
+
+
+def run_writers(add, writers, rows):
+    per_writer = rows // writers
+
+    def work(writer):
+        for i in range(per_writer):
+            add([f"9{writer:09d}", i + 1, "food", "lunch", "2025-02-10"])
+
+    threads = [threading.Thread(target=work, args=(w,)) for w in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return per_writer * writers / (time.perf_counter() - start)
+
+
+def throughput(rows, tmp):
+    print(f"{'writers':>8} {'per-row fsync/s':>16} {'group commit/s':>15} {'avg batch':>10}")
+    for writers in (1, 8, 32):
+        path = os.path.join(tmp, f"per_row_{writers}.csv")
+        with open(path, "w", newline="") as file:
+            csv.writer(file).writerow(EXPENSE_FIELDS)
+        lock = threading.Lock()
+        old = run_writers(lambda values: per_row_add(path, values, lock), writers, rows)
+
+        store = CsvExpenseStore(os.path.join(tmp, f"group_{writers}.csv"))
+        new = run_writers(lambda values: store.add(*values), writers, rows)
+        batch = store._writer.stats()["avg_batch_size"]
+        store.close()
+        print(f"{writers:>8} {old:>16.0f} {new:>15.0f} {batch:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000, help="rows per throughput run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        throughput(args.rows, tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Latency/throughput tradeoff of micro-batched extraction: sends a stream of
+messages through engine.interpret_message_async for several batch windows against a
+local Groq stub, and reports Groq requests, per-message latency and throughput.
+
+    python benchmarks/llm_batching.py --messages 400 --rate 200 --windows 0,5,20,50,100
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine  # noqa: E402
+import extractor  # noqa: E402
+import fastpath  # noqa: E402
+import llmbatch  # noqa: E402
+import llmcache  # noqa: E402
+from httpclients import close_http_clients  # noqa: E402
+from stubs import GroqStub  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "messages.txt")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_window(window_ms, messages, args, stub):
+    llmbatch.batch_scheduler = llmbatch.BatchScheduler(window_ms=window_ms, max_batch=args.max_batch)
+    stub.reset()
+    rng = random.Random(9)
+    latencies = []
+
+    async def one(message):
+        start = time.perf_counter()
+        await engine.interpret_message_async(message)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    tasks = []
+    for message in messages:
+        tasks.append(asyncio.create_task(one(message)))
+        await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    label = "off" if window_ms == 0 else f"{window_ms:g} ms"
+    print(
+        f"window {label:<8} groq requests {stub.requests:>5}  "
+        f"p50 {percentile(latencies, 50) * 1000:>7.1f} ms  p95 {percentile(latencies, 95) * 1000:>7.1f} ms  "
+        f"{len(messages) / elapsed:>7.1f} msg/s"
+    )
+
+
+async def run(args, stub):
+    with open(CORPUS) as file:
+        corpus = [line.strip() for line in file if line.strip()]
+    rng = random.Random(4)
+    # Unique suffixes keep the response cache and fast path out of the measurement
+    messages = [f"{rng.choice(corpus)} #{i}" for i in range(args.messages)]
+    for window in args.windows:
+        await run_window(window, messages, args, stub)
+    await close_http_clients()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=200, help="mean arrivals per second")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub latency per Groq request")
+    parser.add_argument("--windows", type=lambda v: [float(x) for x in v.split(",")], default=[0, 5, 20, 50, 100])
+    args = parser.parse_args()
+
+    fastpath.FASTPATH_ENABLED = False
+    llmcache.llm_cache.enabled = False
+    with GroqStub(latency=args.latency) as stub:
+        extractor.GROQ_URL = stub.completions_url
+        asyncio.run(run(args, stub))
+
+
+if __name__ == "__main__":
+    main_cli()
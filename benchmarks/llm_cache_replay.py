@@ -0,0 +1,71 @@
+"""
+Replays a message log with near-duplicate variants ("How much on food?",
+"how much on food") through engine.interpret_message with the Groq response cache
+off and on, against a local Groq stub. The fast path is disabled so every
+message would otherwise reach the LLM.
+
+    python benchmarks/llm_cache_replay.py --latency 0.05 --replays 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine  # noqa: E402
+import extractor  # noqa: E402
+import fastpath  # noqa: E402
+import llmcache  # noqa: E402
+from stubs import GroqStub  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "messages.txt")
+
+
+def variants(message):
+    return [message, message.upper(), message.capitalize() + "?", f"  {message}  ", message + "!!"]
+
+
+def replay(label, log, stub):
+    stub.reset()
+    start = time.perf_counter()
+    for message in log:
+        engine.interpret_message(message)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {elapsed / len(log) * 1000:>8.2f} ms/msg  {stub.requests / len(log):.2f} Groq calls/msg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--replays", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(CORPUS) as file:
+        messages = [line.strip() for line in file if line.strip()]
+    rng = random.Random(1)
+    log = [rng.choice(variants(message)) for _ in range(args.replays) for message in messages]
+    rng.shuffle(log)
+
+    fastpath.FASTPATH_ENABLED = False
+    with GroqStub(latency=args.latency) as stub, tempfile.TemporaryDirectory() as tmp:
+        extractor.GROQ_URL = stub.completions_url
+
+        llmcache.llm_cache.enabled = False
+        replay("cache off", log, stub)
+
+        db_path = os.path.join(tmp, "llm_cache.db")
+        llmcache.llm_cache = llmcache.LLMCache(db_path=db_path)
+        replay("cache on", log, stub)
+        print(f"stats      {llmcache.llm_cache.stats()}")
+
+        # A fresh process starts with an empty memory cache but finds entries on disk
+        llmcache.llm_cache = llmcache.LLMCache(db_path=db_path)
+        replay("restarted", log, stub)
+        print(f"stats      {llmcache.llm_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Counts Groq round-trips and wall time per message for the single-pass extractor
+versus the old classify + parse/extract path, against a local Groq stub.
+
+    python benchmarks/llm_roundtrips.py --latency 0.05
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine  # noqa: E402
+import extractor  # noqa: E402
+from stubs import GroqStub  # noqa: E402
+
+MESSAGES = [
+    "spent 200 on food yesterday",
+    "I spent 100 on lunch",
+    "Bought groceries for 500",
+    "paid 350 on dinner today",
+    "how much did I spend on food?",
+    "how much on books",
+    "show my transactions on clothing",
+    "hello there",
+]
+
+
+def legacy_path(message):
+    request_type = engine.classify_request(message)
+    if request_type == "add":
+        return request_type, engine.parse_expense(message)
+    if request_type == "query":
+        return request_type, engine.extract_query_term(message)
+    return None, None
+
+
+def run(label, handler, stub, rounds):
+    stub.reset()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in MESSAGES:
+            handler(message)
+    elapsed = time.perf_counter() - start
+    count = rounds * len(MESSAGES)
+    print(f"{label:<12} {stub.requests / count:>6.2f} calls/msg {elapsed / count * 1000:>9.2f} ms/msg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub latency per call in seconds")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    with GroqStub(latency=args.latency) as stub:
+        extractor.GROQ_URL = stub.completions_url
+        run("multi-call", legacy_path, stub, args.rounds)
+        run("single-pass", engine.interpret_message, stub, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Fires N concurrent Meta webhooks at the FastAPI app in main.py, with Groq and the
+Graph API replaced by local stubs, and reports throughput and tail latency of the
+webhook acknowledgements as well as the time until the work queue has drained.
+
+    python benchmarks/load_test.py --requests 500 --concurrency 50 --groq-latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("CSV_FILE", os.path.join(_tmp, "expenses.csv"))
+os.environ.setdefault("EXPENSE_DB", os.path.join(_tmp, "expenses.db"))
+os.environ.setdefault("SEARCH_INDEX_FILE", os.path.join(_tmp, "search_index.json"))
+
+import httpx  # noqa: E402
+
+import extractor  # noqa: E402
+import main  # noqa: E402
+import sendMessage  # noqa: E402
+from stubs import GraphStub, GroqStub, meta_payload  # noqa: E402
+
+MESSAGES = [
+    "spent 200 on food yesterday",
+    "I spent 120 on a new phone cover",
+    "how much on food",
+    "paid 90 for breakfast",
+    "what's the total I spent on phone cover",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def fire(client, payload, latencies, statuses):
+    start = time.perf_counter()
+    response = await client.post("/webhook", json=payload)
+    latencies.append(time.perf_counter() - start)
+    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+
+async def run(args):
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app), httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+        rng = random.Random(3)
+        payloads = [
+            meta_payload(str(9100000000 + rng.randrange(args.users)), rng.choice(MESSAGES), f"wamid.load.{i}")
+            for i in range(args.requests)
+        ]
+        latencies, statuses = [], {}
+        gate = asyncio.Semaphore(args.concurrency)
+
+        async def bounded(payload):
+            async with gate:
+                await fire(client, payload, latencies, statuses)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(bounded(payload) for payload in payloads))
+        elapsed = time.perf_counter() - start
+        await main.work_queue.join()
+        drained = time.perf_counter() - start
+        queue = main.work_queue.snapshot()
+
+    print(f"requests     {args.requests} (concurrency {args.concurrency})")
+    print(f"statuses     {statuses}")
+    print(f"ack rate     {args.requests / elapsed:.1f} req/s")
+    for pct in (50, 95, 99):
+        print(f"ack p{pct:<7} {percentile(latencies, pct) * 1000:.1f} ms")
+    print(f"processed    {args.requests / drained:.1f} msg/s (drained in {drained:.2f}s)")
+    print(f"queue lag    avg {queue['lag_avg_seconds'] * 1000:.1f} ms, max {queue['lag_max_seconds'] * 1000:.1f} ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--groq-latency", type=float, default=0.2)
+    parser.add_argument("--graph-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with GroqStub(latency=args.groq_latency) as groq, GraphStub(latency=args.graph_latency) as graph:
+        extractor.GROQ_URL = groq.completions_url
+        sendMessage.GRAPH_API_URL = graph.url
+        asyncio.run(run(args))
+        print(f"groq calls   {groq.requests}, graph sends {graph.requests}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,130 @@
+"""
+Times summing millions of mixed-currency amounts the way the bot does (integer
+LEDGER_CURRENCY minor units, each amount converted through the FX table) with
+int addition, as an int64 NumPy column and as the old float sum, and how far
+the float sum drifts. Then times writing and totalling through the CSV and
+SQLite stores, which both convert on read. Exactness and parsing are covered
+by tests/test_money.py.
+
+    python benchmarks/money_totals.py --rows 2000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from fractions import Fraction
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("FX_RATES_FILE", os.path.join(ROOT, "fx_rates.json"))
+os.environ.setdefault("LEDGER_CURRENCY", "INR")
+
+from money import NUMPY_AVAILABLE, format_money, get_fx_table, minor_digits, parse_money, sum_minor, to_ledger  # noqa: E402
+from storage import CsvExpenseStore, SqliteExpenseStore  # noqa: E402
+
+FORMS = {
+    "INR": ["₹{}", "{} rs", "{}", "Rs. {}"],
+    "USD": ["${}", "{} USD", "{} dollars"],
+    "EUR": ["€{}", "{} eur"],
+    "GBP": ["£{}"],
+    "JPY": ["¥{}"],
+    "AED": ["{} AED"],
+}
+
+
+# Mixed-currency amounts as users type them, weighted towards rupees
+def synthetic_amounts(count, seed=11):
+    rng = random.Random(seed)
+    currencies = ["INR"] * 6 + ["USD", "USD", "EUR", "GBP", "JPY", "AED"]
+    for _ in range(count):
+        currency = rng.choice(currencies)
+        digits = minor_digits(currency)
+        minor = rng.randrange(1, 500_000)
+        text = str(Decimal(minor).scaleb(-digits)) if digits else str(minor)
+        yield rng.choice(FORMS[currency]).format(text)
+
+
+# The exact ledger total, rounding each amount half-even as money.FxTable does
+def fraction_total(parsed, rates):
+    total = 0
+    for minor, currency in parsed:
+        if currency == "INR":
+            total += minor
+            continue
+        value = Fraction(minor) * rates[currency] / rates["INR"] * Fraction(10) ** (2 - minor_digits(currency))
+        whole, rest = divmod(value, 1)
+        total += int(whole) + (1 if rest > Fraction(1, 2) or (rest == Fraction(1, 2) and whole % 2) else 0)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--store-rows", type=int, default=20_000, help="rows written through each store")
+    args = parser.parse_args()
+
+    fx = get_fx_table()
+    print(f"{args.rows:,} amounts, FX table of {fx.date} ({', '.join(fx.currencies())})")
+    texts = list(synthetic_amounts(args.rows))
+
+    began = time.perf_counter()
+    parsed = [parse_money(text) for text in texts]
+    parse_seconds = time.perf_counter() - began
+    began = time.perf_counter()
+    ledger = [to_ledger(minor, currency) for minor, currency in parsed]
+    convert_seconds = time.perf_counter() - began
+    print(f"parse         {parse_seconds / args.rows * 1e6:>8.2f} us per amount")
+    print(f"convert       {convert_seconds / args.rows * 1e6:>8.2f} us per amount (memoized factor per currency)")
+
+    rates = {currency: Fraction(str(fx._rates[currency])) for currency in fx.currencies()}
+    expected = fraction_total(parsed, rates)
+
+    began = time.perf_counter()
+    int_total = sum(ledger)
+    int_seconds = time.perf_counter() - began
+    if NUMPY_AVAILABLE:
+        import numpy as np
+        column = np.array(ledger, dtype=np.int64)
+        began = time.perf_counter()
+        sum_minor(column)
+        numpy_seconds = time.perf_counter() - began
+
+    # What the old code did: the same rupee amounts as floats, summed as they come
+    floats = [minor / 100 for minor in ledger]
+    began = time.perf_counter()
+    float_total = sum(floats)
+    float_seconds = time.perf_counter() - began
+    shuffled_floats = floats[:]
+    random.Random(3).shuffle(shuffled_floats)
+    drift = float_total - expected / 100
+    order_drift = sum(shuffled_floats) - float_total
+    naive = sum(float(Decimal(minor).scaleb(-minor_digits(currency))) for minor, currency in parsed)
+
+    print(f"\nsum int       {int_seconds * 1000:>8.1f} ms  {format_money(int_total)}")
+    if NUMPY_AVAILABLE:
+        print(f"sum NumPy     {numpy_seconds * 1000:>8.1f} ms  (int64 column, vectorized)")
+    print(f"sum float     {float_seconds * 1000:>8.1f} ms  off by {drift:+.6f} Rs; reordering moves it {order_drift:+.6f}")
+    print(f"ignoring currency (the old ledger) the total would read {naive:,.2f} Rs")
+
+    print()
+    with tempfile.TemporaryDirectory() as tmp:
+        sample = texts[:args.store_rows]
+        for store in (CsvExpenseStore(os.path.join(tmp, "expenses.csv")),
+                      SqliteExpenseStore(os.path.join(tmp, "expenses.db"))):
+            began = time.perf_counter()
+            for number, text in enumerate(sample):
+                store.add(str(9000000000 + number % 100), text, "food", "", "2026-10-01")
+            added = time.perf_counter() - began
+            began = time.perf_counter()
+            sum_minor([row["amount_minor"] for row in store.iter_rows()])
+            totalled = time.perf_counter() - began
+            print(f"{type(store).__name__:<20} {len(sample)} adds in {added:.1f}s, "
+                  f"read and total in {totalled * 1000:.0f} ms")
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
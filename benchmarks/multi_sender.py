@@ -0,0 +1,99 @@
+"""
+Thousands of distinct senders writing to two tenants' numbers of the FastAPI
+app in main.py, with Groq and the Graph API replaced by local stubs. Every
+phone number writes to both tenants; the ledger is split over --shards files.
+That each sender gets only their own replies, from their tenant's number, is
+covered by tests/test_multi_sender.py.
+
+    python benchmarks/multi_sender.py --senders 2000 --shards 4 --concurrency 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.mkdtemp()
+_tenants_file = os.path.join(_tmp, "tenants.json")
+with open(_tenants_file, "w") as file:
+    json.dump([{"id": "acme", "phone_number_id": "acme-phone", "access_token": "acme-token"}], file)
+
+_shards = next((sys.argv[i + 1] for i, arg in enumerate(sys.argv[:-1]) if arg == "--shards"), "4")
+os.environ.setdefault("CSV_FILE", os.path.join(_tmp, "expenses.csv"))
+os.environ.setdefault("EXPENSE_DB", os.path.join(_tmp, "expenses.db"))
+os.environ.setdefault("SEARCH_INDEX_FILE", os.path.join(_tmp, "search_index.json"))
+os.environ.setdefault("EXPENSE_SHARDS", _shards)
+os.environ.setdefault("TENANTS_FILE", _tenants_file)
+os.environ.setdefault("PHONE_NUMBER_ID", "default-phone")
+os.environ.setdefault("OUTBOUND_RATE", "0")
+
+import httpx  # noqa: E402
+
+import extractor  # noqa: E402
+import main  # noqa: E402
+import sendMessage  # noqa: E402
+from stubs import GraphStub, GroqStub, meta_payload  # noqa: E402
+
+# tenant id -> phone number id the webhook is delivered for
+PHONE_NUMBER_IDS = {"default": "default-phone", "acme": "acme-phone"}
+
+# Distinct amount for every (tenant, phone) so a reply with someone else's total shows up
+def amount_for(tenant_index, number):
+    return 10 + number * 2 + tenant_index
+
+
+async def deliver(client, payload, gate):
+    async with gate:
+        while True:
+            response = await client.post("/webhook", json=payload)
+            if response.status_code != 503:
+                return response.status_code
+            await asyncio.sleep(0.01)  # queue full: redeliver like Meta would
+
+
+async def run(args, graph):
+    senders = [
+        (tenant_index, tenant_id, str(9100000000 + number), number)
+        for number in range(args.senders)
+        for tenant_index, tenant_id in enumerate(PHONE_NUMBER_IDS)
+    ]
+    transport = httpx.ASGITransport(app=main.app)
+    gate = asyncio.Semaphore(args.concurrency)
+    async with main.lifespan(main.app), httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+        start = time.perf_counter()
+        for phase, text in (("add", "spent {} on food"), ("query", "how much did I spend on food")):
+            payloads = [
+                meta_payload(phone, text.format(amount_for(tenant_index, number)),
+                             f"wamid.multi.{phase}.{tenant_id}.{phone}", PHONE_NUMBER_IDS[tenant_id])
+                for tenant_index, tenant_id, phone, number in senders
+            ]
+            await asyncio.gather(*(deliver(client, payload, gate) for payload in payloads))
+            await main.work_queue.join()
+        elapsed = time.perf_counter() - start
+
+    store = main.get_store()
+    shards = getattr(store, "shards", [store])
+    print(f"rows per shard {[shard.count() for shard in shards]}")
+    print(f"{2 * len(senders)} messages answered in {elapsed:.2f}s, {2 * len(senders) / elapsed:.0f} msg/s, "
+          f"{len(graph.sent)} replies sent")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--senders", type=int, default=2000, help="phone numbers, each writing to both tenants")
+    parser.add_argument("--shards", type=int, default=4, help="ledger files (read before the app is imported)")
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    with GroqStub() as groq, GraphStub() as graph:
+        extractor.GROQ_URL = groq.completions_url
+        sendMessage.GRAPH_API_URL = graph.url
+        asyncio.run(run(args, graph))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,87 @@
+"""
+What the instrumentation costs: messages per second through the FastAPI app in
+main.py (against local Groq and Graph API stubs) with and without the sampling
+profiler running, and per call, one histogram observation and a DEBUG payload
+log while DEBUG is off. What /metrics, the profiler and the log-level endpoint
+report is covered by tests/test_observability.py.
+
+    python benchmarks/observability.py --messages 200
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("CSV_FILE", os.path.join(_tmp, "expenses.csv"))
+os.environ.setdefault("EXPENSE_DB", os.path.join(_tmp, "expenses.db"))
+os.environ.setdefault("SEARCH_INDEX_FILE", os.path.join(_tmp, "search_index.json"))
+os.environ.setdefault("PROFILER_TOKEN", "profile-token")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx  # noqa: E402
+
+import extractor  # noqa: E402
+import main  # noqa: E402
+import sendMessage  # noqa: E402
+from metrics import STAGE_SECONDS  # noqa: E402
+from stubs import GraphStub, GroqStub, meta_payload  # noqa: E402
+
+MESSAGES = ["spent 200 on food yesterday", "how much on food", "bought a lamp for the bedroom yesterday",
+            "what did I spend on the lamp"]
+AUTH = {"Authorization": "Bearer profile-token"}
+
+def per_call(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+async def answer(client, messages, tag):
+    start = time.perf_counter()
+    for i in range(messages):
+        payload = meta_payload(str(9100000000 + i % 20), MESSAGES[i % len(MESSAGES)], f"wamid.obs.{tag}.{i}")
+        await client.post("/webhook", json=payload)
+    await main.work_queue.join()
+    return messages / (time.perf_counter() - start)
+
+
+async def run(args):
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app), httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+        plain = await answer(client, args.messages, "plain")
+        await client.post("/debug/profile/start", params={"seconds": 60, "interval_ms": 2}, headers=AUTH)
+        profiled = await answer(client, args.messages, "profiled")
+        await client.post("/debug/profile/stop", headers=AUTH)
+    print(f"{plain:.0f} msg/s, {profiled:.0f} msg/s while profiling every 2 ms")
+
+    payload = meta_payload("9100000000", "spent 200 on food")
+    logger = logging.getLogger("sendMessage")
+    calls = 20000
+    observe = per_call(lambda: STAGE_SECONDS.observe(0.01, stage="bench"), calls)
+    gated = per_call(lambda: logger.isEnabledFor(logging.DEBUG) and logger.debug("%s", json.dumps(payload)), calls)
+    dumped = per_call(lambda: json.dumps(payload, indent=2), calls)
+    print(f"histogram observe {observe:.2f} us, gated DEBUG log {gated:.2f} us, "
+          f"payload json.dumps(indent=2) as before {dumped:.2f} us (before printing it)")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    with GroqStub() as groq, GraphStub() as graph:
+        extractor.GROQ_URL = groq.completions_url
+        sendMessage.GRAPH_API_URL = graph.url
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,62 @@
+"""
+Measures how closely the outbound dispatcher holds the configured send rate,
+and its send latency, against a local mock Graph API. Ordering, retries, the
+template fallback and the circuit breaker are covered by
+tests/test_dispatcher.py.
+
+    python benchmarks/outbound_dispatch.py --recipients 50 --messages 4 --rate 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import GraphStub  # noqa: E402
+
+
+def text(to, body):
+    return {"messaging_product": "whatsapp", "to": to, "type": "text", "text": {"body": body}}
+
+
+async def run(args):
+    import sendMessage
+    from dispatcher import AsyncDispatcher
+    from httpclients import close_http_clients
+    from tenants import get_tenant
+
+    tenant = get_tenant()
+    outbound = AsyncDispatcher(sendMessage.post_message, rate=args.rate, burst=10)
+    recipients = [f"91{9000000000 + n}" for n in range(args.recipients)]
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        outbound.send(to, text(to, f"{to}-{i}"), tenant) for i in range(args.messages) for to in recipients
+    ))
+    elapsed = time.perf_counter() - start
+    await close_http_clients()
+
+    total = args.recipients * args.messages
+    floor = (total - 10) / args.rate
+    print(f"{total} sends in {elapsed:.2f}s, {total / elapsed:.0f}/s against a limit of {args.rate:.0f}/s "
+          f"(at least {floor:.2f}s expected)")
+    stats = outbound.snapshot()
+    print(f"latency avg {stats['latency_avg_seconds'] * 1000:.1f} ms, "
+          f"p95 {stats['latency_p95_seconds'] * 1000:.1f} ms, max {stats['latency_max_seconds'] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--recipients", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=4, help="messages per recipient")
+    parser.add_argument("--rate", type=float, default=100, help="sends per second")
+    args = parser.parse_args()
+
+    with GraphStub(latency=0.005) as graph:
+        os.environ["GRAPH_API_URL"] = graph.url
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""
+Replays recorded webhooks through both apps end to end: the Flask webhook() in
+app.py and the FastAPI receive_whatsapp_message() in main.py, with Groq, Twilio
+and the Graph API replaced by local stubs with configurable latency.
+
+The corpus is a JSON-lines file as written by WEBHOOK_RECORD_FILE (see
+recording.py); benchmarks/fixtures/webhooks.jsonl is a recorded sample with
+single and batched messages, delivery-status callbacks and Twilio forms. Meta
+payloads are turned into Twilio forms for the Flask app and the other way round,
+so both apps see the same messages. --repeat replays the corpus several times
+with fresh message ids.
+
+Each app runs in its own process with an empty ledger. Reported per app:
+
+  throughput        webhooks acknowledged and messages fully processed per second
+  latency           p50/p95/p99 of the webhook acknowledgement and of processing one message
+  memory            peak RSS and RSS growth over the run (after the app is imported)
+  calls             Groq requests and outbound sends per message
+
+Each app is replayed --runs times and the median of every metric is kept, which
+takes most of the scheduling noise out of the tail latencies.
+
+--save-baseline stores the results in --baseline (benchmarks/baselines/replay.json);
+later runs print the change against it and exit with status 1 when a metric is
+worse by more than --tolerance.
+
+    python benchmarks/replay.py --app both --repeat 5 --groq-latency 0.2 --graph-latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+
+DEFAULT_CORPUS = os.path.join(BENCHMARKS, "fixtures", "webhooks.jsonl")
+DEFAULT_BASELINE = os.path.join(BENCHMARKS, "baselines", "replay.json")
+
+# metric -> True if higher is better
+METRICS = {
+    "ack_per_second": True,
+    "messages_per_second": True,
+    "ack_p50_ms": False,
+    "ack_p95_ms": False,
+    "ack_p99_ms": False,
+    "process_p50_ms": False,
+    "process_p95_ms": False,
+    "process_p99_ms": False,
+    "rss_peak_mb": False,
+    "rss_growth_mb": False,
+    "groq_calls_per_message": False,
+    "sends_per_message": False,
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return rss_mb()
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+# (sender, text, message id) for every text message of a recorded webhook
+def corpus_messages(entry):
+    payload = entry["payload"]
+    if entry["source"] == "twilio":
+        if payload.get("Body") and payload.get("From"):
+            yield payload["From"].removeprefix("whatsapp:").lstrip("+"), payload["Body"], payload.get("MessageSid")
+        return
+    for entry_data in payload.get("entry") or []:
+        for change in entry_data.get("changes") or []:
+            for message in (change.get("value") or {}).get("messages") or []:
+                if message.get("type") == "text":
+                    yield message.get("from"), (message.get("text") or {}).get("body"), message.get("id")
+
+
+def with_fresh_ids(payload, suffix):
+    payload = json.loads(json.dumps(payload))
+    for entry_data in payload.get("entry") or []:
+        for change in entry_data.get("changes") or []:
+            for message in (change.get("value") or {}).get("messages") or []:
+                message["id"] = f"{message.get('id')}.{suffix}"
+    return payload
+
+
+# The corpus as the requests one app receives, repeated with fresh message ids
+def requests_for(app_name, corpus, repeat):
+    from stubs import meta_payload, twilio_form
+
+    requests = []
+    for round_number in range(repeat):
+        for entry in corpus:
+            if app_name == "fastapi":
+                if entry["source"] == "meta":
+                    requests.append(with_fresh_ids(entry["payload"], f"r{round_number}"))
+                else:
+                    for sender, text, message_id in corpus_messages(entry):
+                        requests.append(meta_payload(sender, text, f"{message_id}.r{round_number}"))
+            else:
+                for sender, text, message_id in corpus_messages(entry):
+                    form = dict(entry["payload"]) if entry["source"] == "twilio" else twilio_form(sender, text)
+                    form["MessageSid"] = f"{message_id}.r{round_number}"
+                    requests.append(form)
+    return requests
+
+
+def timed_handler(handler, durations):
+    if asyncio.iscoroutinefunction(handler):
+        async def async_wrapper(*args):
+            started = time.perf_counter()
+            try:
+                return await handler(*args)
+            finally:
+                durations.append(time.perf_counter() - started)
+        return async_wrapper
+
+    def wrapper(*args):
+        started = time.perf_counter()
+        try:
+            return handler(*args)
+        finally:
+            durations.append(time.perf_counter() - started)
+    return wrapper
+
+
+async def drive_fastapi(main, requests, concurrency, acks, durations):
+    import httpx
+
+    main.work_queue.handler = timed_handler(main.work_queue.handler, durations)
+    transport = httpx.ASGITransport(app=main.app)
+    gate = asyncio.Semaphore(concurrency)
+    async with main.lifespan(main.app), httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+        async def post(payload):
+            async with gate:
+                while True:
+                    started = time.perf_counter()
+                    response = await client.post("/webhook", json=payload)
+                    if response.status_code != 503:
+                        acks.append(time.perf_counter() - started)
+                        return
+                    await asyncio.sleep(0.01)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(post(payload) for payload in requests))
+        acked = time.perf_counter() - start
+        await main.work_queue.join()
+        drained = time.perf_counter() - start
+    return acked, drained
+
+
+def drive_flask(app, requests, concurrency, acks, durations):
+    app.work_queue.handler = timed_handler(app.work_queue.handler, durations)
+    local = threading.local()
+
+    def post(form):
+        if not hasattr(local, "client"):
+            local.client = app.app.test_client()
+        while True:
+            started = time.perf_counter()
+            response = local.client.post("/webhook", data=form)
+            if response.status_code != 503:
+                acks.append(time.perf_counter() - started)
+                return
+            time.sleep(0.01)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(post, requests))
+    acked = time.perf_counter() - start
+    app.work_queue.join()
+    drained = time.perf_counter() - start
+    return acked, drained
+
+
+# Runs in the child process: one app, fresh ledger, stubs in this process
+def run_child(args):
+    tmp = tempfile.mkdtemp()
+    os.environ.update({
+        "CSV_FILE": os.path.join(tmp, "expenses.csv"),
+        "EXPENSE_DB": os.path.join(tmp, "expenses.db"),
+        "SEARCH_INDEX_FILE": os.path.join(tmp, "search_index.json"),
+        "WEBHOOK_RECORD_FILE": "",
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("account_sid", "AC" + "0" * 32)
+    os.environ.setdefault("auth_token", "stub-token")
+
+    from stubs import GraphStub, GroqStub, TwilioStub
+
+    corpus = load_corpus(args.corpus)
+    with GroqStub(latency=args.groq_latency) as groq, GraphStub(latency=args.graph_latency) as graph, \
+            TwilioStub(latency=args.graph_latency) as twilio:
+        os.environ["GROQ_URL"] = groq.completions_url
+        os.environ["GRAPH_API_URL"] = graph.url
+        os.environ["TWILIO_API_URL"] = twilio.url
+        import extractor
+        extractor.GROQ_URL = groq.completions_url
+
+        requests = requests_for(args.child, corpus, args.repeat)
+        acks, durations = [], []
+        if args.child == "fastapi":
+            import main
+            rss_start = rss_mb()
+            acked, drained = asyncio.run(drive_fastapi(main, requests, args.concurrency, acks, durations))
+            sends = graph.requests
+        else:
+            import app
+            rss_start = rss_mb()
+            acked, drained = drive_flask(app, requests, args.concurrency, acks, durations)
+            sends = twilio.requests
+        messages = len(durations)
+
+        return {
+            "webhooks": len(requests),
+            "messages": messages,
+            "ack_per_second": len(requests) / acked,
+            "messages_per_second": messages / drained,
+            "ack_p50_ms": percentile(acks, 50) * 1000,
+            "ack_p95_ms": percentile(acks, 95) * 1000,
+            "ack_p99_ms": percentile(acks, 99) * 1000,
+            "process_p50_ms": percentile(durations, 50) * 1000,
+            "process_p95_ms": percentile(durations, 95) * 1000,
+            "process_p99_ms": percentile(durations, 99) * 1000,
+            "rss_peak_mb": peak_rss_mb(),
+            "rss_growth_mb": rss_mb() - rss_start,
+            "groq_calls_per_message": groq.requests / messages if messages else 0.0,
+            "sends_per_message": sends / messages if messages else 0.0,
+        }
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def run_app(app_name, args):
+    runs = [run_once(app_name, args) for _ in range(args.runs)]
+    # counts are the same every run; only measurements are averaged out
+    return {key: median([run[key] for run in runs]) if isinstance(value, float) else value
+            for key, value in runs[0].items()}
+
+
+def run_once(app_name, args):
+    command = [sys.executable, os.path.abspath(__file__), "--child", app_name, "--corpus", args.corpus,
+               "--repeat", str(args.repeat), "--concurrency", str(args.concurrency),
+               "--groq-latency", str(args.groq_latency), "--graph-latency", str(args.graph_latency)]
+    output = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    if output.returncode != 0:
+        sys.stderr.write(output.stderr)
+        raise SystemExit(f"{app_name} replay failed")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def report(app_name, result, baseline, tolerance):
+    print(f"\n{app_name}: {result['webhooks']} webhooks, {result['messages']} messages")
+    regressions = []
+    for metric, higher_is_better in METRICS.items():
+        value = result[metric]
+        line = f"  {metric:<24} {value:10.2f}"
+        if baseline and metric in baseline:
+            before = baseline[metric]
+            change = (value - before) / before if before else 0.0
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > tolerance:
+                flag = "  REGRESSION"
+                regressions.append(metric)
+            line += f"   baseline {before:10.2f} ({change:+.1%}){flag}"
+        print(line)
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", choices=["flask", "fastapi", "both"], default="both")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=3, help="times the corpus is replayed per run")
+    parser.add_argument("--runs", type=int, default=3, help="runs per app; the median is reported")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--groq-latency", type=float, default=0.05)
+    parser.add_argument("--graph-latency", type=float, default=0.02)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative change counted as a regression")
+    parser.add_argument("--child", choices=["flask", "fastapi"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args)))
+        return
+
+    params = {key: getattr(args, key) for key in ("repeat", "runs", "concurrency", "groq_latency", "graph_latency")}
+    params["corpus"] = os.path.relpath(os.path.abspath(args.corpus), ROOT)
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baselines = json.load(file)
+
+    regressions = []
+    apps = ["flask", "fastapi"] if args.app == "both" else [args.app]
+    for app_name in apps:
+        result = run_app(app_name, args)
+        baseline = baselines.get(app_name)
+        if baseline and baseline.get("params") != params:
+            print(f"\n(baseline for {app_name} was taken with {baseline.get('params')}; not comparing)")
+            baseline = None
+        regressions += [f"{app_name}.{metric}" for metric in
+                        report(app_name, result, baseline and baseline["results"], args.tolerance)]
+        if args.save_baseline:
+            baselines[app_name] = {"results": result, "params": params, "revision": git_revision(),
+                                   "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(baselines, file, indent=2)
+        print(f"\nbaseline saved to {args.baseline}")
+    if regressions:
+        print(f"\nregressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
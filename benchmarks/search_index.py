@@ -0,0 +1,91 @@
+"""
+Build time, memory footprint, persistence cost and query latency of the
+inverted search index against the substring scan it replaces.
+
+    python benchmarks/search_index.py --rows 200000 --users 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from searchindex import SearchIndex  # noqa: E402
+from storage import make_row  # noqa: E402
+
+CATEGORIES = ["food", "groceries", "transport", "books", "clothing", "entertainment", "bills", "health"]
+ITEMS = ["lunch", "dinner", "taxi ride", "tshirt", "novel", "movie tickets", "electricity bill", "medicines",
+         "coffee", "milk", "vegetables", "petrol", "chips", "grocery run"]
+# (query, kind): exact words, plural/singular, synonym, alias, prefix, typo
+QUERIES = [("dinner", "exact"), ("grocery", "plural"), ("medicine", "plural"), ("cab", "synonym"),
+           ("utilities", "alias"), ("veg", "prefix"), ("dinnr", "typo"), ("electrcity", "typo")]
+
+
+def synthetic_rows(count, users, seed=7):
+    rng = random.Random(seed)
+    for row_id in range(1, count + 1):
+        yield make_row(
+            row_id,
+            str(9000000000 + rng.randrange(users)),
+            rng.randrange(10, 5000),
+            rng.choice(CATEGORIES),
+            rng.choice(ITEMS),
+            f"2025-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+        )
+
+
+def scan(rows, user_id, term):
+    return [row for row in rows
+            if row["user_id"] == user_id and (term in row["category"].lower() or term in row["description"].lower())]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--queries", type=int, default=20, help="distinct users to query")
+    args = parser.parse_args()
+
+    rows = list(synthetic_rows(args.rows, args.users))
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = SearchIndex()
+    index.rebuild(rows)
+    build = time.perf_counter() - start
+    footprint = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"built index over {args.rows} rows in {build:.2f}s, {footprint / 2**20:.1f} MiB (postings and row ids)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "search_index.json")
+        start = time.perf_counter()
+        index.save(path)
+        saved = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded = SearchIndex.load(path)
+        load = time.perf_counter() - start
+        print(f"saved in {saved:.2f}s ({os.path.getsize(path) / 2**20:.1f} MiB), loaded {len(loaded)} rows in {load:.2f}s")
+
+    rng = random.Random(11)
+    user_ids = [str(9000000000 + rng.randrange(args.users)) for _ in range(args.queries)]
+    print(f"{'query':>12} {'kind':>8} {'scan ms':>10} {'index ms':>10} {'scan hits':>10} {'index hits':>11}")
+    for term, kind in QUERIES:
+        start = time.perf_counter()
+        scanned = sum(len(scan(rows, user_id, term)) for user_id in user_ids[:3])
+        scan_latency = (time.perf_counter() - start) / 3
+        start = time.perf_counter()
+        for user_id in user_ids:
+            found = index.matches(user_id, term)
+        index_latency = (time.perf_counter() - start) / len(user_ids)
+        found = sum(len(index.matches(user_id, term)) for user_id in user_ids[:3])
+        print(f"{term:>12} {kind:>8} {scan_latency * 1000:>10.3f} {index_latency * 1000:>10.4f} "
+              f"{scanned:>10} {found:>11}")
+
+
+if __name__ == "__main__":
+    main()
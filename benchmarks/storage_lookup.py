@@ -0,0 +1,80 @@
+"""
+Builds a synthetic ledger (1M rows by default) and compares query latency of the
+CSV full scan against the indexed SQLite store.
+
+    python benchmarks/storage_lookup.py --rows 1000000 --users 10000
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import EXPENSE_FIELDS, CsvExpenseStore, SqliteExpenseStore  # noqa: E402
+
+CATEGORIES = ["food", "groceries", "transport", "books", "clothing", "entertainment", "bills", "health"]
+ITEMS = ["lunch", "dinner", "taxi", "tshirt", "novel", "movie", "electricity", "medicine", "coffee", "milk"]
+TERMS = ["food", "taxi", "2025-02", "dinner", "bills"]
+
+
+def synthetic_rows(count, users, seed=7):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield (
+            str(9000000000 + rng.randrange(users)),
+            rng.randrange(10, 5000),
+            rng.choice(CATEGORIES),
+            rng.choice(ITEMS),
+            f"2025-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+        )
+
+
+def time_queries(store, user_ids, repeat):
+    start = time.perf_counter()
+    for user_id in user_ids:
+        for term in TERMS:
+            for _ in range(repeat):
+                store.search(user_id, term)
+    return (time.perf_counter() - start) / (len(user_ids) * len(TERMS) * repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=5, help="distinct users to query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "expenses.csv")
+        db_path = os.path.join(tmp, "expenses.db")
+
+        start = time.perf_counter()
+        with open(csv_path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(EXPENSE_FIELDS)
+            writer.writerows(synthetic_rows(args.rows, args.users))
+        print(f"wrote {args.rows} CSV rows in {time.perf_counter() - start:.1f}s")
+
+        sqlite_store = SqliteExpenseStore(db_path)
+        start = time.perf_counter()
+        sqlite_store.add_many(synthetic_rows(args.rows, args.users))
+        print(f"loaded {args.rows} SQLite rows in {time.perf_counter() - start:.1f}s")
+
+        rng = random.Random(11)
+        user_ids = [str(9000000000 + rng.randrange(args.users)) for _ in range(args.queries)]
+
+        csv_latency = time_queries(CsvExpenseStore(csv_path), user_ids[:2], 1)
+        sqlite_latency = time_queries(sqlite_store, user_ids, 20)
+        print(f"csv scan      {csv_latency * 1000:>10.3f} ms/query")
+        print(f"sqlite index  {sqlite_latency * 1000:>10.3f} ms/query")
+        print(f"speedup       {csv_latency / sqlite_latency:>10.0f}x")
+        sqlite_store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Local stand-ins for the external APIs the bot talks to, used by the benchmarks.
+
+Each stub runs a ThreadingHTTPServer on 127.0.0.1 in a daemon thread, counts the
+requests it receives and can add a fixed artificial latency to every response.
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+def _fake_slots(message):
+    text = message.lower()
+    amount = re.search(r"\d+(?:\.\d+)?", text)
+    topic = re.search(r"\bon\s+([a-z]+)", text)
+    date = re.search(r"(today|yesterday|\d+\s*days?\s*ago)", text)
+    intent = "query" if re.search(r"how much|show|what did", text) else ("add" if amount else "none")
+    return {
+        "intent": intent,
+        "amount": float(amount.group(0)) if amount and intent == "add" else None,
+        "category": topic.group(1) if topic and intent == "add" else None,
+        "description": None,
+        "date": date.group(1) if date and intent == "add" else None,
+        "query_term": topic.group(1) if topic and intent == "query" else None,
+    }
+
+
+# Answer a chat completion request the way the bot's prompts expect
+def fake_groq_completion(payload):
+    system = payload["messages"][0]["content"]
+    message = payload["messages"][-1]["content"]
+    slots = _fake_slots(message)
+
+    if payload.get("response_format", {}).get("type") == "json_object" and "several WhatsApp messages" in system:
+        items = json.loads(message)
+        content = json.dumps({"results": [dict(_fake_slots(item["message"]), index=item["index"]) for item in items]})
+    elif payload.get("response_format", {}).get("type") == "json_object":
+        content = json.dumps(slots)
+    elif "add* an expense" in system or "'add' an expense" in system:
+        content = slots["intent"]
+    elif "Extract the *expense category" in system or "category or item name" in system:
+        content = slots["query_term"] or "unknown"
+    else:
+        content = json.dumps({key: slots[key] for key in ("amount", "category", "description", "date")})
+
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 makes bursts of new connections wait on SYN retries
+    request_queue_size = 1024
+
+
+class StubServer:
+    """Base stub: subclasses implement ``respond(path, payload) -> (status, body)``."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                        payload = dict(parse_qsl(raw.decode("utf-8")))
+                    else:
+                        payload = json.loads(raw) if raw else {}
+                except ValueError:
+                    payload = {"raw": raw.decode("utf-8", "replace")}
+
+                with stub._lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                status, body = stub.respond(self.path, payload)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def respond(self, path, payload):
+        raise NotImplementedError
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class GroqStub(StubServer):
+    """Emulates the Groq chat completions endpoint."""
+
+    def respond(self, path, payload):
+        return 200, fake_groq_completion(payload)
+
+    @property
+    def completions_url(self):
+        return f"{self.url}/openai/v1/chat/completions"
+
+
+class GraphStub(StubServer):
+    """
+    Emulates the WhatsApp Cloud API /{version}/{phone_number_id}/messages endpoint.
+
+    fail_next() queues error responses to return before succeeding again, e.g.
+    fail_next(429, count=3) or fail_next(400, code=131047). paths[i] is the
+    request path sent[i] was posted to, naming the sending phone number id.
+    """
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.sent = []
+        self.paths = []
+        self.failures = []
+
+    def fail_next(self, status, code=None, count=1):
+        error = {"error": {"message": "stub failure", "type": "OAuthException", "code": code or status}}
+        with self._lock:
+            self.failures.extend([(status, error)] * count)
+
+    def respond(self, path, payload):
+        with self._lock:
+            if self.failures:
+                return self.failures.pop(0)
+            self.sent.append(payload)
+            self.paths.append(path)
+            message_id = f"wamid.stub{len(self.sent)}"
+        return 200, {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": payload.get("to"), "wa_id": payload.get("to")}],
+            "messages": [{"id": message_id}],
+        }
+
+    def reset(self):
+        super().reset()
+        with self._lock:
+            self.sent = []
+            self.paths = []
+            self.failures = []
+
+
+class TwilioStub(StubServer):
+    """
+    Emulates Twilio's /2010-04-01/Accounts/{sid}/Messages.json; point the
+    Flask app at it with TWILIO_API_URL. sent holds the posted forms
+    (From, To, Body).
+    """
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.sent = []
+
+    def respond(self, path, payload):
+        with self._lock:
+            self.sent.append(payload)
+            sid = f"SM{len(self.sent):032d}"
+        return 201, {
+            "sid": sid,
+            "status": "queued",
+            "from": payload.get("From"),
+            "to": payload.get("To"),
+            "body": payload.get("Body"),
+            "num_segments": "1",
+            "direction": "outbound-api",
+        }
+
+    def reset(self):
+        super().reset()
+        with self._lock:
+            self.sent = []
+
+
+# Twilio's form-encoded webhook for one incoming WhatsApp message
+def twilio_form(sender, text, message_sid=None, to="+14155238886"):
+    return {
+        "From": f"whatsapp:+{sender.lstrip('+')}",
+        "To": f"whatsapp:{to}",
+        "Body": text,
+        "MessageSid": message_sid or f"SM{abs(hash((sender, text))):032d}"[:34],
+        "NumMedia": "0",
+    }
+
+
+# Minimal Meta webhook payload carrying one text message
+def meta_payload(sender, text, message_id=None, phone_number_id="stub-phone"):
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "stub-waba",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15550000000", "phone_number_id": phone_number_id},
+                    "messages": [{
+                        "from": sender,
+                        "id": message_id or f"wamid.in.{sender}.{abs(hash(text))}",
+                        "timestamp": str(int(time.time())),
+                        "type": "text",
+                        "text": {"body": text},
+                    }],
+                },
+            }],
+        }],
+    }
@@ -0,0 +1,305 @@
+"""
+Per-user spending limits by category, with alerts as they are crossed.
+
+"set food budget to 5000", "budget for travel 2000 per week", "show my budgets"
+and "remove food budget" are understood locally by parse_budget_command().
+Budgets are kept in BUDGETS_FILE, with limits in LEDGER_CURRENCY.
+
+Any number of workers may share the file. Every change is read, merged and
+written back under an exclusive flock on BUDGETS_FILE.lock, and a worker
+reloads the file whenever it has changed since it last looked, so no worker
+overwrites another's budgets.
+
+Budgets listens to the store, and a saved row only costs a dictionary lookup
+unless its user has a budget for its category. What was spent in a period is
+always read from the store's date range for that user (in integer minor units,
+row["amount_minor"]), so rows written by other workers, edits and deletes are
+all counted. Each of BUDGET_ALERT_THRESHOLDS (fractions of the limit) alerts
+once per period across all workers; the alert is queued for the user and sent
+with the reply to the expense that crossed it (pop_alerts()).
+"""
+import json
+import logging
+import os
+import re
+import threading
+from collections import defaultdict
+from datetime import date
+
+from aggregates import category_key
+from dates import parse_date, resolve_period
+from money import format_money, to_minor
+from storage import get_store
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+BUDGETS_FILE = os.getenv("BUDGETS_FILE", "budgets.json")
+BUDGET_ALERT_THRESHOLDS = tuple(sorted(
+    float(value) for value in os.getenv("BUDGET_ALERT_THRESHOLDS", "0.8,1.0").split(",") if value.strip()
+))
+
+PERIODS = ("week", "month")
+
+logger = logging.getLogger(__name__)
+
+_AMOUNT = r"(?:rs\.?\s*|₹\s*)?(?P<amount>\d[\d,]*(?:\.\d+)?)\s*(?:rs\.?|inr|rupees?)?"
+_CATEGORY = r"(?P<category>[a-z][a-z &/-]*?)"
+_PERIOD = r"(?:\s*(?:(?:per|a|an|every|each)\s+)?(?P<period>week|month|weekly|monthly))?"
+_SET = r"(?:set\s+|make\s+)?(?:a\s+|my\s+|the\s+)?"
+
+SET_BUDGET_RES = [
+    # "set food budget to 5000 per month", "food budget 5000"
+    re.compile(rf"^{_SET}{_CATEGORY}\s+budget\s+(?:to\s+|of\s+|at\s+|is\s+|as\s+)?{_AMOUNT}{_PERIOD}\s*[.!]?$"),
+    # "set a budget of 5000 for food weekly"
+    re.compile(rf"^{_SET}budget\s+(?:of\s+)?{_AMOUNT}\s+(?:for|on)\s+{_CATEGORY}{_PERIOD}\s*[.!]?$"),
+    # "budget for food 5000"
+    re.compile(rf"^{_SET}budget\s+(?:for|on)\s+{_CATEGORY}\s+(?:to\s+|of\s+|at\s+|is\s+|as\s+)?{_AMOUNT}{_PERIOD}\s*[.!]?$"),
+]
+SHOW_BUDGETS_RE = re.compile(r"^(?:show|list|what\s+are|check)?\s*(?:me\s+)?(?:my\s+)?budgets?\s*\??$")
+CLEAR_BUDGET_RES = [
+    re.compile(rf"^(?:remove|delete|clear|cancel|drop)\s+(?:my\s+|the\s+)?{_CATEGORY}\s+budget\s*[.!]?$"),
+    re.compile(rf"^(?:remove|delete|clear|cancel|drop)\s+(?:my\s+|the\s+)?budget\s+(?:for|on)\s+{_CATEGORY}\s*[.!]?$"),
+]
+
+
+# ("set", category, limit, period), ("show",), ("clear", category), or None when
+# the message is not about budgets
+def parse_budget_command(message):
+    text = re.sub(r"\s+", " ", (message or "").strip().lower())
+    if "budget" not in text:
+        return None
+    if SHOW_BUDGETS_RE.match(text):
+        return ("show",)
+    for pattern in CLEAR_BUDGET_RES:
+        match = pattern.match(text)
+        if match:
+            return ("clear", category_key(match.group("category")))
+    for pattern in SET_BUDGET_RES:
+        match = pattern.match(text)
+        if match:
+            limit = float(match.group("amount").replace(",", ""))
+            period = (match.group("period") or "month").removesuffix("ly")
+            if limit > 0:
+                return ("set", category_key(match.group("category")), limit, period)
+    return None
+
+
+# (start, end, key) of the week (Monday to Sunday) or month that contains `day`
+def period_bounds(period, day):
+    start, end = resolve_period(f"this {period}", today=day)
+    return start, end, start
+
+
+class Budgets:
+    def __init__(self, store, path=BUDGETS_FILE, thresholds=BUDGET_ALERT_THRESHOLDS):
+        self.store = store
+        self.path = path
+        self.thresholds = thresholds
+        self._lock = threading.RLock()
+        # user -> category -> {"limit": amount, "period": "week" | "month", "alerted": {period key: threshold}}
+        self._budgets = {}
+        self._version = None  # (mtime, size) of BUDGETS_FILE when it was last read
+        self._pending = defaultdict(list)
+        self.alerts_sent = 0
+        self._refresh()
+
+    def _signature(self):
+        try:
+            info = os.stat(self.path)
+        except OSError:
+            return None
+        return info.st_mtime_ns, info.st_size
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read %s, starting without budgets: %s", self.path, e)
+            return {}
+
+    # Reload BUDGETS_FILE if another worker (or this one) changed it since it was last read
+    def _refresh(self):
+        if not self.path:
+            return
+        with self._lock:
+            version = self._signature()
+            if version != self._version:
+                self._budgets = self._read()
+                self._version = version
+
+    # Apply mutate(budgets) to the latest budgets on disk and write them back, all under
+    # an exclusive flock, so concurrent workers never lose each other's changes
+    def _update(self, mutate):
+        with self._lock:
+            if not self.path:
+                return mutate(self._budgets)
+            with open(f"{self.path}.lock", "a") as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+                try:
+                    budgets = self._read()
+                    result = mutate(budgets)
+                    temporary = f"{self.path}.tmp"
+                    with open(temporary, "w", encoding="utf-8") as file:
+                        json.dump(budgets, file, separators=(",", ":"))
+                    os.replace(temporary, self.path)
+                    self._budgets, self._version = budgets, self._signature()
+                    return result
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _budget(self, user_id, category):
+        self._refresh()
+        with self._lock:
+            budget = self._budgets.get(user_id, {}).get(category)
+            return dict(budget) if budget is not None else None
+
+    # Spent in one period, straight from the store
+    def _period_spent(self, user_id, category, start, end):
+        return sum(row["amount_minor"] for row in self.store.date_range(user_id, start, end)
+                   if category_key(row["category"]) == category)
+
+    def spent(self, user_id, category, day=None):
+        """(spent, limit, period), in minor units, for the period containing `day` (today by default), or None."""
+        budget = self._budget(user_id, category)
+        if budget is None:
+            return None
+        start, end, _ = period_bounds(budget["period"], day or date.today())
+        return self._period_spent(user_id, category, start, end), to_minor(budget["limit"]), budget["period"]
+
+    def set(self, user_id, category, limit, period="month"):
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+
+        def mutate(budgets):
+            # A new limit may be crossed again, so alerts already sent do not carry over
+            budgets.setdefault(user_id, {})[category] = {"limit": limit, "period": period, "alerted": {}}
+
+        self._update(mutate)
+        return self.spent(user_id, category)
+
+    def remove(self, user_id, category):
+        def mutate(budgets):
+            user_budgets = budgets.get(user_id, {})
+            if user_budgets.pop(category, None) is None:
+                return False
+            if not user_budgets:
+                del budgets[user_id]
+            return True
+
+        return self._update(mutate)
+
+    def for_user(self, user_id):
+        self._refresh()
+        with self._lock:
+            return {category: dict(budget) for category, budget in self._budgets.get(user_id, {}).items()}
+
+    # Record `threshold` as alerted for the period unless a worker already alerted it (or higher)
+    def _claim_alert(self, user_id, category, key, threshold):
+        def mutate(budgets):
+            budget = budgets.get(user_id, {}).get(category)
+            if budget is None or threshold <= budget["alerted"].get(key, 0):
+                return False
+            budget["alerted"] = {key: threshold}
+            return True
+
+        return self._update(mutate)
+
+    # Store listener: queue an alert when the row takes its period's spending across a threshold
+    def record(self, row):
+        self._refresh()
+        if not self._budgets.get(row["user_id"]):
+            return
+        category = category_key(row["category"])
+        budget = self._budget(row["user_id"], category)
+        day = parse_date(row["date"])
+        if budget is None or day is None:
+            return
+
+        # Only the current period alerts; a late entry for an earlier one just counts
+        start, end, key = period_bounds(budget["period"], day)
+        if key != period_bounds(budget["period"], date.today())[2]:
+            return
+        # Read after the row was committed, so it already includes it
+        spent, limit = self._period_spent(row["user_id"], category, start, end), to_minor(budget["limit"])
+        crossed = [threshold for threshold in self.thresholds if spent >= threshold * limit]
+        if not crossed or crossed[-1] <= budget["alerted"].get(key, 0):
+            return
+        if not self._claim_alert(row["user_id"], category, key, crossed[-1]):
+            return
+        with self._lock:
+            self._pending[row["user_id"]].append(alert_text(category, spent, limit, budget["period"]))
+            self.alerts_sent += 1
+
+    # Store change listener: spending is read from the store, so only the new row can alert
+    def change(self, old, new):
+        if new is not None:
+            self.record(new)
+
+    def pop_alerts(self, user_id):
+        with self._lock:
+            return self._pending.pop(user_id, [])
+
+    def stats(self):
+        self._refresh()
+        with self._lock:
+            return {
+                "users": len(self._budgets),
+                "budgets": sum(len(budgets) for budgets in self._budgets.values()),
+                "alerts_sent": self.alerts_sent,
+            }
+
+
+# spent and limit in minor units, as Budgets.spent() returns them
+def alert_text(category, spent, limit, period):
+    if spent >= limit:
+        return (f"⚠️ You've crossed your {category} budget for this {period}: "
+                f"{format_money(spent)} of {format_money(limit)} spent.")
+    return (f"Heads up: you've used {spent / limit:.0%} of your {category} budget for this {period} "
+            f"({format_money(spent)} of {format_money(limit)}).")
+
+
+def status_line(category, spent, limit, period):
+    return f"{category}: {format_money(spent)} of {format_money(limit)} this {period} ({spent / limit:.0%})"
+
+
+# Carry out a parsed budget command for one user and return the reply
+def apply_budget_command(budgets, user_id, command):
+    if command[0] == "set":
+        _, category, limit, period = command
+        spent, limit, period = budgets.set(user_id, category, limit, period)
+        return (f"Budget set: {format_money(limit)} a {period} on {category}. "
+                f"Spent so far this {period}: {format_money(spent)} ({spent / limit:.0%}).")
+    if command[0] == "clear":
+        category = command[1]
+        if budgets.remove(user_id, category):
+            return f"Removed your {category} budget."
+        return f"You have no {category} budget."
+
+    lines = [status_line(category, *budgets.spent(user_id, category)) for category in sorted(budgets.for_user(user_id))]
+    if not lines:
+        return "You have no budgets yet. Set one with e.g. \"set food budget to 5000 per month\"."
+    return "Your budgets:\n" + "\n".join(lines)
+
+
+_budgets = None
+_budgets_lock = threading.Lock()
+
+
+# Process-wide budgets over get_store(), read from BUDGETS_FILE on first use and
+# listening to the store from then on
+def get_budgets():
+    global _budgets
+    with _budgets_lock:
+        if _budgets is None:
+            store = get_store()
+            _budgets = Budgets(store)
+            store.subscribe(_budgets.record, _budgets.change)
+        return _budgets
@@ -0,0 +1,46 @@
+import bisect
+from collections import defaultdict
+
+
+class DateIndex:
+    """
+    Each user's rows kept sorted by ISO date, so a date range is two bisects
+    and a slice: O(log n + k) for a user with n rows and k matches.
+    """
+
+    def __init__(self, rows=()):
+        self._dates = defaultdict(list)  # user_id -> sorted dates
+        self._rows = defaultdict(list)   # user_id -> rows, in the same order
+        for row in rows:
+            self.add(row)
+
+    # Rows mostly arrive in date order, so this is usually an append
+    def add(self, row):
+        dates = self._dates[row["user_id"]]
+        position = bisect.bisect_right(dates, row["date"])
+        dates.insert(position, row["date"])
+        self._rows[row["user_id"]].insert(position, row)
+
+    # Drop a row that was edited or deleted; it is found by date, then by id
+    def remove(self, row):
+        dates = self._dates.get(row["user_id"])
+        if not dates:
+            return
+        rows = self._rows[row["user_id"]]
+        for position in range(bisect.bisect_left(dates, row["date"]), bisect.bisect_right(dates, row["date"])):
+            if rows[position]["id"] == row["id"]:
+                del dates[position]
+                del rows[position]
+                return
+
+    def range(self, user_id, start, end):
+        """Rows of one user dated start..end (inclusive ISO dates), oldest first."""
+        dates = self._dates.get(user_id)
+        if not dates:
+            return []
+        low = bisect.bisect_left(dates, start)
+        high = bisect.bisect_right(dates, end)
+        return self._rows[user_id][low:high]
+
+    def __len__(self):
+        return sum(len(dates) for dates in self._dates.values())
@@ -0,0 +1,176 @@
+import calendar
+import re
+from datetime import date, datetime, timedelta
+
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+MONTHS["sept"] = 9
+_MONTH_NAMES = "|".join(sorted(MONTHS, key=len, reverse=True))
+
+_SPACES_RE = re.compile(r"\s+")
+_YMD_RE = re.compile(r"^(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})$")
+_DMY_RE = re.compile(r"^(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})$")
+_DAY_MONTH_RE = re.compile(rf"^(\d{{1,2}})(?:st|nd|rd|th)?\s+({_MONTH_NAMES})\.?,?(?:\s+(\d{{4}}))?$")
+_MONTH_DAY_RE = re.compile(rf"^({_MONTH_NAMES})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?,?(?:\s+(\d{{4}}))?$")
+_YEAR_MONTH_RE = re.compile(r"^(\d{4})[-/](\d{1,2})$")
+_MONTH_YEAR_RE = re.compile(rf"^({_MONTH_NAMES})\.?(?:\s+(\d{{4}}))?$")
+_LAST_DAYS_RE = re.compile(r"^(?:last|past|previous)\s+(\d+)\s+days?$")
+# "last 8 weeks", "past 6 months": that many calendar weeks or months, the current one included
+_LAST_WEEKS_MONTHS_RE = re.compile(r"^(?:last|past|previous)\s+(\d+)\s+(week|month)s?$")
+_RANGE_RE = re.compile(r"^(?:between\s+(.+?)\s+and|from\s+(.+?)\s+(?:to|till|until))\s+(.+)$")
+
+# A period phrase at the end of a query term, e.g. "food last month", "taxi between 1 feb and 10 feb"
+_PERIOD_SUFFIX_RE = re.compile(
+    rf"(?:^|\s)(?:(?:in|on|during|for|of)\s+)?("
+    r"(?:between|from|since)\s.+"
+    r"|(?:this|last|past|previous)\s+(?:\d+\s+(?:days?|weeks?|months?)|week|month|year)"
+    r"|today|day before yesterday|yesterday|\d+\s*days?\s*(?:back|ago)"
+    rf"|(?:\d{{1,2}}(?:st|nd|rd|th)?\s+)?(?:{_MONTH_NAMES})\.?(?:\s+\d{{1,2}}(?:st|nd|rd|th)?)?,?(?:\s+\d{{4}})?"
+    r"|\d{4}[-/.]\d{1,2}(?:[-/.]\d{1,2})?|\d{1,2}[-/.]\d{1,2}[-/.]\d{4}"
+    r")$"
+)
+
+
+# Function to resolve relative dates
+def resolve_relative_date(date_str, today=None):
+    today = today or datetime.today()
+
+    # Predefined mappings for relative dates
+    relative_dates = {
+        "today": today,
+        "yesterday": today - timedelta(days=1),
+        "day before yesterday": today - timedelta(days=2),
+        "tomorrow": today + timedelta(days=1),
+        "day after tomorrow": today + timedelta(days=2),
+    }
+
+    # Directly mapped relative date
+    if date_str.lower() in relative_dates:
+        return relative_dates[date_str.lower()].strftime("%Y-%m-%d")
+
+    # Handling "X days back" or "X days ago"
+    match = re.search(r"(\d+)\s*days?\s*(back|ago)", date_str.lower())
+    if match:
+        days_ago = int(match.group(1))
+        resolved_date = today - timedelta(days=days_ago)
+        return resolved_date.strftime("%Y-%m-%d")
+
+    # If format is unknown, return original string
+    return date_str
+
+
+def _make_date(year, month, day):
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+# Parse one absolute date ("2025-02-9", "9/2/2025", "9 Feb 2025", "Feb 9") into a date, or None.
+# Day-first for numeric dates; a missing year means the current one.
+def parse_date(text, today=None):
+    text = (text or "").strip().lower()
+    year = (today or date.today()).year
+    match = _YMD_RE.match(text)
+    if match:
+        return _make_date(match.group(1), match.group(2), match.group(3))
+    match = _DMY_RE.match(text)
+    if match:
+        return _make_date(match.group(3), match.group(2), match.group(1))
+    match = _DAY_MONTH_RE.match(text)
+    if match:
+        return _make_date(match.group(3) or year, MONTHS[match.group(2)], match.group(1))
+    match = _MONTH_DAY_RE.match(text)
+    if match:
+        return _make_date(match.group(3) or year, MONTHS[match.group(1)], match.group(2))
+    return None
+
+
+# Canonical YYYY-MM-DD form of a stored date. Anything that is not a recognisable
+# date (e.g. an unresolved phrase) is returned unchanged apart from whitespace.
+def normalize_date(value):
+    parsed = parse_date(value)
+    return parsed.isoformat() if parsed else (value or "").strip()
+
+
+def _month_bounds(year, month):
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _period_bounds(text, today):
+    text = _SPACES_RE.sub(" ", text.strip().lower())
+
+    match = _RANGE_RE.match(text)
+    if match:
+        start = _period_bounds(match.group(1) or match.group(2), today)
+        end = _period_bounds(match.group(3), today)
+        if not start or not end:
+            return None
+        return min(start[0], end[0]), max(start[1], end[1])
+    if text.startswith("since "):
+        start = _period_bounds(text[len("since "):], today)
+        return (start[0], today) if start else None
+
+    if text in ("this week", "last week", "previous week", "past week"):
+        monday = today - timedelta(days=today.weekday())
+        if text != "this week":
+            monday -= timedelta(days=7)
+        return monday, monday + timedelta(days=6)
+    if text in ("this month", "last month", "previous month", "past month"):
+        if text == "this month":
+            return _month_bounds(today.year, today.month)
+        last = today.replace(day=1) - timedelta(days=1)
+        return _month_bounds(last.year, last.month)
+    if text in ("this year", "last year", "previous year", "past year"):
+        year = today.year if text == "this year" else today.year - 1
+        return date(year, 1, 1), date(year, 12, 31)
+    match = _LAST_DAYS_RE.match(text)
+    if match:
+        return today - timedelta(days=max(int(match.group(1)), 1) - 1), today
+    match = _LAST_WEEKS_MONTHS_RE.match(text)
+    if match:
+        count = max(int(match.group(1)), 1)
+        if match.group(2) == "week":
+            return today - timedelta(days=today.weekday() + 7 * (count - 1)), today
+        months = today.year * 12 + today.month - 1 - (count - 1)
+        return date(months // 12, months % 12 + 1, 1), today
+
+    match = _YEAR_MONTH_RE.match(text)
+    if match and 1 <= int(match.group(2)) <= 12:
+        return _month_bounds(int(match.group(1)), int(match.group(2)))
+    match = _MONTH_YEAR_RE.match(text)
+    if match:
+        month = MONTHS[match.group(1)]
+        year = int(match.group(2)) if match.group(2) else today.year
+        # "february" in January means the February that just went by
+        if not match.group(2) and month > today.month:
+            year -= 1
+        return _month_bounds(year, month)
+
+    day = parse_date(resolve_relative_date(text, datetime.combine(today, datetime.min.time())), today)
+    return (day, day) if day else None
+
+
+# Resolve a period ("this week", "last month", "february", "last 7 days",
+# "between 1 feb and 10 feb", "since 2025-02-01", "yesterday", "2025-02-10")
+# into inclusive (start, end) ISO dates, or None if the text is not a period.
+def resolve_period(text, today=None):
+    bounds = _period_bounds(text or "", today or date.today())
+    return (bounds[0].isoformat(), bounds[1].isoformat()) if bounds else None
+
+
+# Split a query term into (period phrase, rest) when it ends in a period phrase:
+# "food last month" -> ("last month", "food"). The phrase is None otherwise.
+def split_period_phrase(term, today=None):
+    term = _SPACES_RE.sub(" ", (term or "").strip().lower())
+    match = _PERIOD_SUFFIX_RE.search(term)
+    if match and resolve_period(match.group(1), today):
+        return match.group(1), term[:match.start()].strip()
+    return None, term
+
+
+# Split a query term into (period, rest) when it ends in a period phrase:
+# "food last month" -> (("2025-01-01", "2025-01-31"), "food"). period is None otherwise.
+def split_period(term, today=None):
+    phrase, rest = split_period_phrase(term, today)
+    return (resolve_period(phrase, today), rest) if phrase else (None, rest)
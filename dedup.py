@@ -0,0 +1,103 @@
+"""
+Drops webhook redeliveries before any LLM or storage work is done.
+
+Messages are keyed on the provider's message ID (Meta's messages[].id, Twilio's
+MessageSid). Recently seen IDs live in a bounded in-memory LRU with a TTL; when
+DEDUP_DB is set they are also recorded in a small SQLite table so redeliveries
+are still caught after a restart or by another worker process. The FastAPI app
+uses the *_async methods, which run those SQLite calls through ``run_blocking(func,
+*args)`` (its storage pool) instead of on the event loop.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+from ttlcache import TTLCache
+
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "100000"))
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", str(24 * 60 * 60)))
+DEDUP_DB = os.getenv("DEDUP_DB", "")
+
+
+class MessageDeduplicator:
+    def __init__(self, maxsize=DEDUP_MAX_ENTRIES, ttl=DEDUP_TTL, db_path=DEDUP_DB, run_blocking=None):
+        self.ttl = ttl
+        self.run_blocking = run_blocking
+        self._seen = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.checked = 0
+        self.duplicates = 0
+
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS seen_messages (message_id TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+
+    def _claim_persistent(self, message_id):
+        now = time.time()
+        with self._lock:
+            # Forget expired IDs first so a very late redelivery is treated as new, like in memory
+            self._conn.execute("DELETE FROM seen_messages WHERE message_id = ? AND seen_at < ?", (message_id, now - self.ttl))
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO seen_messages (message_id, seen_at) VALUES (?, ?)", (message_id, now)
+            )
+            return cursor.rowcount == 1
+
+    # Returns True the first time a message ID is seen and False for a redelivery.
+    # Messages without an ID cannot be deduplicated and are always accepted.
+    def first_delivery(self, message_id):
+        if not message_id:
+            return True
+
+        is_new = self._seen.add(message_id)
+        if is_new and self._conn is not None:
+            is_new = self._claim_persistent(message_id)
+
+        with self._lock:
+            self.checked += 1
+            if not is_new:
+                self.duplicates += 1
+        return is_new
+
+    # Undo first_delivery() for a message that was not accepted after all
+    # (e.g. the work queue was full), so the provider's retry is processed
+    def forget(self, message_id):
+        if not message_id:
+            return
+        self._seen.pop(message_id)
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM seen_messages WHERE message_id = ?", (message_id,))
+
+    # Run one of the methods above from the event loop: inline while everything is in
+    # memory, through run_blocking (the default executor when unset) once SQLite is involved
+    async def _blocking(self, func, *args):
+        if self._conn is None:
+            return func(*args)
+        if self.run_blocking is not None:
+            return await self.run_blocking(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def first_delivery_async(self, message_id):
+        return await self._blocking(self.first_delivery, message_id)
+
+    async def forget_async(self, message_id):
+        await self._blocking(self.forget, message_id)
+
+    def prune(self):
+        """Delete expired IDs from the persistent table."""
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM seen_messages WHERE seen_at < ?", (time.time() - self.ttl,))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "duplicates_suppressed": self.duplicates,
+                "cached_ids": len(self._seen),
+                "persistent": self._conn is not None,
+            }
@@ -0,0 +1,255 @@
+"""
+Daily or weekly spending digests for every user, built off the request path.
+
+DigestScheduler runs inside the FastAPI app. At DIGEST_HOUR (local time) after
+each period ends (DIGEST_PERIOD=daily or weekly; off by default) it builds every
+user's digest for that period in one pass over its rows (read through the
+store's date index): total, number of expenses, top categories, and where they
+stand on each budget (budgets.py).
+Each digest is then sent through send_message, so only users who wrote in
+through the Graph API get one: Twilio users (stored under "+"-prefixed E.164
+numbers, where Meta's wa_ids are digits only) and tenants without a Meta phone
+number id are skipped. Users who spent nothing in the period get no digest.
+
+Any number of workers may run the scheduler. A period is claimed in
+DIGEST_STATE_FILE under an exclusive flock before it is built, so only one of
+them sends each period's digests. A worker that dies after claiming a period
+does not resend it: a digest is sent at most once.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from aggregates import category_key
+from budgets import get_budgets, status_line
+from metrics import timed
+from money import format_money
+from storage import get_store
+from tenants import get_tenant, split_user_key
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DIGEST_PERIOD = os.getenv("DIGEST_PERIOD", "off")
+DIGEST_HOUR = int(os.getenv("DIGEST_HOUR", "9"))
+DIGEST_STATE_FILE = os.getenv("DIGEST_STATE_FILE", "digests.json")
+DIGEST_TOP_CATEGORIES = int(os.getenv("DIGEST_TOP_CATEGORIES", "3"))
+# Digests handed to the outbound dispatchers at once; they pace the actual sends
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "64"))
+
+PERIODS = ("daily", "weekly")
+
+logger = logging.getLogger(__name__)
+
+
+# (start, end, key) of the last complete day or week (Monday to Sunday) before `today`
+def digest_window(period, today):
+    if period == "daily":
+        day = (today - timedelta(days=1)).isoformat()
+        return day, day, day
+    monday = today - timedelta(days=today.weekday() + 7)
+    return monday.isoformat(), (monday + timedelta(days=6)).isoformat(), monday.isoformat()
+
+
+def digest_text(period, start, end, total, count, categories, budget_lines=()):
+    when = f"for {start}" if start == end else f"for {start} to {end}"
+    lines = [f"Your {period} spending summary {when}: {format_money(total)} over "
+             f"{count} expense{'s' if count != 1 else ''}."]
+    top = sorted(categories.items(), key=lambda item: (-item[1], item[0]))[:DIGEST_TOP_CATEGORIES]
+    if top:
+        lines.append("Top categories: " + ", ".join(f"{category or 'other'} {format_money(amount)}"
+                                                    for category, amount in top) + ".")
+    if budget_lines:
+        lines.append("Budgets:\n" + "\n".join(budget_lines))
+    return "\n".join(lines)
+
+
+# user id -> digest text for every user with expenses dated start..end, from one
+# pass over `rows` (store.iter_date_range(start, end), or any rows: others are
+# skipped). With `budgets` (a Budgets) each digest also shows where the user
+# stands on their budgets this period.
+@timed("digest_build")
+def build_digests(rows, period, start, end, budgets=None, today=None):
+    today = today or date.today()
+    totals = {}  # user -> [total, count, {category: total}], in minor units
+    for row in rows:
+        if not start <= row["date"] <= end:
+            continue
+        entry = totals.get(row["user_id"])
+        if entry is None:
+            entry = totals[row["user_id"]] = [0, 0, defaultdict(int)]
+        entry[0] += row["amount_minor"]
+        entry[1] += 1
+        entry[2][category_key(row["category"])] += row["amount_minor"]
+
+    digests = {}
+    for user_id, (total, count, categories) in totals.items():
+        budget_lines = []
+        if budgets is not None:
+            budget_lines = [status_line(category, *budgets.spent(user_id, category, today))
+                            for category in sorted(budgets.for_user(user_id))]
+        digests[user_id] = digest_text(period, start, end, total, count, categories, budget_lines)
+    return digests
+
+
+# Record `key` as the last period sent unless it already is; True if this process claimed it
+def claim_period(path, period, key):
+    with open(path, "a+", encoding="utf-8") as file:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            file.seek(0)
+            try:
+                state = json.loads(file.read() or "{}")
+            except ValueError:
+                state = {}
+            if state.get(period, "") >= key:
+                return False
+            state[period] = key
+            file.seek(0)
+            file.truncate()
+            file.write(json.dumps(state))
+            file.flush()
+            os.fsync(file.fileno())
+            return True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+# (tenant, phone) to send a user's digest to through the Graph API, or None for a
+# Twilio user, a tenant without a Meta number, or a tenant no longer configured
+def meta_recipient(user_id):
+    tenant_id, phone = split_user_key(user_id)
+    if not phone.isdigit():
+        return None
+    try:
+        tenant = get_tenant(tenant_id)
+    except KeyError:
+        return None
+    return (tenant, phone) if tenant.phone_number_id else None
+
+
+class DigestScheduler:
+    """
+    Sends the digests at DIGEST_HOUR after every period. ``send(text, to=phone,
+    tenant=tenant)`` is a coroutine function (sendMessage.send_message); the
+    ledger pass runs through ``run_blocking(func, *args)`` so it stays off the
+    event loop.
+    """
+
+    def __init__(self, send, period=DIGEST_PERIOD, hour=DIGEST_HOUR, state_file=DIGEST_STATE_FILE,
+                 run_blocking=None, concurrency=DIGEST_CONCURRENCY):
+        self.send = send
+        self.period = period
+        self.hour = hour
+        self.state_file = state_file
+        self.run_blocking = run_blocking
+        self.concurrency = concurrency
+        self._task = None
+        self.runs = 0
+        self.last_period = None
+        self.last_digests = 0
+        self.last_failed = 0
+        self.last_skipped = 0
+        self.last_build_seconds = None
+
+    @property
+    def enabled(self):
+        return self.period in PERIODS
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # First DIGEST_HOUR after `now` that starts a new day (daily) or week (weekly)
+    def next_run(self, now):
+        candidate = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+        if candidate <= now:
+            candidate += timedelta(days=1)
+        if self.period == "weekly":
+            candidate += timedelta(days=(7 - candidate.weekday()) % 7)
+        return candidate
+
+    async def _run(self):
+        while True:
+            now = datetime.now()
+            await asyncio.sleep((self.next_run(now) - now).total_seconds())
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.exception("Digest run failed: %s", e)
+
+    async def _blocking(self, func, *args):
+        if self.run_blocking is not None:
+            return await self.run_blocking(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def _claim_and_build(self, start, end, key, today):
+        if self.state_file and not claim_period(self.state_file, self.period, key):
+            return None
+        started = time.perf_counter()
+        digests = build_digests(get_store().iter_date_range(start, end), self.period, start, end, get_budgets(), today)
+        self.last_build_seconds = time.perf_counter() - started
+        return digests
+
+    # Build and send the digests for the period before `today`. Returns how many were
+    # sent, or None when another worker already claimed the period.
+    async def run_once(self, today=None):
+        today = today or date.today()
+        start, end, key = digest_window(self.period, today)
+        digests = await self._blocking(self._claim_and_build, start, end, key, today)
+        if digests is None:
+            logger.info("%s digests for %s already sent by another worker", self.period, key)
+            return None
+
+        recipients = {user_id: meta_recipient(user_id) for user_id in digests}
+        skipped = sum(1 for recipient in recipients.values() if recipient is None)
+        slots = asyncio.Semaphore(self.concurrency)
+        failed = 0
+
+        async def deliver(user_id, text):
+            nonlocal failed
+            tenant, phone = recipients[user_id]
+            async with slots:
+                try:
+                    await self.send(text, to=phone, tenant=tenant)
+                except Exception as e:
+                    failed += 1
+                    logger.warning("Digest for %s not sent: %s", user_id, e)
+
+        await asyncio.gather(*(deliver(user_id, text) for user_id, text in digests.items() if recipients[user_id]))
+        sent = len(digests) - skipped - failed
+        self.runs += 1
+        self.last_period = key
+        self.last_digests = sent
+        self.last_failed = failed
+        self.last_skipped = skipped
+        logger.info("Sent %d %s digests for %s (%d failed, %d not Meta users)", sent, self.period, key, failed, skipped)
+        return sent
+
+    def stats(self):
+        return {
+            "period": self.period if self.enabled else "off",
+            "runs": self.runs,
+            "last_period": self.last_period,
+            "last_digests": self.last_digests,
+            "last_failed": self.last_failed,
+            "last_skipped": self.last_skipped,
+            "last_build_seconds": self.last_build_seconds,
+        }
@@ -0,0 +1,327 @@
+"""
+Outbound message dispatch with rate limiting, retries and a circuit breaker.
+
+Every reply goes through a dispatcher instead of calling the provider
+directly. The dispatcher:
+
+* waits on a token bucket so sends stay under the provider's throughput limit
+  (OUTBOUND_RATE messages per second, bursts of OUTBOUND_BURST),
+* sends one recipient's messages strictly in order while different
+  recipients proceed concurrently,
+* retries throttling and server errors (RetryableSendError) with exponential
+  backoff and full jitter, up to OUTBOUND_MAX_ATTEMPTS,
+* stops calling a provider that keeps failing: after OUTBOUND_BREAKER_FAILURES
+  consecutive failures sends are dropped for OUTBOUND_BREAKER_RESET seconds,
+  then a single probe decides whether to close the circuit again.
+
+AsyncDispatcher serves the FastAPI app (Graph API), ThreadDispatcher the
+Flask app (Twilio).
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from metrics import OUTBOUND, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", "50"))
+OUTBOUND_BURST = int(os.getenv("OUTBOUND_BURST", "50"))
+OUTBOUND_MAX_ATTEMPTS = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "5"))
+OUTBOUND_BACKOFF_BASE = float(os.getenv("OUTBOUND_BACKOFF_BASE", "0.5"))
+OUTBOUND_BACKOFF_MAX = float(os.getenv("OUTBOUND_BACKOFF_MAX", "30"))
+OUTBOUND_BREAKER_FAILURES = int(os.getenv("OUTBOUND_BREAKER_FAILURES", "10"))
+OUTBOUND_BREAKER_RESET = float(os.getenv("OUTBOUND_BREAKER_RESET", "30"))
+
+
+class SendError(Exception):
+    """A send that failed for good (bad request, auth, unknown recipient)."""
+
+
+class RetryableSendError(SendError):
+    """Throttled or a server-side failure: worth trying again, after ``retry_after`` seconds if given."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(SendError):
+    """The provider has been failing; the message was dropped without trying."""
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``burst``. Thread-safe."""
+
+    def __init__(self, rate=OUTBOUND_RATE, burst=OUTBOUND_BURST, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    # Take a token; returns how long the caller must wait before using it (0 if available now)
+    def reserve(self):
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self):
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def acquire_blocking(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failures`` consecutive failures -> one probe after ``reset_timeout``."""
+
+    def __init__(self, failures=OUTBOUND_BREAKER_FAILURES, reset_timeout=OUTBOUND_BREAKER_RESET, clock=time.monotonic):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._probing = False
+        self.opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if self._clock() - self._opened_at >= self.reset_timeout else "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or self._clock() - self._opened_at < self.reset_timeout:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._probing = False
+
+    def _fail_locked(self):
+        self._consecutive += 1
+        if self._probing or (self._opened_at is None and self._consecutive >= self.failures):
+            if self._opened_at is None:
+                self.opened += 1
+            self._opened_at = self._clock()
+        self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._fail_locked()
+
+    # A send ended without a verdict on the provider (a permanent error, an exception):
+    # a probe still counts as failed so the circuit does not wait on it forever
+    def settle(self):
+        with self._lock:
+            if self._probing:
+                self._fail_locked()
+
+
+# Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]
+def backoff_delay(attempt, base=OUTBOUND_BACKOFF_BASE, cap=OUTBOUND_BACKOFF_MAX, rng=random):
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class DispatchStats:
+    """Send counters plus latency (first attempt to delivery) over the last 1000 sends."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.retries = 0
+        self.dropped = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=1000)
+
+    def record(self, field, latency=None):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def snapshot(self, breaker):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            return {
+                "sent": self.sent,
+                "retries": self.retries,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "circuit": breaker.state,
+                "circuit_opened": breaker.opened,
+                "latency_avg_seconds": sum(latencies) / len(latencies) if latencies else 0.0,
+                "latency_p95_seconds": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+                "latency_max_seconds": latencies[-1] if latencies else 0.0,
+            }
+
+
+class _Dispatcher:
+    def __init__(self, transport, rate=OUTBOUND_RATE, burst=OUTBOUND_BURST, max_attempts=OUTBOUND_MAX_ATTEMPTS,
+                 backoff_base=OUTBOUND_BACKOFF_BASE, backoff_max=OUTBOUND_BACKOFF_MAX,
+                 breaker=None, name="outbound"):
+        self.transport = transport
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.name = name
+        self.stats = DispatchStats()
+
+    def _next_delay(self, error, attempt):
+        """Seconds to wait before retrying, or None to give up."""
+        if not isinstance(error, RetryableSendError) or attempt + 1 >= self.max_attempts:
+            return None
+        self._record("retries")
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+        return max(delay, error.retry_after or 0)
+
+    # Count an outcome in the stats and the metrics; a delivery also times the outbound_send stage
+    def _record(self, outcome, latency=None):
+        self.stats.record(outcome, latency)
+        OUTBOUND.inc(dispatcher=self.name, outcome=outcome)
+        if latency is not None:
+            STAGE_SECONDS.observe(latency, stage="outbound_send")
+
+    def _give_up(self, recipient, error):
+        self._record("dropped" if isinstance(error, (RetryableSendError, CircuitOpenError)) else "failed")
+        logger.warning("%s: giving up on message to %s: %s", self.name, recipient, error)
+
+    def snapshot(self):
+        return self.stats.snapshot(self.breaker)
+
+
+class AsyncDispatcher(_Dispatcher):
+    """``transport`` is a coroutine function ``transport(recipient, *args)`` making one attempt."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tails = {}  # recipient -> future of that recipient's latest send
+
+    async def _deliver(self, recipient, args):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                error = CircuitOpenError(f"{self.name} circuit is open")
+                self._give_up(recipient, error)
+                raise error
+            await self.bucket.acquire()
+            delivered = False
+            try:
+                result = await self.transport(recipient, *args)
+                delivered = True
+            except SendError as error:
+                if isinstance(error, RetryableSendError):
+                    self.breaker.record_failure()
+                delay = self._next_delay(error, attempt)
+                if delay is None:
+                    self._give_up(recipient, error)
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                if not delivered:
+                    self.breaker.settle()
+            self.breaker.record_success()
+            self._record("sent", time.monotonic() - started)
+            return result
+
+    # Send after every earlier message to the same recipient has been dealt with
+    async def send(self, recipient, *args):
+        previous = self._tails.get(recipient)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[recipient] = done
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            return await self._deliver(recipient, args)
+        finally:
+            done.set_result(None)
+            if self._tails.get(recipient) is done:
+                del self._tails[recipient]
+
+
+class ThreadDispatcher(_Dispatcher):
+    """
+    Blocking equivalent: ``transport(recipient, *args)`` is a plain function.
+    Sends to one recipient run one at a time in the order send() was called,
+    so a caller's own messages keep their order.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tails = {}  # recipient -> event set when that recipient's latest send is done
+        self._tails_lock = threading.Lock()
+
+    def _deliver(self, recipient, args):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                error = CircuitOpenError(f"{self.name} circuit is open")
+                self._give_up(recipient, error)
+                raise error
+            self.bucket.acquire_blocking()
+            delivered = False
+            try:
+                result = self.transport(recipient, *args)
+                delivered = True
+            except SendError as error:
+                if isinstance(error, RetryableSendError):
+                    self.breaker.record_failure()
+                delay = self._next_delay(error, attempt)
+                if delay is None:
+                    self._give_up(recipient, error)
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            finally:
+                if not delivered:
+                    self.breaker.settle()
+            self.breaker.record_success()
+            self._record("sent", time.monotonic() - started)
+            return result
+
+    # Send after every earlier message to the same recipient has been dealt with
+    def send(self, recipient, *args):
+        done = threading.Event()
+        with self._tails_lock:
+            previous = self._tails.get(recipient)
+            self._tails[recipient] = done
+        try:
+            if previous is not None:
+                previous.wait()
+            return self._deliver(recipient, args)
+        finally:
+            done.set()
+            with self._tails_lock:
+                if self._tails.get(recipient) is done:
+                    del self._tails[recipient]
@@ -0,0 +1,409 @@
+"""
+The expense bot itself, shared by both apps: understanding a message, saving or
+looking up expenses, and the replies to send back.
+
+app.py (Twilio, Flask) and main.py (Meta Graph API, FastAPI) are thin adapters
+around it: they parse their provider's webhook, queue the message, call
+interpret_message() (or interpret_message_async()) and handle_message(), and
+send the replies through their provider. Both take the sender's user key, so
+follow-ups ("and last month?", "make that 300") are resolved from the sender's
+session (sessions.py) before any Groq call. The Groq calls come in a blocking
+variant for the Flask workers and an async one for the event loop; both use the
+same prompts, parsing and response cache.
+
+Import this module first: it loads .env (see settings.py) before the modules
+that read their configuration at import time.
+"""
+import settings  # noqa: F401  (loads .env before the imports below read the environment)
+
+import json
+import logging
+import re
+from datetime import datetime
+
+import extractor
+import llmbatch
+from aggregates import spending_total
+from budgets import apply_budget_command, get_budgets, parse_budget_command
+from dates import resolve_relative_date
+from extractor import EXTRACTION_MODEL, extract_message_with_llama, extract_message_with_llama_async, llm_slots
+from fastpath import parse_message_locally
+from ledger import answer_analytics, get_ledger, parse_analytics_query
+from httpclients import get_async_client, get_session
+from llmcache import cached_llm, llm_cache
+from metrics import timed
+from money import ConversionError, detect_currency, format_money, from_minor, parse_money, sum_minor
+from reports import WHATSAPP_MESSAGE_LIMIT, summary_pages, transaction_line
+from searchindex import get_search_index
+from sessions import parse_follow_up, sessions
+from storage import get_store, query_expenses
+
+logger = logging.getLogger(__name__)
+
+GROQ_MODEL = "llama3-8b-8192"
+
+ADDED_REPLY = "Expense added successfully ✅"
+NOT_FOUND_REPLY = "I couldn't find that expense. Nothing was changed."
+HELP_REPLY = "I am here to help you manage your expenses!\nPlease enter or query valid expense😊"
+
+CLASSIFY_PROMPT = """You are an assistant that determines if the user wants to *add* an expense or *query* past expenses.
+
+            - If the user is reporting a new expense (e.g., "I spent 100 on lunch", "Bought groceries for 500"), classify it as *'add'*.
+            - If the user is asking about past expenses (e.g., "How much did I spend on food?", "Show my transactions"), classify it as *'query'*.
+            - if the user is not asking query and not reporting a new expense , classify it as *'none'*.
+            - Respond with ONLY one word: *'add'* or *'query'* or *'none'*. Do not explain.
+            """
+
+QUERY_TERM_PROMPT = """Extract the *expense category or item name* from the user's query.
+
+                - If the user asks *"How much did I spend on food?"*, return "food".
+                - If they ask *"How much for a dustbin?"*, return "dustbin".
+                - If no category/item is found, return "unknown".
+
+                Respond with *ONLY the extracted term* (no explanations)."""
+
+EXPENSE_PROMPT = "Extract expense details from user input and return in JSON format with keys: amount, category, description, date."
+
+
+def groq_payload(prompt, message):
+    return {
+        "model": GROQ_MODEL,
+        "messages": [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": message}
+        ]
+    }
+
+
+def groq_headers():
+    return {
+        "Authorization": f"Bearer {extractor.GROQ_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+
+def _content(response):
+    return response.json()["choices"][0]["message"]["content"].strip()
+
+
+# "add" or "query"; None for "none" or anything the model should not have said
+def parse_classification(response):
+    if response.status_code != 200:
+        return None
+    try:
+        classification = _content(response).lower()
+    except (KeyError, IndexError, ValueError):
+        return None
+    return classification if classification in ("add", "query") else None
+
+
+def parse_query_term(response):
+    if response.status_code != 200:
+        return None
+    try:
+        term = _content(response).lower()
+    except (KeyError, IndexError, ValueError):
+        return None
+    return term if term and term != "unknown" else None
+
+
+# The JSON object in the reply, which the model sometimes wraps in prose or a code fence
+def parse_expense_details(response):
+    if response.status_code != 200:
+        return None
+    try:
+        json_match = re.search(r"{[\s\S]*}", _content(response))
+        if json_match:
+            return json.loads(json_match.group(0))
+    except (KeyError, IndexError, ValueError):
+        return None
+    return None
+
+
+def today():
+    return datetime.today().strftime("%Y-%m-%d")
+
+
+# Resolve relative dates after the cache rather than before, so a cached "yesterday" stays correct
+def resolve_expense(extracted_data):
+    if not isinstance(extracted_data, dict):
+        return None
+    if extracted_data.get("date"):
+        extracted_data["date"] = resolve_relative_date(extracted_data["date"])
+    else:
+        extracted_data["date"] = today()
+    return extracted_data
+
+
+# The expense with an exact Decimal amount and its currency: one named in the
+# model's amount ("₹500"), else in the message ("$12 for lunch"), else the ledger's
+def priced(details, message):
+    if not details:
+        return details
+    minor, currency = parse_money(details.get("amount"), detect_currency(message))
+    return dict(details, amount=from_minor(minor, currency), currency=currency)
+
+
+# (request type, details) from a single-pass or local extraction
+def from_extraction(extracted, message):
+    if extracted["intent"] == "add":
+        date = extracted["date"]
+        return "add", priced({
+            "amount": extracted["amount"],
+            "category": extracted["category"] or "Unknown",
+            "description": extracted["description"] or "",
+            "date": resolve_relative_date(date) if date else today(),
+        }, message)
+    if extracted["intent"] == "query":
+        return "query", extracted["query_term"].lower()
+    return None, None
+
+
+# Blocking Groq calls, for the Flask workers
+
+@timed("classify")
+@cached_llm("classify", GROQ_MODEL)
+def classify_request(message):
+    return parse_classification(get_session().post(extractor.GROQ_URL, json=groq_payload(CLASSIFY_PROMPT, message),
+                                                   headers=groq_headers()))
+
+
+@timed("query_term")
+@cached_llm("extract_query_term", GROQ_MODEL)
+def extract_query_term(message):
+    return parse_query_term(get_session().post(extractor.GROQ_URL, json=groq_payload(QUERY_TERM_PROMPT, message),
+                                               headers=groq_headers()))
+
+
+# Expense details as returned by the model; relative dates are left unresolved
+@cached_llm("parse_expense", GROQ_MODEL)
+def request_expense_details(message):
+    return parse_expense_details(get_session().post(extractor.GROQ_URL, json=groq_payload(EXPENSE_PROMPT, message),
+                                                    headers=groq_headers()))
+
+
+@timed("parse")
+def parse_expense(message):
+    return resolve_expense(request_expense_details(message))
+
+
+# Budget commands and analytical questions, which need neither the LLM nor the session
+def interpret_command(message):
+    command = parse_budget_command(message)
+    if command is not None:
+        return "budget", command
+    analytics = parse_analytics_query(message)
+    if analytics is not None:
+        return "analytics", analytics
+    return None
+
+
+# Budget commands, analytical questions and follow-ups to the sender's last message,
+# none of which need the LLM; None for anything else
+def interpret_locally(message, user_id=None):
+    return interpret_command(message) or parse_follow_up(message, sessions.get(user_id) if user_id else None)
+
+
+# Interpret a message with the local rules, then one structured Groq call, falling
+# back to the classify + parse/extract calls when the single-pass response is unusable.
+# Returns ("add", expense), ("query", term), ("budget", command), ("analytics", query),
+# ("edit", change), ("delete", target) or (None, None).
+def interpret_message(message, user_id=None):
+    local = interpret_locally(message, user_id)
+    if local is not None:
+        return local
+
+    extracted = parse_message_locally(message) or extract_message_with_llama(message)
+    if extracted is not None:
+        return from_extraction(extracted, message)
+
+    request_type = classify_request(message)
+    if request_type == "add":
+        return request_type, priced(parse_expense(message), message)
+    if request_type == "query":
+        return request_type, extract_query_term(message)
+    return None, None
+
+
+# The same on the event loop, for the FastAPI app
+
+async def post_to_groq(prompt, message):
+    async with llm_slots():
+        return await get_async_client().post(extractor.GROQ_URL, json=groq_payload(prompt, message),
+                                             headers=groq_headers())
+
+
+@timed("classify")
+@cached_llm("classify", GROQ_MODEL)
+async def classify_request_async(message):
+    return parse_classification(await post_to_groq(CLASSIFY_PROMPT, message))
+
+
+@timed("query_term")
+@cached_llm("extract_query_term", GROQ_MODEL)
+async def extract_query_term_async(message):
+    return parse_query_term(await post_to_groq(QUERY_TERM_PROMPT, message))
+
+
+@cached_llm("parse_expense", GROQ_MODEL)
+async def request_expense_details_async(message):
+    return parse_expense_details(await post_to_groq(EXPENSE_PROMPT, message))
+
+
+@timed("parse")
+async def parse_expense_async(message):
+    return resolve_expense(await request_expense_details_async(message))
+
+
+# Single-pass extraction, micro-batched with other concurrent messages when LLM_BATCH_WINDOW_MS is set
+# (a batch takes its llm_slots() slot when it is sent)
+@timed("extract")
+async def extract_message_async(message):
+    scheduler = llmbatch.batch_scheduler
+    if scheduler.enabled:
+        return await llm_cache.get_or_compute_async(
+            "extract", EXTRACTION_MODEL, message, lambda: scheduler.extract(message)
+        )
+    async with llm_slots():
+        return await extract_message_with_llama_async(message)
+
+
+async def interpret_message_async(message, user_id=None):
+    local = interpret_command(message)
+    if local is None:
+        local = parse_follow_up(message, await sessions.get_async(user_id) if user_id else None)
+    if local is not None:
+        return local
+
+    extracted = parse_message_locally(message)
+    if extracted is None:
+        extracted = await extract_message_async(message)
+    if extracted is not None:
+        return from_extraction(extracted, message)
+
+    request_type = await classify_request_async(message)
+    if request_type == "add":
+        return request_type, priced(await parse_expense_async(message), message)
+    if request_type == "query":
+        return request_type, await extract_query_term_async(message)
+    return None, None
+
+
+# Save expense to the configured store (expenses.csv by default) and return its row id
+@timed("storage_write")
+def save_expense(user_id, amount, category, description, date, currency=None):
+    return get_store().add(user_id, amount, category, description, date, currency)
+
+
+# Change or delete one of the user's expenses; a row id of None means their latest.
+# Returns the row as it is now (edit) or was (delete), or None if there is no such row.
+@timed("storage_write")
+def change_expense(user_id, request_type, row_id, changes=None):
+    store = get_store()
+    if row_id is None:
+        latest = store.last_row(user_id)
+        if latest is None:
+            return None
+        row_id = latest["id"]
+    if request_type == "delete":
+        return store.delete(user_id, row_id)
+    return store.update(user_id, row_id, **changes)
+
+
+#  Fetch filtered expenses (Checks Category + Description) as a list of messages that
+#  each fit in `limit` characters. Totals are in LEDGER_CURRENCY, added up as minor
+#  units. When the reply is a total only (itemize=False) it comes from the running
+#  aggregates if they are sure to give the same total as the search (see
+#  aggregates.spending_total()); otherwise the matching transactions are found through
+#  the search index (plurals, synonyms, typos) and, for a period such as "last month",
+#  the date index.
+@timed("storage_read")
+def fetch_filtered_expenses(user_id, search_term, limit=WHATSAPP_MESSAGE_LIMIT, itemize=True):
+    search_term = search_term.replace('"', '').strip().lower()
+    logger.debug("Searching for: '%s'", search_term)
+
+    index = get_search_index()
+    if not itemize:
+        aggregate = spending_total(user_id, search_term, index)
+        if aggregate is not None:
+            return [f"You have spent a total of {format_money(aggregate[0])} on {search_term}."]
+
+    transactions = query_expenses(get_store(), user_id, search_term, index=index)
+    total_spent = format_money(sum_minor([txn["amount_minor"] for txn in transactions]))
+    if not transactions:
+        return [f"No expenses found for {search_term}."]
+    if not itemize:
+        return [f"You have spent a total of {total_spent} on {search_term}."]
+
+    header = f"You have spent a total of {total_spent} on {search_term}.\nHere are your transactions:"
+    pages = summary_pages(header, (transaction_line(txn) for txn in transactions), len(transactions), limit=limit)
+    logger.debug("Response: %d message(s), first: %s", len(pages), pages[0])
+    return pages
+
+
+# Act on an interpreted message: save, edit or delete an expense, look up the query,
+# answer an analytical question from the columnar ledger or change a budget. Blocking
+# (storage I/O). Returns the replies to send, in order, and a result for the caller.
+# Budget alerts crossed by a new or edited expense follow its reply. The user's
+# session remembers the intent, the question and the expense for follow-ups.
+def handle_message(user_id, request_type, details, limit=WHATSAPP_MESSAGE_LIMIT, itemize=True):
+    if request_type == "add":
+        logger.debug("Parsed Expense: %s", details)
+        if not details:
+            return [], {"message": "Could not extract expense details"}
+        budgets = get_budgets()  # subscribed before the save, so it sees the row
+        try:
+            row_id = save_expense(user_id, details.get("amount", 0), details.get("category", "Unknown"),
+                                  details.get("description", ""), details.get("date") or today(), details.get("currency"))
+        except ConversionError as e:
+            logger.warning("Expense not saved: %s", e)
+            return [f"Sorry, I can't record {details.get('currency')} amounts yet."], {"error": str(e)}
+        except Exception as e:
+            logger.exception("Error saving expense: %s", e)
+            return [], {"error": "Failed to save expense"}
+        sessions.update(user_id, intent="add", expense_id=row_id)
+        return [ADDED_REPLY] + budgets.pop_alerts(user_id), {"message": "Expense added"}
+
+    if request_type in ("edit", "delete"):
+        logger.debug("Follow-up %s: %s", request_type, details)
+        budgets = get_budgets()
+        try:
+            row = change_expense(user_id, request_type, details["id"], details.get("changes"))
+        except ConversionError as e:
+            logger.warning("Expense not changed: %s", e)
+            return ["Sorry, I can't record amounts in that currency yet."], {"error": str(e)}
+        except Exception as e:
+            logger.exception("Error changing expense: %s", e)
+            return [], {"error": "Failed to change expense"}
+        if row is None:
+            return [NOT_FOUND_REPLY], {"message": NOT_FOUND_REPLY}
+        if request_type == "delete":
+            sessions.update(user_id, intent="delete", expense_id=None)
+            reply = f"Deleted:\n{transaction_line(row)}"
+            return [reply], {"message": reply}
+        sessions.update(user_id, intent="edit", expense_id=row["id"])
+        reply = f"Updated:\n{transaction_line(row)}"
+        return [reply] + budgets.pop_alerts(user_id), {"message": reply}
+
+    if request_type == "query":
+        logger.debug("Extracted Query Term: %s", details)
+        if not details:
+            return [], {"message": "Could not identify query term"}
+        # The model may hand back "top categories" or "monthly trend" as the term
+        analytics = parse_analytics_query(details)
+        if analytics is not None:
+            return handle_message(user_id, "analytics", analytics, limit=limit, itemize=itemize)
+        pages = fetch_filtered_expenses(user_id, details, limit=limit, itemize=itemize)
+        sessions.update(user_id, intent="query", filter=details)
+        return pages, {"message": pages}
+
+    if request_type == "analytics":
+        reply = answer_analytics(get_ledger(), user_id, details)
+        sessions.update(user_id, intent="analytics", filter=details)
+        return [reply], {"message": reply}
+
+    if request_type == "budget":
+        reply = apply_budget_command(get_budgets(), user_id, details)
+        return [reply], {"message": reply}
+
+    return [HELP_REPLY], {"message": "Could not classify request"}
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import json
+import logging
+import re
+import weakref
+from httpclients import get_session, get_async_client
+from llmcache import cached_llm
+from metrics import timed
+from money import CURRENCY_RE
+
+logger = logging.getLogger(__name__)
+
+# Groq API Configuration
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_URL = os.getenv("GROQ_URL", "https://api.groq.com/openai/v1/chat/completions")
+EXTRACTION_MODEL = os.getenv("EXTRACTION_MODEL", "llama3-8b-8192")
+
+# At most LLM_CONCURRENCY async Groq calls in flight per event loop, batched or not
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "32"))
+_llm_slots = weakref.WeakKeyDictionary()
+
+
+# The running loop's semaphore bounding Groq calls. Each loop gets its own on first
+# use, since an asyncio.Semaphore binds to the loop that first waits on it.
+def llm_slots():
+    loop = asyncio.get_running_loop()
+    slots = _llm_slots.get(loop)
+    if slots is None:
+        slots = _llm_slots[loop] = asyncio.Semaphore(LLM_CONCURRENCY)
+    return slots
+
+
+INTENTS = ("add", "query", "none")
+EXTRACTION_KEYS = ("intent", "amount", "category", "description", "date", "query_term")
+
+EXTRACTION_PROMPT = """You read one WhatsApp message sent to an expense tracker and return a single JSON object.
+
+- "intent": "add" if the user is reporting a new expense (e.g. "I spent 100 on lunch"), "query" if they are asking about past expenses (e.g. "How much did I spend on food?"), otherwise "none".
+- "amount": the amount spent as a number, or null.
+- "category": the expense category (e.g. "food", "books"), or null.
+- "description": a short description of the item, or null.
+- "date": the date exactly as the user said it (e.g. "yesterday", "3 days ago", "2025-02-10"), or null.
+- "query_term": for a query, the category or item name asked about, followed by any time period exactly as the user said it (e.g. "food", "dustbin", "food last month", "this week"), or null.
+
+Respond with ONLY the JSON object with exactly these keys: intent, amount, category, description, date, query_term."""
+
+
+# Build the single-pass JSON-mode request for a message
+def build_extraction_payload(message):
+    return {
+        "model": EXTRACTION_MODEL,
+        "response_format": {"type": "json_object"},
+        "temperature": 0,
+        "messages": [
+            {"role": "system", "content": EXTRACTION_PROMPT},
+            {"role": "user", "content": message}
+        ]
+    }
+
+
+def _optional_text(value):
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"expected a string, got {type(value).__name__}")
+    value = value.strip()
+    return value or None
+
+
+def _optional_amount(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError("amount must be a number")
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        # "₹500" or "12 USD": the currency is picked up from the message afterwards (engine.priced)
+        match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*", CURRENCY_RE.sub("", value.replace(",", "")))
+        if match:
+            number = float(match.group(1))
+            return int(number) if number.is_integer() else number
+    raise ValueError(f"amount is not a number: {value!r}")
+
+
+# Strictly validate an extraction against the schema, raising ValueError on any mismatch
+def validate_extraction(data):
+    if not isinstance(data, dict):
+        raise ValueError("extraction must be a JSON object")
+
+    missing = [key for key in EXTRACTION_KEYS if key not in data]
+    extra = [key for key in data if key not in EXTRACTION_KEYS]
+    if missing or extra:
+        raise ValueError(f"unexpected keys (missing={missing}, extra={extra})")
+
+    intent = data["intent"]
+    if not isinstance(intent, str) or intent.strip().lower() not in INTENTS:
+        raise ValueError(f"invalid intent: {intent!r}")
+
+    result = {
+        "intent": intent.strip().lower(),
+        "amount": _optional_amount(data["amount"]),
+        "category": _optional_text(data["category"]),
+        "description": _optional_text(data["description"]),
+        "date": _optional_text(data["date"]),
+        "query_term": _optional_text(data["query_term"]),
+    }
+
+    if result["query_term"] and result["query_term"].lower() == "unknown":
+        result["query_term"] = None
+    if result["intent"] == "add" and result["amount"] is None:
+        raise ValueError("add intent without an amount")
+    if result["intent"] == "query" and not result["query_term"]:
+        raise ValueError("query intent without a query term")
+
+    return result
+
+
+# Pull the validated extraction out of a Groq chat completion body
+def parse_extraction_response(response_json):
+    try:
+        content = response_json["choices"][0]["message"]["content"].strip()
+        return validate_extraction(json.loads(content))
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        logger.info("Rejected single-pass extraction: %s", e)
+        return None
+
+
+# Classify the message and extract its slots in one Groq round-trip.
+# Returns None when the call fails or the response does not match the schema,
+# so callers can fall back to the multi-call path. The date is returned as the
+# user said it, so cached results stay valid across days.
+@timed("extract")
+@cached_llm("extract", EXTRACTION_MODEL)
+def extract_message_with_llama(message):
+    import requests
+
+    headers = {
+        "Authorization": f"Bearer {GROQ_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    try:
+        response = get_session().post(GROQ_URL, json=build_extraction_payload(message), headers=headers)
+    except requests.RequestException as e:
+        logger.warning("Single-pass extraction failed: %s", e)
+        return None
+
+    if response.status_code == 200:
+        return parse_extraction_response(response.json())
+    return None
+
+
+# Async variant of extract_message_with_llama for the FastAPI app
+@cached_llm("extract", EXTRACTION_MODEL)
+async def extract_message_with_llama_async(message):
+    import httpx
+
+    headers = {
+        "Authorization": f"Bearer {GROQ_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    try:
+        response = await get_async_client().post(GROQ_URL, json=build_extraction_payload(message), headers=headers)
+    except httpx.HTTPError as e:
+        logger.warning("Single-pass extraction failed: %s", e)
+        return None
+
+    if response.status_code == 200:
+        return parse_extraction_response(response.json())
+    return None
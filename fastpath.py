@@ -0,0 +1,180 @@
+import os
+import re
+import threading
+from dates import resolve_relative_date, split_period
+from metrics import Counter, Gauge
+
+# Set FASTPATH_ENABLED=0 to send every message to the LLM
+FASTPATH_ENABLED = os.getenv("FASTPATH_ENABLED", "1") != "0"
+
+# Results scoring below this are handed to the LLM instead
+CONFIDENCE_THRESHOLD = float(os.getenv("FASTPATH_CONFIDENCE", "0.8"))
+
+CURRENCY_WORDS = r"(?:rs\.?|inr|rupees?|rupee|₹)"
+
+AMOUNT_RE = re.compile(
+    rf"(?:{CURRENCY_WORDS}\s*)?(?<![\w.])(\d{{1,3}}(?:,\d{{3}})+|\d+)(?:\.(\d{{1,2}}))?(?![\w.])(?:\s*{CURRENCY_WORDS}(?!\w))?",
+    re.IGNORECASE,
+)
+
+DATE_RE = re.compile(
+    r"\b(day before yesterday|day after tomorrow|yesterday|today|tomorrow|\d+\s*days?\s*(?:back|ago))\b",
+    re.IGNORECASE,
+)
+
+# "dont add 200 for food", "cancel the 500 for taxi": left to the LLM
+NEGATION_RE = re.compile(r"\b(?:don['’]?t|do\s+not|didn['’]?t|did\s+not|never|cancel(?:led)?)\b", re.IGNORECASE)
+
+ADD_VERBS_RE = re.compile(r"\b(spent|spend|paid|pay|bought|buy|add|added|gave|purchased)\b", re.IGNORECASE)
+
+# "what" needs a spending verb, or "what is 5 plus 3 for me" would be a query for "me"
+QUERY_RE = re.compile(
+    r"^\s*(?:how\s+much\b.*?\b(?:did\s+i\s+)?(?:spen[dt]|pay|paid)?|what\b.*?\b(?:spen[dt]|pay|paid|cost)\b)"
+    r"\s*\b(?:on|for)\s+(?:a\s+|an\s+|the\s+|my\s+)?([a-z][a-z /&-]*?)\s*\??\s*$"
+    r"|^\s*show\s+(?:me\s+)?(?:my\s+)?(?:expenses|transactions|spending)\s+(?:on|for)\s+([a-z][a-z /&-]*?)\s*\??\s*$",
+    re.IGNORECASE,
+)
+
+# "How much did I spend last week?": a period with no topic
+PERIOD_QUERY_RE = re.compile(
+    r"^\s*how\s+much\s+(?:did|have)\s+i\s+(?:spen[dt]|paid)\s+(?:in\s+|during\s+)?(.+?)\s*\??\s*$",
+    re.IGNORECASE,
+)
+
+# "on <thing>" / "for <thing>", stopping at a date phrase or the end of the message
+TOPIC_RE = re.compile(
+    r"\b(?:on|for)\s+(?:a\s+|an\s+|the\s+|some\s+)?([a-z][a-z /&-]*?)\s*(?=\b(?:day before yesterday|yesterday|today|tomorrow|\d+\s*days?)\b|[.!?]|$)",
+    re.IGNORECASE,
+)
+
+# Keyword grammar: words that map directly to a category
+CATEGORY_KEYWORDS = {
+    "food": ("food", "lunch", "dinner", "breakfast", "snacks", "snack", "chips", "pizza", "burger", "meal", "chai", "tea", "coffee"),
+    "groceries": ("groceries", "grocery", "vegetables", "fruits", "milk"),
+    "transport": ("transport", "taxi", "cab", "uber", "ola", "auto", "bus", "train", "metro", "fuel", "petrol"),
+    "books": ("books", "book", "stationery"),
+    "clothing": ("clothing", "clothes", "tshirt", "shirt", "jeans", "shoes"),
+    "entertainment": ("entertainment", "movie", "movies", "concert", "games", "netflix"),
+    "bills": ("bills", "bill", "electricity", "rent", "recharge", "internet", "wifi"),
+    "health": ("health", "medicine", "medicines", "doctor", "pharmacy"),
+}
+KEYWORD_TO_CATEGORY = {word: category for category, words in CATEGORY_KEYWORDS.items() for word in words}
+
+_stats_lock = threading.Lock()
+FASTPATH_STATS = {"hits": 0, "misses": 0}
+
+
+def _record(hit):
+    with _stats_lock:
+        FASTPATH_STATS["hits" if hit else "misses"] += 1
+    FASTPATH_MESSAGES.inc(outcome="hit" if hit else "miss")
+
+
+# Share of messages answered without the LLM
+def fastpath_hit_rate():
+    with _stats_lock:
+        total = FASTPATH_STATS["hits"] + FASTPATH_STATS["misses"]
+        return FASTPATH_STATS["hits"] / total if total else 0.0
+
+
+FASTPATH_MESSAGES = Counter("expense_bot_fastpath_messages_total", "Messages tried on the fast path, by outcome",
+                            ["outcome"])
+FASTPATH_HIT_RATE = Gauge("expense_bot_fastpath_hit_rate", "Share of messages answered without the LLM",
+                          function=fastpath_hit_rate)
+
+
+def _parse_amount(match):
+    whole = int(match.group(1).replace(",", ""))
+    if match.group(2):
+        return whole + int(match.group(2).ljust(2, "0")) / 100
+    return whole
+
+
+def _parse_query(message):
+    match = QUERY_RE.match(message)
+    if match:
+        term = (match.group(1) or match.group(2)).strip().lower()
+    else:
+        match = PERIOD_QUERY_RE.match(message)
+        if not match:
+            return None, 0.0
+        term = match.group(1).strip().lower()
+        period, rest = split_period(term)
+        if period is None or rest:
+            return None, 0.0
+
+    # A trailing period ("food last week") does not make the topic any less clear
+    topic = split_period(term)[1]
+    return {
+        "intent": "query",
+        "amount": None,
+        "category": None,
+        "description": None,
+        "date": None,
+        "query_term": term,
+    }, 1.0 if len(topic.split()) <= 2 else 0.6
+
+
+def _parse_add(message):
+    text = DATE_RE.sub(lambda m: " " * len(m.group(0)), message)
+    amounts = AMOUNT_RE.findall(text)
+    if len(amounts) != 1:
+        return None, 0.0
+
+    confidence = 0.5
+    if ADD_VERBS_RE.search(message):
+        confidence += 0.3
+
+    topic_match = TOPIC_RE.search(AMOUNT_RE.sub(" ", text))
+    topic = topic_match.group(1).strip().lower() if topic_match else None
+    if not topic:
+        # "Bought groceries for 500": fall back to a known keyword anywhere in the message
+        topic = next((word for word in re.findall(r"[a-z]+", text.lower()) if word in KEYWORD_TO_CATEGORY), None)
+        if not topic:
+            return None, 0.0
+    words = topic.split()
+
+    category = next((KEYWORD_TO_CATEGORY[word] for word in words if word in KEYWORD_TO_CATEGORY), None)
+    if category:
+        confidence += 0.2
+        description = "" if topic == category else topic
+    elif len(words) == 1:
+        # Unknown single word: keep it as the category, as the LLM would
+        category = topic
+        description = ""
+        confidence += 0.1
+    else:
+        return None, 0.0
+
+    date = None
+    date_match = DATE_RE.search(message)
+    if date_match:
+        date = resolve_relative_date(date_match.group(1))
+
+    amount = _parse_amount(AMOUNT_RE.search(text))
+    return {
+        "intent": "add",
+        "amount": amount,
+        "category": category,
+        "description": description,
+        "date": date,
+        "query_term": None,
+    }, min(confidence, 1.0)
+
+
+# Parse common messages with regex and keyword rules.
+# Returns an extraction shaped like extractor.validate_extraction(), or None
+# when the rules are not confident enough and the LLM should decide.
+def parse_message_locally(message):
+    if not FASTPATH_ENABLED or not message:
+        return None
+
+    result, confidence = None, 0.0
+    if not NEGATION_RE.search(message):
+        result, confidence = _parse_query(message)
+        if result is None:
+            result, confidence = _parse_add(message)
+
+    hit = result is not None and confidence >= CONFIDENCE_THRESHOLD
+    _record(hit)
+    return result if hit else None
@@ -0,0 +1,402 @@
+"""
+Group commit for the append-only CSV ledger.
+
+Callers hand rows to GroupCommitWriter.append() and block until their row is
+on disk. A single writer thread takes every row that arrived while the previous
+batch was being written (up to EXPENSE_COMMIT_MAX_BATCH, optionally waiting
+EXPENSE_COMMIT_INTERVAL_MS for more), commits them with one write() and one
+fsync(), then wakes every caller in the batch.
+
+Each commit holds an exclusive flock on the file, so several worker processes
+can append to the same ledger without interleaving partial rows. A row that was
+only partly written when a process died has never been acknowledged; it is
+cut off the end of the file before the next commit (and when the writer opens).
+fcntl is not available on Windows, where locking is per process only.
+
+Rows can also be rewritten (replace()), for edits and deletes. A deleted row is
+blanked out rather than removed, so the rows after it keep their numbers. The
+edited file is written next to the ledger and renamed over it, so a reader that
+takes no lock sees the old file or the new one, never a part-written one. Every
+writer locks the file it has open and, if that has been renamed over since, opens
+the new one and locks again. A journal left by a writer that rewrote the file in
+place is still finished by the next process to take the lock for a write.
+
+generation() stamps the file with its inode, size and mtime so readers can tell
+that it changed; changes the writer finds that it did not make itself are
+counted in outside_changes.
+"""
+import csv
+import io
+import logging
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+EXPENSE_COMMIT_INTERVAL_MS = float(os.getenv("EXPENSE_COMMIT_INTERVAL_MS", "0"))
+EXPENSE_COMMIT_MAX_BATCH = int(os.getenv("EXPENSE_COMMIT_MAX_BATCH", "256"))
+EXPENSE_FSYNC = os.getenv("EXPENSE_FSYNC", "1") != "0"
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingRow:
+    __slots__ = ("values", "done", "row_id", "error")
+
+    def __init__(self, values):
+        self.values = values
+        self.done = threading.Event()
+        self.row_id = None
+        self.error = None
+
+
+def encode_rows(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+# A row whose every field is empty: what replace() leaves of a deleted row
+def is_blank(values):
+    return not any(values)
+
+
+# (start, end) byte offsets of row `number` in CSV `data`, counting the header as row 0
+# and skipping empty lines as csv.DictReader does; None past the last row. A newline
+# inside a quoted field does not end a row: a row ends where its quotes are balanced.
+def row_span(data, number):
+    start = end = row = 0
+    quoted = False
+    for line in data.split(b"\n")[:-1]:
+        end += len(line) + 1
+        if b'"' in line and line.count(b'"') % 2:
+            quoted = not quoted
+        if quoted:
+            continue
+        if end - start > 2 or line not in (b"", b"\r"):
+            if row == number:
+                return start, end
+            row += 1
+        start = end
+    return None
+
+
+class GroupCommitWriter:
+    """
+    Appends CSV rows to ``path`` in fsynced batches and numbers them 1, 2, ...
+    after the header, matching csv.DictReader order.
+
+    ``on_commit(first_id, rows, size_before, size_after)`` runs after every
+    commit while ``commit_lock`` is held, so a reader that takes the same lock
+    sees the file and anything derived from it in step. ``on_replace(row_id,
+    old, new, size_before, size_after)`` does the same after every replace().
+
+    ``outside_changes`` counts the times the file was found changed by
+    someone else (another process, a journal replay) since the writer last
+    looked at it.
+    """
+
+    def __init__(self, path, header=None, interval_ms=EXPENSE_COMMIT_INTERVAL_MS,
+                 max_batch=EXPENSE_COMMIT_MAX_BATCH, fsync=EXPENSE_FSYNC, on_commit=None, on_replace=None):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.header = header
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.on_commit = on_commit
+        self.on_replace = on_replace
+        self.commit_lock = threading.Lock()
+        self.commits = 0
+        self.committed_rows = 0
+        self.outside_changes = 0
+
+        self._cond = threading.Condition()
+        self._pending = []
+        self._thread = None
+        self._closing = False
+        self._rows = 0
+        self._blank_rows = 0
+        self._size = None
+        self._stamp = None  # generation() of the file as the writer last left or saw it
+        self._fd = self._open()
+
+        # Recover from a crash mid-write and make sure the header is there
+        with self.commit_lock:
+            self._flock(True)
+            try:
+                if self._sync_locked() == 0 and header:
+                    self._write(encode_rows([header]))
+                    self._size = os.fstat(self._fd).st_size
+                    self._stamp = self._file_stamp()
+            finally:
+                self._funlock()
+
+    def _open(self):
+        return os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+
+    # Lock the open file, first moving to the current one if replace() renamed a new file
+    # over it (in this or another process)
+    def _flock(self, exclusive):
+        if fcntl is None:
+            return
+        while True:
+            fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self._fd).st_ino:
+                    return
+            except FileNotFoundError:
+                pass
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = self._open()
+
+    def _funlock(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._fd, view):]
+        if self.fsync:
+            os.fsync(self._fd)
+
+    # Cut an unterminated last line (a row whose write never completed) off the file
+    def _repair_tail(self, size):
+        end = size
+        while end > 0:
+            chunk = os.pread(self._fd, min(4096, end), end - min(4096, end))
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                end = end - len(chunk) + newline + 1
+                break
+            end -= len(chunk)
+        if end != size:
+            os.ftruncate(self._fd, end)
+            logger.warning("Dropped %d bytes of an incomplete row at the end of %s", size - end, self.path)
+        return end
+
+    # Finish an interrupted rewrite, cut off a torn row and bring the row count up to
+    # date with the file. Caller holds the exclusive flock.
+    def _sync_locked(self):
+        self._replay_journal()
+        size = os.fstat(self._fd).st_size
+        if size and os.pread(self._fd, 1, size - 1) != b"\n":
+            size = self._repair_tail(size)
+        self._recount(size)
+        self._look_locked()
+        return size
+
+    def _file_stamp(self):
+        stat = os.fstat(self._fd)
+        return f"{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    # Count a change made since the writer last left or saw the file. Caller holds the flock.
+    def _look_locked(self):
+        stamp = self._file_stamp()
+        if stamp != self._stamp:
+            if self._stamp is not None:
+                self.outside_changes += 1
+            self._stamp = stamp
+        return stamp
+
+    # Another process wrote (or this is the first look): recount the rows
+    def _recount(self, size):
+        if size != self._size:
+            rows = blank_rows = 0
+            if size:
+                with open(self.path, mode="r", newline="", encoding="utf-8") as file:
+                    for row in csv.DictReader(file):
+                        rows += 1
+                        blank_rows += is_blank(row.values())
+            self._rows, self._blank_rows = rows, blank_rows
+            self._size = size
+
+    def count(self):
+        """Number of rows, not counting the ones blanked out by replace()."""
+        with self.commit_lock:
+            self._flock(False)
+            try:
+                self._recount(os.fstat(self._fd).st_size)
+                return self._rows - self._blank_rows
+            finally:
+                self._funlock()
+
+    def generation(self):
+        """"inode:size:mtime_ns" of the file, which changes with every write to it."""
+        with self.commit_lock:
+            self._flock(False)
+            try:
+                return self._look_locked()
+            finally:
+                self._funlock()
+
+    def _commit(self, rows):
+        data = encode_rows(rows)
+        with self.commit_lock:
+            self._flock(True)
+            try:
+                size_before = self._sync_locked()
+                if size_before == 0 and self.header:
+                    data = encode_rows([self.header]) + data
+                self._write(data)
+                first_id = self._rows + 1
+                self._rows += len(rows)
+                self._size = size_before + len(data)
+                self._stamp = self._file_stamp()
+            finally:
+                self._funlock()
+            self.commits += 1
+            self.committed_rows += len(rows)
+            if self.on_commit is not None:
+                self.on_commit(first_id, rows, size_before, self._size)
+        return first_id
+
+    # Cut the file at `offset` and write `tail` there. Caller holds the flock.
+    def _rewrite_tail(self, offset, tail):
+        os.ftruncate(self._fd, offset)
+        self._write(tail)
+
+    # Put `data` in place of the file in one rename, so a reader sees either the old file
+    # or the new one. Closing the old file drops its lock once the new one is in place.
+    # Caller holds the exclusive flock.
+    def _swap(self, data):
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+            if self.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+        if self.fsync and hasattr(os, "O_DIRECTORY"):
+            directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        old, self._fd = self._fd, self._open()
+        os.close(old)
+
+    # Finish an in-place rewrite that an older writer left half done after writing its
+    # journal, in this or another process. A journal that is itself incomplete was never
+    # acted on and is dropped. Caller holds the exclusive flock.
+    def _replay_journal(self):
+        try:
+            with open(self.journal_path, "rb") as file:
+                header, _, tail = file.read().partition(b"\n")
+        except FileNotFoundError:
+            return
+        try:
+            offset, length = (int(value) for value in header.split())
+        except ValueError:
+            offset, length = None, None
+        if length == len(tail):
+            self._rewrite_tail(offset, tail)
+            self._size = None  # recount, the file may not have changed size
+            logger.warning("Finished an interrupted rewrite of %s from its journal", self.path)
+        os.remove(self.journal_path)
+
+    # The values of row `row_id` (1 = first after the header), or None if there is no such row
+    def row(self, row_id):
+        with self.commit_lock:
+            self._flock(False)
+            try:
+                data = os.pread(self._fd, os.fstat(self._fd).st_size, 0)
+            finally:
+                self._funlock()
+        span = row_span(data, row_id) if row_id > 0 else None
+        if span is None:
+            return None
+        return next(csv.reader(io.StringIO(data[span[0]:span[1]].decode("utf-8"), newline="")))
+
+    def replace(self, row_id, edit):
+        """
+        Rewrite row ``row_id`` as ``edit(old values)`` returns it: a list of
+        values, [] to blank it out, or None to leave it alone. The whole file
+        is written again and renamed over the old one. Returns (old values,
+        new values), or None when there is no such row or edit() returned None.
+        """
+        with self.commit_lock:
+            self._flock(True)
+            try:
+                size_before = self._sync_locked()
+                data = os.pread(self._fd, size_before, 0)
+                span = row_span(data, row_id) if row_id > 0 else None
+                if span is None:
+                    return None
+                start, end = span
+                old = next(csv.reader(io.StringIO(data[start:end].decode("utf-8"), newline="")))
+                new = edit(old)
+                if new is None:
+                    return None
+                new = list(new) or [""] * len(old)
+                self._swap(data[:start] + encode_rows([new]) + data[end:])
+                self._blank_rows += is_blank(new) - is_blank(old)
+                self._size = os.fstat(self._fd).st_size
+                self._stamp = self._file_stamp()
+            finally:
+                self._funlock()
+            if self.on_replace is not None:
+                self.on_replace(row_id, old, new, size_before, self._size)
+        return old, new
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # Give concurrent callers a moment to join this batch
+                if self.interval > 0 and not self._closing and len(self._pending) < self.max_batch:
+                    self._cond.wait_for(lambda: self._closing or len(self._pending) >= self.max_batch, self.interval)
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+
+            try:
+                first_id = self._commit([pending.values for pending in batch])
+                for offset, pending in enumerate(batch):
+                    pending.row_id = first_id + offset
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            for pending in batch:
+                pending.done.set()
+
+    # Append one row and return its id once it is durable on disk
+    def append(self, values):
+        pending = _PendingRow(list(values))
+        with self._cond:
+            if self._closing:
+                raise RuntimeError(f"writer for {self.path} is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+            self._pending.append(pending)
+            self._cond.notify()
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.row_id
+
+    # Commit whatever is still pending, then stop the writer thread
+    def close(self):
+        with self._cond:
+            if self._closing:
+                return
+            self._closing = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        os.close(self._fd)
+
+    def stats(self):
+        return {
+            "commits": self.commits,
+            "rows": self.committed_rows,
+            "avg_batch_size": self.committed_rows / self.commits if self.commits else 0.0,
+        }
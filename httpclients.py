@@ -0,0 +1,174 @@
+"""
+Process-wide HTTP clients for Groq and the WhatsApp Graph API.
+
+Outbound calls reuse one keep-alive connection pool per process instead of
+opening a new TCP+TLS connection on every request. Both clients count new
+connections and requests per host so connection reuse can be checked with
+connection_stats() (also on /metrics as expense_bot_upstream_connections), and
+record every response's status code and round-trip time in the upstream metrics.
+
+requests and httpx are imported when their client is first built, so a Flask
+worker never loads httpx and a FastAPI worker never loads requests.
+"""
+import importlib.util
+import os
+import threading
+import time
+from collections import defaultdict
+
+from metrics import Gauge, record_upstream, service_for
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") != "0"
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_lock = threading.Lock()
+_session = None
+_async_client = None
+
+# host -> {"requests": n, "connections": n} for the async client
+_async_counters = defaultdict(lambda: {"requests": 0, "connections": 0})
+
+
+def _pooled_session():
+    import requests
+
+    class PooledSession(requests.Session):
+        """requests.Session that applies the configured timeout when none is given."""
+
+        def request(self, method, url, **kwargs):
+            kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT))
+            started = time.perf_counter()
+            try:
+                response = super().request(method, url, **kwargs)
+            except requests.RequestException:
+                record_upstream(service_for(url), "error")
+                raise
+            record_upstream(service_for(url), response.status_code, time.perf_counter() - started)
+            return response
+
+    return PooledSession()
+
+
+# Shared synchronous session used for the Groq calls
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            from requests.adapters import HTTPAdapter
+
+            session = _pooled_session()
+            adapter = HTTPAdapter(pool_connections=HTTP_MAX_KEEPALIVE, pool_maxsize=HTTP_MAX_CONNECTIONS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _host_key(url):
+    port = url.port or (443 if url.scheme == "https" else 80)
+    return f"{url.host}:{port}"
+
+
+async def _count_request(request):
+    host = _host_key(request.url)
+
+    async def trace(event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            _async_counters[host]["connections"] += 1
+
+    _async_counters[host]["requests"] += 1
+    request.extensions["trace"] = trace
+
+
+def _build_async_client():
+    import httpx
+
+    class InstrumentedAsyncClient(httpx.AsyncClient):
+        """httpx.AsyncClient recording each response in the upstream metrics."""
+
+        async def send(self, request, **kwargs):
+            started = time.perf_counter()
+            try:
+                response = await super().send(request, **kwargs)
+            except httpx.HTTPError:
+                record_upstream(service_for(request.url), "error")
+                raise
+            record_upstream(service_for(request.url), response.status_code, time.perf_counter() - started)
+            return response
+
+    return InstrumentedAsyncClient(
+        http2=HTTP2_ENABLED and HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        event_hooks={"request": [_count_request]},
+    )
+
+
+# Shared async client used for the Graph API (and async Groq calls).
+# Normally created by start_http_clients(); created lazily if used before startup.
+def get_async_client():
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = _build_async_client()
+    return _async_client
+
+
+# Startup hook: open the shared async client (the blocking session is only built
+# if something calls get_session())
+async def start_http_clients():
+    get_async_client()
+
+
+# Shutdown hook: close pooled connections
+async def close_http_clients():
+    global _session, _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+# Per-host request and new-connection counts for both clients.
+# "reused" is the number of requests that did not need a new connection.
+def connection_stats():
+    stats = {}
+
+    def merge(host, requests_made, connections):
+        entry = stats.setdefault(host, {"requests": 0, "connections": 0})
+        entry["requests"] += requests_made
+        entry["connections"] += connections
+
+    for host, counters in list(_async_counters.items()):
+        merge(host, counters["requests"], counters["connections"])
+
+    session = _session
+    if session is not None:
+        for adapter in {id(a): a for a in session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    merge(f"{pool.host}:{pool.port}", pool.num_requests, pool.num_connections)
+
+    for entry in stats.values():
+        entry["reused"] = max(entry["requests"] - entry["connections"], 0)
+    return stats
+
+
+CONNECTIONS = Gauge("expense_bot_upstream_connections", "Requests, new connections and reused connections per upstream host",
+                    ["host", "count"],
+                    lambda: {(host, count): value for host, entry in connection_stats().items()
+                             for count, value in entry.items()})
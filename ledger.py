@@ -0,0 +1,350 @@
+"""
+Columnar in-memory copy of the ledger for analytical questions: "top
+categories this month", "monthly trend", "average per day last week".
+
+Every row is five numbers in NumPy arrays: the user and the category as codes
+into per-ledger dictionaries (dictionary encoding), amount_minor (int64,
+LEDGER_CURRENCY minor units), the date as days since 1970-01-01 (int32) and the
+row id (int64). That is 28 bytes a row against several hundred for a dict per
+row, and a question is a few vectorized passes over the arrays rather than a
+DictReader pass over the file. The arrays grow by doubling; the store's
+listener appends each new row in place, and an edit overwrites its row, found
+by id. A deleted row stays in the arrays, with no user.
+
+parse_analytics_query() recognises the questions locally; answer_analytics()
+replies to them. NumPy is only imported when the first ColumnarLedger is built.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from datetime import date
+
+from dates import resolve_period
+from money import format_money, sum_minor
+from storage import get_store
+
+LEDGER_CHECK_INTERVAL = float(os.getenv("LEDGER_CHECK_INTERVAL", "30"))
+# Default number of categories in "top categories"
+ANALYTICS_TOP_N = int(os.getenv("ANALYTICS_TOP_N", "3"))
+
+EPOCH = date(1970, 1, 1).toordinal()
+NO_DAY = -(2 ** 31)  # rows whose date is not a date; left out of every date filter
+NO_USER = -1  # user code of a deleted row
+
+# bucket -> default period when the question names none
+TREND_DEFAULTS = {"day": "last 14 days", "week": "last 8 weeks", "month": "last 6 months"}
+
+logger = logging.getLogger(__name__)
+
+np = None
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+
+
+def day_number(iso_date):
+    try:
+        return date.fromisoformat(iso_date).toordinal() - EPOCH
+    except (TypeError, ValueError):
+        return NO_DAY
+
+
+def day_date(number):
+    return date.fromordinal(int(number) + EPOCH)
+
+
+class ColumnarLedger:
+    """
+    The ledger as parallel NumPy columns. record() is the store listener; the
+    query methods take a user and an optional inclusive (start, end) of ISO
+    dates and return plain Python values, amounts in minor units.
+    """
+
+    def __init__(self, capacity=1024):
+        _load_numpy()
+        self._lock = threading.Lock()
+        self._reset(capacity)
+
+    def _reset(self, capacity):
+        self.users = np.empty(capacity, dtype=np.int32)
+        self.categories = np.empty(capacity, dtype=np.int32)
+        self.amounts = np.empty(capacity, dtype=np.int64)
+        self.days = np.empty(capacity, dtype=np.int32)
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+        self.deleted = 0
+        self._user_codes = {}
+        self._category_codes = {}
+        self.category_names = []
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * len(self.amounts))
+        for name in ("users", "categories", "amounts", "days", "ids"):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def _category_code(self, category):
+        key = (category or "").strip().lower()
+        code = self._category_codes.get(key)
+        if code is None:
+            code = self._category_codes[key] = len(self.category_names)
+            self.category_names.append(key)
+        return code
+
+    def _user_code(self, user_id):
+        return self._user_codes.setdefault(user_id, len(self._user_codes))
+
+    def _set(self, position, row):
+        self.users[position] = self._user_code(row["user_id"])
+        self.categories[position] = self._category_code(row["category"])
+        self.amounts[position] = row["amount_minor"]
+        self.days[position] = day_number(row["date"])
+        self.ids[position] = row["id"]
+
+    # Store listener: append one row
+    def record(self, row):
+        with self._lock:
+            if self.size == len(self.amounts):
+                self._grow(self.size + 1)
+            self._set(self.size, row)
+            self.size += 1
+
+    # Store change listener: overwrite an edited row in place, or take a deleted one away from its user
+    def change(self, old, new):
+        with self._lock:
+            # Deleted rows are skipped: SQLite hands the highest id out again once its row is deleted
+            positions = np.flatnonzero((self.ids[:self.size] == old["id"]) & (self.users[:self.size] != NO_USER))
+            if not len(positions):
+                return
+            if new is not None:
+                self._set(positions[0], new)
+            else:
+                self.users[positions[0]] = NO_USER
+                self.amounts[positions[0]] = 0
+                self.deleted += 1
+
+    def rebuild(self, rows):
+        users, categories, amounts, days, ids = [], [], [], [], []
+        with self._lock:
+            self._reset(1024)
+            for row in rows:
+                users.append(self._user_code(row["user_id"]))
+                categories.append(self._category_code(row["category"]))
+                amounts.append(row["amount_minor"])
+                days.append(day_number(row["date"]))
+                ids.append(row["id"])
+            self._grow(len(amounts))
+            self.users[:len(users)] = users
+            self.categories[:len(categories)] = categories
+            self.amounts[:len(amounts)] = amounts
+            self.days[:len(days)] = days
+            self.ids[:len(ids)] = ids
+            self.size = len(amounts)
+
+    # Rows that still exist, to compare with the store's count
+    def __len__(self):
+        return self.size - self.deleted
+
+    def nbytes(self):
+        """Bytes held by the columns (allocated capacity, not just the rows in use)."""
+        return sum(column.nbytes for column in (self.users, self.categories, self.amounts, self.days, self.ids))
+
+    # (category codes, amounts, days) of one user's rows dated start..end
+    def _select(self, user_id, start=None, end=None):
+        with self._lock:
+            code = self._user_codes.get(user_id)
+            size = self.size
+            users, categories = self.users[:size], self.categories[:size]
+            amounts, days = self.amounts[:size], self.days[:size]
+        if code is None:
+            return categories[:0], amounts[:0], days[:0]
+        mask = users == code
+        if start is not None:
+            mask &= days >= day_number(start)
+        if end is not None:
+            mask &= days <= day_number(end)
+        return categories[mask], amounts[mask], days[mask]
+
+    def total(self, user_id, start=None, end=None):
+        """(total, count) of one user's rows."""
+        _, amounts, _ = self._select(user_id, start, end)
+        return sum_minor(amounts), len(amounts)
+
+    def category_totals(self, user_id, start=None, end=None):
+        """[(category, total, count)], largest total first."""
+        categories, amounts, _ = self._select(user_id, start, end)
+        if not len(amounts):
+            return []
+        codes, positions, counts = np.unique(categories, return_inverse=True, return_counts=True)
+        totals = np.zeros(len(codes), dtype=np.int64)
+        np.add.at(totals, positions, amounts)
+        order = np.lexsort((codes, -totals))
+        return [(self.category_names[codes[i]], int(totals[i]), int(counts[i])) for i in order]
+
+    def top_categories(self, user_id, n=ANALYTICS_TOP_N, start=None, end=None):
+        return self.category_totals(user_id, start, end)[:n]
+
+    def bucket_totals(self, user_id, bucket, start, end):
+        """
+        [(first day of the bucket, total, count)] for every day, week (Monday
+        first) or month from start to end, including those with no spending.
+        """
+        _, amounts, days = self._select(user_id, start, end)
+        first, last = day_number(start), day_number(end)
+        if bucket == "day":
+            keys, edges = days, np.arange(first, last + 1)
+        elif bucket == "week":
+            # 1970-01-01 was a Thursday: (day + 3) % 7 is the weekday, Monday 0
+            keys = days - (days + 3) % 7
+            edges = np.arange(first - (first + 3) % 7, last + 1, 7)
+        elif bucket == "month":
+            keys = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+            months = np.array([start, end], dtype="datetime64[D]").astype("datetime64[M]").astype(np.int64)
+            edges = np.arange(months[0], months[1] + 1)
+        else:
+            raise ValueError(f"unknown bucket: {bucket}")
+
+        positions = np.searchsorted(edges, keys)
+        totals = np.zeros(len(edges), dtype=np.int64)
+        np.add.at(totals, positions, amounts)
+        counts = np.bincount(positions, minlength=len(edges))
+        if bucket == "month":
+            starts = edges.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+        else:
+            starts = edges
+        return [(day_date(day).isoformat(), int(total), int(count)) for day, total, count in zip(starts, totals, counts)]
+
+
+# Questions answered from the columns. Each pattern ends in an optional period
+# ("this month", "last 3 months", "in february") resolved by dates.resolve_period().
+_SHOW = r"^(?:(?:show|give|tell)\s+(?:me\s+)?)?(?:my\s+|the\s+)?"
+_PERIOD = r"(?:\s+(?:in\s+|for\s+|during\s+|over\s+)?(?P<period>.+?))?\s*[?.!]?$"
+TOP_CATEGORIES_RES = [
+    re.compile(rf"{_SHOW}(?:top|biggest|largest)\s+(?:(?P<n>\d+)\s+)?(?:spending\s+|expense\s+)?categor(?:y|ies){_PERIOD}"),
+    re.compile(rf"^where\s+(?:did|do)\s+i\s+spend\s+(?:the\s+)?most{_PERIOD}"),
+]
+BREAKDOWN_RES = [
+    re.compile(rf"{_SHOW}(?:spending|expenses?)\s+(?:by|per)\s+category{_PERIOD}"),
+    re.compile(rf"{_SHOW}category\s+(?:breakdown|totals|wise\s+spending){_PERIOD}"),
+]
+TREND_RES = [
+    re.compile(rf"{_SHOW}(?P<bucket>daily|weekly|monthly)\s+(?:spending\s+|expenses?\s+)?(?:trend|totals|breakdown|spending|expenses){_PERIOD}"),
+    re.compile(rf"{_SHOW}(?:spending|expenses?|totals?)\s+(?:by|per|each)\s+(?P<bucket>day|week|month){_PERIOD}"),
+]
+AVERAGE_RES = [
+    re.compile(rf"^(?:what(?:'?s|\s+is)\s+)?(?:my\s+)?(?:average|avg)\s+(?:daily\s+)?(?:spending|spend|expense)?\s*(?:per|a|each)\s+day{_PERIOD}"),
+    re.compile(rf"^(?:what(?:'?s|\s+is)\s+)?(?:my\s+)?daily\s+(?:average|avg){_PERIOD}"),
+    re.compile(rf"^how\s+much\s+do\s+i\s+spend\s+(?:per|a|each)\s+day(?:\s+on\s+average)?{_PERIOD}"),
+]
+_BUCKETS = {"daily": "day", "weekly": "week", "monthly": "month"}
+
+
+def _query(kind, match, today, **fields):
+    text = match.group("period")
+    period = resolve_period(text, today=today) if text else None
+    if text and period is None:
+        return None
+    return dict(kind=kind, period=period, label=text, **fields)
+
+
+# {"kind": "categories" | "trend" | "average", "period": (start, end) or None,
+# "label": the period as asked, ...} for an analytical question, else None
+def parse_analytics_query(message, today=None):
+    text = re.sub(r"\s+", " ", (message or "").strip().lower())
+    for pattern in TOP_CATEGORIES_RES:
+        match = pattern.match(text)
+        if match:
+            n = match.groupdict().get("n")
+            return _query("categories", match, today, n=int(n) if n else ANALYTICS_TOP_N)
+    for pattern in BREAKDOWN_RES:
+        match = pattern.match(text)
+        if match:
+            return _query("categories", match, today, n=None)
+    for pattern in TREND_RES:
+        match = pattern.match(text)
+        if match:
+            bucket = match.group("bucket")
+            return _query("trend", match, today, bucket=_BUCKETS.get(bucket, bucket))
+    for pattern in AVERAGE_RES:
+        match = pattern.match(text)
+        if match:
+            return _query("average", match, today)
+    return None
+
+
+# The reply to a parsed analytics query
+def answer_analytics(ledger, user_id, query, today=None):
+    today = today or date.today()
+    period, label = query["period"], query["label"]
+
+    if query["kind"] == "categories":
+        start, end = period or (None, None)
+        rows = ledger.category_totals(user_id, start, end)
+        when = f" {label}" if label else ""
+        if not rows:
+            return f"No expenses found{when}."
+        total = sum(row[1] for row in rows)
+        shown = rows if query["n"] is None else rows[:query["n"]]
+        header = (f"Spending by category{when}:" if query["n"] is None
+                  else f"Top {len(shown)} categor{'y' if len(shown) == 1 else 'ies'}{when}:")
+        return header + "".join(f"\n- {category or 'other'}: {format_money(amount)} ({amount / total:.0%})"
+                                for category, amount, _ in shown)
+
+    if query["kind"] == "trend":
+        bucket = query["bucket"]
+        label = label or TREND_DEFAULTS[bucket]
+        start, end = period or resolve_period(label, today=today)
+        rows = ledger.bucket_totals(user_id, bucket, start, end)
+        if not any(count for _, _, count in rows):
+            return f"No expenses found {label}."
+        names = {"day": "Daily", "week": "Weekly", "month": "Monthly"}
+        lines = [f"- {first[:7] if bucket == 'month' else first}: {format_money(amount)}" for first, amount, _ in rows]
+        return f"{names[bucket]} spending {label}:\n" + "\n".join(lines)
+
+    label = label or "this month"
+    start, end = period or resolve_period(label, today=today)
+    # Days that have not happened yet do not count towards the average
+    last = min(date.fromisoformat(end), today)
+    days = (last - date.fromisoformat(start)).days + 1
+    if days <= 0:
+        return f"No expenses found {label}."
+    total, count = ledger.total(user_id, start, last.isoformat())
+    return (f"You spent {format_money((2 * total + days) // (2 * days))} a day on average {label} "
+            f"({format_money(total)} over {days} day{'s' if days != 1 else ''}, "
+            f"{count} expense{'s' if count != 1 else ''}).")
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+_last_check = 0.0
+_outside_changes = 0  # store.outside_changes() as of the last rebuild
+
+
+# Process-wide columnar ledger over get_store(), built on first use and then kept
+# current by the store. Every LEDGER_CHECK_INTERVAL seconds it is rebuilt if another
+# process has changed the ledger (see ExpenseStore.outside_changes()).
+def get_ledger():
+    global _ledger, _last_check, _outside_changes
+    with _ledger_lock:
+        store = get_store()
+        if _ledger is None:
+            _ledger = ColumnarLedger()
+            _outside_changes = store.outside_changes()
+            _ledger.rebuild(store.iter_rows())
+            store.subscribe(_ledger.record, _ledger.change)
+            _last_check = time.monotonic()
+        elif time.monotonic() - _last_check >= LEDGER_CHECK_INTERVAL:
+            _last_check = time.monotonic()
+            if store.outside_changes() != _outside_changes:
+                logger.warning("Columnar ledger out of date, rebuilding from the ledger")
+                _outside_changes = store.outside_changes()
+                _ledger.rebuild(store.iter_rows())
+        return _ledger
@@ -0,0 +1,152 @@
+"""
+Opt-in micro-batching of single-pass extractions across concurrent messages.
+
+Messages arriving within LLM_BATCH_WINDOW_MS of each other (up to
+LLM_BATCH_MAX_SIZE) go to Groq as one request that carries the system prompt
+once and asks for indexed JSON results; each waiting handler gets its own
+validated extraction back. Disabled when the window is 0 (the default).
+Each batch request takes one of the extractor's llm_slots(), like a single call.
+"""
+import asyncio
+import json
+import logging
+import os
+
+import extractor
+from extractor import EXTRACTION_KEYS, EXTRACTION_PROMPT, validate_extraction
+from httpclients import get_async_client
+
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "0"))
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "16"))
+
+logger = logging.getLogger(__name__)
+
+BATCH_PROMPT = EXTRACTION_PROMPT.replace(
+    "You read one WhatsApp message sent to an expense tracker and return a single JSON object.",
+    "You read several WhatsApp messages sent to an expense tracker. The user content is a JSON list of "
+    "{\"index\": n, \"message\": text} items. Handle every message independently and return one JSON object "
+    "{\"results\": [...]} with one result per message, each carrying the same \"index\" as its message.\n\n"
+    "For each message:",
+).replace(
+    "Respond with ONLY the JSON object with exactly these keys: intent, amount, category, description, date, query_term.",
+    "Each result has exactly these keys: index, intent, amount, category, description, date, query_term. "
+    "Respond with ONLY the JSON object.",
+)
+
+
+def build_batch_payload(messages):
+    items = [{"index": i, "message": message} for i, message in enumerate(messages)]
+    return {
+        "model": extractor.EXTRACTION_MODEL,
+        "response_format": {"type": "json_object"},
+        "temperature": 0,
+        "messages": [
+            {"role": "system", "content": BATCH_PROMPT},
+            {"role": "user", "content": json.dumps(items, ensure_ascii=False)}
+        ]
+    }
+
+
+# Map an indexed batch response back to one validated extraction (or None) per message
+def parse_batch_response(response_json, count):
+    results = [None] * count
+    try:
+        content = response_json["choices"][0]["message"]["content"].strip()
+        items = json.loads(content)["results"]
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        logger.info("Rejected batched extraction: %s", e)
+        return results
+
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        index = item.get("index")
+        if not isinstance(index, int) or not 0 <= index < count or results[index] is not None:
+            continue
+        try:
+            results[index] = validate_extraction({key: item.get(key) for key in EXTRACTION_KEYS if key in item})
+        except ValueError as e:
+            logger.info("Rejected batched extraction for message %d: %s", index, e)
+    return results
+
+
+class BatchScheduler:
+    def __init__(self, window_ms=LLM_BATCH_WINDOW_MS, max_batch=LLM_BATCH_MAX_SIZE):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        self._sending = set()
+        self.batches = 0
+        self.batched_messages = 0
+
+    @property
+    def enabled(self):
+        return self.window > 0 and self.max_batch > 1
+
+    # Queue a message for the next batch and wait for its extraction
+    async def extract(self, message):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((message, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush_now)
+        return await future
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch):
+        messages = [message for message, _ in batch]
+        self.batches += 1
+        self.batched_messages += len(messages)
+        try:
+            async with extractor.llm_slots():
+                if len(messages) == 1:
+                    results = [await extractor.extract_message_with_llama_async.uncached(messages[0])]
+                else:
+                    results = await self._request(messages)
+        except Exception as e:
+            logger.warning("Batched extraction failed: %s", e)
+            results = [None] * len(messages)
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _request(self, messages):
+        import httpx
+
+        headers = {
+            "Authorization": f"Bearer {extractor.GROQ_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        try:
+            response = await get_async_client().post(extractor.GROQ_URL, json=build_batch_payload(messages), headers=headers)
+        except httpx.HTTPError as e:
+            logger.warning("Batched extraction request failed: %s", e)
+            return [None] * len(messages)
+
+        if response.status_code == 200:
+            return parse_batch_response(response.json(), len(messages))
+        return [None] * len(messages)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "messages": self.batched_messages,
+            "avg_batch_size": self.batched_messages / self.batches if self.batches else 0.0,
+        }
+
+
+# Shared scheduler for the FastAPI app
+batch_scheduler = BatchScheduler()
@@ -0,0 +1,175 @@
+"""
+Cache of Groq responses keyed on (prompt id, model, normalized message text).
+
+Near-identical messages ("how much on food", "How much on food?") share one
+entry. Values are the model's raw output: relative dates such as "yesterday"
+are stored unresolved and callers resolve them with resolve_relative_date when
+they read the entry, so a cached answer stays correct on later days.
+
+Entries live in a bounded in-memory LRU with a TTL and a byte budget. Setting
+LLM_CACHE_DB adds an SQLite store that survives restarts; coroutine callers reach
+it through ``run_blocking(func, *args)`` so the event loop never waits on SQLite.
+"""
+import asyncio
+import functools
+import inspect
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from ttlcache import TTLCache
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(24 * 60 * 60)))
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "")
+
+_SPACES_RE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION_RE = re.compile(r"[\s?!.,;:]+$")
+
+
+# Canonical form of a message for cache lookups
+def normalize_text(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = text.replace("’", "'").replace("‘", "'").replace("“", '"').replace("”", '"')
+    text = _TRAILING_PUNCTUATION_RE.sub("", text)
+    return _SPACES_RE.sub(" ", text).strip()
+
+
+class LLMCache:
+    def __init__(self, maxsize=LLM_CACHE_MAX_ENTRIES, max_bytes=LLM_CACHE_MAX_BYTES, ttl=LLM_CACHE_TTL,
+                 db_path=LLM_CACHE_DB, enabled=LLM_CACHE_ENABLED, run_blocking=None):
+        self.enabled = enabled
+        self.run_blocking = run_blocking
+        self.ttl = ttl
+        # Values are kept as JSON text: every hit decodes a fresh copy, and len() is the byte cost
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl, max_weight=max_bytes, weigh=len)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    @staticmethod
+    def make_key(prompt_id, model, message):
+        return json.dumps([prompt_id, model, normalize_text(message)])
+
+    def get(self, prompt_id, model, message):
+        """Cached value, or None on a miss."""
+        if not self.enabled:
+            return None
+        key = self.make_key(prompt_id, model, message)
+
+        encoded = self._memory.get(key)
+        source = "memory"
+        if encoded is None and self._conn is not None:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value FROM llm_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+                ).fetchone()
+            if row:
+                encoded = row[0]
+                source = "disk"
+                self._memory.set(key, encoded)
+
+        with self._lock:
+            if encoded is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if source == "disk":
+                self.disk_hits += 1
+        return json.loads(encoded)
+
+    def put(self, prompt_id, model, message, value):
+        if not self.enabled or value is None:
+            return
+        key = self.make_key(prompt_id, model, message)
+        encoded = json.dumps(value)
+        self._memory.set(key, encoded)
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, encoded, time.time() + self.ttl),
+                )
+
+    # Return the cached value or compute, store and return it. None results are not cached.
+    def get_or_compute(self, prompt_id, model, message, compute):
+        cached = self.get(prompt_id, model, message)
+        if cached is not None:
+            return cached
+        value = compute()
+        self.put(prompt_id, model, message, value)
+        return value
+
+    # Run one of the methods above from the event loop: inline while everything is in
+    # memory, through run_blocking (the default executor when unset) once SQLite is involved
+    async def _blocking(self, func, *args):
+        if self._conn is None:
+            return func(*args)
+        if self.run_blocking is not None:
+            return await self.run_blocking(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def get_or_compute_async(self, prompt_id, model, message, compute):
+        cached = await self._blocking(self.get, prompt_id, model, message)
+        if cached is not None:
+            return cached
+        value = await compute()
+        await self._blocking(self.put, prompt_id, model, message, value)
+        return value
+
+    def prune(self):
+        """Delete expired rows from the on-disk store."""
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._memory),
+                "bytes": self._memory.weight,
+                "evictions": self._memory.evictions,
+            }
+
+
+# Shared by every Groq helper in the process
+llm_cache = LLMCache()
+
+
+# Decorator caching a Groq helper that takes the message text as its only argument.
+# Works for plain functions and coroutines; the undecorated function stays available as .uncached
+def cached_llm(prompt_id, model, cache=None):
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(message):
+                return await (cache or llm_cache).get_or_compute_async(prompt_id, model, message, lambda: func(message))
+            async_wrapper.uncached = func
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(message):
+            return (cache or llm_cache).get_or_compute(prompt_id, model, message, lambda: func(message))
+        wrapper.uncached = func
+        return wrapper
+    return decorator
@@ -0,0 +1,72 @@
+"""
+Logging setup shared by both apps.
+
+LOG_LEVEL (default INFO) gates what is written, so the per-message detail
+(payloads, parsed slots, replies) costs nothing unless DEBUG is switched on.
+LOG_FORMAT=json writes one JSON object per line for log shippers; anything
+passed as ``extra={...}`` is included as fields. The level can also be changed
+in a running process through set_level() (the /debug/log-level endpoints).
+"""
+import json
+import logging
+import os
+import sys
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+
+# Client libraries that log every request at INFO; kept at WARNING
+QUIET_LOGGERS = ("httpx", "httpcore", "urllib3", "twilio.http_client")
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRIBUTES and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+_configured = False
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    handler = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def set_level(level):
+    """Change the level of every logger at runtime; raises ValueError for an unknown level."""
+    level = str(level).upper()
+    if not isinstance(logging.getLevelName(level), int):
+        raise ValueError(f"Unknown log level: {level}")
+    logging.getLogger().setLevel(level)
+    return level
+
+
+def get_level():
+    return logging.getLevelName(logging.getLogger().level)
@@ -1,121 +1,75 @@
-from fastapi import FastAPI, Request, HTTPException, Query
-from fastapi.responses import PlainTextResponse, JSONResponse
-from dotenv import load_dotenv
+from engine import handle_message, interpret_message_async  # first: loads .env before the other modules read it
+from fastapi import FastAPI, Request, HTTPException, Query, Header
+from fastapi.responses import PlainTextResponse, JSONResponse, StreamingResponse, Response
 import os
-import csv
 import json
-import re
-import requests
-from datetime import datetime, timedelta
-from sendMessage import send_message
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sendMessage import send_message, outbound_stats as dispatcher_stats
+from dispatcher import SendError
+from dates import parse_date, resolve_period
+from storage import get_store
+from tenants import get_tenant, tenant_for_phone_number_id
+from recording import record_webhook
+from searchindex import get_search_index, save_search_index
+from aggregates import get_aggregates
+from budgets import get_budgets
+from digests import DigestScheduler
+from reports import EXPORTERS, PARQUET_AVAILABLE
+from httpclients import start_http_clients, close_http_clients
+from workqueue import AsyncWorkQueue
+from dedup import MessageDeduplicator
+from llmcache import llm_cache
+from sessions import sessions
+import llmbatch
+from logs import configure_logging, get_level, set_level
+from metrics import (CONTENT_TYPE, HTTP_REQUESTS, HTTP_REQUEST_SECONDS, MESSAGES, render as render_metrics, timed,
+                     watch_work_queue)
+from profiler import install_signal_toggle, profiler
+from contextlib import asynccontextmanager
 
-load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Open the shared HTTP connection pools and start the workers on startup;
+# on shutdown drain the work queue before closing the pools
+@asynccontextmanager
+async def lifespan(app):
+    await start_http_clients()
+    await work_queue.start()
+    install_signal_toggle()
+    # Build the running totals and the search index before the first question instead of during it
+    await run_storage(get_aggregates)
+    await run_storage(get_search_index)
+    await run_storage(get_budgets)
+    await digest_scheduler.start()
+    yield
+    await digest_scheduler.stop()
+    await work_queue.stop()
+    await run_storage(save_search_index)
+    await close_http_clients()
+    storage_executor.shutdown(wait=True)
 
-# WhatsApp API Credentials
-ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
-PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
+app = FastAPI(lifespan=lifespan)
+
+# Token Meta echoes back when verifying the webhook
 VERIFY_TOKEN = os.getenv("VERIFY_TOKEN")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")  
-GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
-print(ACCESS_TOKEN)
-
-# CSV File Path
-CSV_FILE = "expenses.csv"
-
-# Ensure CSV file exists with headers
-if not os.path.exists(CSV_FILE):
-    with open(CSV_FILE, mode="w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["user_id", "amount", "category", "description", "date"])
-
-# Function to resolve relative dates
-def resolve_relative_date(date_str):
-    today = datetime.today()
-    relative_dates = {
-        "today": today,
-        "yesterday": today - timedelta(days=1),
-        "day before yesterday": today - timedelta(days=2),
-        "tomorrow": today + timedelta(days=1),
-        "day after tomorrow": today + timedelta(days=2),
-    }
-    
-    if date_str.lower() in relative_dates:
-        return relative_dates[date_str.lower()].strftime("%Y-%m-%d")
-    
-    match = re.search(r"(\d+)\s*days?\s*(back|ago)", date_str.lower())
-    if match:
-        days_ago = int(match.group(1))
-        return (today - timedelta(days=days_ago)).strftime("%Y-%m-%d")
-    
-    return date_str
-
-# Classify request type
-def classify_request(message):
-    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
-    payload = {
-        "model": "llama3-8b-8192",
-        "messages": [
-            {"role": "system", "content": """Determine if user wants to 'add' an expense or 'query' past expenses. Respond with only 'add' or 'query'."""},
-            {"role": "user", "content": message},
-        ],
-    }
-    response = requests.post(GROQ_URL, json=payload, headers=headers)
-    if response.status_code == 200:
-        return response.json().get("choices", [{}])[0].get("message", {}).get("content", "").strip().lower()
-    return None
-
-# Extract search term
-def extract_query_term(message):
-    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
-    payload = {
-        "model": "llama3-8b-8192",
-        "messages": [
-            {"role": "system", "content": "Extract expense category or item name from the user's query."},
-            {"role": "user", "content": message},
-        ],
-    }
-    response = requests.post(GROQ_URL, json=payload, headers=headers)
-    if response.status_code == 200:
-        return response.json().get("choices", [{}])[0].get("message", {}).get("content", "").strip().lower()
-    return None
-
-# Extract expense details
-def parse_expense(message):
-    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
-    payload = {
-        "model": "llama3-8b-8192",
-        "messages": [
-            {"role": "system", "content": "Extract expense details: amount, category, description, and date."},
-            {"role": "user", "content": message},
-        ],
-    }
-    response = requests.post(GROQ_URL, json=payload, headers=headers)
-    if response.status_code == 200:
-        try:
-            extracted_data = json.loads(response.json()["choices"][0]["message"]["content"].strip())
-            extracted_data["date"] = resolve_relative_date(extracted_data.get("date", datetime.today().strftime("%Y-%m-%d")))
-            return extracted_data
-        except (KeyError, json.JSONDecodeError):
-            return None
-    return None
-
-# Save expense
-def save_expense(user_id, amount, category, description, date):
-    with open(CSV_FILE, mode="a", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow([user_id, amount, category, description, date])
-
-# Fetch expenses
-def fetch_filtered_expenses(user_id, search_term):
-    expenses = []
-    with open(CSV_FILE, mode="r") as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            if row["user_id"] == user_id and (search_term in row["category"].lower() or search_term in row["description"].lower()):
-                expenses.append(float(row["amount"]))
-    return f"You have spent a total of {sum(expenses)} Rs on {search_term}." if expenses else f"No expenses found for {search_term}."
+# Bearer token for /export; the endpoint is disabled while it is unset
+EXPORT_TOKEN = os.getenv("EXPORT_TOKEN")
+# Bearer token for /debug (profiler, log level); disabled while unset
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")
+
+# Blocking storage I/O runs on a small dedicated thread pool instead of the event loop
+# (Groq calls are bounded by extractor.LLM_CONCURRENCY)
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "4"))
+storage_executor = ThreadPoolExecutor(max_workers=STORAGE_WORKERS, thread_name_prefix="storage")
+
+# Run a blocking storage call on the storage thread pool
+async def run_storage(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(storage_executor, lambda: func(*args, **kwargs))
 
 # Webhook verification
 @app.get("/webhook", response_class=PlainTextResponse)
@@ -124,48 +78,216 @@ async def verify_webhook(hub_mode: str = Query(None, alias="hub.mode"), hub_chal
         return hub_challenge
     raise HTTPException(status_code=403, detail="Verification failed")
 
-# Webhook message receiver
+# Process one message: interpret it, save or query, and reply to the sender from the
+# tenant's number. Runs on the work queue.
+@timed("process")
+async def process_message(tenant_id, user_phone, message_text):
+    logger.debug("Received message from %s: %s", user_phone, message_text)
+    tenant = get_tenant(tenant_id)
+
+    user_key = tenant.user_key(user_phone)
+    request_type, details = await interpret_message_async(message_text, user_key)
+    MESSAGES.inc(app="fastapi", intent=request_type or "none")
+    logger.info("Message from %s classified as %s", user_phone, request_type)
+
+    # Replies are totals only; the running aggregates answer most of them without a scan
+    replies, result = await run_storage(handle_message, user_key, request_type, details, itemize=False)
+    try:
+        result["whatsapp_responses"] = [await send_message(reply, to=user_phone, tenant=tenant) for reply in replies]
+    except SendError as e:
+        logger.error("Error sending WhatsApp message: %s", e)
+        return {"error": "Failed to send WhatsApp message"}
+    return result
+
+# Keyed on the tenant and sender so each user's messages are applied in order
+work_queue = AsyncWorkQueue(process_message, name="webhook",
+                            key=lambda tenant_id, user_phone, message_text: (tenant_id, user_phone))
+watch_work_queue("webhook", work_queue)
+# With DEDUP_DB, LLM_CACHE_DB or SESSION_DB set, their SQLite calls run on the storage pool too
+deduplicator = MessageDeduplicator(run_blocking=run_storage)
+llm_cache.run_blocking = sessions.run_blocking = run_storage
+# Daily or weekly digests (DIGEST_PERIOD), built on the storage pool and sent like replies
+digest_scheduler = DigestScheduler(send_message, run_blocking=run_storage)
+
+# (metadata, message) for every message of every change of every entry in a (possibly
+# batched) webhook payload; metadata names the business number the message was sent to
+def iter_messages(data):
+    for entry in data.get("entry") or []:
+        if not isinstance(entry, dict):
+            continue
+        for change in entry.get("changes") or []:
+            if not isinstance(change, dict):
+                continue
+            value = change.get("value") or {}
+            metadata = value.get("metadata")
+            metadata = metadata if isinstance(metadata, dict) else {}
+            for message_data in value.get("messages") or []:
+                if isinstance(message_data, dict):
+                    yield metadata, message_data
+
+# Webhook message receiver: validate, enqueue and acknowledge straight away
 @app.post("/webhook")
 async def receive_whatsapp_message(request: Request):
-    data = await request.json()
-    print(f"Incoming data: {json.dumps(data, indent=2)}")  # Log incoming webhook data
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Incoming data: %s", json.dumps(data))
+    record_webhook("meta", data)
+
+    if not isinstance(data, dict) or not isinstance(data.get("entry", []), list):
+        raise HTTPException(status_code=400, detail="Unexpected webhook payload")
+
+    result = {"status": "queued", "queued": 0, "duplicates": 0, "ignored": 0}
+    for metadata, message_data in iter_messages(data):
+        message_id = message_data.get("id")
+        user_phone = message_data.get("from")
+        message_text = (message_data.get("text") or {}).get("body")
+
+        if not message_text or not user_phone:
+            result["ignored"] += 1
+            continue
+
+        # Meta redelivers webhooks it thinks failed; skip IDs already accepted
+        if not await deduplicator.first_delivery_async(message_id):
+            result["duplicates"] += 1
+            continue
+
+        # A full queue answers 503 so Meta redelivers the webhook later; messages
+        # queued so far are then recognised as duplicates on the retry
+        tenant = tenant_for_phone_number_id(metadata.get("phone_number_id"))
+        if not work_queue.submit(tenant.id, user_phone, message_text):
+            await deduplicator.forget_async(message_id)
+            raise HTTPException(status_code=503, detail="Message queue is full")
+        result["queued"] += 1
+
+    if not result["queued"]:
+        result["status"] = "duplicate" if result["duplicates"] else "success"
+    return JSONResponse(content=result)
+
+# Request count and latency per route, for request rates on /metrics
+@app.middleware("http")
+async def count_requests(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    HTTP_REQUESTS.inc(app="fastapi", route=path, status=response.status_code)
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, app="fastapi", route=path)
+    return response
 
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+def check_debug_token(authorization):
+    if not PROFILER_TOKEN or authorization != f"Bearer {PROFILER_TOKEN}":
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+# Start the sampling profiler for up to `seconds` without restarting the app
+@app.post("/debug/profile/start")
+async def start_profiler(seconds: float = None, interval_ms: float = None, authorization: str = Header(None)):
+    check_debug_token(authorization)
+    if not profiler.start(seconds, interval_ms):
+        raise HTTPException(status_code=409, detail="Profiler is already running")
+    return profiler.stats()
+
+@app.post("/debug/profile/stop")
+async def stop_profiler(authorization: str = Header(None)):
+    check_debug_token(authorization)
+    await asyncio.get_running_loop().run_in_executor(None, profiler.stop)
+    return profiler.stats()
+
+# Collapsed stacks of the last profile, for flamegraph.pl or speedscope
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def profile(authorization: str = Header(None)):
+    check_debug_token(authorization)
+    return profiler.folded()
+
+@app.get("/debug/log-level")
+async def log_level(authorization: str = Header(None)):
+    check_debug_token(authorization)
+    return {"level": get_level()}
+
+# Switch e.g. to DEBUG for a while to see payloads, then back, without a redeploy
+@app.post("/debug/log-level")
+async def change_log_level(level: str, authorization: str = Header(None)):
+    check_debug_token(authorization)
+    try:
+        return {"level": set_level(level)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Queue depth, in-flight count and queue lag
+@app.get("/stats/queue")
+async def queue_stats():
+    return work_queue.snapshot()
+
+# Redelivered messages suppressed by the dedup cache
+@app.get("/stats/dedup")
+async def dedup_stats():
+    return deduplicator.stats()
+
+# Hit/miss counts of the Groq response cache
+@app.get("/stats/llm-cache")
+async def llm_cache_stats():
+    return llm_cache.stats()
+
+# Conversation sessions held and how often follow-ups found one
+@app.get("/stats/sessions")
+async def session_stats():
+    return sessions.stats()
+
+# Batches sent by the micro-batching scheduler
+@app.get("/stats/llm-batch")
+async def llm_batch_stats():
+    return llmbatch.batch_scheduler.stats()
+
+# Budgets set and alerts sent, and the last digest run
+@app.get("/stats/budgets")
+async def budget_stats():
+    return {"budgets": get_budgets().stats(), "digests": digest_scheduler.stats()}
+
+# Outbound sends, retries, drops, latency and circuit state per tenant
+@app.get("/stats/outbound")
+async def outbound_stats():
+    return dispatcher_stats()
+
+# Stream one user's expenses as CSV, NDJSON or Parquet, optionally limited to a
+# period ("last month"), a start/end date and a category. user_id is the sender's
+# phone number, looked up under the given tenant (the default tenant if omitted).
+@app.get("/export/{user_id}")
+def export_expenses(user_id: str, format: str = "csv", period: str = None, start: str = None, end: str = None,
+                    category: str = None, tenant: str = None, authorization: str = Header(None)):
+    if not EXPORT_TOKEN or authorization != f"Bearer {EXPORT_TOKEN}":
+        raise HTTPException(status_code=403, detail="Forbidden")
     try:
-        for entry in data.get("entry", []):
-            for change in entry.get("changes", []):
-                message_data = change.get("value", {}).get("messages", [{}])[0]
-                user_phone = message_data.get("from")
-                message_text = message_data.get("text", {}).get("body")
-                
-                print(f"Received message from {user_phone}: {message_text}") 
-                
-                if message_text:
-                    request_type = classify_request(message_text)
-                    print(f"Classified request as: {request_type}")  
-
-                    if request_type == "add":
-                        expense_data = parse_expense(message_text)
-                        print(f"Parsed expense data: {expense_data}") 
-
-                        if expense_data:
-                            save_expense(user_phone, **expense_data)
-                            response = await send_message("Expense added successfully ✅")
-                            return JSONResponse(content={"message": "Expense added successfully.", "whatsapp_response": response})
-                    
-                    elif request_type == "query":
-                        query_term = extract_query_term(message_text)
-                        print(f"Extracted query term: {query_term}")  
-
-                        if query_term:
-                            final_msg = fetch_filtered_expenses(user_phone, query_term)
-                            response = await send_message(final_msg)
-                            return JSONResponse(content={"message": final_msg, "whatsapp_response": response})
-
-                    return JSONResponse(content={"message": "Could not process request."})
-
-        return JSONResponse(content={"status": "success"})
-    
-    except Exception as e:
-        print(f"Error: {str(e)}")  
-        return JSONResponse(content={"status": "error", "message": str(e)})
+        owner = get_tenant(tenant)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant: {tenant}")
+    if format not in EXPORTERS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORTERS)}")
+    if format == "parquet" and not PARQUET_AVAILABLE:
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow")
+
+    if period:
+        bounds = resolve_period(period)
+        if bounds is None:
+            raise HTTPException(status_code=400, detail=f"Unknown period: {period}")
+        start, end = bounds
+    else:
+        for name, value in (("start", start), ("end", end)):
+            if value and parse_date(value) is None:
+                raise HTTPException(status_code=400, detail=f"Invalid {name} date: {value}")
+        start = parse_date(start).isoformat() if start else None
+        end = parse_date(end).isoformat() if end else None
 
+    exporter, media_type = EXPORTERS[format]
+    rows = get_store().iter_user_rows(owner.user_key(user_id), start=start, end=end, category=category)
+    return StreamingResponse(
+        exporter(rows),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="expenses-{user_id}.{format}"'},
+    )
@@ -0,0 +1,223 @@
+"""
+Prometheus metrics for both apps, rendered in the text exposition format by
+render() and served on /metrics. Written in-house to avoid a dependency on
+prometheus_client; only counters, callback gauges and histograms are needed.
+
+  expense_bot_stage_seconds{stage}         classify, parse, query_term, extract,
+                                           storage_read, storage_write,
+                                           outbound_send, process (a whole message)
+                                           and digest_build
+  expense_bot_upstream_responses_total{service,status}
+                                           Groq and Graph API (and Twilio) status
+                                           codes; "error" when no response came back
+  expense_bot_upstream_seconds{service}    one HTTP round-trip to a provider
+  expense_bot_upstream_connections{host,count}
+                                           requests, connections opened and requests
+                                           that reused one, per host; registered by
+                                           httpclients.py
+  expense_bot_http_requests_total{app,route,status} and expense_bot_http_request_seconds{app,route}
+                                           requests served, for request rates
+  expense_bot_messages_total{app,intent}   messages processed by intent
+  expense_bot_outbound_total{dispatcher,outcome}
+                                           sent, retries, dropped, failed
+  expense_bot_queue_depth{queue} / expense_bot_queue_in_flight{queue}
+  expense_bot_fastpath_messages_total{outcome} and expense_bot_fastpath_hit_rate
+                                           messages answered by the fast path (hit)
+                                           or handed to the LLM (miss); registered
+                                           by fastpath.py
+"""
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans a cache hit (well under a millisecond) to a slow LLM call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> value
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        try:
+            if len(labels) == len(self.labelnames):
+                return tuple([str(labels[name]) for name in self.labelnames])
+        except KeyError:
+            pass
+        raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_labels(self.labelnames, values, extra)} {_number(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            return [("", key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Read at scrape time from ``function()``: a number, or {label values: number} when labelled."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _samples(self):
+        value = self.function() if self.function is not None else 0
+        if not self.labelnames:
+            return [("", (), (), value)]
+        return [("", key, (), number) for key, number in sorted(value.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # one count per bucket, then +Inf, then the running sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return sum(counts[:-1]) if counts else 0
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, counts in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    samples.append(("_bucket", key, (("le", _number(bound)),), cumulative))
+                samples.append(("_sum", key, (), counts[-1]))
+                samples.append(("_count", key, (), cumulative))
+        return samples
+
+
+STAGE_SECONDS = Histogram("expense_bot_stage_seconds", "Time spent in each stage of handling a message", ["stage"])
+UPSTREAM_RESPONSES = Counter("expense_bot_upstream_responses_total", "Responses from Groq and the messaging APIs by status code",
+                             ["service", "status"])
+UPSTREAM_SECONDS = Histogram("expense_bot_upstream_seconds", "HTTP round-trip time to Groq and the messaging APIs", ["service"])
+HTTP_REQUESTS = Counter("expense_bot_http_requests_total", "HTTP requests served", ["app", "route", "status"])
+HTTP_REQUEST_SECONDS = Histogram("expense_bot_http_request_seconds", "Time to answer an HTTP request", ["app", "route"])
+MESSAGES = Counter("expense_bot_messages_total", "Messages processed, by what the user asked for", ["app", "intent"])
+OUTBOUND = Counter("expense_bot_outbound_total", "Outbound message sends by outcome", ["dispatcher", "outcome"])
+
+_work_queues = {}
+
+
+def watch_work_queue(name, work_queue):
+    _work_queues[name] = work_queue
+
+
+QUEUE_DEPTH = Gauge("expense_bot_queue_depth", "Messages waiting for a worker", ["queue"],
+                    lambda: {(name,): queue.snapshot()["depth"] for name, queue in list(_work_queues.items())})
+QUEUE_IN_FLIGHT = Gauge("expense_bot_queue_in_flight", "Messages being processed", ["queue"],
+                        lambda: {(name,): queue.snapshot()["in_flight"] for name, queue in list(_work_queues.items())})
+
+
+# Decorator timing a function (plain or coroutine) into expense_bot_stage_seconds
+def timed(stage):
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with STAGE_SECONDS.time(stage=stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with STAGE_SECONDS.time(stage=stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Which provider a URL belongs to, by path so local stubs are labelled like the real APIs
+def service_for(url):
+    path = str(url)
+    if "/chat/completions" in path:
+        return "groq"
+    if path.rstrip("/").endswith("/messages"):
+        return "graph"
+    return "other"
+
+
+def record_upstream(service, status, seconds=None):
+    UPSTREAM_RESPONSES.inc(service=service, status=status)
+    if seconds is not None:
+        UPSTREAM_SECONDS.observe(seconds, service=service)
+
+
+def render():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
@@ -0,0 +1,205 @@
+"""
+Amounts of money: which currency a message is in, exact integer minor units
+(paise, cents) and conversion into the ledger's currency.
+
+Every expense keeps the amount and currency it was entered in. For totals it is
+converted into LEDGER_CURRENCY minor units (row["amount_minor"]), so sums are
+integer additions that neither drift nor mix currencies. Rates come
+from FX_RATES_FILE, a JSON table read once per process:
+
+    {"base": "INR", "date": "2026-10-01", "rates": {"INR": "1", "USD": "83.10", ...}}
+
+where each rate is the number of `base` units one unit of the currency buys.
+Conversions are Decimal arithmetic rounded half-even to the target's minor unit,
+and the factor for each pair of currencies is computed once and memoized.
+
+Both stores keep only the entered amount (the CSV ledger as text such as
+"12.50 USD", SQLite as integer minor units plus the currency) and convert it
+when the row is read, so a new FX_RATES_FILE moves their totals alike.
+"""
+import importlib.util
+import json
+import logging
+import os
+import re
+import threading
+from decimal import ROUND_HALF_EVEN, ROUND_HALF_UP, Decimal, InvalidOperation
+
+# NumPy is optional and only imported by sum_minor() for arrays that are already NumPy columns
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+LEDGER_CURRENCY = os.getenv("LEDGER_CURRENCY", "INR").upper()
+FX_RATES_FILE = os.getenv("FX_RATES_FILE", "fx_rates.json")
+
+# ISO code -> (how replies write it, digits after the decimal point)
+CURRENCIES = {
+    "INR": ("Rs", 2),
+    "USD": ("USD", 2),
+    "EUR": ("EUR", 2),
+    "GBP": ("GBP", 2),
+    "AED": ("AED", 2),
+    "SGD": ("SGD", 2),
+    "JPY": ("JPY", 0),
+}
+
+# Symbols and words that name a currency in a message; the first one found wins
+CURRENCY_RE = re.compile(
+    r"(?P<INR>₹|(?<![a-z])(?:rs\.?|inr|rupees?)(?![a-z]))"
+    r"|(?P<USD>\$|(?<![a-z])(?:usd|dollars?|bucks)(?![a-z]))"
+    r"|(?P<EUR>€|(?<![a-z])(?:eur|euros?)(?![a-z]))"
+    r"|(?P<GBP>£|(?<![a-z])gbp(?![a-z]))"
+    r"|(?P<AED>(?<![a-z])(?:aed|dirhams?)(?![a-z]))"
+    r"|(?P<SGD>(?<![a-z])sgd(?![a-z]))"
+    r"|(?P<JPY>¥|(?<![a-z])(?:jpy|yen)(?![a-z]))",
+    re.IGNORECASE,
+)
+NUMBER_RE = re.compile(r"\d[\d,]*(?:\.\d+)?|\.\d+")
+# What most stored amounts look like; parsed without the currency search or Decimal
+PLAIN_AMOUNT_RE = re.compile(r"(\d+)(?:\.(\d{1,2}))?")
+
+logger = logging.getLogger(__name__)
+
+
+class ConversionError(ValueError):
+    """There is no rate for a currency in FX_RATES_FILE."""
+
+
+def minor_digits(currency):
+    return CURRENCIES.get(currency, (currency, 2))[1]
+
+
+# The currency named in `text` ("₹500", "12 usd", "$3"), or `default` when there is none
+def detect_currency(text, default=None):
+    match = CURRENCY_RE.search(text or "")
+    return match.lastgroup if match else default
+
+
+def to_minor(amount, currency=LEDGER_CURRENCY):
+    """Decimal (or int/str/float) in major units -> int minor units, half-up as people round prices."""
+    amount = amount if isinstance(amount, Decimal) else Decimal(str(amount))
+    return int(amount.scaleb(minor_digits(currency)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor(minor, currency=LEDGER_CURRENCY):
+    return Decimal(minor).scaleb(-minor_digits(currency))
+
+
+# (minor units, currency) for an amount as stored or extracted: a number, or text
+# such as "₹1,200", "12.50 USD" or the legacy "10rs". A currency named in the text
+# wins over `currency`; with neither, the amount is in LEDGER_CURRENCY.
+def parse_money(value, currency=None):
+    if isinstance(value, str):
+        plain = PLAIN_AMOUNT_RE.fullmatch(value)
+        currency = (currency or LEDGER_CURRENCY).upper()
+        if plain and minor_digits(currency) == 2:
+            return int(plain.group(1)) * 100 + int((plain.group(2) or "0").ljust(2, "0")), currency
+        currency = detect_currency(value, currency)
+        match = NUMBER_RE.search(value)
+        value = match.group(0).replace(",", "") if match else 0
+    currency = (currency or LEDGER_CURRENCY).upper()
+    if value is None or isinstance(value, bool):
+        return 0, currency
+    try:
+        return to_minor(value, currency), currency
+    except (InvalidOperation, ValueError):
+        return 0, currency
+
+
+# "12.50" / "500": the shortest exact text for an amount, as written to the CSV ledger
+def decimal_text(minor, currency=LEDGER_CURRENCY):
+    amount = from_minor(minor, currency)
+    return str(amount.to_integral_value()) if amount == amount.to_integral_value() else str(amount)
+
+
+# The amount as the CSV ledger stores it: plain for LEDGER_CURRENCY, "12.50 USD" otherwise
+def ledger_text(minor, currency):
+    text = decimal_text(minor, currency)
+    return text if currency == LEDGER_CURRENCY else f"{text} {currency}"
+
+
+# "500 Rs", "12.50 USD"
+def format_money(minor, currency=LEDGER_CURRENCY):
+    return f"{decimal_text(minor, currency)} {CURRENCIES.get(currency, (currency, 2))[0]}"
+
+
+class FxTable:
+    """Conversion rates from FX_RATES_FILE, with each pair's factor memoized."""
+
+    def __init__(self, path=FX_RATES_FILE, rates=None):
+        self.path = path
+        self.date = None
+        self._rates = {}
+        self._factors = {}
+        if rates is not None:
+            self._rates = {currency.upper(): Decimal(str(rate)) for currency, rate in rates.items()}
+        else:
+            self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            logger.info("No FX rates file at %s; only %s amounts can be saved", self.path, LEDGER_CURRENCY)
+            return
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                table = json.load(file)
+            self._rates = {currency.upper(): Decimal(str(rate)) for currency, rate in table["rates"].items()}
+            self._rates.setdefault(table.get("base", LEDGER_CURRENCY).upper(), Decimal(1))
+            self.date = table.get("date")
+        except (OSError, ValueError, KeyError, InvalidOperation) as e:
+            logger.warning("Could not read FX rates from %s: %s", self.path, e)
+
+    def currencies(self):
+        return sorted(self._rates)
+
+    # Multiply source minor units by this to get target minor units
+    def factor(self, source, target):
+        key = (source, target)
+        factor = self._factors.get(key)
+        if factor is None:
+            if source == target:
+                factor = Decimal(1)
+            elif source in self._rates and target in self._rates:
+                factor = (self._rates[source] / self._rates[target]).scaleb(minor_digits(target) - minor_digits(source))
+            else:
+                raise ConversionError(f"No exchange rate for {source if source not in self._rates else target}")
+            self._factors[key] = factor
+        return factor
+
+    def convert(self, minor, source, target=LEDGER_CURRENCY):
+        if source == target:
+            return minor
+        return int((minor * self.factor(source, target)).quantize(Decimal(1), rounding=ROUND_HALF_EVEN))
+
+
+_fx_table = None
+_fx_lock = threading.Lock()
+
+
+# Process-wide FxTable, read from FX_RATES_FILE on first use
+def get_fx_table():
+    global _fx_table
+    with _fx_lock:
+        if _fx_table is None:
+            _fx_table = FxTable()
+        return _fx_table
+
+
+def to_ledger(minor, currency):
+    if currency == LEDGER_CURRENCY:
+        return minor
+    return (_fx_table or get_fx_table()).convert(minor, currency, LEDGER_CURRENCY)
+
+
+# Exact total of integer minor units. An int64 NumPy column (the columnar ledger's
+# amounts) is summed in one vectorized call unless the total could overflow int64.
+# A list goes through int addition, which never rounds: copying it into an array
+# first costs several times more than the addition itself.
+def sum_minor(values):
+    if NUMPY_AVAILABLE and type(values).__module__ == "numpy":
+        import numpy as np
+
+        bound = int(np.abs(values).max()) if len(values) else 0
+        if bound and bound > np.iinfo(np.int64).max // len(values):
+            return sum(int(value) for value in values)
+        return int(np.sum(values, dtype=np.int64))
+    return sum(values)
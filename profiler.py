@@ -0,0 +1,122 @@
+"""
+Sampling profiler that can be switched on in a running process.
+
+While running, a background thread looks at every other thread's stack every
+PROFILER_INTERVAL_MS and counts each distinct stack. folded() returns the
+counts in the "collapsed stack" format that flamegraph.pl and speedscope read:
+
+    MainThread;app.py:webhook;storage.py:add 42
+
+Sampling only reads frames, so the cost is one stack walk per thread per
+interval and nothing at all while the profiler is off. Both apps expose it on
+/debug/profile (guarded by PROFILER_TOKEN), and SIGUSR2 toggles it too.
+"""
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "10"))
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "300"))
+PROFILER_MAX_DEPTH = int(os.getenv("PROFILER_MAX_DEPTH", "64"))
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _stack(frame, thread_name, max_depth):
+    names = []
+    while frame is not None and len(names) < max_depth:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms=PROFILER_INTERVAL_MS, max_seconds=PROFILER_MAX_SECONDS, max_depth=PROFILER_MAX_DEPTH):
+        self.interval = interval_ms / 1000
+        self.max_seconds = max_seconds
+        self.max_depth = max_depth
+        self._lock = threading.RLock()  # re-entrant: the SIGUSR2 handler may interrupt a holder
+        self._stacks = Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # Start sampling (clearing the previous profile) for at most `seconds`
+    def start(self, seconds=None, interval_ms=None):
+        with self._lock:
+            if self.running:
+                return False
+            if interval_ms:
+                self.interval = interval_ms / 1000
+            self._stacks = Counter()
+            self.samples = 0
+            self.started_at = time.time()
+            self.stopped_at = None
+            self._stop.clear()
+            duration = min(seconds or self.max_seconds, self.max_seconds)
+            self._thread = threading.Thread(target=self._run, args=(duration,), name="profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self, wait=True):
+        self._stop.set()
+        thread = self._thread
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _run(self, duration):
+        deadline = time.monotonic() + duration
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, frame in frames.items():
+                    if ident != own:
+                        self._stacks[_stack(frame, names.get(ident, str(ident)), self.max_depth)] += 1
+                self.samples += 1
+        self.stopped_at = time.time()
+
+    def folded(self):
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": self.running,
+                "samples": self.samples,
+                "interval_ms": self.interval * 1000,
+                "distinct_stacks": len(self._stacks),
+                "started_at": self.started_at,
+                "stopped_at": self.stopped_at,
+            }
+
+
+profiler = SamplingProfiler()
+
+
+def _toggle(signum, frame):
+    if profiler.running:
+        profiler.stop(wait=False)
+    else:
+        profiler.start()
+
+
+# `kill -USR2 <pid>` starts or stops the profiler. Only possible from the main thread.
+def install_signal_toggle():
+    if hasattr(signal, "SIGUSR2") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR2, _toggle)
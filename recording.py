@@ -0,0 +1,24 @@
+"""
+Optional capture of incoming webhooks, to be replayed by benchmarks/replay.py.
+
+With WEBHOOK_RECORD_FILE set, both apps append every webhook they receive to
+that file as one JSON line: {"source": "meta" or "twilio", "received_at": unix
+time, "payload": the parsed body}. Payloads carry phone numbers and message
+text, so only switch it on where keeping those is acceptable.
+"""
+import json
+import os
+import threading
+import time
+
+WEBHOOK_RECORD_FILE = os.getenv("WEBHOOK_RECORD_FILE", "")
+
+_lock = threading.Lock()
+
+
+def record_webhook(source, payload):
+    if not WEBHOOK_RECORD_FILE:
+        return
+    line = json.dumps({"source": source, "received_at": time.time(), "payload": payload}, ensure_ascii=False)
+    with _lock, open(WEBHOOK_RECORD_FILE, "a", encoding="utf-8") as file:
+        file.write(line + "\n")
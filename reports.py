@@ -0,0 +1,157 @@
+"""
+Getting a user's expenses out in bulk: streaming exports and chat summaries.
+
+The export_* generators take an iterator of rows and yield the encoded file a
+chunk of EXPORT_CHUNK_ROWS rows at a time, so memory stays flat however long
+the history is. summary_pages() splits a transaction list into WhatsApp-sized
+messages and stops after SUMMARY_MAX_PAGES, pointing at the export instead.
+"""
+import csv
+import importlib.util
+import io
+import json
+import os
+
+from money import format_money, to_minor
+
+# pyarrow is only imported by export_parquet(), so it costs nothing until a Parquet export is asked for
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+SUMMARY_MAX_PAGES = int(os.getenv("SUMMARY_MAX_PAGES", "3"))
+
+# Longest text body each channel accepts
+WHATSAPP_MESSAGE_LIMIT = 4096
+TWILIO_MESSAGE_LIMIT = 1600
+
+EXPORT_FIELDS = ["id", "user_id", "amount", "currency", "amount_minor", "category", "description", "date"]
+MORE_TRANSACTIONS = "...and {} more transactions. Ask about a shorter period to see them."
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for chunk in _chunks(rows, EXPORT_CHUNK_ROWS):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_ndjson(rows):
+    for chunk in _chunks(rows, EXPORT_CHUNK_ROWS):
+        yield "".join(json.dumps({field: row[field] for field in EXPORT_FIELDS}, ensure_ascii=False) + "\n"
+                      for row in chunk)
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since the last drain()."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+# One Parquet row group per chunk; the footer goes out at the end
+def export_parquet(rows):
+    if not PARQUET_AVAILABLE:
+        raise RuntimeError("Parquet export needs pyarrow")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("user_id", pa.string()),
+        ("amount", pa.float64()),
+        ("currency", pa.string()),
+        ("amount_minor", pa.int64()),
+        ("category", pa.string()),
+        ("description", pa.string()),
+        ("date", pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for chunk in _chunks(rows, EXPORT_CHUNK_ROWS):
+        writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+# format -> (generator, media type)
+EXPORTERS = {
+    "csv": (export_csv, "text/csv"),
+    "ndjson": (export_ndjson, "application/x-ndjson"),
+    "parquet": (export_parquet, "application/vnd.apache.parquet"),
+}
+
+
+def transaction_line(row):
+    return f"- {row['date']}: {format_money(to_minor(row['amount'], row['currency']), row['currency'])} ({row['description']})"
+
+
+# Split header + lines into messages of at most `limit` characters. After max_pages
+# the rest is summarised as "...and N more" (total is the number of lines); the last
+# page gives up lines (and the header, on a single page) only when that note is needed.
+def summary_pages(header, lines, total, limit=WHATSAPP_MESSAGE_LIMIT, max_pages=SUMMARY_MAX_PAGES):
+    pages = []
+    page = [header[:limit]]
+    size = len(page[0])
+    shown = 0
+
+    for line in lines:
+        line = line[:limit]
+        if size + 1 + len(line) > limit:
+            if len(pages) >= max_pages - 1:
+                break
+            pages.append("\n".join(page))
+            page, size = [], -1
+        page.append(line)
+        size += 1 + len(line)
+        shown += 1
+
+    if shown < total:
+        first = 0 if pages else 1  # the header is shortened rather than dropped
+        note = MORE_TRANSACTIONS.format(total - shown)
+        while size + 1 + len(note) > limit and len(page) > first:
+            size -= 1 + len(page.pop())
+            shown -= 1
+            note = MORE_TRANSACTIONS.format(total - shown)
+        if first and size + 1 + len(note) > limit:
+            page[0] = page[0][:max(limit - 1 - len(note), 0)]
+        page.append(note)
+    pages.append("\n".join(page))
+    return pages
@@ -0,0 +1,304 @@
+"""
+Inverted index over the words of every expense's category and description.
+
+Words are lowercased, lightly stemmed ("groceries" and "grocery" meet) and
+mapped through SYNONYMS and CATEGORY_ALIASES, so "cab" finds "taxi" rows and
+"utilities" finds "bills". Each query word must match, either exactly, as the
+prefix of an indexed word ("din" -> "dinner"), or within a small edit distance
+of one of the user's words when neither finds anything ("grocey" -> "grocery").
+
+The index holds row ids only: matches() returns the ids and the rows are read
+from the store. It is kept current through the store's listeners and saved to
+SEARCH_INDEX_FILE (postings and row ids) so a restart does not re-tokenize the
+whole ledger. Saves run on a background thread, never on a request.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+from storage import get_store
+
+SEARCH_INDEX_FILE = os.getenv("SEARCH_INDEX_FILE", "search_index.json")
+SEARCH_INDEX_SAVE_EVERY = int(os.getenv("SEARCH_INDEX_SAVE_EVERY", "100"))
+SEARCH_INDEX_CHECK_INTERVAL = float(os.getenv("SEARCH_INDEX_CHECK_INTERVAL", "30"))
+
+logger = logging.getLogger(__name__)
+
+# canonical word -> words that mean the same thing
+SYNONYMS = {
+    "taxi": ("cab", "uber", "ola", "auto", "rickshaw"),
+    "movie": ("film", "cinema"),
+    "coldrink": ("soda", "cola", "softdrink"),
+    "medicine": ("meds", "tablet", "pharmacy"),
+    "tshirt": ("tee", "shirt"),
+    "petrol": ("fuel", "diesel"),
+}
+
+# category -> other names users give it
+CATEGORY_ALIASES = {
+    "groceries": ("grocery", "supermarket", "kirana"),
+    "transport": ("travel", "commute", "transportation"),
+    "bills": ("utilities", "utility"),
+    "clothing": ("clothes", "apparel"),
+    "food": ("eating", "restaurant", "meal"),
+    "entertainment": ("fun", "leisure"),
+    "health": ("medical", "healthcare"),
+}
+
+STOPWORDS = {"a", "an", "the", "on", "for", "of", "in", "and", "my", "me", "i", "to", "at", "with"}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+# Strip common English suffixes so plural and singular forms share a token
+def stem(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("sses", "shes", "ches", "xes", "zes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    if len(word) > 5 and word.endswith("ing"):
+        return word[:-3]
+    if len(word) > 4 and word.endswith("ed"):
+        return word[:-2]
+    return word
+
+
+CANONICAL = {}
+for _canonical, _words in list(SYNONYMS.items()) + list(CATEGORY_ALIASES.items()):
+    for _word in _words:
+        CANONICAL[stem(_word)] = stem(_canonical)
+
+
+def tokenize(text):
+    tokens = []
+    for word in _WORD_RE.findall((text or "").lower()):
+        if word in STOPWORDS:
+            continue
+        token = stem(word)
+        tokens.append(CANONICAL.get(token, token))
+    return tokens
+
+
+# Levenshtein distance between a and b, or None as soon as it must exceed limit
+def bounded_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+def _typo_limit(token):
+    if len(token) < 4:
+        return 0
+    return 1 if len(token) <= 6 else 2
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.source = None  # path of the ledger the index was built from
+        self.generation = None  # the ledger's generation() the saved index matches, if known
+        self._reset()
+
+    def _reset(self):
+        self._postings = defaultdict(lambda: defaultdict(set))  # user_id -> token -> row ids
+        self._ids = set()                                       # every indexed row id
+        self.unsaved = 0
+
+    def _add(self, row):
+        self._ids.add(row["id"])
+        postings = self._postings[row["user_id"]]
+        for token in tokenize(row["category"]) + tokenize(row["description"]):
+            postings[token].add(row["id"])
+
+    def _discard(self, row):
+        self._ids.discard(row["id"])
+        postings = self._postings.get(row["user_id"], {})
+        for token in tokenize(row["category"]) + tokenize(row["description"]):
+            ids = postings.get(token)
+            if ids is not None:
+                ids.discard(row["id"])
+                if not ids:
+                    del postings[token]
+
+    # Store listener: index one new row
+    def record(self, row):
+        with self._lock:
+            self._add(row)
+            self.unsaved += 1
+
+    # Store change listener: re-index an edited row, or forget a deleted one
+    def change(self, old, new):
+        with self._lock:
+            self._discard(old)
+            if new is not None:
+                self._add(new)
+            self.unsaved += 1
+
+    def rebuild(self, rows):
+        with self._lock:
+            self._reset()
+            for row in rows:
+                self._add(row)
+            self.unsaved = len(self._ids)
+
+    def _token_ids(self, postings, token):
+        ids = set(postings.get(token, ()))
+        if len(token) >= 3:
+            for word, word_ids in postings.items():
+                if word != token and word.startswith(token):
+                    ids |= word_ids
+        if ids:
+            return ids
+
+        limit = _typo_limit(token)
+        if limit:
+            for word, word_ids in postings.items():
+                if bounded_distance(token, word, limit) is not None:
+                    ids |= word_ids
+        return ids
+
+    def matches(self, user_id, term):
+        """Ids of the user's rows matching every word of term, or None if term has no searchable words."""
+        tokens = tokenize(term)
+        if not tokens:
+            return None
+        with self._lock:
+            postings = self._postings.get(user_id)
+            if not postings:
+                return set()
+            ids = None
+            for token in tokens:
+                token_ids = self._token_ids(postings, token)
+                ids = token_ids if ids is None else ids & token_ids
+                if not ids:
+                    return set()
+            return ids
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ids)
+
+    def save(self, path):
+        # Copy under the lock, encode and write outside it so queries are not held up
+        with self._lock:
+            ids = list(self._ids)
+            postings = {user_id: {token: list(token_ids) for token, token_ids in user_postings.items()}
+                        for user_id, user_postings in self._postings.items()}
+            self.unsaved = 0
+        data = {"source": self.source, "generation": self.generation, "ids": ids, "postings": postings}
+        # Write to a temporary file first so a crash never leaves a half-written index
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(data, file, separators=(",", ":"))
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            data = json.load(file)
+        index = cls()
+        if "ids" not in data:
+            raise ValueError("search index saved in an older format")
+        index.source = data.get("source")
+        index.generation = data.get("generation")
+        index._ids = set(data["ids"])
+        for user_id, postings in data["postings"].items():
+            for token, ids in postings.items():
+                index._postings[user_id][token] = set(ids)
+        return index
+
+
+_index = None
+_index_lock = threading.Lock()
+_last_check = 0.0
+_outside_changes = 0  # store.outside_changes() as of the last build or load
+_save_lock = threading.Lock()
+_saver = None  # thread running the latest background save
+
+
+def _load_or_build(store):
+    if SEARCH_INDEX_FILE and os.path.exists(SEARCH_INDEX_FILE):
+        try:
+            index = SearchIndex.load(SEARCH_INDEX_FILE)
+            if index.source == store.path and index.generation == store.generation():
+                return index
+            logger.info("Search index on disk is out of date, rebuilding")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Could not load search index: %s", e)
+    index = SearchIndex()
+    index.rebuild(store.iter_rows())
+    index.source = store.path
+    return index
+
+
+# The ledger generation the index is known to match, or None (so that the saved index is
+# rebuilt when loaded) while one of our writes is on its way to the index or after a
+# change made elsewhere that the index has not been rebuilt for yet
+def _matched_generation(store):
+    generation = store.settled_generation()
+    if store.outside_changes() != _outside_changes:
+        return None
+    return generation
+
+
+def _save(index):
+    with _save_lock:
+        index.generation = _matched_generation(get_store())
+        index.save(SEARCH_INDEX_FILE)
+
+
+# Save the index on a background thread unless a save is already running. Caller holds _index_lock.
+def _save_in_background():
+    global _saver
+    if _saver is not None and _saver.is_alive():
+        return
+    _saver = threading.Thread(target=_save, args=(_index,), name="search-index-save", daemon=True)
+    _saver.start()
+
+
+# Process-wide index over get_store(): loaded from SEARCH_INDEX_FILE (or built) on
+# first use, then kept current by the store. Saved in the background once
+# SEARCH_INDEX_SAVE_EVERY changes have piled up; rebuilt if another process changes
+# the ledger (see ExpenseStore.outside_changes()).
+def get_search_index():
+    global _index, _last_check, _outside_changes
+    with _index_lock:
+        store = get_store()
+        if _index is None:
+            _outside_changes = store.outside_changes()
+            _index = _load_or_build(store)
+            store.subscribe(_index.record, _index.change)
+            _last_check = time.monotonic()
+        elif time.monotonic() - _last_check >= SEARCH_INDEX_CHECK_INTERVAL:
+            _last_check = time.monotonic()
+            if store.outside_changes() != _outside_changes:
+                logger.warning("Search index out of date, rebuilding from the ledger")
+                _outside_changes = store.outside_changes()
+                _index.rebuild(store.iter_rows())
+        if SEARCH_INDEX_FILE and _index.unsaved >= SEARCH_INDEX_SAVE_EVERY:
+            _save_in_background()
+        return _index
+
+
+# Shutdown hook: wait for a background save, then persist whatever it did not cover
+def save_search_index():
+    with _index_lock:
+        index, saver = _index, _saver
+    if saver is not None:
+        saver.join()
+    if index is not None and SEARCH_INDEX_FILE and index.unsaved:
+        _save(index)
@@ -1,87 +1,38 @@
-from fastapi import HTTPException
-from dotenv import load_dotenv
-import httpx
+import settings  # noqa: F401  (loads .env)
+from httpclients import get_async_client
+from dispatcher import AsyncDispatcher, RetryableSendError, SendError
+from tenants import get_tenant
 import os
 import json
 import asyncio
+import logging
+import threading
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
 RECIPIENT_WAID = os.getenv("RECIPIENT_WAID")
-PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
 VERSION = os.getenv("VERSION", "v21.0")
+GRAPH_API_URL = os.getenv("GRAPH_API_URL", "https://graph.facebook.com")
 TEMPLATE_NAME = os.getenv("TEMPLATE_NAME", "reengagement_message")  
 
-async def send_message(message: str):
-    """
-    Sends a WhatsApp message. If more than 24 hours have passed since the last user response,
-    it automatically switches to sending a template message.
-    """
-    
-    url = f"https://graph.facebook.com/{VERSION}/{PHONE_NUMBER_ID}/messages"
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
-
-    data = {
-        "messaging_product": "whatsapp",
-        "to": RECIPIENT_WAID,
-        "type": "text",
-        "text": {"body": message}
-    }
-
-    print(f"Sending WhatsApp message to {RECIPIENT_WAID}: {message}")  
-    print(f"Request URL: {url}")
-    print(f"Request Headers: {json.dumps(headers, indent=2)}")
-    print(f"Request Payload: {json.dumps(data, indent=2)}")
-
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, headers=headers, json=data)
-            response_data = response.json()
+# Graph API error codes that mean "slow down" rather than "this message is bad"
+THROTTLING_ERROR_CODES = {4, 80007, 130429, 131048, 131056}
 
-            print(f"Response Status: {response.status_code}")
-            print(f"Response Body: {json.dumps(response_data, indent=2)}")
 
-            if response.status_code == 200:
-                return response_data
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
 
-            # Check if the failure is due to the 24-hour window restriction
-            if "error" in response_data and response_data["error"].get("code") == 131047:
-                print("Message failed due to 24-hour limit. Switching to template message.")
 
-                # Switch to sending a template message
-                return await send_template_message()
-
-            raise HTTPException(status_code=response.status_code, detail=f"WhatsApp API Error: {response_data}")
-
-        except httpx.RequestError as e:
-            print(f"Request Error: {str(e)}")  
-            raise HTTPException(status_code=500, detail="Failed to connect to WhatsApp API.")
-        
-        except Exception as e:
-            print(f"Unexpected Error: {str(e)}")  
-            raise HTTPException(status_code=500, detail="An unexpected error occurred.")
-
-async def send_template_message():
-    """
-    Sends a WhatsApp message using a pre-approved template to bypass the 24-hour restriction.
-    """
-    url = f"https://graph.facebook.com/{VERSION}/{PHONE_NUMBER_ID}/messages"
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
-
-    data = {
+def _template_payload(recipient, tenant):
+    return {
         "messaging_product": "whatsapp",
-        "to": RECIPIENT_WAID,
+        "to": recipient,
         "type": "template",
         "template": {
-            "name": TEMPLATE_NAME,
+            "name": tenant.template_name,
             "language": { "code": "en_US" },
             "components": [
                 {
@@ -94,29 +45,96 @@ async def send_template_message():
         }
     }
 
-    print(f"Sending WhatsApp template message to {RECIPIENT_WAID}.")
-    print(f"Request Payload: {json.dumps(data, indent=2)}")
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, headers=headers, json=data)
-            response_data = response.json()
+# One attempt at the Graph API from the tenant's number. Throttling, 5xx and connection
+# errors raise RetryableSendError for the dispatcher to retry; other errors raise SendError.
+async def post_message(recipient, data, tenant):
+    import httpx
+
+    url = f"{GRAPH_API_URL}/{VERSION}/{tenant.phone_number_id}/messages"
+    headers = {
+        "Authorization": f"Bearer {tenant.access_token}",
+        "Content-Type": "application/json",
+    }
+
+    logger.info("Sending WhatsApp %s message to %s for tenant %s", data["type"], recipient, tenant.id)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Request payload: %s", json.dumps(data))
+
+    try:
+        response = await get_async_client().post(url, headers=headers, json=data)
+    except httpx.HTTPError as e:
+        logger.warning("Request error: %s", e)
+        raise RetryableSendError(f"Failed to connect to WhatsApp API: {e}")
+
+    try:
+        response_data = response.json()
+    except ValueError:
+        response_data = {"error": {"message": response.text}}
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Response %s: %s", response.status_code, json.dumps(response_data))
+
+    if response.status_code == 200:
+        return response_data
+
+    error = response_data.get("error") or {}
+    # Outside the 24-hour window free-form text is refused; re-engage with the template instead
+    if error.get("code") == 131047 and data["type"] == "text":
+        logger.info("Message to %s failed due to 24-hour limit. Switching to template message.", recipient)
+        return await post_message(recipient, _template_payload(recipient, tenant), tenant)
+
+    if response.status_code == 429 or response.status_code >= 500 or error.get("code") in THROTTLING_ERROR_CODES:
+        raise RetryableSendError(f"WhatsApp API Error: {response_data}", retry_after=_retry_after(response))
+    raise SendError(f"WhatsApp API Error: {response_data}")
+
+
+# One dispatcher per tenant, each rate limited, retried and ordered per recipient (see
+# dispatcher.py), so one business number hitting its limits does not hold up the others
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
 
-            print(f"Template Response Status: {response.status_code}")
-            print(f"Template Response Body: {json.dumps(response_data, indent=2)}")
+def outbound_for(tenant):
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.get(tenant.id)
+        if dispatcher is None:
+            dispatcher = AsyncDispatcher(post_message, name=f"whatsapp:{tenant.id}")
+            _dispatchers[tenant.id] = dispatcher
+        return dispatcher
 
-            if response.status_code == 200:
-                return response_data
 
-            raise HTTPException(status_code=response.status_code, detail=f"WhatsApp API Template Error: {response_data}")
+# tenant id -> that tenant's dispatcher snapshot
+def outbound_stats():
+    with _dispatchers_lock:
+        dispatchers = dict(_dispatchers)
+    return {tenant_id: dispatcher.snapshot() for tenant_id, dispatcher in dispatchers.items()}
 
-        except httpx.RequestError as e:
-            print(f"Request Error: {str(e)}")
-            raise HTTPException(status_code=500, detail="Failed to connect to WhatsApp API.")
-        
-        except Exception as e:
-            print(f"Unexpected Error: {str(e)}")
-            raise HTTPException(status_code=500, detail="An unexpected error occurred.")
+
+async def send_message(message: str, to=None, tenant=None):
+    """
+    Sends a WhatsApp message to ``to`` (RECIPIENT_WAID by default) from the tenant's number.
+    If more than 24 hours have passed since the last user response, it automatically switches
+    to sending a template message. Raises SendError when the message could not be delivered.
+    """
+    tenant = tenant or get_tenant()
+    to = to or RECIPIENT_WAID
+    data = {
+        "messaging_product": "whatsapp",
+        "to": to,
+        "type": "text",
+        "text": {"body": message}
+    }
+    return await outbound_for(tenant).send(to, data, tenant)
+
+async def send_template_message(to=None, tenant=None):
+    """
+    Sends a WhatsApp message using a pre-approved template to bypass the 24-hour restriction.
+    Raises SendError when the message could not be delivered.
+    """
+    tenant = tenant or get_tenant()
+    to = to or RECIPIENT_WAID
+    return await outbound_for(tenant).send(to, _template_payload(to, tenant), tenant)
 
 if __name__ == '__main__':
     asyncio.run(send_message("Check"))
@@ -0,0 +1,276 @@
+"""
+Conversation context per user, so that follow-ups are understood locally.
+
+After every message the engine records the user's last intent, the filter of
+their last question (a query term or an analytics query) and the id of the
+expense they last added or edited. parse_follow_up() reads it back to resolve
+messages that only make sense after the previous one, without asking the LLM:
+
+    "and last month?", "what about travel?"        the last question, refined
+    "make that 300", "it was yesterday",
+    "change the category to travel"                an edit of that expense
+    "delete that", "undo", "delete my last expense" a delete
+
+Sessions live in a bounded in-memory LRU (ttlcache.TTLCache) and expire
+SESSION_TTL seconds after the user's last message. Setting SESSION_DB adds an
+SQLite table that survives restarts. Each process answers from its own LRU
+first, so with several worker processes a session changed by one is seen by
+another once that process's copy has expired. get_async() is the event-loop
+read: it goes through ``run_blocking(func, *args)`` when SQLite is involved.
+"""
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from aggregates import category_key
+from dates import parse_date, resolve_period, resolve_relative_date, split_period_phrase
+from money import detect_currency
+from ttlcache import TTLCache
+
+SESSION_MAX_USERS = int(os.getenv("SESSION_MAX_USERS", "10000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(30 * 60)))
+SESSION_DB = os.getenv("SESSION_DB", "")
+
+_SPACES_RE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION_RE = re.compile(r"[\s?!.,;:]+$")
+
+
+class SessionStore:
+    def __init__(self, maxsize=SESSION_MAX_USERS, ttl=SESSION_TTL, db_path=SESSION_DB, run_blocking=None):
+        self.ttl = ttl
+        self.run_blocking = run_blocking
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (user_id TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _lookup(self, user_id):
+        session = self._memory.get(user_id)
+        source = "memory"
+        if session is None and self._conn is not None:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value FROM sessions WHERE user_id = ? AND expires_at > ?", (user_id, time.time())
+                ).fetchone()
+            if row:
+                session = json.loads(row[0])
+                source = "disk"
+                self._memory.set(user_id, session)
+        return session, source
+
+    def get(self, user_id):
+        """The user's session ({"intent", "filter", "expense_id"}), or None when it has expired."""
+        session, source = self._lookup(user_id)
+        with self._lock:
+            if session is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if source == "disk":
+                self.disk_hits += 1
+        return dict(session)
+
+    def update(self, user_id, **fields):
+        """Merge fields into the user's session, starting one if needed, and restart its TTL."""
+        session = dict(self._lookup(user_id)[0] or {}, **fields)
+        self._memory.set(user_id, session)
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sessions (user_id, value, expires_at) VALUES (?, ?, ?)",
+                    (user_id, json.dumps(session), time.time() + self.ttl),
+                )
+        return session
+
+    # Run one of the methods above from the event loop: inline while everything is in
+    # memory, through run_blocking (the default executor when unset) once SQLite is involved
+    async def _blocking(self, func, *args):
+        if self._conn is None:
+            return func(*args)
+        if self.run_blocking is not None:
+            return await self.run_blocking(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def get_async(self, user_id):
+        return await self._blocking(self.get, user_id)
+
+    def forget(self, user_id):
+        self._memory.pop(user_id)
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    def prune(self):
+        """Delete expired sessions from the on-disk table."""
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "sessions": len(self._memory),
+                "evictions": self._memory.evictions,
+                "expirations": self._memory.expirations,
+                "persistent": self._conn is not None,
+            }
+
+
+# Shared by both apps' message handling in the process
+sessions = SessionStore()
+
+
+# What a follow-up refers to. "that", "it" and a bare "undo" need a session that
+# remembers the expense; "the last expense" falls back to the user's latest row.
+_THAT = r"(?:that|it|this|(?:the\s+|my\s+)?(?P<last>last)\s+(?:one|expense|entry|transaction))"
+_LEAD = r"^(?:(?:no|sorry|oops|actually|wait)[,!.]?\s+)*(?:please\s+)?"
+_CATEGORY = r"[a-z][a-z &/-]*"
+
+DELETE_RE = re.compile(rf"{_LEAD}(?:delete|remove|undo|cancel|scrap|erase)(?:\s+{_THAT})?(?:\s+please)?$", re.IGNORECASE)
+# "change the category to travel", "set the date of the last expense to 2 oct"
+FIELD_EDIT_RE = re.compile(
+    rf"{_LEAD}(?:change|set|update|correct|fix|make)\s+(?:the\s+|its\s+)?"
+    rf"(?P<field>amount|price|category|date|day|description|note)\s+(?:of\s+{_THAT}\s+)?(?:to|as|into)\s+(?P<value>.+)$",
+    re.IGNORECASE,
+)
+# "make that 300", "it was yesterday", "actually ₹300": the new value says which field it is.
+# (pattern, fields the value may be)
+EDIT_RES = [
+    (re.compile(rf"{_LEAD}(?:make|change|correct|update)\s+{_THAT}\s+(?:to\s+|into\s+)?(?P<value>.+)$", re.IGNORECASE),
+     ("amount", "date", "category")),
+    (re.compile(rf"{_LEAD}{_THAT}\s+was\s+(?:actually\s+)?for\s+(?P<value>{_CATEGORY})$", re.IGNORECASE),
+     ("category",)),
+    (re.compile(rf"{_LEAD}{_THAT}\s+(?:should\s+(?:be|have\s+been)|was(?:\s+actually)?)\s+(?:on\s+)?(?P<value>.+)$",
+                re.IGNORECASE),
+     ("amount", "date")),
+    (re.compile(r"^(?:no|actually|sorry|oops)[,!.]?\s+(?P<value>.+)$", re.IGNORECASE),
+     ("amount",)),
+]
+_FIELDS = {"amount": "amount", "price": "amount", "category": "category", "date": "date", "day": "date",
+           "description": "description", "note": "description"}
+
+# "and last month?", "what about travel", "same for this week"
+REFINE_RE = re.compile(
+    r"^(?:and|same\s+for|(?:and\s+)?(?:what|how)\s+about)\s+(?:for\s+|on\s+|in\s+)?(?P<value>.+)$",
+    re.IGNORECASE,
+)
+REFINE_MAX_WORDS = 4
+
+# An amount on its own: "300", "₹1,200", "12.50 usd"
+_AMOUNT_RE = re.compile(r"(?:[₹$€£¥]|rs\.?)?\s*\d[\d,]*(?:\.\d+)?(?:\s*(?P<word>[a-z]+)\.?)?", re.IGNORECASE)
+
+
+def _is_amount(text):
+    match = _AMOUNT_RE.fullmatch(text)
+    return bool(match) and (not match.group("word") or detect_currency(text) is not None)
+
+
+# "yesterday", "2 oct", "2025-10-02" -> ISO date, or None
+def _day(text, today):
+    day = parse_date(resolve_relative_date(text, today), today)
+    return day.isoformat() if day else None
+
+
+# {field: new value} for the first of `fields` that `value` reads as, or None
+def _edit_changes(value, fields, today):
+    value = value.strip()
+    if "amount" in fields and _is_amount(value):
+        return {"amount": value}
+    if "date" in fields:
+        day = _day(value, today)
+        if day:
+            return {"date": day}
+    if "category" in fields and re.fullmatch(_CATEGORY, value, re.IGNORECASE) and len(value.split()) <= 2:
+        return {"category": category_key(value)}
+    if "description" in fields and value:
+        return {"description": value}
+    return None
+
+
+# The expense a follow-up is about: the one in the session, or None to mean the user's
+# latest. "that" only refers to an expense the previous message added or edited;
+# "the last expense" works without a session. False when there is nothing to refer to.
+def _target(match, session):
+    session = session or {}
+    if match.groupdict().get("last"):
+        return session.get("expense_id")
+    if session.get("intent") in ("add", "edit") and session.get("expense_id") is not None:
+        return session["expense_id"]
+    return False
+
+
+def _edit(match, changes, session):
+    target = _target(match, session)
+    if target is False or not changes:
+        return None
+    return "edit", {"id": target, "changes": changes}
+
+
+def _refine(value, session, today):
+    if not session or len(value.split()) > REFINE_MAX_WORDS:
+        return None
+    period = resolve_period(value, today=today)
+    if session.get("intent") == "analytics":
+        return ("analytics", dict(session["filter"], period=period, label=value)) if period else None
+    if session.get("intent") != "query" or not session.get("filter"):
+        return None
+    phrase, topic = split_period_phrase(session["filter"], today)
+    if not period and re.search(r"\d", value) and not split_period_phrase(value, today)[0]:
+        return None  # "and 200 on coffee" is a new expense, not a refinement
+    if period:
+        term = f"{topic} {value}"
+    elif split_period_phrase(value, today)[0] or not phrase:
+        term = value
+    else:
+        term = f"{value} {phrase}"
+    return "query", term.strip().lower()
+
+
+# Resolve a follow-up against the user's session (None if they have none):
+# ("query", term), ("analytics", query), ("edit", {"id", "changes"}) or
+# ("delete", {"id"}), where an id of None means the user's latest expense.
+# None when the message is not a follow-up this session can answer.
+def parse_follow_up(message, session, today=None):
+    today = today or date.today()
+    text = _TRAILING_PUNCTUATION_RE.sub("", _SPACES_RE.sub(" ", (message or "").strip()))
+    if not text or len(text) > 80:
+        return None
+
+    match = DELETE_RE.match(text)
+    if match:
+        target = _target(match, session)
+        return None if target is False else ("delete", {"id": target})
+
+    match = FIELD_EDIT_RE.match(text)
+    if match:
+        field = _FIELDS[match.group("field").lower()]
+        return _edit(match, _edit_changes(match.group("value"), (field,), today), session)
+
+    for pattern, fields in EDIT_RES:
+        match = pattern.match(text)
+        if match:
+            return _edit(match, _edit_changes(match.group("value"), fields, today), session)
+
+    match = REFINE_RE.match(text)
+    if match:
+        return _refine(match.group("value").lower(), session, today)
+    return None
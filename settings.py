@@ -0,0 +1,27 @@
+"""
+Loads a .env file into the environment, once per process, before the modules
+that read their settings at import time.
+
+Only the file named by DOTENV_FILE (default .env in the working directory) is
+read, and python-dotenv is only imported when that file exists, so a worker
+whose environment is set by its process manager pays nothing for it. Set
+DOTENV_FILE to an empty string to skip it altogether.
+"""
+import os
+
+DOTENV_FILE = os.getenv("DOTENV_FILE", ".env")
+
+_loaded = False
+
+
+def load_environment():
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    if DOTENV_FILE and os.path.isfile(DOTENV_FILE):
+        from dotenv import load_dotenv
+        load_dotenv(DOTENV_FILE)
+
+
+load_environment()
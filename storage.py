@@ -0,0 +1,885 @@
+import csv
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+from contextlib import contextmanager
+
+from dateindex import DateIndex
+from groupcommit import GroupCommitWriter, is_blank
+from dates import normalize_date, split_period
+from money import LEDGER_CURRENCY, decimal_text, from_minor, ledger_text, minor_digits, parse_money, to_ledger, to_minor
+
+EXPENSE_FIELDS = ["user_id", "amount", "category", "description", "date"]
+
+# Storage backend: "csv" (default, full scans) or "sqlite" (indexed)
+EXPENSE_STORE = os.getenv("EXPENSE_STORE", "csv")
+CSV_FILE = os.getenv("CSV_FILE", "expenses.csv")
+EXPENSE_DB = os.getenv("EXPENSE_DB", "expenses.db")
+# Split the ledger into this many files by user (1 keeps the single file). Changing it
+# later does not move existing rows: re-import them into the new layout.
+EXPENSE_SHARDS = int(os.getenv("EXPENSE_SHARDS", "1"))
+
+logger = logging.getLogger(__name__)
+
+
+# (minor units as entered, currency) for a new expense. Raises money.ConversionError
+# before anything is written if the currency has no rate.
+def entered_money(amount, currency=None):
+    minor, currency = parse_money(amount, currency)
+    to_ledger(minor, currency)
+    return minor, currency
+
+
+# The row for `minor` units of `currency` as entered. Both stores keep the amount as
+# entered and convert it into LEDGER_CURRENCY here, on read, with the current rates.
+def money_row(row_id, user_id, minor, currency, category, description, date):
+    return {
+        "id": row_id,
+        "user_id": user_id,
+        "amount": minor / 10 ** minor_digits(currency),
+        "currency": currency,
+        "amount_minor": to_ledger(minor, currency),
+        "category": category,
+        "description": description,
+        "date": date,
+    }
+
+
+# `amount` is a number or text such as "12.50 USD" or the legacy "10rs"; see money.parse_money()
+def make_row(row_id, user_id, amount, category, description, date, currency=None):
+    minor, currency = parse_money(amount, currency)
+    return money_row(row_id, user_id, minor, currency, category or "", description or "", normalize_date(date))
+
+
+# `row` with the given fields changed, as update() stores it. A new amount without a
+# currency of its own stays in the row's currency; a new currency alone re-reads the
+# row's amount in it. The changed amount is an exact Decimal for the stores to write
+# through to_minor(). Raises money.ConversionError like add().
+def edited_row(row, amount=None, category=None, description=None, date=None, currency=None):
+    row = dict(row)
+    if amount is not None or currency is not None:
+        if amount is None:
+            amount = decimal_text(to_minor(row["amount"], row["currency"]), row["currency"])
+        minor, row["currency"] = entered_money(amount, currency or row["currency"])
+        row["amount"], row["amount_minor"] = from_minor(minor, row["currency"]), to_ledger(minor, row["currency"])
+    if category is not None:
+        row["category"] = category.strip()
+    if description is not None:
+        row["description"] = description.strip()
+    if date is not None:
+        row["date"] = normalize_date(date)
+    return row
+
+
+class ExpenseStore:
+    """
+    Interface every storage backend implements. Rows are returned as dicts with
+    the keys id, user_id, amount, currency, amount_minor, category, description
+    and date. amount is what was entered, in currency; amount_minor is the same
+    in LEDGER_CURRENCY minor units and is what totals add up.
+
+    Derived structures (aggregates, indexes) subscribe() to be told about every
+    row added, edited or deleted, so they can be kept up to date without
+    rescanning the ledger. Changes they are not told about (another process
+    writing to the same ledger) show up in outside_changes().
+    """
+
+    def __init__(self):
+        self._listeners = []
+        self._change_listeners = []
+        self._writes = 0  # writes on their way to the listeners
+        self._writes_lock = threading.Lock()
+
+    def subscribe(self, listener, on_change=None):
+        """
+        Call listener(row) after every add, with the row as stored, and
+        on_change(old, new) after every update; new is None after a delete.
+        """
+        self._listeners.append(listener)
+        if on_change is not None:
+            self._change_listeners.append(on_change)
+
+    def _notify(self, row):
+        for listener in self._listeners:
+            listener(row)
+
+    def _notify_change(self, old, new):
+        for listener in self._change_listeners:
+            listener(old, new)
+
+    # Wraps a write from before it is committed until its listeners have run
+    @contextmanager
+    def _writing(self):
+        with self._writes_lock:
+            self._writes += 1
+        try:
+            yield
+        finally:
+            with self._writes_lock:
+                self._writes -= 1
+
+    def add(self, user_id, amount, category, description, date, currency=None):
+        """Append an expense and return its row id. The currency defaults to one named in amount, else LEDGER_CURRENCY."""
+        raise NotImplementedError
+
+    def update(self, user_id, row_id, amount=None, category=None, description=None, date=None, currency=None):
+        """
+        Change the given fields of one of the user's rows (see edited_row()) and
+        return the row as stored now, or None if the user has no such row.
+        """
+        raise NotImplementedError
+
+    def delete(self, user_id, row_id):
+        """Remove one of the user's rows and return it, or None if the user has no such row."""
+        raise NotImplementedError
+
+    def get(self, user_id, row_id):
+        """One of the user's rows by id, or None."""
+        for row in self.iter_user_rows(user_id):
+            if row["id"] == row_id:
+                return row
+        return None
+
+    def get_many(self, user_id, row_ids):
+        """The user's rows with the given ids, in insertion order."""
+        row_ids = set(row_ids)
+        return [row for row in self.iter_user_rows(user_id) if row["id"] in row_ids]
+
+    def last_row(self, user_id):
+        """The user's most recently added row that still exists, or None."""
+        row = None
+        for row in self.iter_user_rows(user_id):
+            pass
+        return row
+
+    def count(self):
+        """Number of rows in the ledger."""
+        raise NotImplementedError
+
+    def generation(self):
+        """
+        Token that changes whenever the ledger's content does, whoever changes it.
+        Saved with a derived structure, it tells on load whether that is current.
+        """
+        raise NotImplementedError
+
+    def outside_changes(self):
+        """
+        How many times the ledger has been found changed other than by this
+        store's own writes: by another process, or by add_many(). Listeners never
+        hear of those changes, so a derived structure rebuilds when this moves.
+        """
+        raise NotImplementedError
+
+    def settled_generation(self):
+        """generation(), or None while one of this store's writes has not reached its listeners yet."""
+        generation = self.generation()
+        with self._writes_lock:
+            return None if self._writes else generation
+
+    def search(self, user_id, search_term):
+        """Rows of one user whose category, description or date contain the term."""
+        raise NotImplementedError
+
+    def date_range(self, user_id, start, end):
+        """Rows of one user dated start..end (inclusive YYYY-MM-DD), oldest first."""
+        raise NotImplementedError
+
+    def iter_rows(self):
+        """Every row of every user, in insertion order."""
+        raise NotImplementedError
+
+    def iter_date_range(self, start, end):
+        """Stream every user's rows dated start..end (inclusive), for batch jobs such as the digests."""
+        for row in self.iter_rows():
+            if start <= row["date"] <= end:
+                yield row
+
+    def iter_user_rows(self, user_id, start=None, end=None, category=None):
+        """
+        Stream one user's rows in insertion order, optionally only those dated
+        start..end (inclusive) and in one category (case-insensitive).
+        """
+        for row in self.iter_rows():
+            if (row["user_id"] == user_id
+                    and (start is None or row["date"] >= start)
+                    and (end is None or row["date"] <= end)
+                    and (category is None or row["category"].lower() == category.lower())):
+                yield row
+
+    def close(self):
+        pass
+
+
+class CsvExpenseStore(ExpenseStore):
+    """
+    The original expenses.csv ledger. Every search scans the whole file; date
+    ranges go through an in-memory DateIndex built on first use. Appends go
+    through a GroupCommitWriter, so each add returns once its row is fsynced
+    and several processes can share the file. Amounts in another currency than
+    LEDGER_CURRENCY are written with their code ("12.50 USD").
+
+    Row ids are line numbers. An edit writes a new file and renames it over the
+    ledger, so reads need no lock; a delete blanks the row out, so the ids after
+    it do not move, and blank rows are skipped when reading.
+    """
+
+    def __init__(self, path=CSV_FILE):
+        super().__init__()
+        self.path = path
+        self._date_index = None
+        self._index_outside = None  # the writer's outside_changes when the date index was built
+        # Creates the file with headers if needed and repairs a torn last row
+        self._writer = GroupCommitWriter(path, header=EXPENSE_FIELDS, on_commit=self._committed,
+                                         on_replace=self._replaced)
+
+    # Runs under the writer's commit_lock after every batch
+    def _committed(self, first_id, rows, size_before, size_after):
+        if self._date_index is None:
+            return
+        if self._writer.outside_changes != self._index_outside:
+            # Someone else wrote since the index was built
+            self._date_index = None
+            return
+        for offset, values in enumerate(rows):
+            self._date_index.add(make_row(first_id + offset, *values))
+
+    # Runs under the writer's commit_lock after every replace
+    def _replaced(self, row_id, old, new, size_before, size_after):
+        if self._date_index is None:
+            return
+        if self._writer.outside_changes != self._index_outside:
+            self._date_index = None
+            return
+        self._date_index.remove(make_row(row_id, *old))
+        if not is_blank(new):
+            self._date_index.add(make_row(row_id, *new))
+
+    def count(self):
+        return self._writer.count()
+
+    # The file's inode, size and mtime
+    def generation(self):
+        return self._writer.generation()
+
+    def outside_changes(self):
+        self._writer.generation()  # looks at the file
+        return self._writer.outside_changes
+
+    # Rewrite one of the user's rows as change(row) returns it (None blanks it out).
+    # Returns (old row, new row or None), or None if the user has no such row.
+    def _replace(self, user_id, row_id, change):
+        rows = {}
+
+        def edit(values):
+            old = make_row(row_id, *values)
+            if is_blank(values) or old["user_id"] != user_id:
+                return None
+            new = change(old)
+            if new is None:
+                rows["changed"] = old, None
+                return []
+            values = [user_id, ledger_text(to_minor(new["amount"], new["currency"]), new["currency"]),
+                      new["category"], new["description"], new["date"]]
+            rows["changed"] = old, make_row(row_id, *values)
+            return values
+
+        with self._writing():
+            if self._writer.replace(row_id, edit) is None:
+                return None
+            self._notify_change(*rows["changed"])
+        return rows["changed"]
+
+    # Reads the whole file but parses only the row asked for
+    def get(self, user_id, row_id):
+        values = self._writer.row(row_id)
+        if values is None or is_blank(values) or values[0] != user_id:
+            return None
+        return make_row(row_id, *values)
+
+    # Scans the file without building a row for every line, only for the last match
+    def last_row(self, user_id):
+        last = None
+        with open(self.path, mode="r", newline="") as file:
+            reader = csv.reader(file)
+            next(reader, None)
+            row_id = 0
+            for values in reader:
+                if not values:
+                    continue
+                row_id += 1
+                if values[0] == user_id:
+                    last = row_id, values
+        return make_row(last[0], *last[1]) if last else None
+
+    def update(self, user_id, row_id, amount=None, category=None, description=None, date=None, currency=None):
+        changed = self._replace(user_id, row_id, lambda row: edited_row(row, amount, category, description, date,
+                                                                        currency))
+        return changed[1] if changed else None
+
+    def delete(self, user_id, row_id):
+        changed = self._replace(user_id, row_id, lambda row: None)
+        return changed[0] if changed else None
+
+    def add(self, user_id, amount, category, description, date, currency=None):
+        date = normalize_date(date)
+        minor, currency = parse_money(amount, currency)
+        to_ledger(minor, currency)  # raises ConversionError before anything is written
+        amount = ledger_text(minor, currency)
+        with self._writing():
+            row_id = self._writer.append([user_id, amount, category, description, date])
+            self._notify(make_row(row_id, user_id, amount, category, description, date))
+        return row_id
+
+    def date_range(self, user_id, start, end):
+        self._writer.generation()  # counts a change made elsewhere, even one that kept the size
+        with self._writer.commit_lock:
+            outside = self._writer.outside_changes
+            if self._date_index is None or outside != self._index_outside:
+                self._date_index = DateIndex(self.iter_rows())
+                self._index_outside = outside
+            return list(self._date_index.range(user_id, start, end))
+
+    def iter_rows(self):
+        with open(self.path, mode="r", newline="") as file:
+            for row_id, row in enumerate(csv.DictReader(file), start=1):
+                if is_blank(row.values()):
+                    continue
+                yield make_row(row_id, row["user_id"], row["amount"], row["category"], row["description"], row["date"])
+
+    def search(self, user_id, search_term):
+        matches = []
+        for row in self.iter_rows():
+            if row["user_id"] != user_id:
+                continue
+            if (search_term in row["category"].strip().lower()
+                    or search_term in row["description"].strip().lower()
+                    or search_term in row["date"].strip().lower()):
+                matches.append(row)
+        return matches
+
+    def close(self):
+        self._writer.close()
+
+
+class SqliteExpenseStore(ExpenseStore):
+    """
+    SQLite ledger in WAL mode. Lookups go through the (user_id, date) and
+    (user_id, category) indexes so a query only touches one user's rows, and
+    descriptions are searched through an FTS5 trigram index. The date index
+    serves batch jobs that read one period for every user.
+
+    amount_minor is the amount as entered, in minor units of its currency; like
+    the CSV ledger, rows are converted into LEDGER_CURRENCY when they are read.
+
+    Triggers count every row written in store_meta's "generation", from any
+    connection, so the count is the store's generation().
+    """
+
+    TABLE = """
+        CREATE TABLE IF NOT EXISTS expenses (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            amount_minor INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            category TEXT NOT NULL DEFAULT '',
+            description TEXT NOT NULL DEFAULT '',
+            date TEXT NOT NULL DEFAULT ''
+        );
+    """
+    SCHEMA = TABLE + """
+        CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date);
+        CREATE INDEX IF NOT EXISTS idx_expenses_user_category ON expenses (user_id, category COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date);
+        CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5 (
+            description, content='expenses', content_rowid='id', tokenize='trigram'
+        );
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses BEGIN
+            INSERT INTO expenses_fts (rowid, description) VALUES (new.id, new.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, description) VALUES ('delete', old.id, old.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, description) VALUES ('delete', old.id, old.description);
+            INSERT INTO expenses_fts (rowid, description) VALUES (new.id, new.description);
+        END;
+        CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT);
+        INSERT OR IGNORE INTO store_meta (key, value) VALUES ('generation', 0);
+        CREATE TRIGGER IF NOT EXISTS expenses_generation_insert AFTER INSERT ON expenses BEGIN
+            UPDATE store_meta SET value = value + 1 WHERE key = 'generation';
+        END;
+        CREATE TRIGGER IF NOT EXISTS expenses_generation_delete AFTER DELETE ON expenses BEGIN
+            UPDATE store_meta SET value = value + 1 WHERE key = 'generation';
+        END;
+        CREATE TRIGGER IF NOT EXISTS expenses_generation_update AFTER UPDATE ON expenses BEGIN
+            UPDATE store_meta SET value = value + 1 WHERE key = 'generation';
+        END;
+    """
+
+    # In money_row() argument order
+    COLUMNS = "id, user_id, amount_minor, currency, category, description, date"
+
+    def __init__(self, path=EXPENSE_DB):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._store_entered_amounts()
+        self._normalize_dates()
+        self._seen_generation = None  # the generation counter as this store last wrote or saw it
+        self._outside_changes = 0
+        self.generation()
+
+    # One-time upgrade of a ledger that kept a REAL amount (in LEDGER_CURRENCY before
+    # currencies, then with its currency and a converted total): the table is rebuilt
+    # with the amount as entered in integer minor units, keeping every row id
+    def _store_entered_amounts(self):
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(expenses)")}
+        if "amount" not in columns:
+            return
+        currency = "currency" if "currency" in columns else "''"
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            rows = self._conn.execute(
+                f"SELECT id, user_id, amount, {currency}, category, description, date FROM expenses"
+            ).fetchall()
+            # Dropping the table drops its indexes and triggers; they are made again below
+            self._conn.execute("DROP TABLE expenses")
+            self._conn.execute(self.TABLE)
+            self._conn.executemany(
+                f"INSERT INTO expenses ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((row_id, user_id, to_minor(amount, currency or LEDGER_CURRENCY), currency or LEDGER_CURRENCY,
+                  category, description, date)
+                 for row_id, user_id, amount, currency, category, description, date in rows),
+            )
+        self._conn.executescript(self.SCHEMA)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+        logger.info("Stored the %d amounts of %s as entered, in minor units", len(rows), self.path)
+
+    # One-time rewrite of dates stored before they were normalized on write (e.g. "2025-02-9")
+    def _normalize_dates(self):
+        if self.get_meta("dates_normalized"):
+            return
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT id, date FROM expenses WHERE date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+            ).fetchall()
+            updates = [(normalize_date(date), row_id) for row_id, date in rows if normalize_date(date) != date]
+            self._conn.executemany("UPDATE expenses SET date = ? WHERE id = ?", updates)
+            self._conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES ('dates_normalized', '1')")
+
+    # Caller holds _lock
+    def _generation_locked(self):
+        return self._conn.execute(
+            "SELECT CAST(value AS INTEGER) FROM store_meta WHERE key = 'generation'").fetchone()[0]
+
+    # Count a change made since this store last wrote or looked, other than the `written`
+    # rows it has just written itself. Caller holds _lock.
+    def _look_locked(self, written=0):
+        generation = self._generation_locked()
+        if self._seen_generation is not None and generation - written != self._seen_generation:
+            self._outside_changes += 1
+        self._seen_generation = generation
+        return generation
+
+    def generation(self):
+        with self._lock:
+            return str(self._look_locked())
+
+    def outside_changes(self):
+        with self._lock:
+            self._look_locked()
+            return self._outside_changes
+
+    INSERT = ("INSERT INTO expenses (user_id, amount_minor, currency, category, description, date) "
+              "VALUES (?, ?, ?, ?, ?, ?)")
+
+    def add(self, user_id, amount, category, description, date, currency=None):
+        category, description, date = (category or "").strip(), (description or "").strip(), normalize_date(date)
+        minor, currency = entered_money(amount, currency)
+        with self._writing():
+            with self._lock, self._conn:
+                cursor = self._conn.execute(self.INSERT, (user_id, minor, currency, category, description, date))
+                row_id = cursor.lastrowid
+                self._look_locked(written=1)
+            self._notify(money_row(row_id, user_id, minor, currency, category, description, date))
+        return row_id
+
+    def add_many(self, rows):
+        """
+        Bulk insert (user_id, amount, category, description, date[, currency])
+        tuples in one transaction. Listeners are not notified; they rebuild from
+        the ledger.
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                self.INSERT,
+                ((user_id, *entered_money(amount, currency[0] if currency else None), (category or "").strip(),
+                  (description or "").strip(), normalize_date(date))
+                 for user_id, amount, category, description, date, *currency in rows),
+            )
+
+    def _get(self, user_id, row_id):
+        row = self._conn.execute(f"SELECT {self.COLUMNS} FROM expenses WHERE id = ? AND user_id = ?",
+                                 (row_id, user_id)).fetchone()
+        return money_row(*row) if row else None
+
+    def get(self, user_id, row_id):
+        with self._lock:
+            return self._get(user_id, row_id)
+
+    def get_many(self, user_id, row_ids):
+        row_ids = sorted(row_ids)
+        rows = []
+        with self._lock:
+            # In chunks that stay under SQLite's limit on bound parameters
+            for start in range(0, len(row_ids), 500):
+                chunk = row_ids[start:start + 500]
+                rows.extend(money_row(*row) for row in self._conn.execute(
+                    f"SELECT {self.COLUMNS} FROM expenses WHERE user_id = ? AND id IN ({', '.join('?' * len(chunk))}) "
+                    "ORDER BY id", (user_id, *chunk)))
+        return rows
+
+    def last_row(self, user_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {self.COLUMNS} FROM expenses WHERE user_id = ? ORDER BY id DESC LIMIT 1",
+                                     (user_id,)).fetchone()
+            return money_row(*row) if row else None
+
+    def update(self, user_id, row_id, amount=None, category=None, description=None, date=None, currency=None):
+        with self._writing():
+            with self._lock, self._conn:
+                old = self._get(user_id, row_id)
+                if old is None:
+                    return None
+                new = edited_row(old, amount, category, description, date, currency)
+                minor = to_minor(new["amount"], new["currency"])
+                self._conn.execute(
+                    "UPDATE expenses SET amount_minor = ?, currency = ?, category = ?, description = ?, date = ? "
+                    "WHERE id = ?",
+                    (minor, new["currency"], new["category"], new["description"], new["date"], row_id),
+                )
+                new = money_row(row_id, user_id, minor, new["currency"], new["category"], new["description"],
+                                new["date"])
+                self._look_locked(written=1)
+            self._notify_change(old, new)
+        return new
+
+    def delete(self, user_id, row_id):
+        with self._writing():
+            with self._lock, self._conn:
+                old = self._get(user_id, row_id)
+                if old is None:
+                    return None
+                self._conn.execute("DELETE FROM expenses WHERE id = ?", (row_id,))
+                self._look_locked(written=1)
+            self._notify_change(old, None)
+        return old
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+
+    def iter_rows(self):
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {self.COLUMNS} FROM expenses ORDER BY id").fetchall()
+        for row in rows:
+            yield money_row(*row)
+
+    def date_range(self, user_id, start, end):
+        # Served by idx_expenses_user_date: one seek, then the k matching entries
+        with self._lock:
+            return [money_row(*row) for row in self._conn.execute(
+                f"SELECT {self.COLUMNS} FROM expenses WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY date, id",
+                (user_id, start, end),
+            )]
+
+    def iter_date_range(self, start, end):
+        # Own connection and served by idx_expenses_date, like iter_user_rows below
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(f"SELECT {self.COLUMNS} FROM expenses WHERE date BETWEEN ? AND ?", (start, end))
+            while True:
+                rows = cursor.fetchmany(500)
+                if not rows:
+                    break
+                for row in rows:
+                    yield money_row(*row)
+        finally:
+            conn.close()
+
+    def iter_user_rows(self, user_id, start=None, end=None, category=None):
+        # Own connection, so a long export neither holds the store lock nor loads every row
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            sql = f"SELECT {self.COLUMNS} FROM expenses WHERE user_id = ?"
+            params = [user_id]
+            if start is not None:
+                sql += " AND date >= ?"
+                params.append(start)
+            if end is not None:
+                sql += " AND date <= ?"
+                params.append(end)
+            if category is not None:
+                sql += " AND category = ? COLLATE NOCASE"
+                params.append(category)
+            cursor = conn.execute(sql + " ORDER BY id", params)
+            while True:
+                rows = cursor.fetchmany(500)
+                if not rows:
+                    break
+                for row in rows:
+                    yield money_row(*row)
+        finally:
+            conn.close()
+
+    def search(self, user_id, search_term):
+        params = {"user": user_id, "term": search_term}
+        if len(search_term) >= 3:
+            # Trigram FTS handles substring matches on descriptions
+            description_match = "id IN (SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH :fts)"
+            params["fts"] = '"' + search_term.replace('"', '""') + '"'
+        else:
+            description_match = "instr(lower(description), :term)"
+
+        # user_id = :user keeps the scan on this user's slice of the index
+        sql = f"""
+            SELECT {self.COLUMNS} FROM expenses
+            WHERE user_id = :user
+              AND (instr(lower(category), :term) OR instr(date, :term) OR {description_match})
+            ORDER BY id
+        """
+        with self._lock:
+            return [money_row(*row) for row in self._conn.execute(sql, params)]
+
+    def get_meta(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# expenses.csv -> expenses-0.csv, expenses-1.csv, ...
+def shard_path(path, shard):
+    root, ext = os.path.splitext(path)
+    return f"{root}-{shard}{ext}"
+
+
+class ShardedExpenseStore(ExpenseStore):
+    """
+    Spreads users over several stores of one backend, each with its own file,
+    writer and locks, so busy users on different shards never wait for each other.
+    A user always lands on the same shard (crc32 of the user id).
+
+    Row ids are global: shard-local id * number of shards + shard. They are
+    unique and grow with insertion order within a user, which is all the indexes
+    rely on; iter_rows() goes shard by shard rather than in global order.
+    """
+
+    def __init__(self, shards):
+        super().__init__()
+        self.shards = list(shards)
+        self.path = "+".join(shard.path for shard in self.shards)
+        for number, shard in enumerate(self.shards):
+            shard.subscribe(lambda row, number=number: self._notify(self._global_row(row, number)),
+                            lambda old, new, number=number: self._notify_change(
+                                self._global_row(old, number), new and self._global_row(new, number)))
+
+    def _shard_number(self, user_id):
+        return zlib.crc32(str(user_id).encode("utf-8")) % len(self.shards)
+
+    def _global_row(self, row, number):
+        return dict(row, id=row["id"] * len(self.shards) + number)
+
+    def _rows(self, rows, number):
+        return [self._global_row(row, number) for row in rows]
+
+    # (shard number, shard-local id) of a global row id, or None if it is not on the user's shard
+    def _locate(self, user_id, row_id):
+        number = self._shard_number(user_id)
+        if row_id % len(self.shards) != number:
+            return None
+        return number, row_id // len(self.shards)
+
+    def _global_or_none(self, row, number):
+        return self._global_row(row, number) if row else None
+
+    def update(self, user_id, row_id, amount=None, category=None, description=None, date=None, currency=None):
+        location = self._locate(user_id, row_id)
+        if location is None:
+            return None
+        number, local_id = location
+        return self._global_or_none(
+            self.shards[number].update(user_id, local_id, amount, category, description, date, currency), number)
+
+    def delete(self, user_id, row_id):
+        location = self._locate(user_id, row_id)
+        if location is None:
+            return None
+        number, local_id = location
+        return self._global_or_none(self.shards[number].delete(user_id, local_id), number)
+
+    def get(self, user_id, row_id):
+        location = self._locate(user_id, row_id)
+        if location is None:
+            return None
+        number, local_id = location
+        return self._global_or_none(self.shards[number].get(user_id, local_id), number)
+
+    def get_many(self, user_id, row_ids):
+        number = self._shard_number(user_id)
+        local_ids = [row_id // len(self.shards) for row_id in row_ids if row_id % len(self.shards) == number]
+        return self._rows(self.shards[number].get_many(user_id, local_ids), number)
+
+    def last_row(self, user_id):
+        number = self._shard_number(user_id)
+        return self._global_or_none(self.shards[number].last_row(user_id), number)
+
+    def add(self, user_id, amount, category, description, date, currency=None):
+        number = self._shard_number(user_id)
+        return self.shards[number].add(user_id, amount, category, description, date, currency) * len(self.shards) + number
+
+    # Bulk insert for the SQLite migration, routed shard by shard
+    def add_many(self, rows):
+        by_shard = [[] for _ in self.shards]
+        for row in rows:
+            by_shard[self._shard_number(row[0])].append(row)
+        for shard, shard_rows in zip(self.shards, by_shard):
+            if shard_rows:
+                shard.add_many(shard_rows)
+
+    def count(self):
+        return sum(shard.count() for shard in self.shards)
+
+    def generation(self):
+        return "+".join(shard.generation() for shard in self.shards)
+
+    def outside_changes(self):
+        return sum(shard.outside_changes() for shard in self.shards)
+
+    def settled_generation(self):
+        generations = [shard.settled_generation() for shard in self.shards]
+        return None if None in generations else "+".join(generations)
+
+    def search(self, user_id, search_term):
+        number = self._shard_number(user_id)
+        return self._rows(self.shards[number].search(user_id, search_term), number)
+
+    def date_range(self, user_id, start, end):
+        number = self._shard_number(user_id)
+        return self._rows(self.shards[number].date_range(user_id, start, end), number)
+
+    def iter_rows(self):
+        for number, shard in enumerate(self.shards):
+            for row in shard.iter_rows():
+                yield self._global_row(row, number)
+
+    def iter_date_range(self, start, end):
+        for number, shard in enumerate(self.shards):
+            for row in shard.iter_date_range(start, end):
+                yield self._global_row(row, number)
+
+    def iter_user_rows(self, user_id, start=None, end=None, category=None):
+        number = self._shard_number(user_id)
+        for row in self.shards[number].iter_user_rows(user_id, start=start, end=end, category=category):
+            yield self._global_row(row, number)
+
+    # Store-wide metadata (the migration marker) lives on the first shard
+    def get_meta(self, key):
+        return self.shards[0].get_meta(key)
+
+    def set_meta(self, key, value):
+        self.shards[0].set_meta(key, value)
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+
+# One-shot copy of the legacy CSV ledger into SQLite. Does nothing if it already ran.
+def migrate_csv_to_sqlite(csv_path=CSV_FILE, db_path=EXPENSE_DB, store=None):
+    store = store or SqliteExpenseStore(db_path)
+    if store.get_meta("migrated_from_csv"):
+        return 0
+    if not os.path.exists(csv_path):
+        store.set_meta("migrated_from_csv", csv_path)
+        return 0
+
+    csv_store = CsvExpenseStore(csv_path)
+    rows = [
+        (row["user_id"], row["amount"], row["category"], row["description"], row["date"], row["currency"])
+        for row in csv_store.iter_rows()
+    ]
+    csv_store.close()
+    store.add_many(rows)
+    store.set_meta("migrated_from_csv", csv_path)
+    logger.info("Migrated %d expenses from %s to %s", len(rows), csv_path, store.path)
+    return len(rows)
+
+
+# Rows answering a query term. A trailing period ("food last month", "this week")
+# is served by date_range() and the rest of the term filters the rows in it.
+# With a searchindex.SearchIndex the topic is resolved through the index instead
+# of a substring scan, and the matching rows are read by id.
+def query_expenses(store, user_id, term, today=None, index=None):
+    period, rest = split_period(term, today)
+    ids = index.matches(user_id, rest) if index is not None and rest else None
+    if period is None:
+        return store.get_many(user_id, ids) if ids is not None else store.search(user_id, term)
+    rows = store.date_range(user_id, *period)
+    if ids is not None:
+        rows = [row for row in rows if row["id"] in ids]
+    elif rest:
+        rows = [row for row in rows if rest in row["category"].lower() or rest in row["description"].lower()]
+    return rows
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _open_store(backend, path, shards):
+    if shards > 1:
+        return ShardedExpenseStore(backend(shard_path(path, shard)) for shard in range(shards))
+    return backend(path)
+
+
+# Process-wide store for the backend selected by EXPENSE_STORE, split over EXPENSE_SHARDS files
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            if EXPENSE_STORE == "sqlite":
+                _store = _open_store(SqliteExpenseStore, EXPENSE_DB, EXPENSE_SHARDS)
+                migrate_csv_to_sqlite(CSV_FILE, EXPENSE_DB, store=_store)
+            elif EXPENSE_STORE == "csv":
+                _store = _open_store(CsvExpenseStore, CSV_FILE, EXPENSE_SHARDS)
+            else:
+                raise ValueError(f"Unknown EXPENSE_STORE: {EXPENSE_STORE}")
+        return _store
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if sys.argv[1:] == ["migrate"]:
+        migrate_csv_to_sqlite()
+    else:
+        print("usage: python storage.py migrate")
@@ -0,0 +1,101 @@
+"""
+Tenants: the business numbers one deployment answers for.
+
+Each tenant carries the credentials used to reply from its number. They are
+read once from TENANTS_FILE (a JSON list of objects with the Tenant fields)
+and cached. The "default" tenant always exists and is configured from the
+original environment variables (PHONE_NUMBER_ID, ACCESS_TOKEN, account_sid,
+auth_token), so a single-number deployment needs no file.
+
+Users are stored under Tenant.user_key(), which prefixes the phone number with
+the tenant id, so the same person writing to two tenants has two separate
+ledgers. The default tenant keeps bare phone numbers, as before.
+"""
+import json
+import os
+import threading
+
+import settings  # noqa: F401  (loads .env)
+
+TENANTS_FILE = os.getenv("TENANTS_FILE", "")
+DEFAULT_TENANT_ID = "default"
+TWILIO_SANDBOX_NUMBER = "+14155238886"
+
+
+class Tenant:
+    def __init__(self, id, phone_number_id=None, access_token=None, template_name=None,
+                 twilio_number=None, account_sid=None, auth_token=None):
+        self.id = id
+        self.phone_number_id = phone_number_id
+        self.access_token = access_token
+        self.template_name = template_name or os.getenv("TEMPLATE_NAME", "reengagement_message")
+        self.twilio_number = twilio_number or TWILIO_SANDBOX_NUMBER
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+
+    # Key this tenant's users are stored under
+    def user_key(self, phone):
+        return phone if self.id == DEFAULT_TENANT_ID else f"{self.id}:{phone}"
+
+    def __repr__(self):
+        return f"Tenant({self.id!r})"
+
+
+# (tenant id, phone) of a stored user key; the inverse of Tenant.user_key
+def split_user_key(user_id):
+    tenant_id, separator, phone = user_id.partition(":")
+    return (tenant_id, phone) if separator else (DEFAULT_TENANT_ID, user_id)
+
+
+def default_tenant_from_env():
+    return Tenant(
+        DEFAULT_TENANT_ID,
+        phone_number_id=os.getenv("PHONE_NUMBER_ID"),
+        access_token=os.getenv("ACCESS_TOKEN"),
+        account_sid=os.getenv("account_sid"),
+        auth_token=os.getenv("auth_token"),
+    )
+
+
+def load_tenants(path=TENANTS_FILE):
+    tenants = {DEFAULT_TENANT_ID: default_tenant_from_env()}
+    if path:
+        with open(path) as file:
+            for config in json.load(file):
+                tenant = Tenant(**config)
+                tenants[tenant.id] = tenant
+    return tenants
+
+
+_tenants = None
+_by_phone_number_id = {}
+_by_twilio_number = {}
+_lock = threading.Lock()
+
+
+def get_tenants():
+    global _tenants, _by_phone_number_id, _by_twilio_number
+    with _lock:
+        if _tenants is None:
+            _tenants = load_tenants()
+            _by_phone_number_id = {t.phone_number_id: t for t in _tenants.values() if t.phone_number_id}
+            _by_twilio_number = {t.twilio_number: t for t in _tenants.values() if t.id != DEFAULT_TENANT_ID}
+        return _tenants
+
+
+def get_tenant(tenant_id=None):
+    """Tenant by id (the default tenant for None); KeyError if unknown."""
+    return get_tenants()[tenant_id or DEFAULT_TENANT_ID]
+
+
+# Tenant that owns the number a Meta webhook was delivered for; the default tenant if none does
+def tenant_for_phone_number_id(phone_number_id):
+    tenants = get_tenants()
+    return _by_phone_number_id.get(phone_number_id) or tenants[DEFAULT_TENANT_ID]
+
+
+# Same for a Twilio "To" address such as "whatsapp:+14155238886"
+def tenant_for_twilio_number(address):
+    tenants = get_tenants()
+    number = (address or "").removeprefix("whatsapp:")
+    return _by_twilio_number.get(number) or tenants[DEFAULT_TENANT_ID]
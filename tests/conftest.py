@@ -0,0 +1,95 @@
+"""
+Shared set-up for the test suite.
+
+Every module reads its configuration at import time, so the environment is
+pointed at a scratch directory here, before any test imports the bot: the
+ledger, search index, budgets and digest state live there, the LLM cache is
+off and outbound sends are not rate limited. Groq and the Graph API are
+replaced by the local stubs in benchmarks/stubs.py.
+
+    python -m pytest -q
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+TMP = tempfile.mkdtemp(prefix="expense-bot-tests-")
+TENANTS_FILE = os.path.join(TMP, "tenants.json")
+with open(TENANTS_FILE, "w") as file:
+    json.dump([{"id": "acme", "phone_number_id": "acme-phone", "access_token": "acme-token"}], file)
+
+os.environ.update({
+    "DOTENV_FILE": "",
+    "CSV_FILE": os.path.join(TMP, "expenses.csv"),
+    "EXPENSE_DB": os.path.join(TMP, "expenses.db"),
+    "SEARCH_INDEX_FILE": os.path.join(TMP, "search_index.json"),
+    "BUDGETS_FILE": os.path.join(TMP, "budgets.json"),
+    "DIGEST_STATE_FILE": os.path.join(TMP, "digests.json"),
+    "FX_RATES_FILE": os.path.join(ROOT, "fx_rates.json"),
+    "TENANTS_FILE": TENANTS_FILE,
+    "PHONE_NUMBER_ID": "default-phone",
+    "LLM_CACHE_ENABLED": "0",
+    "OUTBOUND_RATE": "0",
+    "PROFILER_TOKEN": "profile-token",
+    "LOG_LEVEL": "WARNING",
+})
+
+from stubs import GraphStub, GroqStub  # noqa: E402
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as file:
+        return json.load(file)
+
+
+@pytest.fixture(scope="session")
+def groq():
+    import extractor
+
+    with GroqStub() as stub:
+        extractor.GROQ_URL = stub.completions_url
+        yield stub
+
+
+@pytest.fixture(scope="session")
+def _graph_server():
+    import sendMessage
+
+    with GraphStub() as stub:
+        sendMessage.GRAPH_API_URL = stub.url
+        yield stub
+
+
+# The mock Graph API, emptied for each test
+@pytest.fixture
+def graph(_graph_server):
+    _graph_server.reset()
+    return _graph_server
+
+
+# Runs `scenario(client)` against the FastAPI app inside its lifespan and returns its result
+@pytest.fixture
+def meta_app(groq, graph):
+    import httpx
+    import main
+
+    def run(scenario):
+        async def drive():
+            # The lifespan shuts the storage pool down on the way out
+            main.storage_executor = ThreadPoolExecutor(max_workers=main.STORAGE_WORKERS, thread_name_prefix="storage")
+            transport = httpx.ASGITransport(app=main.app)
+            async with main.lifespan(main.app), httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+                return await scenario(client)
+        return asyncio.run(drive())
+
+    return run
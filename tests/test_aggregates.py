@@ -0,0 +1,96 @@
+import pytest
+
+import engine
+import storage
+from aggregates import SpendingAggregates, check_consistency, get_aggregates, spending_total
+from ledger import get_ledger
+from searchindex import get_search_index
+from storage import CsvExpenseStore, get_store
+
+USER = "9400000001"
+
+
+@pytest.fixture(scope="module")
+def ledger():
+    get_aggregates(), get_search_index()  # subscribed before the rows go in
+    store = get_store()
+    store.add(USER, 100, "food", "lunch", "2025-03-03")
+    store.add(USER, 40, "food", "tea", "2025-03-04")
+    store.add(USER, 50, "groceries", "food shop", "2025-03-04")
+    store.add(USER, 70, "travel", "cab", "2025-04-01")
+    return store
+
+
+def total_line(pages):
+    return pages[0].split("\n")[0]
+
+
+@pytest.mark.parametrize("term", ["food", "travel", "2025-03-04", "2025-03", "cab", "2025-05", "books"])
+def test_total_only_reply_matches_the_itemized_one(ledger, term):
+    assert (engine.fetch_filtered_expenses(USER, term, itemize=False)
+            == [total_line(engine.fetch_filtered_expenses(USER, term))])
+
+
+def test_category_shared_with_a_description_is_searched(ledger):
+    index = get_search_index()
+
+    assert spending_total(USER, "travel", index) == (7000, 1)
+    assert spending_total(USER, "food", index) is None
+    assert engine.fetch_filtered_expenses(USER, "food", itemize=False) == [
+        "You have spent a total of 190 Rs on food."]
+
+
+def test_days_and_months_come_from_the_running_totals(ledger):
+    index = get_search_index()
+
+    assert spending_total(USER, "2025-03-04", index) == (9000, 2)
+    assert spending_total(USER, "2025-03", index) == (19000, 3)
+    assert spending_total(USER, "2025-03 food", index) is None
+
+
+
+def test_running_totals_match_a_recompute_after_edits(tmp_path):
+    store = CsvExpenseStore(str(tmp_path / "expenses.csv"))
+    totals = SpendingAggregates()
+    store.subscribe(totals.record, totals.change)
+    lunch = store.add(USER, 100, "food", "lunch", "2025-03-03")
+    store.add(USER, "12.50 USD", "Books", "novel", "2025-03-04")
+    cab = store.add(USER, 70, "travel", "cab", "2025-04-01")
+    store.update(USER, lunch, amount=120, category="Travel", date="2025-04-02")
+    store.delete(USER, cab)
+
+    assert check_consistency(totals, store.iter_rows()) == []
+    assert totals.category_total(USER, "food") is None
+    assert totals.category_total(USER, "travel") == (12000, 1)
+    store.close()
+
+
+def test_drift_is_reported_per_table(tmp_path):
+    store = CsvExpenseStore(str(tmp_path / "expenses.csv"))
+    store.add(USER, 100, "food", "lunch", "2025-03-03")
+    totals = SpendingAggregates()
+    totals.rebuild(store.iter_rows())
+    totals.by_category[(USER, "food")][0] += 1
+    totals.by_month[(USER, "2025-02")] = [500, 1]
+
+    assert sorted(check_consistency(totals, store.iter_rows())) == [
+        ("by_category", (USER, "food"), (10001, 1), (10000, 1)),
+        ("by_month", (USER, "2025-02"), (500, 1), None),
+    ]
+    store.close()
+
+
+def test_rows_written_by_another_process_trigger_a_rebuild(ledger, monkeypatch):
+    # The search index and columnar ledger are caught up too, for the tests after this one
+    for setting in ("aggregates.AGGREGATES_CHECK_INTERVAL", "searchindex.SEARCH_INDEX_CHECK_INTERVAL",
+                    "ledger.LEDGER_CHECK_INTERVAL"):
+        monkeypatch.setattr(setting, 0)
+    before = get_aggregates().category_total(USER, "books")
+    other = CsvExpenseStore(storage.CSV_FILE)
+    other.add(USER, 30, "books", "atlas", "2025-04-05")
+    other.close()
+
+    assert before is None
+    assert get_aggregates().category_total(USER, "books") == (3000, 1)
+    assert check_consistency(get_aggregates(), get_store().iter_rows()) == []
+    assert len(get_search_index()) == len(get_ledger()) == get_store().count()
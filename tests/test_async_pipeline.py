@@ -0,0 +1,57 @@
+import asyncio
+import threading
+
+from dedup import MessageDeduplicator
+from llmcache import LLMCache
+from sessions import SessionStore
+
+
+# Thread idents that ran each SQL statement on the object's connection
+def trace_threads(owner):
+    threads = []
+    owner._conn.set_trace_callback(lambda statement: threads.append(threading.get_ident()))
+    return threads
+
+
+def test_sqlite_backed_lookups_stay_off_the_event_loop(tmp_path):
+    deduplicator = MessageDeduplicator(db_path=str(tmp_path / "dedup.db"))
+    cache = LLMCache(db_path=str(tmp_path / "cache.db"), enabled=True)
+    SessionStore(db_path=str(tmp_path / "sessions.db")).update("u1", intent="add", expense_id=4)
+    sessions = SessionStore(db_path=str(tmp_path / "sessions.db"))
+    threads = [trace_threads(owner) for owner in (deduplicator, cache, sessions)]
+
+    async def handle():
+        async def compute():
+            return {"intent": "query"}
+
+        return (await deduplicator.first_delivery_async("wamid.1"),
+                await deduplicator.first_delivery_async("wamid.1"),
+                await cache.get_or_compute_async("extract", "model", "How much on food?", compute),
+                await cache.get_or_compute_async("extract", "model", "how much on food", compute),
+                await sessions.get_async("u1"),
+                threading.get_ident())
+
+    first, again, computed, cached, session, loop_thread = asyncio.run(handle())
+
+    assert (first, again) == (True, False)
+    assert computed == cached == {"intent": "query"}
+    assert session == {"intent": "add", "expense_id": 4}
+    assert all(threads)
+    assert loop_thread not in {thread for statements in threads for thread in statements}
+
+
+def test_in_memory_lookups_answer_inline():
+    calls = []
+
+    async def run_blocking(func, *args):
+        calls.append(func.__name__)
+        return func(*args)
+
+    deduplicator = MessageDeduplicator(db_path="", run_blocking=run_blocking)
+    sessions = SessionStore(db_path="", run_blocking=run_blocking)
+
+    async def handle():
+        return await deduplicator.first_delivery_async("wamid.2"), await sessions.get_async("u2")
+
+    assert asyncio.run(handle()) == (True, None)
+    assert calls == []
@@ -0,0 +1,101 @@
+import copy
+
+import main
+from conftest import load_fixture
+from stubs import meta_payload
+
+
+def text_messages(payload):
+    expected = {}
+    for _, message in main.iter_messages(payload):
+        if message.get("type") == "text":
+            expected.setdefault(message["from"], []).append(message["text"]["body"])
+    return expected
+
+
+# Wrap the queue's handler to log when each message starts and ends
+def recording(log):
+    original = main.process_message
+
+    async def handler(tenant_id, user_phone, message_text):
+        log.append(("start", user_phone, message_text))
+        try:
+            return await original(tenant_id, user_phone, message_text)
+        finally:
+            log.append(("end", user_phone, message_text))
+
+    return handler
+
+
+def deliver(meta_app, *payloads):
+    log = []
+
+    async def scenario(client):
+        main.work_queue.handler = recording(log)
+        try:
+            responses = []
+            for payload in payloads:
+                responses.append((await client.post("/webhook", json=payload)).json())
+                await main.work_queue.join()
+            return responses
+        finally:
+            main.work_queue.handler = main.process_message
+
+    return meta_app(scenario), log
+
+
+def test_every_message_of_every_entry_is_processed(meta_app, graph):
+    payload = load_fixture("meta_batch.json")
+    expected = text_messages(payload)
+
+    (result,), log = deliver(meta_app, payload)
+
+    assert result == {"status": "queued", "queued": 5, "duplicates": 0, "ignored": 1}
+    started = {}
+    for event, user, text in log:
+        if event == "start":
+            started.setdefault(user, []).append(text)
+    assert started == expected
+    assert {sent["to"] for sent in graph.sent} == set(expected)
+
+
+def test_one_users_messages_run_in_order_and_never_overlap(meta_app):
+    payload = load_fixture("meta_batch.json")
+    for entry in payload["entry"]:
+        for change in entry["changes"]:
+            for message in change["value"].get("messages", []):
+                message["id"] += ".order"
+
+    _, log = deliver(meta_app, payload)
+
+    active = set()
+    for event, user, _ in log:
+        if event == "start":
+            assert user not in active, f"two messages of {user} ran concurrently"
+            active.add(user)
+        else:
+            active.remove(user)
+
+
+def test_redelivered_batch_is_recognised_as_duplicates(meta_app):
+    payload = load_fixture("meta_batch.json")
+    for entry in payload["entry"]:
+        for change in entry["changes"]:
+            for message in change["value"].get("messages", []):
+                message["id"] += ".redelivery"
+
+    (first, again), log = deliver(meta_app, payload, copy.deepcopy(payload))
+
+    assert first["queued"] == 5
+    assert again == {"status": "duplicate", "queued": 0, "duplicates": 5, "ignored": 1}
+    assert len(log) == 2 * 5
+
+
+def test_payload_without_messages_is_acknowledged(meta_app):
+    payload = meta_payload("919800000009", "")
+    payload["entry"][0]["changes"][0]["value"].pop("messages")
+
+    (result,), log = deliver(meta_app, payload)
+
+    assert result == {"status": "success", "queued": 0, "duplicates": 0, "ignored": 0}
+    assert not log
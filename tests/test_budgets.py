@@ -0,0 +1,63 @@
+from datetime import date
+
+import pytest
+
+from budgets import Budgets
+from storage import SqliteExpenseStore
+
+TODAY = date.today().isoformat()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteExpenseStore(str(tmp_path / "expenses.db"))
+    yield store
+    store.close()
+
+
+# Two workers: each has its own Budgets over the same file, listening to its own store
+@pytest.fixture
+def workers(store, tmp_path):
+    path = str(tmp_path / "budgets.json")
+    workers = [Budgets(store, path=path, thresholds=(0.8, 1.0)) for _ in range(2)]
+    for budgets in workers:
+        store.subscribe(budgets.record, budgets.change)
+    return workers
+
+
+def test_workers_keep_each_others_budgets(workers, tmp_path):
+    first, second = workers
+    first.set("u1", "food", 1000)
+    second.set("u1", "travel", 500, "week")
+    first.set("u2", "books", 200)
+
+    for budgets in workers + [Budgets(None, path=str(tmp_path / "budgets.json"))]:
+        assert set(budgets.for_user("u1")) == {"food", "travel"}
+        assert set(budgets.for_user("u2")) == {"books"}
+
+
+def test_spent_counts_rows_written_by_any_worker(workers, store, tmp_path):
+    first, _ = workers
+    first.set("u1", "food", 1000)
+    # Another process writing to the same ledger, with no listener here
+    other = SqliteExpenseStore(str(tmp_path / "expenses.db"))
+    other.add("u1", 300, "food", "lunch", TODAY)
+    other.close()
+    row_id = store.add("u1", 100, "food", "snack", TODAY)
+
+    assert first.spent("u1", "food")[0] == 40000
+    store.update("u1", row_id, amount="50")
+    assert first.spent("u1", "food")[0] == 35000
+
+
+def test_each_threshold_alerts_once_across_workers(workers, store):
+    first, second = workers
+    second.set("u1", "food", 1000)
+
+    store.add("u1", 850, "food", "groceries", TODAY)
+    store.add("u1", 10, "food", "tea", TODAY)
+    store.add("u1", 200, "food", "dinner", TODAY)
+
+    alerts = first.pop_alerts("u1") + second.pop_alerts("u1")
+    assert len(alerts) == 2
+    assert alerts[0].startswith("Heads up") and "crossed" in alerts[1]
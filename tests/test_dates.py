@@ -0,0 +1,83 @@
+import random
+from datetime import date
+
+import pytest
+
+from dateindex import DateIndex
+from dates import normalize_date, resolve_period, split_period
+from storage import CsvExpenseStore
+
+TODAY = date(2025, 3, 12)  # a Wednesday
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("this week", ("2025-03-10", "2025-03-16")),
+    ("last week", ("2025-03-03", "2025-03-09")),
+    ("last month", ("2025-02-01", "2025-02-28")),
+    ("december", ("2024-12-01", "2024-12-31")),
+    ("last 7 days", ("2025-03-06", "2025-03-12")),
+    ("last 2 weeks", ("2025-03-03", "2025-03-12")),
+    ("past 3 months", ("2025-01-01", "2025-03-12")),
+    ("between 1 feb and 10 feb", ("2025-02-01", "2025-02-10")),
+    ("since 2025-03-01", ("2025-03-01", "2025-03-12")),
+    ("3 days ago", ("2025-03-09", "2025-03-09")),
+    ("10/2/2025", ("2025-02-10", "2025-02-10")),
+    ("2025-02", ("2025-02-01", "2025-02-28")),
+    ("feb 30", None),
+    ("food", None),
+])
+def test_resolve_period(text, expected):
+    assert resolve_period(text, TODAY) == expected
+
+
+@pytest.mark.parametrize("term, expected", [
+    ("food last month", (("2025-02-01", "2025-02-28"), "food")),
+    ("taxi between 1 feb and 10 feb", (("2025-02-01", "2025-02-10"), "taxi")),
+    ("Groceries in  February", (("2025-02-01", "2025-02-28"), "groceries")),
+    ("coffee on 9 march", (("2025-03-09", "2025-03-09"), "coffee")),
+    ("2025-03", (("2025-03-01", "2025-03-31"), "")),
+    ("books", (None, "books")),
+])
+def test_split_period(term, expected):
+    assert split_period(term, TODAY) == expected
+
+
+def test_normalize_date():
+    assert [normalize_date(value) for value in ["2025-3-9", "9/3/2025", " 9 March 2025 ", "someday", None]] == [
+        "2025-03-09", "2025-03-09", "2025-03-09", "someday", ""]
+
+
+def test_date_index_answers_like_a_scan():
+    generator = random.Random(12)
+    rows = [{"id": number, "user_id": generator.choice("ab"),
+             "date": date(2025, generator.randint(1, 4), generator.randint(1, 28)).isoformat()}
+            for number in range(300)]
+    index = DateIndex(rows)
+    for row in rows[::3]:
+        index.remove(row)
+    kept = [row for row in rows if row["id"] % 3]
+
+    for start, end in [("2025-01-01", "2025-12-31"), ("2025-02-10", "2025-02-10"), ("2025-03-05", "2025-04-02"),
+                       ("2026-01-01", "2026-01-31")]:
+        found = index.range("a", start, end)
+        assert sorted(row["id"] for row in found) == [
+            row["id"] for row in kept if row["user_id"] == "a" and start <= row["date"] <= end]
+        assert [row["date"] for row in found] == sorted(row["date"] for row in found)
+    assert len(index) == len(kept)
+    assert index.range("nobody", "2025-01-01", "2025-12-31") == []
+
+
+def test_store_date_range_follows_writes(tmp_path):
+    store = CsvExpenseStore(str(tmp_path / "expenses.csv"))
+    tea = store.add("u1", 40, "food", "tea", "2025-03-10")
+    store.add("u1", 70, "travel", "cab", "2025-02-27")
+    store.add("u2", 90, "food", "dinner", "2025-03-10")
+    store.add("u1", 120, "food", "lunch", "2025-03-01")
+
+    before = store.date_range("u1", *resolve_period("this month", TODAY))
+    store.update("u1", tea, date="2025-02-28")
+
+    assert [row["description"] for row in before] == ["lunch", "tea"]
+    assert [row["description"] for row in store.date_range("u1", *resolve_period("last month", TODAY))] == [
+        "cab", "tea"]
+    store.close()
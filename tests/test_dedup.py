@@ -0,0 +1,63 @@
+import time
+
+import main
+from dedup import MessageDeduplicator
+from stubs import meta_payload
+
+
+def test_redelivery_is_suppressed():
+    deduplicator = MessageDeduplicator(db_path="")
+
+    assert [deduplicator.first_delivery(message_id) for message_id in ["wamid.1", "wamid.2", "wamid.1"]] == [
+        True, True, False]
+    assert deduplicator.first_delivery(None) and deduplicator.first_delivery("")
+    assert deduplicator.stats() == {"checked": 3, "duplicates_suppressed": 1, "cached_ids": 2, "persistent": False}
+
+
+def test_forgotten_message_is_accepted_again(tmp_path):
+    deduplicator = MessageDeduplicator(db_path=str(tmp_path / "dedup.db"))
+    deduplicator.first_delivery("wamid.1")
+    deduplicator.forget("wamid.1")
+
+    assert deduplicator.first_delivery("wamid.1")
+    assert not MessageDeduplicator(db_path=str(tmp_path / "dedup.db")).first_delivery("wamid.1")
+
+
+def test_ids_survive_a_restart_until_they_expire(tmp_path):
+    path = str(tmp_path / "dedup.db")
+    MessageDeduplicator(db_path=path, ttl=0.2).first_delivery("wamid.1")
+
+    restarted = MessageDeduplicator(db_path=path, ttl=0.2)
+    suppressed = restarted.first_delivery("wamid.1")
+    time.sleep(0.3)
+    later = MessageDeduplicator(db_path=path, ttl=0.2)
+
+    assert not suppressed
+    assert later.first_delivery("wamid.1")
+
+
+def test_expired_ids_are_pruned(tmp_path):
+    deduplicator = MessageDeduplicator(db_path=str(tmp_path / "dedup.db"), ttl=0.05)
+    deduplicator.first_delivery("wamid.1")
+    time.sleep(0.1)
+    deduplicator.prune()
+
+    assert deduplicator._conn.execute("SELECT COUNT(*) FROM seen_messages").fetchone()[0] == 0
+
+
+def test_message_refused_by_a_full_queue_is_accepted_on_the_retry(meta_app, monkeypatch):
+    payload = meta_payload("919800000031", "spent 40 on tea", message_id="wamid.full-queue")
+    submit = main.work_queue.submit
+
+    async def scenario(client):
+        monkeypatch.setattr(main.work_queue, "submit", lambda *args: False)
+        refused = await client.post("/webhook", json=payload)
+        monkeypatch.setattr(main.work_queue, "submit", submit)
+        retried = await client.post("/webhook", json=payload)
+        again = await client.post("/webhook", json=payload)
+        return refused.status_code, retried.json(), again.json()
+
+    refused, retried, again = meta_app(scenario)
+
+    assert refused == 503
+    assert (retried["queued"], again["status"]) == (1, "duplicate")
@@ -0,0 +1,29 @@
+import asyncio
+from datetime import date
+
+from digests import DigestScheduler, meta_recipient
+from storage import get_store
+
+
+def test_only_meta_users_of_configured_tenants_get_digests():
+    assert meta_recipient("919800000001")[1] == "919800000001"
+    assert meta_recipient("acme:919800000001")[0].id == "acme"
+    assert meta_recipient("+919800000001") is None       # a Twilio user
+    assert meta_recipient("acme:+919800000001") is None
+    assert meta_recipient("gone:919800000001") is None   # tenant no longer configured
+
+
+def test_digests_go_to_each_users_own_tenant(tmp_path):
+    store = get_store()
+    for user_id in ("919800000101", "acme:919800000102", "+919800000103"):
+        store.add(user_id, 120, "food", "lunch", "2026-03-01")
+    sent = []
+
+    async def send(text, to, tenant):
+        sent.append((tenant.id, to))
+
+    scheduler = DigestScheduler(send, period="daily", state_file=str(tmp_path / "digests.json"))
+    count = asyncio.run(scheduler.run_once(date(2026, 3, 2)))
+
+    assert sorted(sent) == [("acme", "919800000102"), ("default", "919800000101")]
+    assert count == 2 and scheduler.stats()["last_skipped"] == 1
@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import sendMessage
+from dispatcher import (AsyncDispatcher, CircuitBreaker, CircuitOpenError, RetryableSendError, SendError,
+                        ThreadDispatcher)
+from httpclients import close_http_clients
+from tenants import get_tenant
+
+
+def text(to, body):
+    return {"messaging_product": "whatsapp", "to": to, "type": "text", "text": {"body": body}}
+
+
+def dispatcher(**kwargs):
+    kwargs.setdefault("rate", 0)
+    return AsyncDispatcher(sendMessage.post_message, backoff_base=0.01, backoff_max=0.05, **kwargs)
+
+
+def send(outbound, to, body):
+    return outbound.send(to, text(to, body), get_tenant())
+
+
+# Run a coroutine sending through the shared Graph client, which is bound to the loop
+def run(coroutine):
+    async def scenario():
+        try:
+            return await coroutine
+        finally:
+            await close_http_clients()
+
+    return asyncio.run(scenario())
+
+
+def test_each_recipients_messages_arrive_in_order(graph):
+    outbound = dispatcher(rate=500, burst=10)
+    recipients = [f"91{9000000000 + n}" for n in range(20)]
+
+    async def scenario():
+        await asyncio.gather(*(send(outbound, to, f"{to}-{i}") for i in range(4) for to in recipients))
+
+    run(scenario())
+
+    for to in recipients:
+        assert [p["text"]["body"] for p in graph.sent if p["to"] == to] == [f"{to}-{i}" for i in range(4)]
+
+
+def test_throttling_and_server_errors_are_retried(graph):
+    outbound = dispatcher()
+    graph.fail_next(429, count=2)
+    graph.fail_next(503)
+
+    run(send(outbound, "911", "after retries"))
+
+    assert outbound.snapshot()["retries"] == 3
+    assert len(graph.sent) == 1
+
+
+def test_closed_window_falls_back_to_the_template(graph):
+    graph.fail_next(400, code=131047)
+
+    run(send(dispatcher(), "912", "outside window"))
+
+    assert [p["type"] for p in graph.sent] == ["template"]
+
+
+def test_bad_request_fails_without_retries(graph):
+    outbound = dispatcher()
+    graph.fail_next(400, code=100)
+
+    with pytest.raises(SendError):
+        run(send(outbound, "913", "bad"))
+
+    stats = outbound.snapshot()
+    assert stats["retries"] == 0 and stats["failed"] == 1
+
+
+def test_circuit_opens_and_a_successful_probe_closes_it(graph):
+    outbound = dispatcher(max_attempts=2, breaker=CircuitBreaker(failures=4, reset_timeout=0.2))
+    graph.fail_next(500, count=4)
+
+    async def scenario():
+        for n in range(2):
+            with pytest.raises(SendError):
+                await send(outbound, "914", f"down {n}")
+        requests = graph.requests
+        with pytest.raises(CircuitOpenError):
+            await send(outbound, "914", "while open")
+        assert graph.requests == requests
+        await asyncio.sleep(0.25)
+        await send(outbound, "914", "probe")
+
+    run(scenario())
+
+    assert outbound.breaker.state == "closed"
+
+
+@pytest.mark.parametrize("error", [SendError("bad recipient"), ValueError("bug")])
+def test_probe_that_fails_otherwise_does_not_block_the_circuit(error):
+    breaker = CircuitBreaker(failures=1, reset_timeout=0.05)
+    outcomes = [RetryableSendError("down"), error, None]
+
+    def transport(recipient, body):
+        outcome = outcomes.pop(0)
+        if outcome is not None:
+            raise outcome
+
+    outbound = ThreadDispatcher(transport, rate=0, max_attempts=1, breaker=breaker)
+    with pytest.raises(RetryableSendError):
+        outbound.send("915", "opens the circuit")
+    time.sleep(0.06)
+    with pytest.raises(type(error)):
+        outbound.send("915", "probe")
+
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    outbound.send("915", "next probe")
+    assert breaker.state == "closed"
+
+
+def test_async_probe_that_fails_otherwise_does_not_block_the_circuit():
+    breaker = CircuitBreaker(failures=1, reset_timeout=0.05)
+    outcomes = [RetryableSendError("down"), SendError("bad recipient"), None]
+
+    async def transport(recipient, body):
+        outcome = outcomes.pop(0)
+        if outcome is not None:
+            raise outcome
+
+    outbound = AsyncDispatcher(transport, rate=0, max_attempts=1, breaker=breaker)
+
+    async def scenario():
+        for body in ("opens the circuit", "probe"):
+            with pytest.raises(SendError):
+                await outbound.send("916", body)
+            await asyncio.sleep(0.06)
+        await outbound.send("916", "next probe")
+
+    asyncio.run(scenario())
+
+    assert breaker.state == "closed"
+
+
+def test_thread_dispatcher_sends_in_call_order():
+    sent = []
+    first_started, release = threading.Event(), threading.Event()
+
+    def transport(recipient, body):
+        if body == 0:
+            first_started.set()
+            release.wait(5)
+        sent.append(body)
+
+    outbound = ThreadDispatcher(transport, rate=0)
+    threads = [threading.Thread(target=outbound.send, args=("917", 0))]
+    threads[0].start()
+    first_started.wait(5)
+    # Queue the rest behind the first send, each call made after the previous one
+    for body in range(1, 8):
+        thread = threading.Thread(target=outbound.send, args=("917", body))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert sent == list(range(8))
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from extractor import (EXTRACTION_KEYS, build_extraction_payload, extract_message_with_llama,
+                       extract_message_with_llama_async, parse_extraction_response, validate_extraction)
+from httpclients import close_http_clients
+
+
+def extraction(**fields):
+    return dict(dict.fromkeys(EXTRACTION_KEYS), **fields)
+
+
+def completion(content):
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+def test_extraction_is_normalized():
+    assert validate_extraction(extraction(intent=" ADD ", amount="₹1,200", category=" food ", description="",
+                                          date="yesterday", query_term="unknown")) == {
+        "intent": "add", "amount": 1200, "category": "food", "description": None, "date": "yesterday",
+        "query_term": None,
+    }
+    assert validate_extraction(extraction(intent="add", amount="12.5 USD"))["amount"] == 12.5
+    assert validate_extraction(extraction(intent="query", query_term="food last month"))["query_term"] == "food last month"
+
+
+@pytest.mark.parametrize("data", [
+    ["add"],
+    {key: None for key in EXTRACTION_KEYS if key != "date"},
+    dict(extraction(intent="none"), confidence=0.9),
+    extraction(intent="delete"),
+    extraction(intent="add"),
+    extraction(intent="add", amount=True),
+    extraction(intent="add", amount="a lot"),
+    extraction(intent="query", query_term="unknown"),
+    extraction(intent="none", category=5),
+])
+def test_extraction_outside_the_schema_is_rejected(data):
+    with pytest.raises(ValueError):
+        validate_extraction(data)
+
+
+@pytest.mark.parametrize("body", [
+    {},
+    {"choices": []},
+    completion("not json"),
+    completion('{"intent": "add"}'),
+])
+def test_unusable_responses_fall_back(body):
+    assert parse_extraction_response(body) is None
+
+
+def test_payload_asks_for_one_json_object():
+    payload = build_extraction_payload("I spent 100 on lunch")
+
+    assert payload["response_format"] == {"type": "json_object"}
+    assert payload["temperature"] == 0
+    assert payload["messages"][-1] == {"role": "user", "content": "I spent 100 on lunch"}
+
+
+def test_one_groq_call_classifies_and_extracts(groq):
+    groq.reset()
+
+    added = extract_message_with_llama("Paid 250 on snacks yesterday")
+
+    async def ask():
+        try:
+            return await extract_message_with_llama_async("How much on snacks")
+        finally:
+            await close_http_clients()
+
+    asked = asyncio.run(ask())
+
+    assert added == {"intent": "add", "amount": 250, "category": "snacks", "description": None,
+                     "date": "yesterday", "query_term": None}
+    assert (asked["intent"], asked["query_term"]) == ("query", "snacks")
+    assert groq.requests == 2
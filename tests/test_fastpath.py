@@ -0,0 +1,43 @@
+import pytest
+
+from fastpath import parse_message_locally
+
+
+@pytest.mark.parametrize("message, term", [
+    ("how much did I spend on food?", "food"),
+    ("how much on groceries last week", "groceries last week"),
+    ("what did I spend on taxi", "taxi"),
+    ("what have i paid for rent?", "rent"),
+    ("show me my expenses for books", "books"),
+])
+def test_spending_questions_are_queries(message, term):
+    result = parse_message_locally(message)
+
+    assert result["intent"] == "query" and result["query_term"] == term
+
+
+@pytest.mark.parametrize("message", [
+    "what is 5 plus 3 for me",
+    "what time is it for you",
+    "what should I cook for dinner",
+])
+def test_what_without_a_spending_verb_goes_to_the_llm(message):
+    assert parse_message_locally(message) is None
+
+
+def test_expense_is_parsed_locally():
+    result = parse_message_locally("spent 200 on food")
+
+    assert (result["intent"], result["amount"], result["category"]) == ("add", 200, "food")
+
+
+@pytest.mark.parametrize("message", [
+    "dont add 200 for food",
+    "don't add 200 for food",
+    "do not add 200 for food",
+    "I never spent 500 on taxi",
+    "cancel the 300 for groceries",
+    "how much didn't I spend on food",
+])
+def test_negated_messages_go_to_the_llm(message):
+    assert parse_message_locally(message) is None
@@ -0,0 +1,82 @@
+import pytest
+
+import engine
+from aggregates import check_consistency, get_aggregates
+from ledger import ColumnarLedger, get_ledger
+from searchindex import get_search_index
+from storage import get_store
+
+# (message, is a follow-up)
+CONVERSATION = [
+    ("set groceries budget to 250", False),
+    ("spent 200 on food yesterday", False),
+    ("make that 300", True),
+    ("it was for groceries", True),
+    ("how much did I spend on groceries?", False),
+    ("and last week?", True),
+    ("what about food?", True),
+    ("paid 120 for taxi today", False),
+    ("delete that", True),
+    ("top categories this month", False),
+    ("how about last month?", True),
+]
+USERS = ["9300000001", "9300000002"]
+
+
+# Plays the conversation for every user. Returns the replies by (message, user) and the
+# Groq calls the follow-ups made.
+@pytest.fixture(scope="module")
+def conversation(groq):
+    # Built before the conversation so they have to follow every add, edit and delete
+    get_aggregates(), get_search_index(), get_ledger()
+    replies, calls = {}, 0
+    for user in USERS:
+        for message, follow_up in CONVERSATION:
+            before = groq.requests
+            request_type, details = engine.interpret_message(message, user)
+            if follow_up:
+                calls += groq.requests - before
+            replies[message, user] = engine.handle_message(user, request_type, details)[0]
+    return replies, calls
+
+
+def test_follow_ups_need_no_groq_call_with_a_session(conversation):
+    assert conversation[1] == 0
+
+
+def test_edit_changes_amount_and_category_of_the_same_expense(conversation):
+    rows = list(get_store().iter_user_rows(USERS[0]))
+
+    assert [(row["amount_minor"], row["category"]) for row in rows] == [(30000, "groceries")]
+
+
+def test_budget_alert_follows_the_edit_that_crossed_it(conversation):
+    replies, _ = conversation
+
+    assert any("crossed your groceries budget" in reply for reply in replies["it was for groceries", USERS[0]])
+
+
+def test_follow_up_question_keeps_the_topic():
+    assert (engine.parse_follow_up("and last week?", {"intent": "query", "filter": "groceries"})
+            == ("query", "groceries last week"))
+
+
+def test_delete_that_removes_the_expense_just_added(conversation):
+    replies, _ = conversation
+
+    for user in USERS:
+        assert replies["delete that", user][0].startswith("Deleted")
+        assert not any(row["category"] == "transport" for row in get_store().iter_user_rows(user))
+
+
+def test_derived_structures_follow_edits_and_deletes(conversation):
+    store = get_store()
+    rows = list(store.iter_rows())
+    rebuilt = ColumnarLedger()
+    rebuilt.rebuild(rows)
+
+    assert not check_consistency(get_aggregates(), rows)
+    assert len(get_search_index()) == store.count()
+    assert not get_search_index().matches(USERS[0], "taxi")
+    assert len(get_ledger()) == store.count()
+    assert all(get_ledger().category_totals(user) == rebuilt.category_totals(user) for user in USERS)
@@ -0,0 +1,168 @@
+import csv
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from conftest import ROOT
+from groupcommit import encode_rows, row_span
+from storage import EXPENSE_FIELDS, CsvExpenseStore
+
+# Appends rows and prints each id as soon as add() acknowledges it
+WRITER = """
+import sys
+sys.path.insert(0, sys.argv[1])
+from storage import CsvExpenseStore
+store = CsvExpenseStore(sys.argv[2])
+for i in range(int(sys.argv[3])):
+    print(store.add(sys.argv[4], i + 1, "food", f"{sys.argv[4]}-{i}", "2025-02-10"), flush=True)
+store.close()
+"""
+
+
+def spawn(path, count, tag):
+    return subprocess.Popen([sys.executable, "-c", WRITER, ROOT, str(path), str(count), tag],
+                            stdout=subprocess.PIPE, text=True)
+
+
+def read_rows(path):
+    with open(path, newline="") as file:
+        return list(csv.DictReader(file))
+
+
+# Store rows with amounts 100, 200, ... 500, then leave the state of a process that died
+# while rewriting row 3 as 3000: the journal is written and the file cut at the row
+def interrupted_rewrite(path):
+    store = CsvExpenseStore(path)
+    for amount in (100, 200, 300, 400, 500):
+        store.add("u", amount, "food", "ok", "2025-02-10")
+    store.close()
+    with open(path, "rb") as file:
+        data = file.read()
+    start, end = row_span(data, 3)
+    tail = encode_rows([["u", "3000", "food", "ok", "2025-02-10"]]) + data[end:]
+    with open(f"{path}.journal", "wb") as journal:
+        journal.write(f"{start} {len(tail)}\n".encode("ascii") + tail)
+    with open(path, "r+b") as file:
+        file.truncate(start)
+
+
+def amounts(path):
+    return [float(row["amount"]) for row in read_rows(path)]
+
+
+def test_processes_appending_to_one_file_keep_every_row(tmp_path):
+    path = tmp_path / "shared.csv"
+    CsvExpenseStore(str(path)).close()
+
+    children = [spawn(path, 200, f"p{n}") for n in range(4)]
+    acked = [set(map(int, child.communicate()[0].split())) for child in children]
+
+    rows = read_rows(path)
+    assert len(rows) == 800
+    assert all(len(row) == len(EXPENSE_FIELDS) and None not in row.values() for row in rows)
+    assert set().union(*acked) == set(range(1, 801))
+    for row_id, row in enumerate(rows, start=1):
+        tag = row["description"].split("-")[0]
+        assert row_id in acked[int(tag[1:])]
+
+
+def test_killed_writer_loses_no_acknowledged_row(tmp_path):
+    path = tmp_path / "killed.csv"
+    child = spawn(path, 1_000_000, "k")
+    time.sleep(1.0)
+    child.send_signal(signal.SIGKILL)
+    acked = {int(line) for line in child.communicate()[0].split()}
+
+    descriptions = {row["description"] for row in read_rows(path)}
+    assert acked
+    assert all(f"k-{row_id - 1}" in descriptions for row_id in acked)
+
+
+def test_torn_last_row_is_cut_off_and_numbering_carries_on(tmp_path):
+    path = str(tmp_path / "torn.csv")
+    store = CsvExpenseStore(path)
+    for i in range(10):
+        store.add("u", i + 1, "food", "ok", "2025-02-10")
+    store.close()
+    with open(path, "ab") as file:
+        file.write(b"u,999,food,half-writ")
+
+    store = CsvExpenseStore(path)
+    row_id = store.add("u", 11, "food", "after crash", "2025-02-10")
+    store.close()
+
+    rows = read_rows(path)
+    assert row_id == 11
+    assert len(rows) == 11 and rows[-1]["description"] == "after crash"
+
+
+def test_interrupted_rewrite_is_finished_from_the_journal(tmp_path):
+    path = str(tmp_path / "journal.csv")
+    interrupted_rewrite(path)
+
+    CsvExpenseStore(path).close()
+
+    assert amounts(path) == [100, 200, 3000, 400, 500]
+    assert not os.path.exists(f"{path}.journal")
+
+
+def test_open_writer_finishes_a_rewrite_another_process_left(tmp_path):
+    path = str(tmp_path / "journal.csv")
+    store = CsvExpenseStore(path)
+    interrupted_rewrite(path)
+
+    row_id = store.add("u", 600, "food", "after crash", "2025-02-10")
+    store.close()
+
+    assert row_id == 6
+    assert amounts(path) == [100, 200, 3000, 400, 500, 600]
+
+
+def test_date_range_sees_a_same_size_edit_from_another_process(tmp_path):
+    path = str(tmp_path / "edited.csv")
+    store = CsvExpenseStore(path)
+    row_id = store.add("u", 100, "food", "lunch", "2025-02-10")
+    assert [row["amount"] for row in store.date_range("u", "2025-02-01", "2025-02-28")] == [100]
+    size = os.path.getsize(path)
+
+    other = CsvExpenseStore(path)
+    other.update("u", row_id, amount="200")
+    other.close()
+
+    assert os.path.getsize(path) == size
+    assert [row["amount"] for row in store.date_range("u", "2025-02-01", "2025-02-28")] == [200]
+    store.close()
+
+
+def test_reader_never_sees_a_part_written_edit(tmp_path):
+    path = str(tmp_path / "read.csv")
+    store = CsvExpenseStore(path)
+    for amount in (100, 200, 300, 400, 500):
+        store.add("u", amount, "food", "ok", "2025-02-10")
+
+    rows = store.iter_rows()
+    first = next(rows)
+    store.update("u", 2, amount="2000")
+    store.close()
+
+    # The reader keeps the file as it was when it started
+    assert [first["amount"]] + [row["amount"] for row in rows] == [100, 200, 300, 400, 500]
+    assert amounts(path) == [100, 2000, 300, 400, 500]
+
+
+def test_writer_appends_to_the_file_another_process_replaced(tmp_path):
+    path = str(tmp_path / "replaced.csv")
+    store = CsvExpenseStore(path)
+    for amount in (100, 200, 300):
+        store.add("u", amount, "food", "ok", "2025-02-10")
+
+    other = CsvExpenseStore(path)
+    other.update("u", 1, amount="1000")
+    other.close()
+    row_id = store.add("u", 400, "food", "ok", "2025-02-10")
+    store.close()
+
+    assert row_id == 4
+    assert amounts(path) == [1000, 200, 300, 400]
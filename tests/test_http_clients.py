@@ -0,0 +1,87 @@
+import asyncio
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+
+import httpclients
+from httpclients import close_http_clients, connection_stats, get_async_client, get_session
+from metrics import UPSTREAM_RESPONSES, render
+from stubs import GraphStub
+
+
+def test_async_client_reuses_its_connection(graph):
+    host = urlsplit(graph.url).netloc
+    before = connection_stats().get(host, {"reused": 0})["reused"]
+
+    async def scenario():
+        client = get_async_client()
+        try:
+            for _ in range(2):
+                response = await client.post(f"{graph.url}/v1/phone/messages", json={"to": "911"})
+                assert response.status_code == 200
+        finally:
+            await close_http_clients()
+
+    asyncio.run(scenario())
+
+    assert connection_stats()[host]["reused"] == before + 1
+
+
+def test_session_reuses_its_connection_and_metrics_show_it(graph):
+    host = urlsplit(graph.url).netloc
+    session = get_session()
+    try:
+        for _ in range(2):
+            assert session.post(f"{graph.url}/v1/phone/messages", json={"to": "911"}).status_code == 200
+        stats = connection_stats()[host]
+        metrics = render()
+    finally:
+        asyncio.run(close_http_clients())
+
+    assert stats["requests"] - stats["connections"] == stats["reused"] >= 1
+    assert f'expense_bot_upstream_connections{{host="{host}",count="reused"}} {stats["reused"]}' in metrics
+
+
+def test_clients_are_shared_until_closed():
+    async def scenario():
+        client = get_async_client()
+        same = get_async_client() is client
+        await close_http_clients()
+        reopened = get_async_client()
+        await close_http_clients()
+        return same, reopened is not client, client.is_closed
+
+    session = get_session()
+    shared = get_session() is session
+
+    assert shared
+    assert asyncio.run(scenario()) == (True, True, True)
+    assert get_session() is not session
+    asyncio.run(close_http_clients())
+
+
+def test_session_applies_the_configured_timeout(monkeypatch):
+    monkeypatch.setattr(httpclients, "HTTP_TIMEOUT", 0.05)
+    errors = UPSTREAM_RESPONSES.value(service="graph", status="error")
+    with GraphStub(latency=0.5) as slow:
+        try:
+            with pytest.raises(requests.Timeout):
+                get_session().post(f"{slow.url}/v1/phone/messages", json={"to": "911"})
+        finally:
+            asyncio.run(close_http_clients())
+
+    assert UPSTREAM_RESPONSES.value(service="graph", status="error") == errors + 1
+
+
+def test_async_responses_are_recorded(graph):
+    answered = UPSTREAM_RESPONSES.value(service="graph", status=200)
+
+    async def scenario():
+        try:
+            return (await get_async_client().post(f"{graph.url}/v1/phone/messages", json={"to": "911"})).status_code
+        finally:
+            await close_http_clients()
+
+    assert asyncio.run(scenario()) == 200
+    assert UPSTREAM_RESPONSES.value(service="graph", status=200) == answered + 1
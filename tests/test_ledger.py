@@ -0,0 +1,135 @@
+import random
+from collections import defaultdict
+from datetime import date, timedelta
+
+import pytest
+
+from ledger import ColumnarLedger, answer_analytics, parse_analytics_query
+
+TODAY = date(2025, 3, 12)
+CATEGORIES = ["food", "Food ", "travel", "books", ""]
+
+
+def random_rows(count, seed):
+    generator = random.Random(seed)
+    return [{"id": number, "user_id": generator.choice(["a", "b"]), "category": generator.choice(CATEGORIES),
+             "amount_minor": generator.randint(1, 10 ** 6),
+             "date": "someday" if number % 50 == 7 else (date(2025, 1, 1) + timedelta(days=generator.randint(0, 89))).isoformat()}
+            for number in range(count)]
+
+
+def in_range(row, start, end):
+    return row["date"] != "someday" and (start is None or row["date"] >= start) and (end is None or row["date"] <= end)
+
+
+def expected_categories(rows, user, start=None, end=None):
+    totals = defaultdict(lambda: [0, 0])
+    for row in rows:
+        if row["user_id"] == user and (start is None and end is None or in_range(row, start, end)):
+            entry = totals[row["category"].strip().lower()]
+            entry[0] += row["amount_minor"]
+            entry[1] += 1
+    return sorted((category, total, count) for category, (total, count) in totals.items())
+
+
+@pytest.fixture
+def edited():
+    rows = random_rows(600, seed=23)
+    ledger = ColumnarLedger(capacity=4)
+    for row in rows:
+        ledger.record(row)
+    generator = random.Random(5)
+    for row in generator.sample(rows, 60):
+        new = dict(row, amount_minor=row["amount_minor"] + 1, category=generator.choice(CATEGORIES))
+        ledger.change(row, new)
+        rows[rows.index(row)] = new
+    for row in generator.sample(rows, 40):
+        ledger.change(row, None)
+        rows.remove(row)
+    return ledger, rows
+
+
+def test_columns_follow_appends_edits_and_deletes(edited):
+    ledger, rows = edited
+    rebuilt = ColumnarLedger()
+    rebuilt.rebuild(rows)
+
+    assert len(ledger) == len(rebuilt) == len(rows)
+    for user in ("a", "b"):
+        for start, end in [(None, None), ("2025-02-01", "2025-02-28"), ("2025-03-15", "2025-01-01")]:
+            totals = ledger.category_totals(user, start, end)
+            assert sorted(totals) == expected_categories(rows, user, start, end)
+            assert [total for _, total, _ in totals] == sorted((total for _, total, _ in totals), reverse=True)
+            assert rebuilt.category_totals(user, start, end) == totals
+            assert ledger.total(user, start, end) == (sum(total for _, total, _ in totals),
+                                                      sum(count for _, _, count in totals))
+    assert ledger.category_totals("nobody") == [] and ledger.total("nobody") == (0, 0)
+
+
+@pytest.mark.parametrize("bucket, start, end", [
+    ("day", "2025-02-25", "2025-03-03"),
+    ("week", "2025-01-08", "2025-03-02"),
+    ("month", "2024-12-15", "2025-03-31"),
+])
+def test_bucket_totals_cover_every_bucket(edited, bucket, start, end):
+    ledger, rows = edited
+
+    def first_day(iso):
+        day = date.fromisoformat(iso)
+        if bucket == "week":
+            return day - timedelta(days=day.weekday())
+        return day.replace(day=1) if bucket == "month" else day
+
+    expected = defaultdict(lambda: [0, 0])
+    for row in rows:
+        if row["user_id"] == "a" and in_range(row, start, end):
+            entry = expected[first_day(row["date"]).isoformat()]
+            entry[0] += row["amount_minor"]
+            entry[1] += 1
+    buckets = ledger.bucket_totals("a", bucket, start, end)
+
+    assert buckets[0][0] == first_day(start).isoformat()
+    assert [first for first, _, _ in buckets] == sorted({first for first, _, _ in buckets})
+    assert {first: [total, count] for first, total, count in buckets if count} == dict(expected)
+    assert all(total == 0 for _, total, count in buckets if not count)
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("Show me my top 5 categories last month",
+     {"kind": "categories", "period": ("2025-02-01", "2025-02-28"), "label": "last month", "n": 5}),
+    ("where did I spend the most in february?",
+     {"kind": "categories", "period": ("2025-02-01", "2025-02-28"), "label": "february", "n": 3}),
+    ("spending by category", {"kind": "categories", "period": None, "label": None, "n": None}),
+    ("weekly spending last 4 weeks",
+     {"kind": "trend", "period": ("2025-02-17", "2025-03-12"), "label": "last 4 weeks", "bucket": "week"}),
+    ("expenses per day this week",
+     {"kind": "trend", "period": ("2025-03-10", "2025-03-16"), "label": "this week", "bucket": "day"}),
+    ("what's my daily average", {"kind": "average", "period": None, "label": None}),
+    ("top categories someday", None),
+    ("how much on food", None),
+])
+def test_parse_analytics_query(message, expected):
+    assert parse_analytics_query(message, today=TODAY) == expected
+
+
+@pytest.fixture
+def small():
+    ledger = ColumnarLedger()
+    ledger.rebuild([{"id": number, "user_id": "u", "category": category, "amount_minor": amount, "date": day}
+                    for number, (category, amount, day) in enumerate([
+                        ("food", 12000, "2025-03-03"), ("Travel", 7000, "2025-03-04"),
+                        ("food", 4000, "2025-03-10"), ("books", 99900, "2025-02-10")])])
+    return ledger
+
+
+@pytest.mark.parametrize("message, reply", [
+    ("top 2 categories this month", "Top 2 categories this month:\n- food: 160 Rs (70%)\n- travel: 70 Rs (30%)"),
+    ("spending by category",
+     "Spending by category:\n- books: 999 Rs (81%)\n- food: 160 Rs (13%)\n- travel: 70 Rs (6%)"),
+    ("monthly trend last 2 months", "Monthly spending last 2 months:\n- 2025-02: 999 Rs\n- 2025-03: 230 Rs"),
+    ("average per day this month",
+     "You spent 19.17 Rs a day on average this month (230 Rs over 12 days, 3 expenses)."),
+    ("top categories last year", "No expenses found last year."),
+])
+def test_answer_analytics(small, message, reply):
+    assert answer_analytics(small, "u", parse_analytics_query(message, today=TODAY), today=TODAY) == reply
@@ -0,0 +1,32 @@
+import asyncio
+
+import extractor
+from llmbatch import BatchScheduler
+
+
+def test_batches_take_an_llm_slot_each(monkeypatch):
+    scheduler = BatchScheduler(window_ms=1, max_batch=2)
+    in_flight, most = 0, 0
+
+    async def request(messages):
+        nonlocal in_flight, most
+        in_flight += 1
+        most = max(most, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return [{"intent": "none"} for _ in messages]
+
+    monkeypatch.setattr(scheduler, "_request", request)
+
+    monkeypatch.setattr(extractor, "LLM_CONCURRENCY", 1)
+
+    async def scenario():
+        return await asyncio.gather(*(scheduler.extract(f"message {n}") for n in range(6)))
+
+    results = asyncio.run(scenario())
+    # A second event loop (another test, a restarted app) gets slots of its own
+    again = asyncio.run(scenario())
+
+    assert results == again == [{"intent": "none"}] * 6
+    assert scheduler.batches == 6
+    assert most == 1
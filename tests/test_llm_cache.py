@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from llmcache import LLMCache, cached_llm, normalize_text
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("How much on food?", "how much on food"),
+    ("  how   MUCH on\tfood ?! ", "how much on food"),
+    ("what’s my total…", "what's my total"),
+    ("ＦＯＯＤ", "food"),
+    (None, ""),
+])
+def test_normalize_text(text, expected):
+    assert normalize_text(text) == expected
+
+
+def counting(value):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return value
+    return compute, calls
+
+
+def test_near_identical_messages_share_an_entry():
+    cache = LLMCache(db_path="", enabled=True)
+    compute, calls = counting({"intent": "query", "query_term": "food"})
+
+    first = cache.get_or_compute("extract", "model", "How much on food?", compute)
+    second = cache.get_or_compute("extract", "model", "how much on FOOD", compute)
+    second["query_term"] = "changed"
+
+    assert first == cache.get_or_compute("extract", "model", "how much on food", compute)
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 2
+    assert cache.get("classify", "model", "how much on food") is None
+    assert cache.get("extract", "other-model", "how much on food") is None
+
+
+def test_failed_calls_are_not_cached():
+    cache = LLMCache(db_path="", enabled=True)
+    compute, calls = counting(None)
+
+    cache.get_or_compute("extract", "model", "spent 40", compute)
+    cache.get_or_compute("extract", "model", "spent 40", compute)
+
+    assert len(calls) == 2
+
+
+def test_disabled_cache_always_computes():
+    cache = LLMCache(db_path="", enabled=False)
+    compute, calls = counting("add")
+
+    cache.get_or_compute("classify", "model", "spent 40", compute)
+    cache.get_or_compute("classify", "model", "spent 40", compute)
+
+    assert len(calls) == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_entries_are_bounded_by_bytes():
+    cache = LLMCache(db_path="", enabled=True, max_bytes=100)
+    for number in range(10):
+        cache.put("extract", "model", f"message {number}", {"query_term": "x" * 20})
+
+    assert cache.stats()["bytes"] <= 100
+    assert cache.stats()["evictions"] > 0
+    assert cache.get("extract", "model", "message 9") == {"query_term": "x" * 20}
+
+
+def test_entries_survive_a_restart_on_disk(tmp_path):
+    path = str(tmp_path / "llm_cache.db")
+    LLMCache(db_path=path, enabled=True).put("extract", "model", "spent 40 on tea", {"intent": "add"})
+    restarted = LLMCache(db_path=path, enabled=True)
+
+    assert restarted.get("extract", "model", "Spent 40 on tea.") == {"intent": "add"}
+    assert restarted.get("extract", "model", "spent 40 on tea") == {"intent": "add"}
+    assert (restarted.stats()["hits"], restarted.stats()["disk_hits"]) == (2, 1)
+
+
+def test_expired_entries_are_misses_and_pruned(tmp_path):
+    cache = LLMCache(db_path=str(tmp_path / "llm_cache.db"), enabled=True, ttl=-1)
+    cache.put("extract", "model", "spent 40", {"intent": "add"})
+    cache.prune()
+
+    assert cache.get("extract", "model", "spent 40") is None
+    assert cache._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] == 0
+
+
+def test_decorated_helpers_are_cached_sync_and_async():
+    cache = LLMCache(db_path="", enabled=True)
+    calls = []
+
+    @cached_llm("classify", "model", cache=cache)
+    def classify(message):
+        calls.append(message)
+        return "add"
+
+    @cached_llm("query_term", "model", cache=cache)
+    async def query_term(message):
+        calls.append(message)
+        return "food"
+
+    async def ask():
+        return [await query_term("How much on food?"), await query_term("how much on food")]
+
+    assert [classify("Spent 40"), classify("spent 40!")] == ["add", "add"]
+    assert asyncio.run(ask()) == ["food", "food"]
+    assert calls == ["Spent 40", "How much on food?"]
+    assert classify.uncached("spent 40") == "add" and len(calls) == 3
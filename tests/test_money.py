@@ -0,0 +1,171 @@
+import random
+import sqlite3
+from decimal import Decimal
+from fractions import Fraction
+
+import pytest
+
+import money
+from aggregates import SpendingAggregates, check_consistency
+from money import FxTable, detect_currency, format_money, get_fx_table, minor_digits, parse_money, sum_minor, to_ledger, to_minor
+from storage import CsvExpenseStore, SqliteExpenseStore
+
+# (text as entered, currency of the message) -> (minor units, currency)
+PARSE_CASES = [
+    ("₹1,200", None, (120000, "INR")),
+    ("12.50 USD", None, (1250, "USD")),
+    ("10rs", None, (1000, "INR")),
+    ("$0.10", None, (10, "USD")),
+    ("€7.005", None, (701, "EUR")),
+    ("¥500", None, (500, "JPY")),
+    ("499", "GBP", (49900, "GBP")),
+    ("3 dirhams", None, (300, "AED")),
+    (0.1, None, (10, "INR")),
+    (Decimal("19.99"), "SGD", (1999, "SGD")),
+    (None, None, (0, "INR")),
+]
+DETECT_CASES = [
+    ("spent $12 on lunch", "USD"),
+    ("paid 40 euros for the museum", "EUR"),
+    ("spent 500 on books", None),
+    ("5 hours of parking for 200rs", "INR"),
+]
+FORMS = {
+    "INR": ["₹{}", "{} rs", "{}", "Rs. {}"],
+    "USD": ["${}", "{} USD", "{} dollars"],
+    "EUR": ["€{}", "{} eur"],
+    "GBP": ["£{}"],
+    "JPY": ["¥{}"],
+    "AED": ["{} AED"],
+}
+
+
+# Mixed-currency amounts as users type them, weighted towards rupees
+def synthetic_amounts(count, seed=11):
+    rng = random.Random(seed)
+    currencies = ["INR"] * 6 + ["USD", "USD", "EUR", "GBP", "JPY", "AED"]
+    for _ in range(count):
+        currency = rng.choice(currencies)
+        digits = minor_digits(currency)
+        minor = rng.randrange(1, 500_000)
+        text = str(Decimal(minor).scaleb(-digits)) if digits else str(minor)
+        yield rng.choice(FORMS[currency]).format(text)
+
+
+# The exact ledger total, rounding each amount half-even as money.FxTable does
+def fraction_total(texts):
+    fx = get_fx_table()
+    rates = {currency: Fraction(str(fx._rates[currency])) for currency in fx.currencies()}
+    total = 0
+    for minor, currency in map(parse_money, texts):
+        if currency == "INR":
+            total += minor
+            continue
+        value = Fraction(minor) * rates[currency] / rates["INR"] * Fraction(10) ** (2 - minor_digits(currency))
+        whole, rest = divmod(value, 1)
+        total += int(whole) + (1 if rest > Fraction(1, 2) or (rest == Fraction(1, 2) and whole % 2) else 0)
+    return total
+
+
+@pytest.mark.parametrize("value, currency, expected", PARSE_CASES)
+def test_parse_money(value, currency, expected):
+    assert parse_money(value, currency) == expected
+
+
+@pytest.mark.parametrize("text, expected", DETECT_CASES)
+def test_detect_currency(text, expected):
+    assert detect_currency(text) == expected
+
+
+def test_conversion_is_exact_and_rounds_half_even():
+    assert to_minor(0.1) + to_minor(0.2) == to_minor(0.3)
+    assert format_money(to_ledger(1250, "USD")) == "1038.75 Rs"
+    eighths = FxTable(path=None, rates={"INR": "1", "EUR": "0.125"})
+    assert [eighths.convert(minor, "EUR", "INR") for minor in (100, 300, 400)] == [12, 38, 50]  # 12.5, 37.5, 50
+
+
+def test_integer_total_matches_the_exact_total_in_any_order():
+    texts = list(synthetic_amounts(20_000))
+    ledger = [to_ledger(*parse_money(text)) for text in texts]
+
+    assert sum_minor(ledger) == fraction_total(texts)
+    random.Random(3).shuffle(ledger)
+    assert sum_minor(ledger) == fraction_total(texts)
+
+
+def test_sum_minor_is_exact_past_int64():
+    np = pytest.importorskip("numpy")
+
+    column = np.array([2 ** 62, 2 ** 62, 1], dtype=np.int64)
+    assert sum_minor(column) == 2 ** 63 + 1
+    assert sum_minor(column[:0]) == 0
+    assert sum_minor(np.array([5, 7], dtype=np.int64)) == sum_minor([5, 7]) == 12
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def store(request, tmp_path):
+    store = (CsvExpenseStore(str(tmp_path / "expenses.csv")) if request.param == "csv"
+             else SqliteExpenseStore(str(tmp_path / "expenses.db")))
+    yield store
+    store.close()
+
+
+def test_store_totals_match_the_exact_total(store):
+    texts = list(synthetic_amounts(500, seed=5))
+    aggregates = SpendingAggregates()
+    store.subscribe(aggregates.record)
+    for number, text in enumerate(texts):
+        store.add(str(9000000000 + number % 10), text, "food", "", "2026-10-01")
+
+    stored = sum_minor([row["amount_minor"] for row in store.iter_rows()])
+
+    assert stored == fraction_total(texts)
+    assert stored == sum(aggregates.category_total(str(9000000000 + user), "food")[0] for user in range(10))
+    assert not check_consistency(aggregates, store.iter_rows())
+
+
+def test_stores_convert_with_the_current_rates(store, monkeypatch):
+    row_id = store.add("u1", "10 USD", "books", "", "2026-10-01")
+    monkeypatch.setattr(money, "_fx_table", FxTable(path=None, rates={"INR": "1", "USD": "90"}))
+
+    row = store.get("u1", row_id)
+
+    assert (row["amount"], row["currency"], row["amount_minor"]) == (10.0, "USD", 90000)
+
+
+def test_edits_keep_the_amount_exact(store):
+    row_id = store.add("u1", "5", "food", "", "2026-10-01")
+
+    edited = store.update("u1", row_id, amount="90071992547409.93")
+    stored = store.get("u1", row_id)
+    store.update("u1", row_id, amount="12.5", currency="USD")
+    store.update("u1", row_id, currency="JPY")
+    moved = store.get("u1", row_id)
+
+    assert edited["amount_minor"] == stored["amount_minor"] == 9007199254740993
+    assert (moved["amount"], moved["currency"], moved["amount_minor"]) == (13.0, "JPY", to_ledger(13, "JPY"))
+
+
+def test_sqlite_ledger_with_real_amounts_is_upgraded(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE expenses (id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, amount REAL NOT NULL, "
+                 "currency TEXT NOT NULL DEFAULT '', amount_minor INTEGER NOT NULL DEFAULT 0, "
+                 "category TEXT NOT NULL DEFAULT '', description TEXT NOT NULL DEFAULT '', date TEXT NOT NULL DEFAULT '')")
+    conn.executemany("INSERT INTO expenses (id, user_id, amount, currency, amount_minor, category, description, date) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     [(1, "u1", 0.1, "", 0, "food", "tea", "2026-10-01"),
+                      (4, "u1", 12.5, "USD", 103875, "books", "novel", "2026-10-02")])
+    conn.commit()
+    conn.close()
+
+    store = SqliteExpenseStore(path)
+    rows = list(store.iter_rows())
+    found = store.search("u1", "novel")
+    new_id = store.add("u1", 20, "food", "lunch", "2026-10-03")
+    store.close()
+
+    assert [(row["id"], row["amount"], row["currency"], row["amount_minor"]) for row in rows] == [
+        (1, 0.1, "INR", 10), (4, 12.5, "USD", 103875)]
+    assert [row["id"] for row in found] == [4]
+    assert new_id == 5
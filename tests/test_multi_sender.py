@@ -0,0 +1,54 @@
+import asyncio
+
+import main
+from stubs import meta_payload
+
+# tenant id -> phone number id the webhook is delivered for
+PHONE_NUMBER_IDS = {"default": "default-phone", "acme": "acme-phone"}
+
+
+# Distinct amount for every (tenant, phone) so a reply with someone else's total shows up
+def amount_for(tenant_index, number):
+    return 10 + number * 2 + tenant_index
+
+
+def replies_by_sender(graph):
+    replies = {}
+    for path, payload in zip(graph.paths, graph.sent):
+        phone_number_id = path.strip("/").split("/")[1]
+        replies.setdefault((phone_number_id, payload["to"]), []).append(payload["text"]["body"])
+    return replies
+
+
+def test_each_sender_gets_their_own_replies_from_their_tenants_number(meta_app, graph):
+    # Every phone number writes to both tenants
+    senders = [
+        (tenant_index, tenant_id, str(9200000000 + number), number)
+        for number in range(25)
+        for tenant_index, tenant_id in enumerate(PHONE_NUMBER_IDS)
+    ]
+
+    async def scenario(client):
+        statuses = []
+        for phase, text in (("add", "spent {} on food"), ("query", "how much did I spend on food")):
+            payloads = [
+                meta_payload(phone, text.format(amount_for(tenant_index, number)),
+                             f"wamid.tenants.{phase}.{tenant_id}.{phone}", PHONE_NUMBER_IDS[tenant_id])
+                for tenant_index, tenant_id, phone, number in senders
+            ]
+            responses = await asyncio.gather(*(client.post("/webhook", json=payload) for payload in payloads))
+            statuses += [response.status_code for response in responses]
+            await main.work_queue.join()
+        return statuses
+
+    statuses = meta_app(scenario)
+
+    assert set(statuses) == {200}
+    replies = replies_by_sender(graph)
+    for tenant_index, tenant_id, phone, number in senders:
+        amount = amount_for(tenant_index, number)
+        assert replies[(PHONE_NUMBER_IDS[tenant_id], phone)] == [
+            "Expense added successfully ✅",
+            f"You have spent a total of {amount} Rs on food.",
+        ]
+    assert len(graph.sent) == 2 * len(senders)
@@ -0,0 +1,88 @@
+import logging
+import re
+
+import main
+from stubs import meta_payload
+
+MESSAGES = ["spent 200 on food yesterday", "how much on food", "bought a lamp for the bedroom yesterday",
+            "what did I spend on the lamp"]
+AUTH = {"Authorization": "Bearer profile-token"}
+
+
+# Sum of the samples of metric `name` whose labels include `labels`
+def metric_value(text, name, **labels):
+    total = 0.0
+    for line in text.splitlines():
+        match = re.match(r"([a-z_]+)(?:\{(.*)\})? (\S+)$", line)
+        if not match or match.group(1) != name:
+            continue
+        found = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2) or ""))
+        if all(found.get(key) == str(value) for key, value in labels.items()):
+            total += float(match.group(3))
+    return total
+
+
+STAGES = ("extract", "storage_write", "storage_read", "outbound_send", "process")
+COUNTED = {
+    "groq 200": ("expense_bot_upstream_responses_total", {"service": "groq", "status": 200}),
+    "graph 200": ("expense_bot_upstream_responses_total", {"service": "graph", "status": 200}),
+    "graph 429": ("expense_bot_upstream_responses_total", {"service": "graph", "status": 429}),
+    "webhooks": ("expense_bot_http_requests_total", {"route": "/webhook", "status": 200}),
+    **{stage: ("expense_bot_stage_seconds_count", {"stage": stage}) for stage in STAGES},
+}
+
+
+def counts(text):
+    return {key: metric_value(text, name, **labels) for key, (name, labels) in COUNTED.items()}
+
+
+def test_metrics_count_stages_upstream_statuses_and_requests(meta_app, graph):
+    async def scenario(client):
+        before = counts((await client.get("/metrics")).text)
+        graph.fail_next(429)
+        for i in range(20):
+            payload = meta_payload(str(9300000000 + i % 5), MESSAGES[i % len(MESSAGES)], f"wamid.metrics.{i}")
+            await client.post("/webhook", json=payload)
+        await main.work_queue.join()
+        after = counts((await client.get("/metrics")).text)
+        return {key: after[key] - before[key] for key in COUNTED}
+
+    delta = meta_app(scenario)
+
+    assert all(delta[stage] > 0 for stage in STAGES), delta
+    assert delta["groq 200"] > 0
+    assert delta["graph 200"] == len(graph.sent)
+    assert delta["graph 429"] == 1
+    assert delta["webhooks"] == 20
+
+
+def test_profiler_runs_at_runtime_behind_the_token(meta_app):
+    async def scenario(client):
+        forbidden = await client.post("/debug/profile/start", headers={"Authorization": "Bearer wrong"})
+        started = await client.post("/debug/profile/start", params={"seconds": 30, "interval_ms": 2}, headers=AUTH)
+        for i in range(8):
+            payload = meta_payload("9300000010", MESSAGES[i % len(MESSAGES)], f"wamid.profile.{i}")
+            await client.post("/webhook", json=payload)
+        await main.work_queue.join()
+        await client.post("/debug/profile/stop", headers=AUTH)
+        folded = (await client.get("/debug/profile", headers=AUTH)).text
+        return forbidden.status_code, started, folded
+
+    forbidden, started, folded = meta_app(scenario)
+
+    assert forbidden == 403
+    assert started.status_code == 200 and started.json()["running"]
+    assert [line for line in folded.splitlines() if line]
+
+
+def test_log_level_changes_at_runtime(meta_app):
+    async def scenario(client):
+        response = await client.post("/debug/log-level", params={"level": "debug"}, headers=AUTH)
+        enabled = logging.getLogger("main").isEnabledFor(logging.DEBUG)
+        await client.post("/debug/log-level", params={"level": "WARNING"}, headers=AUTH)
+        return response.json(), enabled
+
+    body, enabled = meta_app(scenario)
+
+    assert body.get("level") == "DEBUG" and enabled
+    assert not logging.getLogger("main").isEnabledFor(logging.DEBUG)
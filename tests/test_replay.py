@@ -0,0 +1,69 @@
+import argparse
+import json
+from collections import Counter
+
+import pytest
+
+import recording
+import replay
+from stubs import meta_payload
+
+
+def messages_of(requests, source):
+    return Counter((sender, text) for request in requests
+                   for sender, text, _ in replay.corpus_messages({"source": source, "payload": request}))
+
+
+def test_webhooks_are_recorded_for_replay(meta_app, tmp_path, monkeypatch):
+    path = tmp_path / "webhooks.jsonl"
+    monkeypatch.setattr(recording, "WEBHOOK_RECORD_FILE", str(path))
+    payload = meta_payload("919800000061", "how much on books", message_id="wamid.recorded")
+
+    async def scenario(client):
+        return (await client.post("/webhook", json=payload)).status_code
+
+    assert meta_app(scenario) == 200
+    corpus = replay.load_corpus(str(path))
+    assert [(entry["source"], entry["payload"]) for entry in corpus] == [("meta", payload)]
+    assert list(replay.corpus_messages(corpus[0])) == [("919800000061", "how much on books", "wamid.recorded")]
+
+
+def test_both_apps_are_sent_the_same_messages():
+    corpus = replay.load_corpus(replay.DEFAULT_CORPUS)
+    recorded = json.dumps(corpus)
+
+    meta = replay.requests_for("fastapi", corpus, repeat=2)
+    twilio = replay.requests_for("flask", corpus, repeat=2)
+    ids = [message_id for request in meta
+           for _, _, message_id in replay.corpus_messages({"source": "meta", "payload": request})]
+
+    assert messages_of(meta, "meta") == messages_of(twilio, "twilio")
+    assert sum(messages_of(meta, "meta").values()) == 2 * sum(1 for entry in corpus for _ in replay.corpus_messages(entry))
+    assert len(set(ids)) == len(ids)
+    assert len({form["MessageSid"] for form in twilio}) == len(twilio)
+    assert json.dumps(corpus) == recorded
+
+
+def test_report_flags_only_changes_past_the_tolerance(capsys):
+    baseline = {metric: 100.0 for metric in replay.METRICS}
+    result = dict(baseline, webhooks=10, messages=10, ack_per_second=70.0, messages_per_second=130.0,
+                  ack_p99_ms=120.0, process_p99_ms=130.0, groq_calls_per_message=50.0)
+
+    assert replay.report("fastapi", result, baseline, tolerance=0.25) == ["ack_per_second", "process_p99_ms"]
+    assert "REGRESSION" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("app_name", ["fastapi", "flask"])
+def test_replay_processes_every_recorded_message(app_name, tmp_path, monkeypatch):
+    # The child process gets a ledger of its own; keep its budgets and digest state out of the suite's
+    monkeypatch.setenv("BUDGETS_FILE", str(tmp_path / "budgets.json"))
+    monkeypatch.setenv("DIGEST_STATE_FILE", str(tmp_path / "digests.json"))
+    args = argparse.Namespace(corpus=replay.DEFAULT_CORPUS, repeat=1, concurrency=8, groq_latency=0.0,
+                              graph_latency=0.0)
+    messages = sum(1 for entry in replay.load_corpus(replay.DEFAULT_CORPUS) for _ in replay.corpus_messages(entry))
+
+    result = replay.run_once(app_name, args)
+
+    assert result["messages"] == messages
+    assert result["sends_per_message"] == 1.0
+    assert result["groq_calls_per_message"] < 1.0
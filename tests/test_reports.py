@@ -0,0 +1,125 @@
+import csv
+import io
+import json
+
+import pytest
+
+import main
+import reports
+from reports import MORE_TRANSACTIONS, export_csv, export_ndjson, summary_pages
+from storage import get_store
+from tenants import get_tenant
+
+HEADER = "You have spent a total of 300 Rs on food.\nHere are your transactions:"
+ROWS = [{"id": number, "user_id": "u1", "amount": 10.5, "currency": "INR", "amount_minor": 1050, "category": "food",
+         "description": f"snack {number}", "date": "2025-03-01"} for number in range(7)]
+
+
+def lines(count, width=20):
+    return [f"- line {number}".ljust(width, ".") for number in range(count)]
+
+
+def test_lines_filling_the_page_exactly_are_all_shown():
+    body = lines(3)
+    limit = len(HEADER) + sum(1 + len(line) for line in body)
+
+    assert summary_pages(HEADER, iter(body), 3, limit=limit, max_pages=1) == ["\n".join([HEADER, *body])]
+    assert summary_pages(HEADER, iter(body), 3, limit=limit - 1, max_pages=2) == [
+        "\n".join([HEADER, *body[:2]]), body[2]]
+
+
+def test_one_page_ends_with_the_rest_counted():
+    pages = summary_pages(HEADER, iter(lines(100)), 100, limit=300, max_pages=1)
+    shown = pages[0].split("\n")[2:-1]
+
+    assert len(pages) == 1 and len(pages[0]) <= 300
+    assert shown == lines(len(shown))
+    assert pages[0].endswith("\n" + MORE_TRANSACTIONS.format(100 - len(shown)))
+
+
+def test_oversized_header_is_cut_to_fit():
+    header = "H" * 500
+
+    single = summary_pages(header, iter(lines(5)), 5, limit=200, max_pages=1)
+    paged = summary_pages(header, iter(lines(5)), 5, limit=200, max_pages=3)
+
+    assert single == ["H" * (199 - len(MORE_TRANSACTIONS.format(5))) + "\n" + MORE_TRANSACTIONS.format(5)]
+    assert paged == ["H" * 200, "\n".join(lines(5))]
+
+
+def test_pages_never_pass_the_limit_or_the_page_cap():
+    body = [f"- {number} " + "x" * (number * 7 % 90) for number in range(400)]
+
+    for limit in (120, 1600, 4096):
+        for max_pages in (1, 2, 3):
+            pages = summary_pages(HEADER, iter(body), len(body), limit=limit, max_pages=max_pages)
+            shown = [line for line in "\n".join(pages).split("\n")[2:] if not line.startswith("...and")]
+            assert len(pages) <= max_pages
+            assert max(map(len, pages)) <= limit
+            assert shown == [line[:limit] for line in body[:len(shown)]]
+            assert pages[-1].endswith(MORE_TRANSACTIONS.format(len(body) - len(shown)))
+
+
+def test_exports_stream_a_chunk_at_a_time(monkeypatch):
+    monkeypatch.setattr(reports, "EXPORT_CHUNK_ROWS", 3)
+
+    csv_chunks = list(export_csv(iter(ROWS)))
+    ndjson_chunks = list(export_ndjson(iter(ROWS)))
+
+    assert len(csv_chunks) == len(ndjson_chunks) == 3
+    parsed = list(csv.DictReader(io.StringIO("".join(csv_chunks))))
+    assert [row["description"] for row in parsed] == [row["description"] for row in ROWS]
+    assert parsed[0]["amount_minor"] == "1050"
+    assert [json.loads(line) for line in "".join(ndjson_chunks).splitlines()] == [
+        {field: row[field] for field in reports.EXPORT_FIELDS} for row in ROWS]
+    assert list(export_csv(iter([]))) == [",".join(reports.EXPORT_FIELDS) + "\r\n"]
+
+
+def test_export_endpoint_filters_and_streams(meta_app, monkeypatch):
+    monkeypatch.setattr(main, "EXPORT_TOKEN", "export-token")
+    phone = "919800000051"
+    store, user = get_store(), get_tenant(None).user_key(phone)
+    store.add(user, 120, "food", "lunch", "2025-03-03")
+    store.add(user, 70, "travel", "cab", "2025-03-04")
+    store.add(user, 40, "food", "tea", "2025-04-01")
+    auth = {"Authorization": "Bearer export-token"}
+
+    async def scenario(client):
+        return [await client.get(f"/export/{phone}", params=params, headers=headers) for params, headers in [
+            ({"start": "2025-03-01", "end": "2025-03-31", "category": "FOOD"}, auth),
+            ({"format": "ndjson"}, auth),
+            ({"format": "xml"}, auth),
+            ({"period": "someday"}, auth),
+            ({}, {}),
+        ]]
+
+    csv_export, ndjson_export, bad_format, bad_period, anonymous = meta_app(scenario)
+
+    assert [row["description"] for row in csv.DictReader(io.StringIO(csv_export.text))] == ["lunch"]
+    assert csv_export.headers["content-type"].startswith("text/csv")
+    assert [json.loads(line)["description"] for line in ndjson_export.text.splitlines()] == ["lunch", "cab", "tea"]
+    assert (bad_format.status_code, bad_period.status_code, anonymous.status_code) == (400, 400, 403)
+
+
+@pytest.mark.skipif(reports.PARQUET_AVAILABLE, reason="pyarrow is installed")
+def test_parquet_without_pyarrow_is_refused(meta_app, monkeypatch):
+    monkeypatch.setattr(main, "EXPORT_TOKEN", "export-token")
+
+    async def scenario(client):
+        return await client.get("/export/919800000051", params={"format": "parquet"},
+                                headers={"Authorization": "Bearer export-token"})
+
+    assert meta_app(scenario).status_code == 501
+
+
+@pytest.mark.skipif(not reports.PARQUET_AVAILABLE, reason="needs pyarrow")
+def test_parquet_export_writes_a_row_group_per_chunk(monkeypatch):
+    import pyarrow.parquet as pq
+
+    monkeypatch.setattr(reports, "EXPORT_CHUNK_ROWS", 3)
+
+    data = b"".join(reports.export_parquet(iter(ROWS)))
+    parquet = pq.ParquetFile(io.BytesIO(data))
+
+    assert parquet.metadata.num_row_groups == 3
+    assert parquet.read().to_pylist() == ROWS
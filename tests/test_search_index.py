@@ -0,0 +1,162 @@
+import json
+import threading
+
+import pytest
+
+import searchindex
+from searchindex import SearchIndex
+from storage import CsvExpenseStore, ShardedExpenseStore, SqliteExpenseStore, query_expenses
+
+
+@pytest.fixture(params=["csv", "sqlite", "sharded"])
+def store(request, tmp_path):
+    if request.param == "csv":
+        store = CsvExpenseStore(str(tmp_path / "expenses.csv"))
+    elif request.param == "sqlite":
+        store = SqliteExpenseStore(str(tmp_path / "expenses.db"))
+    else:
+        store = ShardedExpenseStore(CsvExpenseStore(str(tmp_path / f"expenses-{n}.csv")) for n in range(3))
+    yield store
+    store.close()
+
+
+# A second store on the same files, standing in for another process
+def reopen(store):
+    if isinstance(store, ShardedExpenseStore):
+        return ShardedExpenseStore(type(shard)(shard.path) for shard in store.shards)
+    return type(store)(store.path)
+
+
+def indexed(store):
+    index = SearchIndex()
+    index.rebuild(store.iter_rows())
+    store.subscribe(index.record, index.change)
+    return index
+
+
+def test_matches_are_read_back_from_the_store(store):
+    index = indexed(store)
+    store.add("u1", 120, "transport", "uber to work", "2026-10-01")
+    store.add("u1", 80, "food", "dinner", "2026-10-02")
+    store.add("u2", 60, "transport", "cab home", "2026-10-02")
+
+    rows = query_expenses(store, "u1", "taxi", index=index)
+
+    assert [row["description"] for row in rows] == ["uber to work"]
+    assert rows[0]["amount_minor"] == 12000
+
+
+def test_edited_row_is_found_under_its_new_words(store):
+    index = indexed(store)
+    row_id = store.add("u1", 120, "transport", "uber to work", "2026-10-01")
+    store.update("u1", row_id, amount="150", category="groceries", description="weekly groceries")
+
+    assert query_expenses(store, "u1", "taxi", index=index) == []
+    rows = query_expenses(store, "u1", "grocery", index=index)
+    assert [(row["id"], row["amount_minor"]) for row in rows] == [(row_id, 15000)]
+
+
+def test_saved_file_holds_postings_and_ids_not_rows(store, tmp_path):
+    index = indexed(store)
+    for number in range(5):
+        store.add("u1", number + 1, "food", f"lunch {number}", "2026-10-01")
+    path = str(tmp_path / "search_index.json")
+
+    index.save(path)
+
+    with open(path) as file:
+        data = json.load(file)
+    assert set(data) == {"source", "generation", "ids", "postings"}
+    assert sorted(data["ids"]) == sorted(row["id"] for row in store.iter_rows())
+    loaded = SearchIndex.load(path)
+    assert len(loaded) == 5 and loaded.matches("u1", "lunch") == index.matches("u1", "lunch")
+    assert index.unsaved == 0
+
+
+def test_index_saved_with_rows_is_rebuilt(tmp_path):
+    path = tmp_path / "search_index.json"
+    path.write_text(json.dumps({"source": "x", "rows": [], "postings": {}}))
+
+    with pytest.raises(ValueError):
+        SearchIndex.load(str(path))
+
+
+def test_get_search_index_saves_off_the_calling_thread(monkeypatch, tmp_path):
+    path = str(tmp_path / "search_index.json")
+    started, release = threading.Event(), threading.Event()
+    saved_on = []
+
+    class SlowIndex(SearchIndex):
+        def save(self, path):
+            saved_on.append(threading.current_thread())
+            started.set()
+            release.wait(5)
+            super().save(path)
+
+    index = SlowIndex()
+    index.unsaved = searchindex.SEARCH_INDEX_SAVE_EVERY
+    monkeypatch.setattr(searchindex, "SEARCH_INDEX_FILE", path)
+    monkeypatch.setattr(searchindex, "_index", index)
+    monkeypatch.setattr(searchindex, "_last_check", float("inf"))
+    monkeypatch.setattr(searchindex, "_saver", None)
+
+    assert searchindex.get_search_index() is index  # returns while the save is still running
+    assert started.wait(5) and saved_on[0] is not threading.current_thread()
+    release.set()
+    searchindex.save_search_index()
+    assert SearchIndex.load(path) is not None
+
+
+def test_only_writes_from_elsewhere_are_outside_changes(store):
+    row_id = store.add("u1", 120, "transport", "uber to work", "2026-10-01")
+    store.update("u1", row_id, description="uber home")
+    store.delete("u1", store.add("u1", 5, "food", "tea", "2026-10-01"))
+    assert store.outside_changes() == 0
+
+    other = reopen(store)
+    other.update("u1", row_id, description="train home")
+    other.close()
+
+    assert store.outside_changes() == 1
+    assert store.outside_changes() == 1
+
+
+def test_saved_index_is_loaded_only_while_the_ledger_is_unchanged(store, monkeypatch, tmp_path):
+    monkeypatch.setattr(searchindex, "SEARCH_INDEX_FILE", str(tmp_path / "search_index.json"))
+    monkeypatch.setattr(searchindex, "get_store", lambda: store)
+    monkeypatch.setattr(searchindex, "_outside_changes", 0)
+    monkeypatch.setattr(searchindex, "_saver", None)
+    row_id = store.add("u1", 120, "transport", "uber to work", "2026-10-01")
+
+    def restart():
+        monkeypatch.setattr(searchindex, "_index", None)
+        return searchindex.get_search_index()
+
+    assert restart().generation is None  # built from the ledger
+    searchindex.save_search_index()
+    assert restart().generation == store.generation()  # loaded from the file
+
+    # Same number of rows, different words
+    other = reopen(store)
+    other.update("u1", row_id, description="train to work")
+    other.close()
+
+    index = restart()
+    assert index.generation is None
+    assert index.matches("u1", "train") == {row_id}
+
+
+def test_index_catches_up_with_another_process(store, monkeypatch):
+    monkeypatch.setattr(searchindex, "SEARCH_INDEX_FILE", "")
+    monkeypatch.setattr(searchindex, "SEARCH_INDEX_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(searchindex, "get_store", lambda: store)
+    monkeypatch.setattr(searchindex, "_outside_changes", 0)
+    monkeypatch.setattr(searchindex, "_index", None)
+    row_id = store.add("u1", 120, "transport", "uber to work", "2026-10-01")
+    searchindex.get_search_index()
+
+    other = reopen(store)
+    other.update("u1", row_id, description="train to work")
+    other.close()
+
+    assert searchindex.get_search_index().matches("u1", "train") == {row_id}
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import settings
+from conftest import ROOT
+
+
+@pytest.fixture
+def fresh(monkeypatch):
+    monkeypatch.setattr(settings, "_loaded", False)
+    monkeypatch.delenv("SETTINGS_TEST_VALUE", raising=False)
+    return settings
+
+
+def test_dotenv_file_is_loaded_once(fresh, tmp_path, monkeypatch):
+    path = tmp_path / ".env"
+    path.write_text("SETTINGS_TEST_VALUE=first\n")
+    monkeypatch.setattr(fresh, "DOTENV_FILE", str(path))
+
+    fresh.load_environment()
+    path.write_text("SETTINGS_TEST_VALUE=second\n")
+    monkeypatch.delenv("SETTINGS_TEST_VALUE")
+    fresh.load_environment()
+
+    assert "SETTINGS_TEST_VALUE" not in os.environ
+    fresh._loaded = False
+    fresh.load_environment()
+    assert os.environ["SETTINGS_TEST_VALUE"] == "second"
+
+
+@pytest.mark.parametrize("dotenv_file", ["", "missing.env"])
+def test_no_file_means_no_dotenv_import(fresh, tmp_path, monkeypatch, dotenv_file):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(fresh, "DOTENV_FILE", dotenv_file)
+    monkeypatch.setitem(sys.modules, "dotenv", None)  # importing it now would fail
+
+    fresh.load_environment()
+
+    assert "SETTINGS_TEST_VALUE" not in os.environ
+
+
+@pytest.mark.parametrize("app_module, absent", [
+    ("main", ["requests", "flask", "twilio", "numpy", "pyarrow", "dotenv"]),
+    ("app", ["httpx", "fastapi", "numpy", "pyarrow", "dotenv"]),
+])
+def test_each_app_starts_without_the_other_ones_dependencies(app_module, absent):
+    code = f"import sys, {app_module}; print(' '.join(name for name in {absent!r} if name in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True,
+                            env=dict(os.environ, DOTENV_FILE=""))
+
+    assert output.returncode == 0, output.stderr
+    assert output.stdout.strip() == ""
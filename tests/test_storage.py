@@ -0,0 +1,114 @@
+from datetime import date
+
+import pytest
+
+from storage import (CsvExpenseStore, ShardedExpenseStore, SqliteExpenseStore, migrate_csv_to_sqlite, query_expenses,
+                     shard_path)
+
+USERS = [str(9100000000 + number) for number in range(6)]
+ROWS = [
+    (user, 10 * (number + 1) + shift, category, description, day)
+    for shift, user in enumerate(USERS)
+    for number, (category, description, day) in enumerate([
+        ("food", "lunch", "2025-03-03"),
+        ("Groceries", "rice", "2025-03-10"),
+        ("travel", "cab to the airport", "2025-04-01"),
+        ("food", "tea", "2025-04-02"),
+    ])
+]
+
+
+def open_store(kind, tmp_path):
+    if kind == "csv":
+        return CsvExpenseStore(str(tmp_path / "expenses.csv"))
+    if kind == "sqlite":
+        return SqliteExpenseStore(str(tmp_path / "expenses.db"))
+    backend, path = (CsvExpenseStore, "expenses.csv") if kind == "sharded-csv" else (SqliteExpenseStore, "expenses.db")
+    return ShardedExpenseStore(backend(shard_path(str(tmp_path / path), shard)) for shard in range(3))
+
+
+def content(rows):
+    return [(row["user_id"], row["amount_minor"], row["category"], row["description"], row["date"]) for row in rows]
+
+
+@pytest.fixture(params=["csv", "sqlite", "sharded-csv", "sharded-sqlite"])
+def store(request, tmp_path):
+    store = open_store(request.param, tmp_path)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def reference(tmp_path):
+    store = CsvExpenseStore(str(tmp_path / "reference.csv"))
+    for row in ROWS:
+        store.add(*row)
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize("term", ["food", "cab", "2025-03", "gro", "food last month", "tea", "books"])
+def test_every_backend_answers_like_the_csv_scan(store, reference, term):
+    for row in ROWS:
+        store.add(*row)
+
+    for user in USERS[:3]:
+        today = date(2025, 4, 15)
+        assert (content(query_expenses(store, user, term, today=today))
+                == content(query_expenses(reference, user, term, today=today)))
+        assert (content(store.date_range(user, "2025-03-05", "2025-04-01"))
+                == content(reference.date_range(user, "2025-03-05", "2025-04-01")))
+
+
+def test_sharded_ids_are_global(tmp_path):
+    store = open_store("sharded-sqlite", tmp_path)
+    heard = []
+    store.subscribe(heard.append)
+    ids = [store.add(*row) for row in ROWS]
+
+    assert len(set(ids)) == len(ids)
+    assert [row["id"] for row in heard] == ids
+    assert sorted(row["id"] for row in store.iter_rows()) == sorted(ids)
+    for (user, *_), row_id in zip(ROWS, ids):
+        assert row_id % 3 == store._shard_number(user)
+        assert store.get(user, row_id)["id"] == row_id
+    store.close()
+
+
+def test_sharded_edits_reach_only_the_owners_row(tmp_path):
+    store = open_store("sharded-csv", tmp_path)
+    ids = {row: store.add(*row) for row in ROWS}
+    owner, other = USERS[0], next(user for user in USERS if store._shard_number(user) != store._shard_number(USERS[0]))
+    lunch = ids[ROWS[0]]
+
+    assert store.get(other, lunch) is None
+    assert store.update(other, lunch, amount=1) is None
+    assert store.delete(other, lunch) is None
+
+    edited = store.update(owner, lunch, amount=15, category="snacks")
+    assert (edited["id"], edited["amount_minor"], edited["category"]) == (lunch, 1500, "snacks")
+    assert [row["id"] for row in store.get_many(owner, [lunch, lunch + 1])] == [lunch]
+    assert store.last_row(owner)["id"] == max(row_id for row, row_id in ids.items() if row[0] == owner)
+
+    assert store.delete(owner, lunch)["id"] == lunch
+    assert store.get(owner, lunch) is None
+    assert store.count() == len(ROWS) - 1
+    store.close()
+
+
+def test_csv_ledger_is_migrated_once(tmp_path):
+    csv_path, db_path = str(tmp_path / "expenses.csv"), str(tmp_path / "expenses.db")
+    legacy = CsvExpenseStore(csv_path)
+    for row in ROWS:
+        legacy.add(*row)
+    legacy.add(USERS[0], "12.50 USD", "books", "novel", "2025-04-03")
+    legacy.close()
+    store = SqliteExpenseStore(db_path)
+
+    assert migrate_csv_to_sqlite(csv_path, db_path, store=store) == len(ROWS) + 1
+    assert migrate_csv_to_sqlite(csv_path, db_path, store=store) == 0
+    legacy = CsvExpenseStore(csv_path)
+    assert content(store.iter_rows()) == content(legacy.iter_rows())
+    assert store.search(USERS[0], "novel")[0]["currency"] == "USD"
+    legacy.close()
+    store.close()
@@ -0,0 +1,135 @@
+import asyncio
+import random
+import threading
+import time
+
+from workqueue import AsyncWorkQueue, ThreadWorkQueue
+
+
+def test_thread_queue_runs_each_keys_items_in_submission_order():
+    handled = []
+    lock = threading.Lock()
+
+    def handler(user, n):
+        time.sleep(random.uniform(0, 0.005))
+        with lock:
+            handled.append((user, n))
+
+    work_queue = ThreadWorkQueue(handler, workers=8, max_in_flight=8, name="test",
+                                 key=lambda user, n: user)
+    users = [f"u{n}" for n in range(5)]
+    for n in range(40):
+        for user in users:
+            assert work_queue.submit(user, n)
+    work_queue.join()
+    work_queue.stop()
+
+    for user in users:
+        assert [n for who, n in handled if who == user] == list(range(40))
+    assert work_queue.snapshot()["processed"] == 200
+
+
+def test_thread_queue_keys_do_not_wait_for_each_other():
+    release = threading.Event()
+    handled = []
+
+    def handler(user, n):
+        if user == "slow":
+            release.wait(5)
+        handled.append(user)
+
+    work_queue = ThreadWorkQueue(handler, workers=2, max_in_flight=2, name="test", key=lambda user, n: user)
+    work_queue.submit("slow", 0)
+    work_queue.submit("fast", 0)
+    deadline = time.monotonic() + 5
+    while "fast" not in handled and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    work_queue.join()
+    work_queue.stop()
+
+    assert handled == ["fast", "slow"]
+
+
+def test_thread_queue_burst_from_one_key_holds_one_worker():
+    release = threading.Event()
+    handled = []
+
+    def handler(user, n):
+        if user == "hot":
+            release.wait(5)
+        handled.append((user, n))
+
+    work_queue = ThreadWorkQueue(handler, workers=2, max_in_flight=2, name="test", key=lambda user, n: user)
+    for n in range(5):
+        work_queue.submit("hot", n)
+    work_queue.submit("cold", 0)
+    deadline = time.monotonic() + 5
+    while ("cold", 0) not in handled and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert handled == [("cold", 0)]
+    assert work_queue.snapshot()["depth"] == 4  # waiting behind the running "hot" item
+
+    release.set()
+    work_queue.join()
+    work_queue.stop()
+    assert handled[1:] == [("hot", n) for n in range(5)]
+
+
+def test_async_queue_burst_from_one_key_holds_one_worker():
+    handled = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def handler(user, n):
+            if user == "hot":
+                await release.wait()
+            handled.append((user, n))
+
+        work_queue = AsyncWorkQueue(handler, workers=2, max_in_flight=2, name="test", key=lambda user, n: user)
+        await work_queue.start()
+        for n in range(5):
+            work_queue.submit("hot", n)
+        work_queue.submit("cold", 0)
+        for _ in range(100):
+            if handled:
+                break
+            await asyncio.sleep(0.01)
+        assert handled == [("cold", 0)]
+        release.set()
+        await work_queue.join()
+        await work_queue.stop()
+
+    asyncio.run(scenario())
+
+    assert handled[1:] == [("hot", n) for n in range(5)]
+
+
+def test_waiting_items_count_towards_the_queue_depth_limit():
+    release = threading.Event()
+    work_queue = ThreadWorkQueue(lambda user: release.wait(5), workers=1, maxsize=3, name="test",
+                                 key=lambda user: user)
+
+    assert work_queue.submit("hot")
+    time.sleep(0.05)  # running now, so no longer counted
+    accepted = [work_queue.submit("hot") for _ in range(4)]
+    release.set()
+    work_queue.join()
+    work_queue.stop()
+
+    assert accepted == [True, True, True, False]
+
+
+def test_thread_queue_stop_gives_up_on_a_full_queue():
+    release = threading.Event()
+    work_queue = ThreadWorkQueue(lambda n: release.wait(5), workers=1, maxsize=1, name="test")
+    work_queue.submit(0)
+    time.sleep(0.05)
+    work_queue.submit(1)  # fills the queue while the worker is busy
+
+    started = time.monotonic()
+    work_queue.stop(timeout=0.2)
+    release.set()
+
+    assert time.monotonic() - started < 1
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire ``ttl`` seconds after they
+    were written. Lookups, inserts and evictions are O(1).
+
+    With ``max_weight`` and ``weigh`` (a function of the value, e.g. len) the
+    cache also evicts least recently used entries until the total weight fits.
+    """
+
+    def __init__(self, maxsize=10000, ttl=3600.0, clock=time.monotonic, max_weight=None, weigh=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self._weigh = weigh if max_weight is not None else None
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.weight = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _weight_of(self, value):
+        return self._weigh(value) if self._weigh else 0
+
+    def _remove(self, key):
+        _, value = self._data.pop(key)
+        self.weight -= self._weight_of(value)
+        return value
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires_at, value = item
+            if expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def _store(self, key, value, ttl):
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (self._clock() + (self.ttl if ttl is None else ttl), value)
+        self.weight += self._weight_of(value)
+        while len(self._data) > self.maxsize or (self._weigh and self.weight > self.max_weight and len(self._data) > 1):
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    # Insert only if the key is absent (or expired). Returns True if it was inserted.
+    def add(self, key, value=True, ttl=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING and item[0] > self._clock():
+                self._data.move_to_end(key)
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            return self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,304 @@
+"""
+Background work queues used by the webhook handlers.
+
+Handlers validate the payload, submit() the message and return straight away;
+a pool of workers runs the slow part (LLM calls, storage, outbound reply).
+AsyncWorkQueue serves the FastAPI app, ThreadWorkQueue the Flask app.
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+WORK_QUEUE_DEPTH = int(os.getenv("WORK_QUEUE_DEPTH", "1000"))
+WORK_QUEUE_WORKERS = int(os.getenv("WORK_QUEUE_WORKERS", "8"))
+WORK_QUEUE_IN_FLIGHT = int(os.getenv("WORK_QUEUE_IN_FLIGHT", "8"))
+WORK_QUEUE_DRAIN_TIMEOUT = float(os.getenv("WORK_QUEUE_DRAIN_TIMEOUT", "30"))
+
+logger = logging.getLogger(__name__)
+
+
+class QueueStats:
+    """Counters and queue-lag (time from submit to a worker picking the item up)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self.lag_total = 0.0
+        self.started = 0
+
+    def record_submit(self, accepted):
+        with self._lock:
+            if accepted:
+                self.submitted += 1
+            else:
+                self.rejected += 1
+
+    def record_start(self, enqueued_at):
+        lag = time.monotonic() - enqueued_at
+        with self._lock:
+            self.started += 1
+            self.in_flight += 1
+            self.lag_last = lag
+            self.lag_max = max(self.lag_max, lag)
+            self.lag_total += lag
+
+    def record_done(self, ok):
+        with self._lock:
+            self.in_flight -= 1
+            if ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+
+    def snapshot(self, depth):
+        with self._lock:
+            return {
+                "depth": depth,
+                "in_flight": self.in_flight,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "failed": self.failed,
+                "lag_last_seconds": self.lag_last,
+                "lag_max_seconds": self.lag_max,
+                "lag_avg_seconds": self.lag_total / self.started if self.started else 0.0,
+            }
+
+
+class AsyncWorkQueue:
+    """
+    asyncio queue drained by a fixed pool of worker tasks.
+
+    With ``key`` set (a function of the submitted args), items sharing a key are
+    processed one at a time in submission order while different keys run
+    concurrently, e.g. to apply one user's messages in sequence. Only a key's
+    oldest item goes on the queue; the rest wait in that key's line, outside
+    the queue, and the worker that finishes an item runs the next one in its
+    line. A burst from one key so holds one worker, never the whole pool. Items
+    in the lines count towards ``maxsize``.
+    """
+
+    def __init__(self, handler, workers=WORK_QUEUE_WORKERS, maxsize=WORK_QUEUE_DEPTH,
+                 max_in_flight=WORK_QUEUE_IN_FLIGHT, name="work", key=None):
+        self.handler = handler
+        self.key = key
+        self.workers = workers
+        self.maxsize = maxsize
+        self.max_in_flight = max_in_flight
+        self.name = name
+        self.stats = QueueStats()
+        self._queue = None
+        self._slots = None
+        self._tasks = []
+        self._lines = {}  # key -> deque of the items waiting behind the one queued or running
+        self._waiting = 0  # items in the lines
+
+    @property
+    def running(self):
+        return bool(self._tasks)
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._tasks = [asyncio.create_task(self._worker(), name=f"{self.name}-{i}") for i in range(self.workers)]
+
+    # Enqueue without waiting. Returns False when the queue is full.
+    def submit(self, *args):
+        if self._queue is None:
+            raise RuntimeError(f"{self.name} queue has not been started")
+        item = (time.monotonic(), args)
+        key = self.key(*args) if self.key is not None else None
+        line = self._lines.get(key) if key is not None else None
+        if self.maxsize and self._queue.qsize() + self._waiting >= self.maxsize:
+            accepted = False
+        elif line is not None:
+            line.append(item)
+            self._waiting += 1
+            accepted = True
+        else:
+            self._queue.put_nowait(item + (key,))
+            if key is not None:
+                self._lines[key] = deque()
+            accepted = True
+        self.stats.record_submit(accepted)
+        return accepted
+
+    async def _run(self, enqueued_at, args):
+        async with self._slots:
+            self.stats.record_start(enqueued_at)
+            ok = False
+            try:
+                await self.handler(*args)
+                ok = True
+            except Exception as e:
+                logger.exception("%s worker failed: %s", self.name, e)
+            finally:
+                self.stats.record_done(ok)
+
+    async def _worker(self):
+        while True:
+            enqueued_at, args, key = await self._queue.get()
+            try:
+                await self._run(enqueued_at, args)
+                if key is None:
+                    continue
+                # Nothing else runs between the check and the delete, so no item is left behind
+                line = self._lines[key]
+                while line:
+                    enqueued_at, args = line.popleft()
+                    self._waiting -= 1
+                    await self._run(enqueued_at, args)
+                del self._lines[key]
+            finally:
+                self._queue.task_done()
+
+    # Wait until everything submitted so far has been processed
+    async def join(self):
+        await self._queue.join()
+
+    # Wait for queued items to finish, then stop the workers
+    async def stop(self, timeout=WORK_QUEUE_DRAIN_TIMEOUT):
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("%s queue: drain timed out with %d items left", self.name,
+                           self._queue.qsize() + self._waiting)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def snapshot(self):
+        return self.stats.snapshot(self._queue.qsize() + self._waiting if self._queue else 0)
+
+
+class ThreadWorkQueue:
+    """
+    Thread-based equivalent for the synchronous Flask app. Workers start on first
+    submit. ``key`` works as in AsyncWorkQueue.
+    """
+
+    def __init__(self, handler, workers=WORK_QUEUE_WORKERS, maxsize=WORK_QUEUE_DEPTH,
+                 max_in_flight=WORK_QUEUE_IN_FLIGHT, name="work", key=None):
+        self.handler = handler
+        self.key = key
+        self.workers = workers
+        self.maxsize = maxsize
+        self.name = name
+        self.stats = QueueStats()
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._lines = {}  # key -> deque of the items waiting behind the one queued or running
+        self._waiting = 0  # items in the lines
+        self._lines_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, *args):
+        self.start()
+        item = (time.monotonic(), args)
+        key = self.key(*args) if self.key is not None else None
+        with self._lines_lock:
+            line = self._lines.get(key) if key is not None else None
+            if self.maxsize and self._queue.qsize() + self._waiting >= self.maxsize:
+                accepted = False
+            elif line is not None:
+                line.append(item)
+                self._waiting += 1
+                accepted = True
+            else:
+                try:
+                    self._queue.put_nowait(item + (key,))
+                    accepted = True
+                except queue.Full:
+                    accepted = False
+                if accepted and key is not None:
+                    self._lines[key] = deque()
+        self.stats.record_submit(accepted)
+        return accepted
+
+    def _run(self, enqueued_at, args):
+        with self._slots:
+            self.stats.record_start(enqueued_at)
+            ok = False
+            try:
+                self.handler(*args)
+                ok = True
+            except Exception as e:
+                logger.exception("%s worker failed: %s", self.name, e)
+            finally:
+                self.stats.record_done(ok)
+
+    # The next item in the key's line, or None after freeing the key
+    def _next_in_line(self, key):
+        with self._lines_lock:
+            line = self._lines[key]
+            if not line:
+                del self._lines[key]
+                return None
+            self._waiting -= 1
+            return line.popleft()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                enqueued_at, args, key = item
+                self._run(enqueued_at, args)
+                while key is not None:
+                    item = self._next_in_line(key)
+                    if item is None:
+                        break
+                    self._run(*item)
+            finally:
+                self._queue.task_done()
+
+    # Block until everything submitted so far has been processed
+    def join(self):
+        self._queue.join()
+
+    # Let the workers finish everything already queued, then stop them
+    def stop(self, timeout=WORK_QUEUE_DRAIN_TIMEOUT):
+        with self._start_lock:
+            threads, self._threads = self._threads, []
+        if not threads:
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            for _ in threads:
+                self._queue.put(None, timeout=max(deadline - time.monotonic(), 0))
+        except queue.Full:
+            pass
+        for thread in threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        if any(thread.is_alive() for thread in threads):
+            logger.warning("%s queue: drain timed out with %d items left", self.name, self.snapshot()["depth"])
+
+    def snapshot(self):
+        with self._lines_lock:
+            return self.stats.snapshot(self._queue.qsize() + self._waiting)